@@ -0,0 +1,231 @@
+"""Benchmark the streaming half-space-tree anomaly baselines against the Isolation Forest.
+
+Replays recorded labeled traffic (the training store's examples in arrival
+order, or a CSV in the ``training.py import`` format) through three
+detectors and reports detection quality and throughput:
+
+- ``isolation_forest``: the served model (MODEL_PATH, or the seeded fallback), never updated;
+- ``isolation_forest_refit``: an Isolation Forest fit once on the warm-up events, the best
+  a model fit at startup can do without batch refits;
+- ``hst``: the per-input-type half-space tree baselines, scoring each event before
+  learning from it (prequential evaluation, as in serving).
+
+Quality is ROC AUC and average precision of the anomaly scores against the
+labels (malicious = anomalous), plus precision and recall of the served
+``is_anomaly`` decision, over the events after every baseline's warm-up.
+Throughput is events/s one event at a time and in batches of 256.
+
+    python benchmarks/bench_anomaly.py                        # the training store, if it has enough examples
+    python benchmarks/bench_anomaly.py --input labeled.csv
+    python benchmarks/bench_anomaly.py --synthetic 20000      # seeded stream with drift and injected anomalies
+
+The synthetic stream is the load benchmarks' traffic with 2% of events
+made anomalous (outsized URLs and domains, unusual IP ranges with odd
+device fingerprints), and its normal traffic shifts halfway through.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import pickle
+import random
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import load_anomaly_model  # noqa: E402
+from features import ANOMALY_FEATURES, RequestFeatures  # noqa: E402
+from online_anomaly import OnlineAnomalyConfig, OnlineAnomalyDetector, type_code  # noqa: E402
+from training import LabeledStore, TrainingConfig  # noqa: E402
+from workload import URL_WORDS, sample_device, sample_email, sample_ip, sample_url  # noqa: E402
+
+ANOMALY_RATIO = 0.02
+BATCH_SIZE = 256
+
+
+def anomalous_request(input_type: str, rng: random.Random) -> Dict[str, Any]:
+    if input_type == "ip":
+        value = f"{rng.choice([0, 127, 240, 255])}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+        device = {"screen": {"width": rng.choice([0, 8192]), "height": rng.choice([0, 8192]), "colorDepth": 8},
+                  "userAgent": "x" * rng.randint(400, 800), "plugins": [f"p{i}" for i in range(40)], "timezone": 14}
+        return {"input_type": "ip", "input_value": value, "device_fingerprint": device}
+    words = [rng.choice(URL_WORDS) + str(rng.randint(0, 9999)) for _ in range(rng.randint(6, 12))]
+    host = "-".join(words[:3]) + "." + ".".join(words[3:]) + ".ru"
+    if input_type == "email":
+        return {"input_type": "email", "input_value": f"{'x' * rng.randint(30, 60)}@{host}"}
+    query = "&".join(f"{w}={rng.randint(0, 10 ** 9)}" for w in words)
+    return {"input_type": "url", "input_value": f"http://{host}/{'/'.join(words)}?{query}"}
+
+
+def synthetic_stream(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Labeled requests; normal traffic drifts to longer URLs and more device fingerprints halfway"""
+    rng = random.Random(seed)
+    samplers = {"ip": sample_ip, "url": sample_url, "email": sample_email}
+    examples = []
+    for i in range(count):
+        input_type = rng.choice(list(samplers))
+        drifted = i >= count // 2
+        if rng.random() < ANOMALY_RATIO:
+            examples.append({**anomalous_request(input_type, rng), "label": 1})
+            continue
+        value = samplers[input_type](rng)
+        if drifted and input_type == "url":
+            value += "/" + "/".join(rng.choice(URL_WORDS) for _ in range(rng.randint(1, 4)))
+        example = {"input_type": input_type, "input_value": value, "label": 0}
+        if rng.random() < (0.7 if drifted else 0.3):
+            example["device_fingerprint"] = sample_device(rng)
+        examples.append(example)
+    return examples
+
+
+def recorded_stream(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Labeled examples from a CSV, or from the training store when ``path`` is None"""
+    if path is None:
+        config = TrainingConfig.from_env(os.getenv("MODEL_PATH", "/app/models"))
+        if not os.path.exists(config.store_path):
+            return []
+        return [
+            {"input_type": e.input_type, "input_value": e.input_value, "label": e.label,
+             "device_fingerprint": e.device_fingerprint}
+            for e in LabeledStore(config.store_path).examples(["ip", "url", "email", "domain"])
+        ]
+    with open(path, newline="") as f:
+        return [
+            {
+                "input_type": row["input_type"],
+                "input_value": row["input_value"],
+                "label": int(row["label"].strip().lower() in ("1", "true", "malicious", "yes")),
+                "device_fingerprint": json.loads(row["device_fingerprint"]) if row.get("device_fingerprint") else None,
+            }
+            for row in csv.DictReader(f)
+        ]
+
+
+def feature_rows(examples: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Anomaly features, baseline codes and labels of the examples that have anomaly features"""
+    rows, codes, labels = [], [], []
+    for example in examples:
+        features = RequestFeatures(example["input_type"], example["input_value"], example.get("device_fingerprint"))
+        row = features.anomaly
+        if row is not None:
+            rows.append(row)
+            codes.append(type_code(example["input_type"]))
+            labels.append(int(example["label"]))
+    return np.array(rows, dtype=np.float32).reshape(-1, ANOMALY_FEATURES), np.array(codes), np.array(labels)
+
+
+def quality(labels: np.ndarray, scores: np.ndarray, flagged: np.ndarray) -> Dict[str, Any]:
+    from sklearn.metrics import average_precision_score, roc_auc_score
+    both = len(set(labels.tolist())) == 2
+    true_positives = int((flagged & (labels == 1)).sum())
+    return {
+        "roc_auc": round(float(roc_auc_score(labels, scores)), 4) if both else None,
+        "average_precision": round(float(average_precision_score(labels, scores)), 4) if both else None,
+        "precision": round(true_positives / flagged.sum(), 4) if flagged.sum() else 0.0,
+        "recall": round(true_positives / (labels == 1).sum(), 4) if (labels == 1).sum() else None,
+        "flagged": round(float(flagged.mean()), 4),
+    }
+
+
+def throughput(score_batch, rows: np.ndarray, batch_size: int, limit: int) -> float:
+    """Events per second scoring ``rows[:limit]`` in batches of ``batch_size``"""
+    rows = rows[:limit]
+    started = time.perf_counter()
+    for start in range(0, len(rows), batch_size):
+        score_batch(rows[start:start + batch_size], start)
+    return round(len(rows) / (time.perf_counter() - started), 1)
+
+
+def run(rows: np.ndarray, codes: np.ndarray, labels: np.ndarray, args: argparse.Namespace) -> Dict[str, Any]:
+    from sklearn.ensemble import IsolationForest
+    config = OnlineAnomalyConfig.from_env(os.getenv("MODEL_PATH", "/app/models"))
+
+    # Prequential pass: each event is scored against its baseline, then learned
+    detector = OnlineAnomalyDetector(ANOMALY_FEATURES, config)
+    hst_probability = np.full(len(rows), np.nan)
+    for start in range(0, len(rows), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        hst_probability[start:end] = detector.process(rows[start:end], codes[start:end])[0]
+
+    # Compare over the events every detector scored for real: after the warm-up, baseline ready
+    evaluated = ~np.isnan(hst_probability)
+    evaluated[:args.warmup] = False
+    served, _, _ = load_anomaly_model()
+    refit = IsolationForest(random_state=args.seed).fit(rows[:args.warmup][labels[:args.warmup] == 0])
+
+    results: Dict[str, Any] = {"events": len(rows), "evaluated": int(evaluated.sum()),
+                               "anomalies": int(labels[evaluated].sum())}
+    engines: Dict[str, Dict[str, Any]] = {}
+    for name, model in (("isolation_forest", served), ("isolation_forest_refit", refit)):
+        scores = -model.decision_function(rows[evaluated])
+        flagged = model.predict(rows[evaluated]) == -1
+        engines[name] = {
+            **quality(labels[evaluated], scores, flagged),
+            "events_per_second": {
+                "batch_1": throughput(lambda batch, _: model.decision_function(batch), rows, 1, args.single_events),
+                f"batch_{BATCH_SIZE}": throughput(lambda batch, _: model.decision_function(batch), rows, BATCH_SIZE,
+                                                  len(rows)),
+            },
+            "memory_bytes": len(pickle.dumps(model)),
+        }
+    probability = hst_probability[evaluated]
+    engines["hst"] = {
+        **quality(labels[evaluated], probability, probability > config.threshold),
+        "memory_bytes": detector.stats()["memory_bytes"],
+    }
+    # Throughput on fresh detectors, past their warm-up like a long-running service
+    timed = {}
+    for batch_size, limit in ((1, args.single_events), (BATCH_SIZE, len(rows))):
+        fresh = OnlineAnomalyDetector(ANOMALY_FEATURES, config)
+        fresh.process(rows[:args.warmup], codes[:args.warmup])
+        tail, tail_codes = rows[args.warmup:], codes[args.warmup:]
+        timed[f"batch_{batch_size}"] = throughput(
+            lambda batch, start: fresh.process(batch, tail_codes[start:start + len(batch)]), tail, batch_size, limit
+        )
+    engines["hst"]["events_per_second"] = timed
+    results["engines"] = engines
+    results["hst_config"] = {"trees": config.trees, "depth": config.depth, "window": config.window,
+                             "threshold": config.threshold}
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", help="Labeled CSV (input_value,input_type,label[,device_fingerprint]); "
+                                        "default: the training store")
+    parser.add_argument("--synthetic", type=int, help="Replay this many synthetic events instead")
+    parser.add_argument("--warmup", type=int, default=3000,
+                        help="Events before evaluation starts (the refit forest is fit on their benign ones)")
+    parser.add_argument("--single-events", type=int, default=2000, help="Events timed one at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    examples = synthetic_stream(args.synthetic, args.seed) if args.synthetic else recorded_stream(args.input)
+    source = "synthetic" if args.synthetic else args.input or "training store"
+    rows, codes, labels = feature_rows(examples)
+    if len(rows) <= args.warmup:
+        parser.error(f"{source} has {len(rows)} events with anomaly features, need more than --warmup {args.warmup}"
+                     f" (try --synthetic 20000)")
+    results = {"source": source, **run(rows, codes, labels, args)}
+
+    print(f"source={source} events={results['events']} evaluated={results['evaluated']} "
+          f"anomalies={results['anomalies']}")
+    print(f"{'engine':<24}{'roc auc':>9}{'avg prec':>10}{'precision':>11}{'recall':>8}{'flagged':>9}"
+          f"{'ev/s b=1':>11}{f'ev/s b={BATCH_SIZE}':>13}{'memory KB':>11}")
+    for name, row in results["engines"].items():
+        rate = row["events_per_second"]
+        print(f"{name:<24}{row['roc_auc'] or float('nan'):>9.3f}{row['average_precision'] or float('nan'):>10.3f}"
+              f"{row['precision']:>11.3f}{row['recall'] or float('nan'):>8.3f}{row['flagged']:>9.3f}"
+              f"{rate['batch_1']:>11.0f}{rate[f'batch_{BATCH_SIZE}']:>13.0f}{row['memory_bytes'] / 1024:>11.0f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark the vectorized batch feature extractors against the scalar ones.
+
+Builds synthetic IP and URL inputs, checks that the batch matrices are
+identical to stacking the scalar extractor outputs, and prints per-batch
+latency and speedup.
+
+    python benchmarks/bench_features.py --sizes 1 100 10000 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from features import (  # noqa: E402
+    extract_ip_features, extract_ip_features_batch, extract_url_features, extract_url_features_batch,
+)
+
+URL_WORDS = ["login", "secure", "account", "bank", "paypal", "update", "verify", "cdn", "static", "api"]
+URL_TLDS = ["com", "net", "org", "io", "co.uk", "ru"]
+
+
+def best_time(fn, repeat: int) -> float:
+    """Best wall-clock time of ``repeat`` calls, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def sample_ips(rng: random.Random, size: int):
+    return [".".join(str(rng.randint(0, 255)) for _ in range(4)) for _ in range(size)]
+
+
+def sample_urls(rng: random.Random, size: int):
+    urls = []
+    for _ in range(size):
+        host = ".".join(rng.choice(URL_WORDS) + str(rng.randint(0, 99)) for _ in range(rng.randint(1, 3)))
+        path = "/".join(rng.choice(URL_WORDS) for _ in range(rng.randint(0, 4)))
+        query = f"?id={rng.randint(0, 10 ** 6)}&ref={rng.choice(URL_WORDS)}" if rng.random() < 0.5 else ""
+        scheme = rng.choice(["https://", "http://", ""])
+        urls.append(f"{scheme}{host}.{rng.choice(URL_TLDS)}/{path}{query}")
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    extractors = (
+        ("ip", sample_ips, extract_ip_features, extract_ip_features_batch),
+        ("url", sample_urls, extract_url_features, extract_url_features_batch),
+    )
+
+    print(f"{'input':<8}{'batch':>8}{'scalar ms':>12}{'batch ms':>12}{'speedup':>10}{'identical':>11}")
+    for name, sample, scalar_fn, batch_fn in extractors:
+        for size in args.sizes:
+            values = sample(rng, size)
+            scalar = lambda: np.stack([scalar_fn(value) for value in values])
+            identical = np.array_equal(scalar(), batch_fn(values))
+            scalar_ms = best_time(scalar, args.repeat)
+            batch_ms = best_time(lambda: batch_fn(values), args.repeat)
+            print(f"{name:<8}{size:>8}{scalar_ms:>12.3f}{batch_ms:>12.3f}"
+                  f"{scalar_ms / batch_ms:>9.1f}x{str(identical):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Benchmark IP intelligence table lookups, one address at a time and in batches.
+
+Builds a synthetic table of random disjoint IPv4 and IPv6 ranges with the
+table builder (or opens an existing one with --table), checks the scalar and
+batch lookups against a plain bisect over the ranges, and prints the cost
+per lookup:
+
+- ``find``: the range search alone, on an already parsed address;
+- ``lookup``/``geo_features``: from the address string, as the API and
+  ``extract_ip_features`` call them;
+- ``find_many``/``locate``: the batch searches, on parsed keys and on strings.
+
+It then forks workers that each touch the whole table and reports how much
+of it they hold privately: the mapping is shared, so next to nothing.
+
+    python benchmarks/bench_ip_intel.py --ranges 1000000 --ipv6-ranges 200000
+    python benchmarks/bench_ip_intel.py --table /app/models/ip_intel.bin
+"""
+import os
+import sys
+import csv
+import json
+import time
+import bisect
+import random
+import tempfile
+import argparse
+import ipaddress
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ip_intel import IpIntelTable, build  # noqa: E402
+from prefork import memory_usage  # noqa: E402
+
+COUNTRIES = ["US", "DE", "FR", "GB", "NL", "RU", "CN", "BR", "IN", "AU"]
+
+
+def write_ranges(path: str, ipv4: int, ipv6: int, rng: random.Random):
+    """CSV of ``ipv4`` and ``ipv6`` random disjoint ranges, as start_ip,end_ip integers"""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["start_ip", "end_ip", "country", "latitude", "longitude", "asn", "hosting", "vpn"])
+        for count, low, high in ((ipv4, 0, 2 ** 32), (ipv6, 2 ** 125, 2 ** 126)):
+            bounds = set()
+            while len(bounds) < 2 * count:
+                bounds.add(rng.randrange(low, high))
+            bounds = sorted(bounds)
+            for start, end in zip(bounds[::2], bounds[1::2]):
+                writer.writerow([start, end, rng.choice(COUNTRIES), round(rng.uniform(-90, 90), 3),
+                                 round(rng.uniform(-180, 180), 3), rng.randint(1, 400000),
+                                 int(rng.random() < 0.1), int(rng.random() < 0.05)])
+
+
+def sample_addresses(table: IpIntelTable, count: int, rng: np.random.Generator) -> Dict[str, List[str]]:
+    """Addresses to look up, half inside a table range and half anywhere"""
+    samples = {}
+    for family, section, address in (("ipv4", table.ipv4, ipaddress.IPv4Address),
+                                     ("ipv6", table.ipv6, ipaddress.IPv6Address)):
+        if not len(section):
+            continue
+        rows = rng.integers(0, len(section), count)
+        numbers = []
+        starts, ends = bounds(section, family)
+        for i, row in enumerate(rows.tolist()):
+            start, end = starts[row], ends[row]
+            inside = start + int(rng.integers(0, min(end - start, 2 ** 62) + 1))
+            numbers.append(inside if i % 2 else int(rng.integers(0, 2 ** 32)) << (0 if family == "ipv4" else 94))
+        samples[family] = [str(address(number)) for number in numbers]
+    return samples
+
+
+def bounds(section, family: str) -> List[List[int]]:
+    """The range starts and ends as Python ints"""
+    if family == "ipv4":
+        return [section.start.tolist(), section.end.tolist()]
+    return [[int.from_bytes(bytes(key).ljust(16, b"\0"), "big") for key in column] for column in (section.start, section.end)]
+
+
+def reference_rows(starts: List[int], ends: List[int], numbers: List[int]) -> List[int]:
+    """Table rows by a plain bisect over the range bounds"""
+    rows = []
+    for number in numbers:
+        i = bisect.bisect_right(starts, number) - 1
+        rows.append(i if i >= 0 and number <= ends[i] else -1)
+    return rows
+
+
+def per_lookup_ns(fn, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return round(best / count * 1e9, 1)
+
+
+def private_bytes_touching(table: IpIntelTable, workers: int) -> List[int]:
+    """Private memory each forked worker gains by searching the whole table"""
+    results = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            before = memory_usage().get("private", 0)
+            for section in (table.ipv4, table.ipv6):
+                for column in (section.start, section.end, section.country, section.latitude, section.longitude):
+                    int(np.asarray(column).view(np.uint8).sum())
+            os.write(write, str(memory_usage().get("private", 0) - before).encode())
+            os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as f:
+            results.append(int(f.read() or 0))
+        os.waitpid(pid, 0)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", help="Benchmark this table instead of a synthetic one")
+    parser.add_argument("--ranges", type=int, default=1_000_000, help="Synthetic IPv4 ranges")
+    parser.add_argument("--ipv6-ranges", type=int, default=200_000, help="Synthetic IPv6 ranges")
+    parser.add_argument("--lookups", type=int, default=100_000, help="Addresses looked up per family")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2, help="Forked workers for the sharing check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.table
+        if path is None:
+            path = os.path.join(directory, "ip_intel.bin")
+            source = os.path.join(directory, "ranges.csv")
+            write_ranges(source, args.ranges, args.ipv6_ranges, random.Random(args.seed))
+            started = time.perf_counter()
+            build(source, path)
+            results["build_seconds"] = round(time.perf_counter() - started, 2)
+        started = time.perf_counter()
+        table = IpIntelTable.open(path)
+        results["open_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        results["table"] = {**table.stats(), "file_bytes": os.path.getsize(path)}
+
+        samples = sample_addresses(table, args.lookups, np.random.default_rng(args.seed))
+        for family, addresses in samples.items():
+            section = table.ipv4 if family == "ipv4" else table.ipv6
+            numbers = [int(ipaddress.ip_address(address)) for address in addresses]
+            keys = numbers if family == "ipv4" else [number.to_bytes(16, "big") for number in numbers]
+            packed = np.array(keys, dtype=section.start.dtype)
+
+            expected = reference_rows(*bounds(section, family), numbers)
+            scalar = [section.find(key) for key in keys]
+            batch = table.locate(addresses)[0 if family == "ipv4" else 1].tolist()
+            if not scalar == batch == section.find_many(packed).tolist() == expected:
+                raise SystemExit(f"{family} lookups disagree with the reference search")
+
+            n = len(addresses)
+            results[family] = {
+                "lookups": n,
+                "hit_rate": round(sum(row >= 0 for row in expected) / n, 3),
+                "ns_per_lookup": {
+                    "find": per_lookup_ns(lambda: [section.find(key) for key in keys], n, args.repeat),
+                    "lookup": per_lookup_ns(lambda: [table.lookup(a) for a in addresses], n, args.repeat),
+                    "geo_features": per_lookup_ns(lambda: [table.geo_features(a) for a in addresses], n, args.repeat),
+                    "find_many": per_lookup_ns(lambda: section.find_many(packed), n, args.repeat),
+                    "locate": per_lookup_ns(lambda: table.locate(addresses), n, args.repeat),
+                },
+            }
+        if hasattr(os, "fork"):
+            results["worker_private_bytes"] = private_bytes_touching(table, args.workers)
+
+    print(f"table: {results['table']['ipv4_ranges']} IPv4 + {results['table']['ipv6_ranges']} IPv6 ranges, "
+          f"{results['table']['file_bytes'] / 2 ** 20:.1f} MiB, opened in {results['open_ms']} ms"
+          + (f", built in {results['build_seconds']} s" if "build_seconds" in results else ""))
+    print(f"{'family':<8}{'hit rate':>9}" + "".join(f"{name:>14}" for name in results.get("ipv4", results.get("ipv6", {}))
+                                                     .get("ns_per_lookup", {})) + "   (ns per lookup)")
+    for family in ("ipv4", "ipv6"):
+        if family in results:
+            row = results[family]
+            print(f"{family:<8}{row['hit_rate']:>9.3f}" + "".join(f"{value:>14.1f}" for value in row["ns_per_lookup"].values()))
+    if "worker_private_bytes" in results:
+        print(f"private bytes per worker after touching the whole table: {results['worker_private_bytes']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
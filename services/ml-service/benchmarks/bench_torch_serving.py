@@ -0,0 +1,64 @@
+"""Benchmark the PyTorch serving modes on CPU.
+
+Builds the eager, optimized (BatchNorm folded + TorchScript) and quantized
+(dynamic int8) variants of DeviceFingerprintNet and BehavioralLSTM (loaded
+from MODEL_PATH, or the seeded fallbacks), and reports the drift from the
+eager model plus per-batch latency and throughput.
+
+    python benchmarks/bench_torch_serving.py --sizes 1 32 256 --threads 1
+"""
+import os
+import sys
+import time
+import argparse
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app import BehavioralLSTM, DeviceFingerprintNet, load_torch_model  # noqa: E402
+from torch_serving import SERVING_MODES, max_drift, prepare_serving_model  # noqa: E402
+
+
+def latency_ms(model, inputs: torch.Tensor, repeat: int) -> float:
+    """Median latency of ``repeat`` forward passes, in milliseconds"""
+    timings = []
+    with torch.inference_mode():
+        model(inputs)  # warm-up (TorchScript profiles the first calls)
+        model(inputs)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            model(inputs)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 32, 256])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    device_model, _, _ = load_torch_model('device_fingerprint', 'device_fingerprint.pth', DeviceFingerprintNet)
+    lstm_model, _, _ = load_torch_model('behavioral_lstm', 'behavioral_lstm.pth', BehavioralLSTM)
+    generator = torch.Generator().manual_seed(0)
+    inputs = {
+        'device_fingerprint': lambda n: device_model.example_input(n, generator),
+        'behavioral_lstm': lambda n: torch.randn(n, 10, lstm_model.lstm.input_size, generator=generator),
+    }
+
+    print(f"{'model':<20}{'mode':<11}{'batch':>7}{'latency ms':>13}{'rows/s':>12}{'drift':>11}")
+    for name, model in (('device_fingerprint', device_model), ('behavioral_lstm', lstm_model)):
+        check_inputs = inputs[name](256)
+        for mode in SERVING_MODES:
+            candidate, report = prepare_serving_model(name, model, check_inputs, mode, tolerance=float("inf"))
+            drift = max_drift(model, candidate, check_inputs)
+            for size in args.sizes:
+                ms = latency_ms(candidate, inputs[name](size), args.repeat)
+                print(f"{name:<20}{report['mode']:<11}{size:>7}{ms:>13.3f}{size / ms * 1000:>12.0f}{drift:>11.1e}")
+
+
+if __name__ == "__main__":
+    main()
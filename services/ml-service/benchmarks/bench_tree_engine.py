@@ -0,0 +1,60 @@
+"""Benchmark the compiled tree-ensemble evaluator against sklearn.
+
+Scores the service's IP/URL RandomForests and the IsolationForest (loaded
+from MODEL_PATH, or the seeded fallbacks) at several batch sizes, checks the
+compiled outputs against sklearn and prints per-batch latency and speedup.
+
+    python benchmarks/bench_tree_engine.py --sizes 1 10 100 1000 10000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app import load_anomaly_model, load_classifier  # noqa: E402
+from tree_engine import compile_model, max_deviation  # noqa: E402
+
+
+def best_time(fn, repeat: int) -> float:
+    """Best wall-clock time of ``repeat`` calls, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ip_model, _, _ = load_classifier('ip_reputation', 12)
+    url_model, _, _ = load_classifier('url_analysis', 14)
+    anomaly_model, _, _ = load_anomaly_model()
+    rng = np.random.RandomState(0)
+
+    print(f"{'model':<20}{'batch':>8}{'sklearn ms':>14}{'compiled ms':>14}{'speedup':>10}{'max dev':>12}")
+    for name, model in (('ip_reputation', ip_model), ('url_analysis', url_model), ('anomaly_detection', anomaly_model)):
+        compiled = compile_model(model)
+        if name == 'anomaly_detection':
+            sklearn_fn = lambda X: (model.decision_function(X), model.predict(X))
+        else:
+            sklearn_fn = lambda X: (model.predict_proba(X), model.predict(X))
+
+        for size in args.sizes:
+            X = rng.randn(size, model.n_features_in_).astype(np.float32)
+            deviation = max_deviation(compiled, model, X)
+            sklearn_ms = best_time(lambda: sklearn_fn(X), args.repeat)
+            compiled_ms = best_time(lambda: compiled.predict(X), args.repeat)
+            print(f"{name:<20}{size:>8}{sklearn_ms:>14.3f}{compiled_ms:>14.3f}"
+                  f"{sklearn_ms / compiled_ms:>9.1f}x{deviation:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
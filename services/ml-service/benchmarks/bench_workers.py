@@ -0,0 +1,168 @@
+"""Benchmark pre-fork serving: throughput and per-worker memory by SERVING_WORKERS.
+
+Starts the service (src/app.py) once per worker count and drives
+/api/analyze over HTTP from separate client processes with unique requests,
+so every request misses the caches and runs the models. Reports requests/s,
+the speed-up over one worker, and each worker's RSS, PSS (shared pages
+split between the processes sharing them) and private memory from /proc;
+PSS and private memory staying flat as workers are added is the
+copy-on-write sharing of the parent's models.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --requests 3000 --clients 4
+
+Redis is not needed: without it the service caches locally only. The
+clients share the machine with the server, so leave them cores of their
+own (or point --url at a server started elsewhere and pass one worker count).
+"""
+import os
+import sys
+import time
+import json
+import random
+import signal
+import asyncio
+import argparse
+import subprocess
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from report import latency_stats  # noqa: E402
+from workload import sample_requests  # noqa: E402
+
+SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app.py")
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    """RSS, PSS and private memory of ``pid`` in MiB"""
+    fields = {"Rss:": "rss", "Pss:": "pss", "Private_Clean:": "private", "Private_Dirty:": "private"}
+    usage: Dict[str, float] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            name = fields.get(parts[0]) if parts else None
+            if name is not None:
+                usage[name] = usage.get(name, 0.0) + int(parts[1]) / 1024
+    return {name: round(value, 1) for name, value in usage.items()}
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+async def drive(url: str, payloads: List[Dict[str, Any]], concurrency: int) -> List[Any]:
+    import httpx
+    samples: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            payload = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post("/api/analyze", json=payload)
+            samples.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return [samples, errors]
+
+
+def client_process(args) -> List[Any]:
+    url, payloads, concurrency = args
+    return asyncio.run(drive(url, payloads, concurrency))
+
+
+def wait_ready(url: str, timeout: float) -> None:
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def run(workers: int, args: argparse.Namespace, payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    env = dict(os.environ, SERVING_WORKERS=str(workers), SERVING_PORT=str(args.port))
+    env.setdefault("REDIS_URL", "redis://127.0.0.1:1")
+    url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, SERVICE], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url, args.startup_timeout)
+        time.sleep(1.0)  # let every worker finish its own warm-up
+        # Warm each worker's connection and executor outside the timed run
+        asyncio.run(drive(url, payloads[:args.clients * args.concurrency], args.concurrency))
+
+        timed = payloads[args.clients * args.concurrency:]
+        shares = [(url, timed[i::args.clients], args.concurrency) for i in range(args.clients)]
+        started = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            results = pool.map(client_process, shares)
+        elapsed = time.perf_counter() - started
+
+        samples = [sample for result in results for sample in result[0]]
+        worker_pids = children(server.pid) if workers > 1 else [server.pid]
+        return {
+            "workers": workers,
+            "requests": len(samples),
+            "errors": sum(result[1] for result in results),
+            "requests_per_second": round(len(samples) / elapsed, 1),
+            "latency_ms": latency_stats(samples),
+            "parent_memory_mb": memory_mb(server.pid) if workers > 1 else None,
+            "worker_memory_mb": [memory_mb(pid) for pid in worker_pids],
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=3000, help="Requests per worker count")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight per client process")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for workers in args.workers:
+        # A fresh request stream per run, so no run is served from an earlier run's Redis entries
+        payloads = sample_requests(args.requests, rng=random.Random(f"{args.seed}:{workers}"))
+        rows.append(run(workers, args, payloads))
+
+    base = rows[0]["requests_per_second"] / rows[0]["workers"]
+    print(f"cpus={os.cpu_count()}")
+    print(f"{'workers':>7}{'req/s':>10}{'per worker':>12}{'scaling':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'rss MB':>9}{'pss MB':>9}{'priv MB':>9}")
+    for row in rows:
+        memory = row["worker_memory_mb"]
+        mean = {name: sum(m.get(name, 0.0) for m in memory) / len(memory) for name in ("rss", "pss", "private")}
+        per_worker = row["requests_per_second"] / row["workers"]
+        print(f"{row['workers']:>7}{row['requests_per_second']:>10.1f}{per_worker:>12.1f}{per_worker / base:>9.0%}"
+              f"{row['latency_ms']['p50']:>9.1f}{row['latency_ms']['p95']:>9.1f}"
+              f"{mean['rss']:>9.1f}{mean['pss']:>9.1f}{mean['private']:>9.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Load tests of /api/analyze and /api/analyze/batch against the in-process app.
+
+The app runs through its own startup/shutdown with Redis replaced by
+fakeredis and is driven over httpx's ASGI transport, so the numbers cover
+routing, validation, caching and inference but no network.
+"""
+import time
+import asyncio
+import random
+from typing import Any, Dict, List
+
+import app
+from report import latency_stats, memory_stats
+from workload import sample_requests
+
+# Distinct requests the cache-hit scenario cycles over
+HIT_WORKING_SET = 50
+
+
+def use_fake_redis() -> None:
+    import fakeredis
+    app.create_redis_client = lambda: fakeredis.FakeAsyncRedis()
+
+
+async def drive(client, path: str, payloads: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    """POST every payload with at most ``concurrency`` in flight"""
+    samples: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async def worker():
+        while not queue.empty():
+            payload = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                status = str((await client.post(path, json=payload)).status_code)
+            except Exception as e:
+                status = type(e).__name__
+            samples.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"elapsed": time.perf_counter() - started, "samples": samples, "statuses": statuses}
+
+
+def entry(run: Dict[str, Any], items: int, concurrency: int, batch_size: int) -> Dict[str, Any]:
+    elapsed = run["elapsed"]
+    return {
+        "kind": "load",
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "throughput": round(items / elapsed, 1) if elapsed > 0 else 0.0,
+        "throughput_unit": "items/s",
+        "requests_per_second": round(len(run["samples"]) / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": latency_stats(run["samples"]),
+        "statuses": run["statuses"],
+        "errors": sum(count for status, count in run["statuses"].items() if status != "200"),
+        "memory": memory_stats(),
+    }
+
+
+async def run_load(requests: int, concurrency: int, batch_size: int, seed: int,
+                   repeat_ratio: float) -> Dict[str, Dict[str, Any]]:
+    import httpx
+    use_fake_redis()
+    rng = random.Random(seed)
+    # Separate streams so the batch scenario doesn't start from the single scenario's cache
+    singles = sample_requests(requests, repeat_ratio=repeat_ratio, rng=random.Random(rng.random()))
+    batches = sample_requests(requests, repeat_ratio=repeat_ratio, rng=random.Random(rng.random()))
+    batch_payloads = [{"requests": batches[i:i + batch_size]} for i in range(0, len(batches), batch_size)]
+
+    results = {}
+    async with app.app.router.lifespan_context(app.app):
+        while not app.service_ready:
+            await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            run = await drive(client, "/api/analyze", singles, concurrency)
+            results[f"load/analyze/c={concurrency}"] = entry(run, len(singles), concurrency, 1)
+
+            # Cache hits only: requests cycling over a working set the first scenario already cached
+            hits = [singles[i % HIT_WORKING_SET] for i in range(requests)]
+            run = await drive(client, "/api/analyze", hits, concurrency)
+            results[f"load/analyze_hits/c={concurrency}"] = entry(run, len(hits), concurrency, 1)
+
+            run = await drive(client, "/api/analyze/batch", batch_payloads, concurrency)
+            results[f"load/batch/c={concurrency},n={batch_size}"] = entry(run, len(batches), concurrency, batch_size)
+    return results
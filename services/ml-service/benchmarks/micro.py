@@ -0,0 +1,88 @@
+"""Microbenchmarks: every feature extractor and every model scorer at fixed batch sizes"""
+import time
+import random
+from typing import Any, Callable, Dict, List, Sequence
+import numpy as np
+
+import app
+from features import (
+    behavioral_event, behavioral_sequence, combined_anomaly_features, extract_device_features, extract_ip_features,
+    extract_ip_features_batch, extract_url_features, extract_url_features_batch,
+)
+from online_anomaly import anomaly_scoring_row
+from report import latency_stats, memory_stats
+from workload import sample_device, sample_ip, sample_session, sample_url
+
+
+def time_calls(fn: Callable[[], Any], repeat: int) -> List[float]:
+    """Durations of ``repeat`` calls after one warm-up call, in seconds"""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def model_inputs(ips: List[str], urls: List[str], devices: List[Dict[str, Any]],
+                 sessions: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Realistic input rows for every model, built with the service's extractors"""
+    ip_rows = extract_ip_features_batch(ips)
+    device_rows = np.stack([extract_device_features(device) for device in devices])
+    return {
+        'ip_reputation': ip_rows,
+        'url_analysis': extract_url_features_batch(urls),
+        'device_fingerprint': device_rows,
+        'behavioral_lstm': np.stack([behavioral_sequence(session) for session in sessions]),
+        # Fresh sessions (zero state); a step costs the same whatever the state holds
+        'behavioral_step': np.stack([
+            app.behavioral_step_row(behavioral_event(session), None, app.active_bundle) for session in sessions
+        ]),
+        # No input type: the Isolation Forest path, leaving the streaming baselines untouched
+        # (benchmarks/bench_anomaly.py measures those)
+        'anomaly_detection': np.stack([
+            anomaly_scoring_row(combined_anomaly_features(ip, device), None) for ip, device in zip(ip_rows, device_rows)
+        ]),
+    }
+
+
+def run_micro(sizes: Sequence[int], repeat: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    rng = random.Random(seed)
+    largest = max(sizes)
+    ips = [sample_ip(rng) for _ in range(largest)]
+    urls = [sample_url(rng) for _ in range(largest)]
+    devices = [sample_device(rng) for _ in range(largest)]
+    sessions = [sample_session(rng) for _ in range(largest)]
+    rows = model_inputs(ips, urls, devices, sessions)
+
+    benchmarks: Dict[str, Callable[[int], Callable[[], Any]]] = {
+        'extract.ip': lambda n: lambda: [extract_ip_features(ip) for ip in ips[:n]],
+        'extract.ip_batch': lambda n: lambda: extract_ip_features_batch(ips[:n]),
+        'extract.url': lambda n: lambda: [extract_url_features(url) for url in urls[:n]],
+        'extract.url_batch': lambda n: lambda: extract_url_features_batch(urls[:n]),
+        'extract.device': lambda n: lambda: [extract_device_features(device) for device in devices[:n]],
+        'extract.behavioral': lambda n: lambda: [behavioral_sequence(session) for session in sessions[:n]],
+    }
+    for model_name, scorer in app.BATCH_SCORERS.items():
+        benchmarks[f'model.{model_name}'] = lambda n, scorer=scorer, X=rows[model_name]: lambda: scorer(X[:n])
+
+    results = {}
+    for name, make in benchmarks.items():
+        for size in sizes:
+            try:
+                samples = time_calls(make(size), repeat)
+            except Exception as e:
+                # Recorded rather than fatal; the service itself falls back on scorer errors
+                results[f"micro/{name}/{size}"] = {"kind": "micro", "batch_size": size, "error": str(e)}
+                continue
+            stats = latency_stats(samples)
+            results[f"micro/{name}/{size}"] = {
+                "kind": "micro",
+                "batch_size": size,
+                "throughput": round(size / (stats["p50"] / 1000), 1) if stats["p50"] else 0.0,
+                "throughput_unit": "rows/s",
+                "latency_ms": stats,
+                "memory": memory_stats(),
+            }
+    return results
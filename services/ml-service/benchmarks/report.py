@@ -0,0 +1,147 @@
+"""Statistics, result files and regression checks for the benchmark suite"""
+import os
+import sys
+import json
+import platform
+import resource
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+import numpy as np
+
+# Metrics checked against the baseline; (name, True if higher is better)
+GATED_METRICS = (("throughput", True), ("latency_ms.p50", False), ("latency_ms.p95", False))
+
+# Latency differences below this are treated as timer noise
+NOISE_FLOOR_MS = 0.05
+
+# Settings that change what is being measured, recorded with every run
+CONFIG_ENV = (
+    "MODEL_PATH", "TREE_ENGINE", "TREE_ENGINE_MAX_ROWS", "TORCH_SERVING_MODE", "INFERENCE_BACKEND",
+    "INFERENCE_WORKERS", "TORCH_NUM_THREADS", "BATCHING_ENABLED", "SUBRESULT_CACHE_ENABLED", "IP_INTEL_PATH",
+)
+
+
+def latency_stats(samples_s: Sequence[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    if not len(samples_s):
+        return {"count": 0}
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": int(ms.size),
+        "mean": round(float(ms.mean()), 4),
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(ms.max()), 4),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size in MiB (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def memory_stats() -> Dict[str, float]:
+    return {"rss_mb": round(rss_mb(), 1), "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Where and how a run was taken, so results are only compared like for like"""
+    import torch
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "env": {name: os.environ[name] for name in CONFIG_ENV if name in os.environ},
+        "args": args,
+    }
+
+
+def save(path: str, run: Dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2, sort_keys=True)
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def metric(entry: Dict[str, Any], name: str) -> Any:
+    value: Any = entry
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Gated metrics of benchmarks present in both runs, flagged when worse than ``threshold``"""
+    rows = []
+    for name, entry in current["results"].items():
+        base_entry = baseline.get("results", {}).get(name)
+        if base_entry is None:
+            continue
+        for metric_name, higher_is_better in GATED_METRICS:
+            value, base = metric(entry, metric_name), metric(base_entry, metric_name)
+            if value is None or base is None or base == 0:
+                continue
+            change = (value - base) / base
+            worse = -change if higher_is_better else change
+            noise = not higher_is_better and abs(value - base) < NOISE_FLOOR_MS
+            rows.append({
+                "benchmark": name,
+                "metric": metric_name,
+                "baseline": base,
+                "current": value,
+                "change": round(change, 4),
+                "regression": worse > threshold and not noise,
+            })
+    return rows
+
+
+def print_results(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'benchmark':<48}{'throughput':>14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>9}")
+    for name, entry in results.items():
+        if "error" in entry:
+            print(f"{name:<48}  failed: {entry['error']}")
+            continue
+        latency = entry.get("latency_ms", {})
+        print(f"{name:<48}{entry.get('throughput', 0):>14,.0f}{latency.get('p50', 0):>10.3f}"
+              f"{latency.get('p95', 0):>10.3f}{latency.get('p99', 0):>10.3f}"
+              f"{entry.get('memory', {}).get('rss_mb', 0):>9.0f}")
+
+
+def print_comparison(rows: List[Dict[str, Any]], threshold: float) -> None:
+    print(f"\nComparison with baseline (regression threshold {threshold:.0%})")
+    print(f"{'benchmark':<48}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>9}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['benchmark']:<48}{row['metric']:<16}{row['baseline']:>12.3f}{row['current']:>12.3f}"
+              f"{row['change']:>+9.1%}{flag}")
@@ -0,0 +1,74 @@
+"""Reproducible benchmark suite: extractor/model microbenchmarks plus in-process load tests.
+
+Workloads are generated from a fixed seed, results (throughput, p50/p95/p99
+latency, memory and the run's environment) are written as JSON, and a
+previous results file can be given as a baseline: the run exits non-zero if
+any shared benchmark's throughput or p50/p95 latency got worse by more than
+--threshold.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --output current.json --baseline baseline.json --threshold 0.15
+
+Only compare runs taken on the same machine with the same settings; the
+environment block of each results file records both.
+"""
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import report  # noqa: E402
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Allowed relative slowdown before a benchmark counts as regressed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000], help="Microbenchmark batch sizes")
+    parser.add_argument("--repeat", type=int, default=30, help="Timed calls per microbenchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per load scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=50, help="Requests per /api/analyze/batch call")
+    parser.add_argument("--repeat-ratio", type=float, default=0.2,
+                        help="Share of load requests that repeat an earlier one (cache hits)")
+    args = parser.parse_args(argv)
+
+    import app
+    from micro import run_micro
+    from load import run_load
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    if not args.skip_micro:
+        asyncio.run(app.load_models())
+        results.update(run_micro(args.sizes, args.repeat, args.seed))
+    if not args.skip_load:
+        results.update(asyncio.run(run_load(args.requests, args.concurrency, args.batch_size, args.seed,
+                                            args.repeat_ratio)))
+
+    run = {"meta": report.environment(vars(args)), "results": results}
+    report.save(args.output, run)
+    report.print_results(results)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        rows = report.compare(run, report.load(args.baseline), args.threshold)
+        report.print_comparison(rows, args.threshold)
+        regressions = [row for row in rows if row["regression"]]
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Seeded synthetic analysis requests shared by the micro and load benchmarks"""
+import random
+from typing import Any, Dict, List, Optional
+
+URL_WORDS = ["login", "secure", "account", "bank", "paypal", "update", "verify", "cdn", "static", "api"]
+URL_TLDS = ["com", "net", "org", "io", "co.uk", "ru"]
+PLATFORMS = ["Win32", "MacIntel", "Linux x86_64", "iPhone"]
+
+
+def sample_ip(rng: random.Random) -> str:
+    return ".".join(str(rng.randint(0, 255)) for _ in range(4))
+
+
+def sample_url(rng: random.Random) -> str:
+    host = ".".join(rng.choice(URL_WORDS) + str(rng.randint(0, 99)) for _ in range(rng.randint(1, 3)))
+    path = "/".join(rng.choice(URL_WORDS) for _ in range(rng.randint(0, 4)))
+    query = f"?id={rng.randint(0, 10 ** 6)}&ref={rng.choice(URL_WORDS)}" if rng.random() < 0.5 else ""
+    scheme = rng.choice(["https://", "http://", ""])
+    return f"{scheme}{host}.{rng.choice(URL_TLDS)}/{path}{query}"
+
+
+def sample_email(rng: random.Random) -> str:
+    return f"user{rng.randint(0, 10 ** 6)}@{rng.choice(URL_WORDS)}{rng.randint(0, 99)}.{rng.choice(URL_TLDS)}"
+
+
+def sample_device(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "screen": {"width": rng.choice([1280, 1920, 2560, 390]), "height": rng.choice([720, 1080, 1440, 844]),
+                   "colorDepth": 24, "pixelRatio": rng.choice([1.0, 2.0, 3.0])},
+        "userAgent": "Mozilla/5.0 " + "x" * rng.randint(20, 120),
+        "language": rng.choice(["en-US", "de-DE", "fr-FR"]),
+        "platform": rng.choice(PLATFORMS),
+        "cookieEnabled": 1,
+        "plugins": [f"plugin{i}" for i in range(rng.randint(0, 5))],
+        "fonts": [f"font{i}" for i in range(rng.randint(0, 20))],
+        "timezone": rng.randint(-12, 12),
+    }
+
+
+def sample_session(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "session_duration": rng.randint(1, 3600),
+        "page_views": rng.randint(1, 50),
+        "clicks": rng.randint(0, 200),
+        "scroll_depth": rng.random(),
+        "typing_speed": rng.random() * 10,
+    }
+
+
+def sample_requests(count: int, seed: int = 0, device_ratio: float = 0.3, session_ratio: float = 0.2,
+                    repeat_ratio: float = 0.0, rng: Optional[random.Random] = None) -> List[Dict[str, Any]]:
+    """ThreatAnalysisRequest payloads; ``repeat_ratio`` of them repeat an earlier payload (cache hits)"""
+    rng = rng or random.Random(seed)
+    samplers = {"ip": sample_ip, "url": sample_url, "email": sample_email}
+    requests: List[Dict[str, Any]] = []
+    for _ in range(count):
+        if requests and rng.random() < repeat_ratio:
+            requests.append(rng.choice(requests))
+            continue
+        input_type = rng.choice(list(samplers))
+        request: Dict[str, Any] = {"input_value": samplers[input_type](rng), "input_type": input_type}
+        if rng.random() < device_ratio:
+            request["device_fingerprint"] = sample_device(rng)
+        if rng.random() < session_ratio:
+            request["session_data"] = sample_session(rng)
+        requests.append(request)
+    return requests
@@ -0,0 +1,239 @@
+"""Admission control for the analysis endpoints.
+
+At most ``max_in_flight`` analysis requests run at once and at most
+``max_queue`` wait for a slot, in arrival order. A request arriving at a
+full queue, or one that has waited ``max_wait_ms`` without getting a slot,
+is shed with 429 and a ``Retry-After`` estimated from the queue ahead of
+it, so callers back off instead of timing out on an ever longer queue.
+
+The middleware admits requests before their bodies are parsed, so a shed
+request costs next to nothing. While a request waits it keeps reading the
+ASGI channel (buffering the body for the app); a client that disconnects
+while queued is dropped without its analysis ever starting. Paths not
+listed (``/health``, ``/ready``, ``/metrics``, ...) are never queued.
+"""
+import os
+import math
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional
+from starlette.responses import JSONResponse
+from metrics import REGISTRY, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of queued"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Service overloaded ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(Exception):
+    """Raised when a queued request's client goes away before it is admitted"""
+
+
+@dataclass
+class AdmissionConfig:
+    """In-flight and queue limits for the analysis endpoints"""
+    enabled: bool = True
+    max_in_flight: int = 64
+    max_queue: int = 256
+    # Longest a request may wait for a slot; 0 waits as long as it takes
+    max_wait_ms: float = 5000.0
+    min_retry_after_seconds: int = 1
+    max_retry_after_seconds: int = 30
+
+    @classmethod
+    def from_env(cls) -> "AdmissionConfig":
+        min_retry_after = max(1, int(os.getenv("ADMISSION_MIN_RETRY_AFTER_SECONDS", cls.min_retry_after_seconds)))
+        return cls(
+            enabled=os.getenv("ADMISSION_ENABLED", "true").lower() == "true",
+            max_in_flight=max(1, int(os.getenv("ADMISSION_MAX_IN_FLIGHT", cls.max_in_flight))),
+            max_queue=max(0, int(os.getenv("ADMISSION_MAX_QUEUE", cls.max_queue))),
+            max_wait_ms=max(0.0, float(os.getenv("ADMISSION_MAX_WAIT_MS", cls.max_wait_ms))),
+            min_retry_after_seconds=min_retry_after,
+            max_retry_after_seconds=max(min_retry_after, int(os.getenv(
+                "ADMISSION_MAX_RETRY_AFTER_SECONDS", cls.max_retry_after_seconds
+            ))),
+        )
+
+
+# Queue wait buckets in seconds (0.1ms .. 30s)
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+WAIT_SECONDS = REGISTRY.register(Histogram(
+    "sureguard_ml_admission_wait_seconds", "Time admitted requests waited for an analysis slot", buckets=WAIT_BUCKETS
+))
+
+
+class AdmissionController:
+    """FIFO limiter with a bounded wait queue.
+
+    ``acquire()`` returns once the caller holds a slot, which it gives back
+    with ``release()``; a released slot goes straight to the longest-waiting
+    request. ``shed=False`` callers (stream chunks, already flow-controlled
+    by their stream) wait without the queue bound or wait limit applying.
+    """
+
+    def __init__(self, config: Optional[AdmissionConfig] = None):
+        self.config = config or AdmissionConfig()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.released = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self.disconnected = 0
+        self.total_wait_ms = 0.0
+        self.total_hold_ms = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request has likely drained"""
+        config = self.config
+        avg_hold = self.total_hold_ms / self.released / 1000 if self.released else 0.0
+        estimate = math.ceil(avg_hold * (self.queued + 1) / config.max_in_flight)
+        return min(config.max_retry_after_seconds, max(config.min_retry_after_seconds, estimate))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(reason, self.retry_after())
+
+    def _admitted(self, enqueued: float) -> float:
+        admitted_at = time.perf_counter()
+        self.admitted += 1
+        self.total_wait_ms += (admitted_at - enqueued) * 1000
+        WAIT_SECONDS.observe(admitted_at - enqueued)
+        return admitted_at
+
+    async def acquire(self, wait_disconnect: Optional[Callable[[], Awaitable[Any]]] = None,
+                      shed: bool = True) -> float:
+        """Wait for a slot; returns the ``time.perf_counter()`` it was granted at.
+
+        Raises AdmissionRejected when the request is shed, or
+        ClientDisconnected when ``wait_disconnect()`` completes first.
+        """
+        config = self.config
+        enqueued = time.perf_counter()
+        if self.in_flight < config.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return self._admitted(enqueued)
+        if shed and len(self._waiters) >= config.max_queue:
+            raise self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        waits = [waiter]
+        disconnect = None
+        if wait_disconnect is not None:
+            disconnect = asyncio.ensure_future(wait_disconnect())
+            waits.append(disconnect)
+        timeout = config.max_wait_ms / 1000 if shed and config.max_wait_ms > 0 else None
+        try:
+            await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            self._leave(waiter)
+            raise
+        finally:
+            if disconnect is not None and not disconnect.done():
+                disconnect.cancel()
+        if disconnect is not None and disconnect.done():
+            self._leave(waiter)
+            self.disconnected += 1
+            raise ClientDisconnected()
+        if not waiter.done():
+            self._leave(waiter)
+            raise self._reject("queue_timeout")
+        return self._admitted(enqueued)
+
+    def release(self, admitted_at: float) -> None:
+        """Give back a slot taken by ``acquire()``"""
+        self.released += 1
+        self.total_hold_ms += (time.perf_counter() - admitted_at) * 1000
+        self._hand_over()
+
+    def _hand_over(self) -> None:
+        # The slot stays in flight when it goes to a waiter
+        if self._waiters:
+            self._waiters.popleft().set_result(None)
+        else:
+            self.in_flight -= 1
+
+    def _leave(self, waiter: asyncio.Future) -> None:
+        """Take a waiter out of the queue, passing on a slot it was already handed"""
+        if waiter.done():
+            self._hand_over()
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.config.enabled,
+            "max_in_flight": self.config.max_in_flight,
+            "max_queue": self.config.max_queue,
+            "max_wait_ms": self.config.max_wait_ms,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "disconnected": self.disconnected,
+            "avg_wait_ms": self.total_wait_ms / self.admitted if self.admitted else 0.0,
+            "avg_hold_ms": self.total_hold_ms / self.released if self.released else 0.0,
+            "retry_after_seconds": self.retry_after(),
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware putting requests to ``paths`` through an AdmissionController.
+
+    Shed requests get 429 with ``Retry-After``; requests whose client
+    disconnected while queued get no response at all.
+    """
+
+    def __init__(self, app: Any, controller: AdmissionController, paths: Iterable[str]):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not self.controller.config.enabled or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # Messages read while queued, replayed to the app once admitted
+        buffered: List[Dict[str, Any]] = []
+
+        async def wait_disconnect() -> None:
+            while True:
+                message = await receive()
+                buffered.append(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def replay() -> Dict[str, Any]:
+            return buffered.pop(0) if buffered else await receive()
+
+        try:
+            admitted_at = await self.controller.acquire(wait_disconnect)
+        except AdmissionRejected as e:
+            logger.warning(f"Shed {scope['path']}: {e}")
+            response = JSONResponse({"detail": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        except ClientDisconnected:
+            logger.info(f"Dropped {scope['path']}: client disconnected while queued")
+            return
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            self.controller.release(admitted_at)
@@ -2,27 +2,66 @@ import os
 import json
 import asyncio
 import logging
+import hashlib
+import threading
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from functools import wraps
+from typing import Dict, List, Optional, Any, Tuple
+
+_import_started = time.perf_counter()
+
 import numpy as np
-import pandas as pd
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
+from pydantic_core import to_json
 import redis.asyncio as redis
-import tensorflow as tf
 import joblib
-from sklearn.ensemble import IsolationForest, RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
 import torch
 import torch.nn as nn
-from transformers import AutoTokenizer, AutoModel
 import uvicorn
+from admission import AdmissionConfig, AdmissionController, AdmissionMiddleware
+from batching import BatchingConfig, MicroBatcher
+from executor import ExecutorConfig, ExecutorSaturated, InferenceExecutor
+from cache import RedisBackend, RedisCacheConfig, TieredCache, stable_digest
+from tree_engine import compile_model, max_deviation
+from torch_serving import prepare_serving_model
+from features import (
+    ANOMALY_FEATURES, DEVICE_DENSE_FEATURES, DEVICE_HASH_BUCKETS, DEVICE_TOKEN_SLOTS, RequestFeatures,
+    anomaly_features, behavioral_event, behavioral_sequence, combined_anomaly_features, email_domain,
+    extract_device_features, extract_ip_features, extract_ip_features_batch, extract_url_features,
+    extract_url_features_batch, normalize_url, use_ip_intel,
+)
+from streaming import NDJSONScoringStream, NDJSONStreamingResponse, StreamingConfig
+from registry import (
+    BASE_VERSION, ModelBundle, ModelRegistry, RegistryError, remember_bundle, set_bundle_loader,
+)
+from indicators import IndicatorConfig, IndicatorError, IndicatorIndex, IndicatorMatch, directory_fingerprint
+from ip_intel import IpIntelConfig, IpIntelError, IpIntelTable, table_fingerprint
+from sessions import SessionConfig, SessionState, SessionStore
+from online_anomaly import OnlineAnomalyConfig, OnlineAnomalyDetector, anomaly_scoring_row
+from training import MODES, TRAINABLE_MODELS, LabeledStore, TrainingConfig, TrainingJobs
+from prefork import PreforkConfig, memory_usage, run_prefork, worker_index
+from metrics import (
+    CONTENT_TYPE, REGISTRY, STAGE_SECONDS, Counter, MetricsMiddleware, record_stage, server_timing, stage,
+    start_breakdown,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Startup stage timings, reported by /ready (sklearn is imported lazily by the model loaders)
+startup_timings = {
+    'imports_ms': round((time.perf_counter() - _import_started) * 1000, 1),
+    'models_ms': {},
+}
+
 # Initialize FastAPI app
 app = FastAPI(
     title="SureGuard AI ML Service",
@@ -30,6 +69,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Admission control: bounded in-flight analyses and wait queue, shedding the excess
+# with 429 (ADMISSION_* settings, see admission.py); /health and /ready are never queued
+ADMISSION_PATHS = ("/api/analyze", "/api/analyze/batch")
+admission = AdmissionController(AdmissionConfig.from_env())
+app.add_middleware(AdmissionMiddleware, controller=admission, paths=ADMISSION_PATHS)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -38,13 +83,160 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Redis connection
 redis_client = None
 
 # Models
-models = {}
-scalers = {}
+MODEL_PATH = os.getenv("MODEL_PATH", "/app/models")
+FALLBACK_MODEL_PATH = os.getenv("FALLBACK_MODEL_PATH", os.path.join(MODEL_PATH, "fallback"))
+FALLBACK_SEED = 42
+# joblib mmap_mode for model artifacts: 'r' (default) maps their arrays from the
+# page cache, shared by every process and version that loads them; 'none' reads them into memory
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE", "r").lower()
+MODEL_MMAP_MODE = None if MODEL_MMAP_MODE in ("", "none") else MODEL_MMAP_MODE
+_torch_init_lock = threading.Lock()
+
+# Versioned model registry; versions may override any of the base artifacts above
+MODEL_REGISTRY_PATH = os.getenv("MODEL_REGISTRY_PATH", os.path.join(MODEL_PATH, "registry"))
+# Follow the registry's active-version pointer (e.g. set by another pod or the CLI); 0 disables
+# (pre-fork workers follow it regardless, see SERVING_WORKER_POLL_SECONDS)
+MODEL_REGISTRY_POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "0"))
+model_registry = ModelRegistry(MODEL_REGISTRY_PATH)
+
+# Retraining runs as a separate, thread-capped process (TRAINING_* settings, see training.py)
+training_config = TrainingConfig.from_env(MODEL_PATH)
+labeled_store = LabeledStore(training_config.store_path)
+training_jobs = TrainingJobs(training_config)
+training_task: Optional[asyncio.Task] = None
+
+# The bundle new requests are served with, and the one it replaced (kept loaded for rollback).
+# Requests take a reference at their start, so a swap never affects in-flight requests.
+active_bundle: Optional[ModelBundle] = None
+previous_bundle: Optional[ModelBundle] = None
+reload_task: Optional[asyncio.Task] = None
+registry_poll_task: Optional[asyncio.Task] = None
+reload_status: Dict[str, Any] = {'state': 'idle'}
+
+# Compiled tree-ensemble evaluator (TREE_ENGINE=sklearn|compiled|auto); "auto" only
+# uses it for batches up to TREE_ENGINE_MAX_ROWS, where it beats sklearn's per-call overhead
+TREE_ENGINE = os.getenv("TREE_ENGINE", "sklearn").lower()
+TREE_ENGINE_MAX_ROWS = int(os.getenv("TREE_ENGINE_MAX_ROWS", "512"))
+TREE_ENGINE_TOLERANCE = float(os.getenv("TREE_ENGINE_TOLERANCE", "1e-9"))
+
+# PyTorch serving variants per model (TORCH_SERVING_MODE_<MODEL>, default TORCH_SERVING_MODE):
+# eager, optimized (BatchNorm folded + TorchScript) or quantized (also dynamic int8)
+TORCH_SERVING_MODE = os.getenv("TORCH_SERVING_MODE", "eager").lower()
+
+# Set once models are loaded and warmed up; /ready and the analysis endpoints check it
+# (models_preloaded: loaded by the pre-fork parent before this worker was forked)
+models_preloaded = False
+service_ready = False
+
+# Micro-batching (per-model limits via BATCH_<MODEL>_MAX_SIZE / BATCH_<MODEL>_MAX_WAIT_MS)
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "true").lower() == "true"
+batchers: Dict[str, MicroBatcher] = {}
+
+# Serving processes: SERVING_WORKERS > 1 pre-forks workers sharing the parent's models (see prefork.py)
+serving_config = PreforkConfig.from_env()
+# Swaps (model reload, rollback and retrain, indicator and IP table reloads) happen in the
+# worker that was asked, so pre-fork workers follow the registry and the files at least this often
+SERVING_WORKER_POLL_SECONDS = max(1.0, float(os.getenv("SERVING_WORKER_POLL_SECONDS", "5")))
+
+# Inference execution backend (INFERENCE_BACKEND=inline|thread|process)
+inference_executor: Optional[InferenceExecutor] = None
+
+# Redis tier shared by the caches: pooled connections, coalesced reads, write-behind
+# writes, local-only caching while Redis is failing (REDIS_* settings, see cache.py)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+redis_cache_config = RedisCacheConfig.from_env()
+redis_backend: Optional[RedisBackend] = None
+
+# Known malicious/benign indicators, answered before any feature extraction or model
+# (INDICATOR_* settings, see indicators.py). Reloads build a new index and swap it in.
+INDICATOR_INPUT_TYPES = ('ip', 'url', 'email', 'domain')
+indicator_config = IndicatorConfig.from_env(MODEL_PATH)
+indicator_index = IndicatorIndex.empty()
+indicator_reload_lock = asyncio.Lock()
+indicator_poll_task: Optional[asyncio.Task] = None
+
+# Local IP intelligence behind the IP geolocation features (IP_INTEL_* settings, see
+# ip_intel.py). The table file is memory-mapped; a rebuilt one is mapped and swapped in.
+ip_intel_config = IpIntelConfig.from_env(MODEL_PATH)
+ip_intel_table = IpIntelTable.empty()
+ip_intel_poll_task: Optional[asyncio.Task] = None
+
+# Per-session LSTM state for incremental behavioral scoring (SESSION_* settings, see sessions.py);
+# pre-fork workers can't be routed to, so they share sessions through Redis (SESSION_REDIS_MODE=always)
+session_config = SessionConfig.from_env()
+session_store: Optional[SessionStore] = None
+
+# Streaming anomaly baselines per input type, updated by every event /api/analyze scores
+# (ANOMALY_* settings, see online_anomaly.py). Until an input type's baseline is
+# ready, and with ANOMALY_ENGINE=isolation_forest, the Isolation Forest scores. The
+# baselines live in the serving process, so HST refuses INFERENCE_BACKEND=process.
+anomaly_config = OnlineAnomalyConfig.from_env(MODEL_PATH)
+anomaly_detector = OnlineAnomalyDetector(ANOMALY_FEATURES, anomaly_config) if anomaly_config.engine == 'hst' else None
+anomaly_checkpoint_task: Optional[asyncio.Task] = None
+
+# Analysis result cache: in-process LRU tier in front of Redis
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "300"))
+analysis_cache: Optional[TieredCache] = None
+
+# Per-model sub-result caches, keyed on each model's own input and version
+# (TTL per model via SUBRESULT_TTL_<PREDICTION>_SECONDS)
+SUBRESULT_CACHE_ENABLED = os.getenv("SUBRESULT_CACHE_ENABLED", "true").lower() == "true"
+SUBRESULT_TTL_DEFAULTS = {
+    'ip_reputation': 3600,
+    'url_analysis': 3600,
+    'device_fingerprint': 900,
+    'behavioral_analysis': 300,
+    'anomaly_detection': 300,
+}
+subresult_caches: Dict[str, TieredCache] = {}
+
+# Cascade: run the IP/URL model first and skip the costlier models when max(p, 1 - p) of
+# its malicious probability p reaches CASCADE_CONFIDENCE. ANALYSIS_DEADLINE_MS is the default
+# latency budget of /api/analyze (0: none; ?deadline_ms= overrides it per request).
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "false").lower() == "true"
+CASCADE_CONFIDENCE = float(os.getenv("CASCADE_CONFIDENCE", "0.9"))
+ANALYSIS_DEADLINE_MS = float(os.getenv("ANALYSIS_DEADLINE_MS", "0"))
+
+# Largest accepted /api/analyze/batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+# Pause before retrying a streamed chunk the inference queue turned away
+STREAM_SATURATED_BACKOFF_SECONDS = float(os.getenv("STREAM_SATURATED_BACKOFF_MS", "20")) / 1000
+
+# Allow ?debug_timings=true to return a per-stage breakdown in a Server-Timing header
+DEBUG_TIMINGS_ENABLED = os.getenv("DEBUG_TIMINGS_ENABLED", "false").lower() == "true"
+
+# Serving metrics (stage histograms live in metrics.py)
+INFERENCE_ROWS = REGISTRY.register(Counter(
+    "sureguard_ml_inference_rows_total", "Feature rows scored by each model", ["model"]
+))
+MODEL_FALLBACKS = REGISTRY.register(Counter(
+    "sureguard_ml_model_fallbacks_total", "Predictions replaced by the fallback after a model error", ["prediction"]
+))
+MODEL_RELOADS = REGISTRY.register(Counter(
+    "sureguard_ml_model_reloads_total", "Model version swaps by kind and result", ["kind", "result"]
+))
+MODELS_SKIPPED = REGISTRY.register(Counter(
+    "sureguard_ml_models_skipped_total", "Predictions left out of an ensemble by reason (cascade, deadline)",
+    ["prediction", "reason"]
+))
+TRAINING_JOBS = REGISTRY.register(Counter(
+    "sureguard_ml_training_jobs_total", "Finished training jobs by final state", ["state"]
+))
+INDICATOR_LOOKUPS = REGISTRY.register(Counter(
+    "sureguard_ml_indicator_lookups_total", "Known-indicator lookups by input type and result", ["input_type", "result"]
+))
+INDICATOR_RELOADS = REGISTRY.register(Counter(
+    "sureguard_ml_indicator_reloads_total", "Indicator index reloads by result", ["result"]
+))
+IP_INTEL_RELOADS = REGISTRY.register(Counter(
+    "sureguard_ml_ip_intel_reloads_total", "IP intelligence table loads by result", ["result"]
+))
 
 # Pydantic models
 class ThreatAnalysisRequest(BaseModel):
@@ -62,19 +254,66 @@ class ThreatAnalysisResponse(BaseModel):
     severity: str = Field(..., description="Severity level (low, medium, high, critical)")
     explanation: str = Field(..., description="Human-readable explanation")
     recommendations: List[str] = Field(..., description="Recommended actions")
-    model_predictions: Dict[str, float] = Field(..., description="Individual model predictions")
+    model_predictions: Dict[str, Optional[float]] = Field(
+        ..., description="Individual model predictions (null for models that were skipped)"
+    )
     processing_time_ms: float = Field(..., description="Processing time in milliseconds")
+    model_version: Optional[str] = Field(None, description="Model registry version that produced the scores")
+    indicator_match: Optional[Dict[str, str]] = Field(
+        None, description="Known-indicator list entry that decided the verdict (no models were run)"
+    )
+    skipped_models: Dict[str, str] = Field(
+        default_factory=dict, description="Applicable models that didn't run and why (cascade or deadline)"
+    )
 
 class BatchAnalysisRequest(BaseModel):
-    requests: List[ThreatAnalysisRequest] = Field(..., max_items=100)
+    requests: List[ThreatAnalysisRequest] = Field(..., max_items=BATCH_MAX_ITEMS)
+
+class IpIntelLookupRequest(BaseModel):
+    ips: List[str] = Field(..., max_items=BATCH_MAX_ITEMS, description="IPv4 or IPv6 addresses")
+
+class ModelReloadRequest(BaseModel):
+    version: Optional[str] = Field(None, description="Registry version to activate (default: newest published)")
+
+class LabeledExample(ThreatAnalysisRequest):
+    label: bool = Field(..., description="True if the input turned out to be malicious")
+    source: Optional[str] = Field(None, description="Where the label came from (analyst, chargeback, ...)")
+
+class LabeledExamplesRequest(BaseModel):
+    examples: List[LabeledExample] = Field(..., max_items=BATCH_MAX_ITEMS)
+
+class RetrainRequest(BaseModel):
+    models: List[str] = Field(default_factory=lambda: list(TRAINABLE_MODELS), description="Models to retrain")
+    mode: str = Field('auto', description="auto, warm_start or refit")
+    activate: bool = Field(False, description="Swap the new version in once it is published")
+    force: bool = Field(False, description="Publish even if holdout F1 is worse than the current model's")
+
+class SessionEventRequest(BaseModel):
+    session_id: str = Field(..., min_length=1, max_length=256, description="Client-chosen session identifier")
+    event: Dict[str, Any] = Field(..., description="Behavioral fields of this event (session_duration, page_views, clicks, ...)")
+    reset: bool = Field(False, description="Start the session over with this event")
+
+class SessionEventResponse(BaseModel):
+    session_id: str
+    steps: int = Field(..., description="Events applied to the session so far, including this one")
+    new_session: bool = Field(..., description="True if no state was kept for the session (new, expired, reset or model changed)")
+    risk_score: int = Field(..., ge=0, le=100, description="Risk score from 0-100")
+    behavioral_analysis: Dict[str, float] = Field(..., description="Behavioral LSTM prediction after this event")
+    model_version: Optional[str] = Field(None, description="Model registry version that produced the score")
+    processing_time_ms: float
 
 class ModelMetrics(BaseModel):
     model_name: str
-    accuracy: float
-    precision: float
-    recall: float
-    f1_score: float
-    last_updated: datetime
+    version: Optional[str] = None
+    inference_calls: int = 0
+    rows_scored: int = 0
+    fallbacks: int = 0
+    latency_ms: Dict[str, Optional[float]] = Field(default_factory=dict, description="Per-call inference latency")
+    # Holdout metrics recorded when the serving version was trained; None for untrained models
+    accuracy: Optional[float] = None
+    precision: Optional[float] = None
+    recall: Optional[float] = None
+    f1_score: Optional[float] = None
 
 # Neural Network Models
 class BehavioralLSTM(nn.Module):
@@ -89,24 +328,49 @@ class BehavioralLSTM(nn.Module):
         self.softmax = nn.Softmax(dim=1)
         
     def forward(self, x):
-        h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size)
-        c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size)
-        
-        out, _ = self.lstm(x, (h0, c0))
+        # The LSTM starts from a zero state by default; no need to allocate h0/c0 per call
+        out, _ = self.lstm(x)
         out = self.dropout(out[:, -1, :])
         out = self.fc(out)
         return self.softmax(out)
+    
+    def step(self, x, state):
+        """Advance ``state`` = (h, c) by one (batch, input_size) step; returns the probabilities and the new state"""
+        out, state = self.lstm(x.unsqueeze(1), state)
+        out = self.dropout(out[:, -1, :])
+        out = self.fc(out)
+        return self.softmax(out), state
 
 class DeviceFingerprintNet(nn.Module):
-    def __init__(self, input_size=100, hidden_sizes=[256, 128, 64], num_classes=2):
+    """MLP over ``extract_device_features`` rows.
+    
+    The first layer is sparse in the hashed tokens: the scalar features go
+    through a Linear and each token's bucket adds its learned vector
+    (EmbeddingBag, summed), so a fingerprint costs its few tokens rather than
+    a product with every bucket.
+    """
+    
+    # First-layer input width of checkpoints saved before the hashed tokens
+    LEGACY_INPUT_SIZE = 100
+    
+    def __init__(self, dense_size=DEVICE_DENSE_FEATURES, hash_buckets=DEVICE_HASH_BUCKETS,
+                 hidden_sizes=[256, 128, 64], num_classes=2):
         super(DeviceFingerprintNet, self).__init__()
+        self.dense_size = dense_size
+        self.hash_buckets = hash_buckets
         
-        layers = []
-        prev_size = input_size
+        self.dense = nn.Linear(dense_size, hidden_sizes[0])
+        # Bucket ``hash_buckets`` is the padding of unused token slots
+        self.tokens = nn.EmbeddingBag(hash_buckets + 1, hidden_sizes[0], mode='sum', padding_idx=hash_buckets)
+        bound = 1 / dense_size ** 0.5
+        nn.init.uniform_(self.tokens.weight, -bound, bound)
         
-        for hidden_size in hidden_sizes:
+        layers = []
+        prev_size = hidden_sizes[0]
+        for i, hidden_size in enumerate(hidden_sizes):
+            if i > 0:
+                layers.append(nn.Linear(prev_size, hidden_size))
             layers.extend([
-                nn.Linear(prev_size, hidden_size),
                 nn.ReLU(),
                 nn.BatchNorm1d(hidden_size),
                 nn.Dropout(0.3)
@@ -119,469 +383,1346 @@ class DeviceFingerprintNet(nn.Module):
         self.network = nn.Sequential(*layers)
         
     def forward(self, x):
-        return self.network(x)
-
-# Feature extraction functions
-def extract_ip_features(ip_address: str) -> np.ndarray:
-    """Extract features from IP address"""
-    features = []
+        tokens = x[:, self.dense_size:].long()
+        tokens = torch.where(tokens < 0, self.hash_buckets, tokens)
+        return self.network(self.dense(x[:, :self.dense_size]) + self.tokens(tokens))
+    
+    def example_input(self, batch_size: int, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        """Random input rows: normal scalar features and random buckets with some unused slots"""
+        dense = torch.randn(batch_size, self.dense_size, generator=generator)
+        tokens = torch.randint(-1, self.hash_buckets, (batch_size, DEVICE_TOKEN_SLOTS), generator=generator)
+        return torch.cat((dense, tokens.float()), dim=1)
+    
+    def load_state_dict(self, state_dict, strict=True):
+        """Load a state dict, converting a legacy one (one Linear over 100 zero-padded inputs)"""
+        if 'dense.weight' not in state_dict and 'network.0.weight' in state_dict:
+            state_dict = self.upgrade_legacy_state(state_dict)
+        return super().load_state_dict(state_dict, strict=strict)
     
+    def upgrade_legacy_state(self, state_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """Map a legacy state dict onto this architecture.
+        
+        The legacy inputs were the same scalar features followed by zero
+        padding, so the first Linear keeps its scalar columns and drops the
+        padding's. Its plugin/font digest columns took process-dependent
+        values and now take stable ones. The token embeddings start at zero:
+        the model scores as before until it is retrained.
+        """
+        upgraded = {}
+        for key, value in state_dict.items():
+            _, index, name = key.split('.', 2)
+            if index == '0':
+                upgraded[f'dense.{name}'] = value[:, :self.dense_size] if name == 'weight' else value
+            else:
+                upgraded[f'network.{int(index) - 1}.{name}'] = value
+        upgraded['tokens.weight'] = torch.zeros_like(self.tokens.weight)
+        return upgraded
+
+# Model loading functions
+def artifact_version(*paths: str) -> str:
+    """Content digest identifying a model artifact"""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def untrained_version() -> str:
+    """Version for a model generated at startup (unique to this process)"""
+    return f"untrained-{uuid.uuid4().hex[:12]}"
+
+def find_artifacts(*filenames: str, search_path: Optional[List[str]] = None) -> Optional[List[str]]:
+    """Locate artifacts in ``search_path`` (default: the model directory, then the persisted fallback directory)"""
+    for directory in search_path or [MODEL_PATH, FALLBACK_MODEL_PATH]:
+        paths = [os.path.join(directory, filename) for filename in filenames]
+        if all(os.path.exists(path) for path in paths):
+            return paths
+    return None
+
+def persist_fallback(save, filename: str) -> Optional[str]:
+    """Atomically write a generated fallback artifact so later boots and workers reuse it"""
+    path = os.path.join(FALLBACK_MODEL_PATH, filename)
     try:
-        # Basic IP parsing
-        octets = ip_address.split('.')
-        if len(octets) == 4:
-            features.extend([int(octet) for octet in octets])
-        else:
-            features.extend([0, 0, 0, 0])
-            
-        # IP range features
-        first_octet = int(octets[0]) if len(octets) > 0 else 0
-        features.extend([
-            1 if first_octet in [10] else 0,  # Private Class A
-            1 if first_octet == 172 else 0,   # Private Class B
-            1 if first_octet == 192 else 0,   # Private Class C
-            1 if first_octet == 127 else 0,   # Loopback
-            1 if first_octet >= 224 else 0,   # Multicast
-        ])
-        
-        # Geolocation features (mock - in production, use real geolocation service)
-        features.extend([
-            hash(ip_address) % 1000 / 1000,  # Mock latitude
-            hash(ip_address[::-1]) % 1000 / 1000,  # Mock longitude
-            hash(ip_address + "country") % 200,  # Mock country code
-        ])
-        
-    except Exception as e:
-        logger.error(f"Error extracting IP features: {e}")
-        features = [0] * 12
-        
-    return np.array(features, dtype=np.float32)
-
-def extract_url_features(url: str) -> np.ndarray:
-    """Extract features from URL"""
-    features = []
-    
-    try:
-        # Basic URL features
-        features.extend([
-            len(url),
-            url.count('.'),
-            url.count('/'),
-            url.count('?'),
-            url.count('&'),
-            url.count('='),
-            url.count('-'),
-            url.count('_'),
-            1 if 'https' in url else 0,
-            1 if any(char.isdigit() for char in url) else 0,
-        ])
-        
-        # Suspicious patterns
-        suspicious_keywords = ['admin', 'login', 'secure', 'bank', 'paypal', 'amazon']
-        features.append(sum(1 for keyword in suspicious_keywords if keyword in url.lower()))
-        
-        # Domain features
-        domain_parts = url.split('/')[2].split('.') if '//' in url else url.split('.') 
-        features.extend([
-            len(domain_parts),
-            max(len(part) for part in domain_parts) if domain_parts else 0,
-            1 if any(char.isdigit() for char in domain_parts[0]) if domain_parts else 0,
-        ])
-        
-    except Exception as e:
-        logger.error(f"Error extracting URL features: {e}")
-        features = [0] * 14
-        
-    return np.array(features, dtype=np.float32)
+        os.makedirs(FALLBACK_MODEL_PATH, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        save(tmp_path)
+        os.replace(tmp_path, path)
+        return path
+    except OSError as e:
+        logger.warning(f"Could not persist fallback artifact {path}: {e}")
+        return None
+
+def build_fallback_classifier(n_features: int):
+    """Train the default RandomForest + scaler on seeded dummy data"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+    
+    rng = np.random.RandomState(FALLBACK_SEED)
+    X_dummy = rng.rand(1000, n_features)
+    y_dummy = rng.randint(0, 2, 1000)
+    scaler = StandardScaler().fit(X_dummy)
+    model = RandomForestClassifier(n_estimators=100, random_state=42).fit(scaler.transform(X_dummy), y_dummy)
+    return model, scaler
 
-def extract_device_features(device_fingerprint: Dict[str, Any]) -> np.ndarray:
-    """Extract features from device fingerprint"""
-    features = []
+def build_fallback_anomaly_model():
+    """Train the default IsolationForest on seeded dummy data"""
+    from sklearn.ensemble import IsolationForest
     
+    X_dummy = np.random.RandomState(FALLBACK_SEED).rand(1000, 50)
+    return IsolationForest(contamination=0.1, random_state=42).fit(X_dummy)
+
+def load_classifier(model_name: str, n_features: int,
+                    search_path: Optional[List[str]] = None) -> Tuple[Any, Any, str]:
+    """Load a RandomForest + scaler pair, building and persisting the default if missing"""
+    model_file, scaler_file = f"{model_name}_model.pkl", f"{model_name}_scaler.pkl"
+    paths = find_artifacts(model_file, scaler_file, search_path=search_path)
+    if paths:
+        logger.info(f"Loading {model_name} model from {os.path.dirname(paths[0])}")
+        model = joblib.load(paths[0], mmap_mode=MODEL_MMAP_MODE)
+        return model, joblib.load(paths[1], mmap_mode=MODEL_MMAP_MODE), artifact_version(*paths)
+    
+    logger.warning(f"{model_name} model not found, creating default model")
+    model, scaler = build_fallback_classifier(n_features)
+    model_path = persist_fallback(lambda path: joblib.dump(model, path), model_file)
+    scaler_path = persist_fallback(lambda path: joblib.dump(scaler, path), scaler_file)
+    version = artifact_version(model_path, scaler_path) if model_path and scaler_path else untrained_version()
+    return model, scaler, version
+
+def load_anomaly_model(search_path: Optional[List[str]] = None) -> Tuple[Any, None, str]:
+    """Load the IsolationForest, building and persisting the default if missing"""
+    paths = find_artifacts("anomaly_model.pkl", search_path=search_path)
+    if paths:
+        logger.info(f"Loading anomaly detection model from {os.path.dirname(paths[0])}")
+        return joblib.load(paths[0], mmap_mode=MODEL_MMAP_MODE), None, artifact_version(*paths)
+    
+    logger.warning("Anomaly detection model not found, creating default model")
+    model = build_fallback_anomaly_model()
+    model_path = persist_fallback(lambda path: joblib.dump(model, path), "anomaly_model.pkl")
+    return model, None, artifact_version(model_path) if model_path else untrained_version()
+
+def load_torch_model(model_name: str, filename: str, factory,
+                     search_path: Optional[List[str]] = None) -> Tuple[nn.Module, None, str]:
+    """Load a PyTorch state dict, persisting a seeded default if missing"""
+    paths = find_artifacts(filename, search_path=search_path)
+    if paths:
+        model = factory()
+        model.load_state_dict(torch.load(paths[0], map_location='cpu'))
+        model.eval()
+        logger.info(f"Loaded {model_name} model from {os.path.dirname(paths[0])}")
+        return model, None, artifact_version(*paths)
+    
+    logger.warning(f"{model_name} model not found, using default")
+    # Seeded init so every worker builds the same default; torch's RNG is global
+    with _torch_init_lock:
+        torch.manual_seed(FALLBACK_SEED)
+        model = factory()
+    model.eval()
+    model_path = persist_fallback(lambda path: torch.save(model.state_dict(), path), filename)
+    return model, None, artifact_version(model_path) if model_path else untrained_version()
+
+MODEL_LOADERS = {
+    'ip_reputation': lambda search_path: load_classifier('ip_reputation', 12, search_path),
+    'url_analysis': lambda search_path: load_classifier('url_analysis', 14, search_path),
+    'anomaly_detection': load_anomaly_model,
+    'behavioral_lstm': lambda search_path: load_torch_model(
+        'behavioral_lstm', 'behavioral_lstm.pth', BehavioralLSTM, search_path),
+    'device_fingerprint': lambda search_path: load_torch_model(
+        'device_fingerprint', 'device_fingerprint.pth', DeviceFingerprintNet, search_path),
+}
+
+def import_model_frameworks() -> float:
+    """Import the sklearn modules the model artifacts need, returning the time taken in ms.
+
+    Done once up front: unpickling in parallel threads would otherwise import
+    the same sklearn modules concurrently and trip the import lock.
+    """
+    started = time.perf_counter()
+    import sklearn.ensemble  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def version_search_path(version: str) -> List[str]:
+    """Directories a version's artifacts are read from: its registry directory, then the base directories"""
+    if version == BASE_VERSION:
+        return [MODEL_PATH, FALLBACK_MODEL_PATH]
+    return [model_registry.version_dir(version), MODEL_PATH, FALLBACK_MODEL_PATH]
+
+def build_bundle(version: str) -> ModelBundle:
+    """Load, compile and prepare every model of ``version`` (blocking; run it off the event loop)"""
+    if not model_registry.exists(version):
+        raise RegistryError(f"Unknown model version {version!r}")
+    started = time.perf_counter()
+    bundle = ModelBundle(version=version)
+    bundle.timings['sklearn_import_ms'] = import_model_frameworks()
+    search_path = version_search_path(version)
+    
+    def timed_loader(model_name: str):
+        loader_started = time.perf_counter()
+        result = MODEL_LOADERS[model_name](search_path)
+        return result, round((time.perf_counter() - loader_started) * 1000, 1)
+    
+    # Loaders are independent and mostly release the GIL (file IO, tree fitting)
+    names = list(MODEL_LOADERS)
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="model-loader") as pool:
+        results = list(pool.map(timed_loader, names))
+    
+    bundle.timings['models_ms'] = {}
+    for name, ((model, scaler, model_version), elapsed_ms) in zip(names, results):
+        bundle.models[name] = model
+        if scaler is not None:
+            bundle.scalers[name] = scaler
+        bundle.model_versions[name] = model_version
+        bundle.timings['models_ms'][name] = elapsed_ms
+    
+    compile_tree_models(bundle)
+    prepare_torch_serving(bundle)
+    bundle.timings['load_models_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Model version {version} loaded in {bundle.timings['load_models_ms']}ms")
+    return bundle
+
+def configured_version() -> str:
+    """Version to serve at startup: the registry's active version, or the base models"""
     try:
-        # Screen features
-        screen = device_fingerprint.get('screen', {})
-        features.extend([
-            screen.get('width', 0),
-            screen.get('height', 0),
-            screen.get('colorDepth', 0),
-            screen.get('pixelRatio', 1.0),
-        ])
-        
-        # Browser features
-        features.extend([
-            len(device_fingerprint.get('userAgent', '')),
-            len(device_fingerprint.get('language', '')),
-            len(device_fingerprint.get('platform', '')),
-            device_fingerprint.get('cookieEnabled', 0),
-            device_fingerprint.get('doNotTrack', 0),
-        ])
-        
-        # Plugin and font features
-        plugins = device_fingerprint.get('plugins', [])
-        fonts = device_fingerprint.get('fonts', [])
-        features.extend([
-            len(plugins),
-            len(fonts),
-            hash(str(plugins)) % 1000,
-            hash(str(fonts)) % 1000,
-        ])
-        
-        # Timezone and other features
-        features.extend([
-            device_fingerprint.get('timezone', 0),
-            device_fingerprint.get('webgl', 0),
-            device_fingerprint.get('canvas', 0),
-        ])
-        
-        # Pad to fixed size
-        while len(features) < 100:
-            features.append(0)
-            
-    except Exception as e:
-        logger.error(f"Error extracting device features: {e}")
-        features = [0] * 100
-        
-    return np.array(features[:100], dtype=np.float32)
+        version = model_registry.active()
+        if model_registry.exists(version):
+            return version
+        logger.error(f"Active model version {version!r} is missing from {MODEL_REGISTRY_PATH}, using base models")
+    except RegistryError as e:
+        logger.error(f"Model registry unreadable, using base models: {e}")
+    return BASE_VERSION
 
-# Model loading functions
 async def load_models():
-    """Load all ML models"""
-    global models, scalers
+    """Load the configured model version and make it the active bundle"""
+    global active_bundle
     
     try:
-        model_path = "/app/models"
-        
-        # Load IP reputation model (Random Forest)
-        try:
-            models['ip_reputation'] = joblib.load(f"{model_path}/ip_reputation_model.pkl")
-            scalers['ip_reputation'] = joblib.load(f"{model_path}/ip_reputation_scaler.pkl")
-            logger.info("Loaded IP reputation model")
-        except FileNotFoundError:
-            # Create and train a simple model if not found
-            logger.warning("IP reputation model not found, creating default model")
-            models['ip_reputation'] = RandomForestClassifier(n_estimators=100, random_state=42)
-            scalers['ip_reputation'] = StandardScaler()
-            
-            # Generate some dummy training data
-            X_dummy = np.random.rand(1000, 12)
-            y_dummy = np.random.randint(0, 2, 1000)
-            scalers['ip_reputation'].fit(X_dummy)
-            X_scaled = scalers['ip_reputation'].transform(X_dummy)
-            models['ip_reputation'].fit(X_scaled, y_dummy)
-        
-        # Load URL analysis model
-        try:
-            models['url_analysis'] = joblib.load(f"{model_path}/url_analysis_model.pkl")
-            scalers['url_analysis'] = joblib.load(f"{model_path}/url_analysis_scaler.pkl")
-            logger.info("Loaded URL analysis model")
-        except FileNotFoundError:
-            logger.warning("URL analysis model not found, creating default model")
-            models['url_analysis'] = RandomForestClassifier(n_estimators=100, random_state=42)
-            scalers['url_analysis'] = StandardScaler()
-            
-            X_dummy = np.random.rand(1000, 14)
-            y_dummy = np.random.randint(0, 2, 1000)
-            scalers['url_analysis'].fit(X_dummy)
-            X_scaled = scalers['url_analysis'].transform(X_dummy)
-            models['url_analysis'].fit(X_scaled, y_dummy)
-        
-        # Load anomaly detection model
-        try:
-            models['anomaly_detection'] = joblib.load(f"{model_path}/anomaly_model.pkl")
-            logger.info("Loaded anomaly detection model")
-        except FileNotFoundError:
-            logger.warning("Anomaly detection model not found, creating default model")
-            models['anomaly_detection'] = IsolationForest(contamination=0.1, random_state=42)
-            X_dummy = np.random.rand(1000, 50)
-            models['anomaly_detection'].fit(X_dummy)
-        
-        # Load PyTorch models
-        try:
-            models['behavioral_lstm'] = BehavioralLSTM()
-            models['behavioral_lstm'].load_state_dict(
-                torch.load(f"{model_path}/behavioral_lstm.pth", map_location='cpu')
-            )
-            models['behavioral_lstm'].eval()
-            logger.info("Loaded behavioral LSTM model")
-        except FileNotFoundError:
-            logger.warning("Behavioral LSTM model not found, using default")
-            models['behavioral_lstm'] = BehavioralLSTM()
-            models['behavioral_lstm'].eval()
-        
-        try:
-            models['device_fingerprint'] = DeviceFingerprintNet()
-            models['device_fingerprint'].load_state_dict(
-                torch.load(f"{model_path}/device_fingerprint.pth", map_location='cpu')
-            )
-            models['device_fingerprint'].eval()
-            logger.info("Loaded device fingerprint model")
-        except FileNotFoundError:
-            logger.warning("Device fingerprint model not found, using default")
-            models['device_fingerprint'] = DeviceFingerprintNet()
-            models['device_fingerprint'].eval()
-        
-        logger.info("All models loaded successfully")
+        bundle = await asyncio.to_thread(build_bundle, configured_version())
+        remember_bundle(bundle)
+        active_bundle = bundle
+        startup_timings.update(bundle.timings)
         
     except Exception as e:
         logger.error(f"Error loading models: {e}")
         raise
 
+# Worker processes that receive a bundle version they haven't loaded build it themselves
+set_bundle_loader(build_bundle)
+
+def compile_tree_models(bundle: ModelBundle):
+    """Compile the tree ensembles, keeping only those that reproduce sklearn on a validation sample"""
+    if TREE_ENGINE not in ('compiled', 'auto'):
+        return
+    
+    started = time.perf_counter()
+    for model_name in ('ip_reputation', 'url_analysis', 'anomaly_detection'):
+        model = bundle.models.get(model_name)
+        compiled = compile_model(model) if model is not None else None
+        if compiled is None:
+            continue
+        X_check = np.random.RandomState(0).randn(256, model.n_features_in_)
+        deviation = max_deviation(compiled, model, X_check)
+        if deviation > TREE_ENGINE_TOLERANCE:
+            logger.warning(f"Compiled {model_name} deviates from sklearn by {deviation}, using sklearn")
+            continue
+        bundle.compiled[model_name] = compiled
+    bundle.timings['compile_trees_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Compiled tree models: {sorted(bundle.compiled)}")
+
+def compiled_engine(bundle: ModelBundle, model_name: str, n_rows: int):
+    """Compiled evaluator to use for this call, or None for sklearn"""
+    compiled = bundle.compiled.get(model_name)
+    if compiled is None or (TREE_ENGINE == 'auto' and n_rows > TREE_ENGINE_MAX_ROWS):
+        return None
+    return compiled
+
+def prepare_torch_serving(bundle: ModelBundle):
+    """Build the configured serving variant of each PyTorch model, checked against eager"""
+    started = time.perf_counter()
+    generator = torch.Generator().manual_seed(0)
+    example_inputs = {
+        'device_fingerprint': lambda model: model.example_input(64, generator),
+        'behavioral_lstm': lambda model: torch.randn(64, 10, model.lstm.input_size, generator=generator),
+    }
+    
+    for model_name, example_input in example_inputs.items():
+        mode = os.getenv(f"TORCH_SERVING_MODE_{model_name.upper()}", TORCH_SERVING_MODE).lower()
+        tolerance = os.getenv("TORCH_DRIFT_TOLERANCE")
+        model = bundle.models[model_name]
+        bundle.serving[model_name], bundle.torch_report[model_name] = prepare_serving_model(
+            model_name, model, example_input(model), mode, float(tolerance) if tolerance else None
+        )
+    bundle.timings['torch_serving_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+def serving_model(bundle: ModelBundle, model_name: str):
+    """Model variant used for inference"""
+    model = bundle.serving.get(model_name)
+    return model if model is not None else bundle.models[model_name]
+
+# Batch scoring functions (one row per input, results in row order). Each
+# takes the bundle to score with, defaulting to the active one.
+def batch_scorer(model_name: str):
+    """Time every call of a batch scoring function and count the rows it scores"""
+    stage_name = f'inference.{model_name}'
+    
+    def decorator(score_fn):
+        @wraps(score_fn)
+        def wrapper(features: np.ndarray, bundle: Optional[ModelBundle] = None) -> List[Dict[str, float]]:
+            with stage(stage_name):
+                results = score_fn(features, bundle or active_bundle)
+            INFERENCE_ROWS.inc(model_name, amount=len(features))
+            return results
+        return wrapper
+    return decorator
+
+def _classifier_results(proba: np.ndarray, predictions: np.ndarray) -> List[Dict[str, float]]:
+    """Convert classifier outputs into per-row prediction dicts"""
+    return [
+        {
+            'malicious_probability': float(p[1] if len(p) > 1 else p[0]),
+            'prediction': int(prediction),
+            'confidence': float(max(p))
+        }
+        for p, prediction in zip(proba, predictions)
+    ]
+
+def _classify(bundle: ModelBundle, model_name: str, features: np.ndarray) -> List[Dict[str, float]]:
+    """Scale and classify a feature matrix with a RandomForest model"""
+    features_scaled = bundle.scalers[model_name].transform(features)
+    compiled = compiled_engine(bundle, model_name, len(features_scaled))
+    if compiled is not None:
+        proba, predictions = compiled.predict(features_scaled)
+    else:
+        model = bundle.models[model_name]
+        proba = model.predict_proba(features_scaled)
+        predictions = model.predict(features_scaled)
+    return _classifier_results(proba, predictions)
+
+@batch_scorer('ip_reputation')
+def score_ip_reputation(features: np.ndarray, bundle: ModelBundle) -> List[Dict[str, float]]:
+    """Score a matrix of IP feature rows"""
+    return _classify(bundle, 'ip_reputation', features)
+
+@batch_scorer('url_analysis')
+def score_url_analysis(features: np.ndarray, bundle: ModelBundle) -> List[Dict[str, float]]:
+    """Score a matrix of URL feature rows"""
+    return _classify(bundle, 'url_analysis', features)
+
+@batch_scorer('device_fingerprint')
+def score_device_fingerprint(features: np.ndarray, bundle: ModelBundle) -> List[Dict[str, float]]:
+    """Score a matrix of device feature rows"""
+    with torch.inference_mode():
+        proba = serving_model(bundle, 'device_fingerprint')(torch.from_numpy(features)).numpy()
+    return [
+        {
+            'malicious_probability': float(p[1] if len(p) > 1 else p[0]),
+            'prediction': int(np.argmax(p)),
+            'confidence': float(max(p))
+        }
+        for p in proba
+    ]
+
+@batch_scorer('behavioral_lstm')
+def score_behavioral_analysis(sequences: np.ndarray, bundle: ModelBundle) -> List[Dict[str, float]]:
+    """Score a batch of (sequence_length, 50) behavioral sequences"""
+    with torch.inference_mode():
+        proba = serving_model(bundle, 'behavioral_lstm')(torch.from_numpy(sequences)).numpy()
+    return [
+        {
+            'anomaly_probability': float(p[1] if len(p) > 1 else p[0]),
+            'prediction': int(np.argmax(p)),
+            'confidence': float(max(p))
+        }
+        for p in proba
+    ]
+
+def session_state_size(bundle: ModelBundle) -> int:
+    """Length of a session's flattened LSTM state (h and c of every layer)"""
+    model = bundle.models['behavioral_lstm']
+    return 2 * model.num_layers * model.hidden_size
+
+def behavioral_step_row(event: np.ndarray, state: Optional[np.ndarray], bundle: ModelBundle) -> np.ndarray:
+    """Input row for ``score_behavioral_steps``: the event, then the session state (zeros for a new session)"""
+    if state is None:
+        state = np.zeros(session_state_size(bundle), dtype=np.float32)
+    return np.concatenate((event, state))
+
+@batch_scorer('behavioral_step')
+def score_behavioral_steps(rows: np.ndarray, bundle: ModelBundle) -> List[Tuple[Dict[str, float], np.ndarray]]:
+    """Advance a batch of sessions by one event each, returning each prediction and new flattened state.
+    
+    Runs the eager LSTM: the serving variants are traced over whole sequences from a zero state.
+    """
+    model = bundle.models['behavioral_lstm']
+    input_size = model.lstm.input_size
+    # (n, 2 * layers * hidden) -> h and c, each (layers, n, hidden)
+    state = torch.from_numpy(rows[:, input_size:]).reshape(len(rows), 2, model.num_layers, model.hidden_size)
+    h, c = state.permute(1, 2, 0, 3).contiguous()
+    with torch.inference_mode():
+        proba, (h, c) = model.step(torch.from_numpy(rows[:, :input_size]).contiguous(), (h, c))
+        new_states = torch.stack((h, c)).permute(2, 0, 1, 3).reshape(len(rows), -1).numpy()
+    return [
+        (
+            {
+                'anomaly_probability': float(p[1] if len(p) > 1 else p[0]),
+                'prediction': int(np.argmax(p)),
+                'confidence': float(max(p))
+            },
+            new_state.copy()
+        )
+        for p, new_state in zip(proba.numpy(), new_states)
+    ]
+
+def score_isolation_forest(features: np.ndarray, bundle: ModelBundle) -> List[Dict[str, float]]:
+    """Score a matrix of 50-dim anomaly feature rows with the Isolation Forest"""
+    compiled = compiled_engine(bundle, 'anomaly_detection', len(features))
+    if compiled is not None:
+        anomaly_scores, is_anomaly = compiled.predict(features)
+    else:
+        model = bundle.models['anomaly_detection']
+        anomaly_scores = model.decision_function(features)
+        is_anomaly = model.predict(features)
+
+    # Convert to probability (anomaly score is typically negative for anomalies)
+    return [
+        {
+            'anomaly_probability': float(max(0, min(1, (1 - score) / 2))),
+            'is_anomaly': bool(label == -1),
+            'anomaly_score': float(score)
+        }
+        for score, label in zip(anomaly_scores, is_anomaly)
+    ]
+
+def anomaly_results(rows: np.ndarray, bundle: ModelBundle, update: bool) -> List[Dict[str, float]]:
+    """Score ``anomaly_scoring_row`` rows against their input type's streaming baseline, updating it if ``update``.
+    
+    Rows whose baseline isn't ready yet (or that have none) are scored by the Isolation Forest.
+    """
+    features, codes = rows[:, :ANOMALY_FEATURES], rows[:, ANOMALY_FEATURES].astype(np.int64)
+    results: List[Optional[Dict[str, float]]] = [None] * len(rows)
+    if anomaly_detector is not None:
+        probabilities, scores = anomaly_detector.process(features, codes, update=update)
+        for i in np.flatnonzero(~np.isnan(probabilities)):
+            results[i] = {
+                'anomaly_probability': float(probabilities[i]),
+                'is_anomaly': bool(probabilities[i] > anomaly_config.threshold),
+                'anomaly_score': float(scores[i])
+            }
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        for i, result in zip(pending, score_isolation_forest(features[pending], bundle)):
+            results[i] = result
+    return results
+
+@batch_scorer('anomaly_detection')
+def score_anomalies(rows: np.ndarray, bundle: ModelBundle) -> List[Dict[str, float]]:
+    """Score anomaly rows of live traffic, adding them to the streaming baselines"""
+    return anomaly_results(rows, bundle, update=True)
+
+@batch_scorer('anomaly_detection')
+def score_anomalies_read_only(rows: np.ndarray, bundle: ModelBundle) -> List[Dict[str, float]]:
+    """Score anomaly rows against the streaming baselines without changing them"""
+    return anomaly_results(rows, bundle, update=False)
+
+BATCH_SCORERS = {
+    'ip_reputation': score_ip_reputation,
+    'url_analysis': score_url_analysis,
+    'device_fingerprint': score_device_fingerprint,
+    'behavioral_lstm': score_behavioral_analysis,
+    'behavioral_step': score_behavioral_steps,
+    'anomaly_detection': score_anomalies,
+}
+MODEL_STAGES = {model_name: f'model.{model_name}' for model_name in BATCH_SCORERS}
+# Batch, stream and offline scoring read the anomaly baselines but don't feed them, so their
+# results don't depend on request order, chunking or (for bulk_score.py) the worker count
+VECTORIZED_SCORERS = {**BATCH_SCORERS, 'anomaly_detection': score_anomalies_read_only}
+
+async def run_inference(fn, *args):
+    """Run a blocking inference call on the configured execution backend"""
+    if inference_executor is None:
+        return fn(*args)
+    return await inference_executor.run(fn, *args)
+
+async def infer(model_name: str, row: np.ndarray, bundle: ModelBundle) -> Dict[str, float]:
+    """Score a single row with ``bundle``, through the model's micro-batcher when batching is enabled"""
+    # Measured from the request's side: includes batching and executor queueing
+    with stage(MODEL_STAGES[model_name]):
+        batcher = batchers.get(model_name)
+        if batcher is not None:
+            return await batcher.submit(row, bundle)
+        return (await run_inference(BATCH_SCORERS[model_name], row[np.newaxis], bundle))[0]
+
+def init_inference_worker():
+    """Process-pool worker initializer: make sure the worker has models loaded"""
+    if active_bundle is None:
+        load_startup_ip_intel()
+        asyncio.run(load_models())
+        load_anomaly_state()
+
+def start_inference_executor():
+    """Create the execution backend for model inference"""
+    global inference_executor
+    inference_executor = InferenceExecutor(ExecutorConfig.from_env(), worker_initializer=init_inference_worker)
+    inference_executor.start()
+
+def stop_inference_executor():
+    """Shut down the execution backend"""
+    global inference_executor
+    if inference_executor is not None:
+        inference_executor.shutdown()
+        inference_executor = None
+
+def start_batchers():
+    """Start one micro-batcher per model"""
+    if not BATCHING_ENABLED:
+        logger.info("Micro-batching disabled")
+        return
+    runner = inference_executor.run if inference_executor is not None else None
+    for model_name, score_fn in BATCH_SCORERS.items():
+        batcher = MicroBatcher(model_name, score_fn, BatchingConfig.from_env(model_name), runner=runner)
+        batcher.start()
+        batchers[model_name] = batcher
+
+async def stop_batchers():
+    """Stop all micro-batchers"""
+    for batcher in batchers.values():
+        await batcher.stop()
+    batchers.clear()
+
+async def cached_prediction(prediction_key: str, cache_input: Any, compute, bundle: ModelBundle) -> Dict[str, float]:
+    """Serve a prediction from its model's sub-result cache, computing it on a miss"""
+    cache = subresult_caches.get(prediction_key)
+    if cache is None:
+        return await compute()
+    # Keyed on the model's own artifact version, so entries survive swaps that don't change it
+    model_version = bundle.model_versions.get(PREDICTION_MODELS[prediction_key], 'unknown')
+    key = f"sub:{prediction_key}:{model_version}:{stable_digest(cache_input)}"
+    return await cache.get_or_compute(key, compute)
+
 # Prediction functions
-async def predict_ip_reputation(ip_address: str) -> Dict[str, float]:
+async def predict_ip_reputation(ip_address: str, features: Optional[RequestFeatures] = None,
+                                bundle: Optional[ModelBundle] = None) -> Dict[str, float]:
     """Predict IP reputation"""
+    features = features or RequestFeatures('ip', ip_address)
+    bundle = bundle or active_bundle
     try:
-        features = extract_ip_features(ip_address)
-        features_scaled = scalers['ip_reputation'].transform([features])
-        
-        # Get probability predictions
-        proba = models['ip_reputation'].predict_proba(features_scaled)[0]
-        prediction = models['ip_reputation'].predict(features_scaled)[0]
-        
-        return {
-            'malicious_probability': float(proba[1] if len(proba) > 1 else proba[0]),
-            'prediction': int(prediction),
-            'confidence': float(max(proba))
-        }
+        return await cached_prediction(
+            # The geolocation features come from the IP intelligence table in use
+            'ip_reputation', [ip_address, ip_intel_table.version],
+            lambda: infer('ip_reputation', features.ip, bundle), bundle
+        )
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in IP reputation prediction: {e}")
+        MODEL_FALLBACKS.inc('ip_reputation')
         return {'malicious_probability': 0.5, 'prediction': 0, 'confidence': 0.5}
 
-async def predict_url_analysis(url: str) -> Dict[str, float]:
+async def predict_url_analysis(url: str, features: Optional[RequestFeatures] = None,
+                               bundle: Optional[ModelBundle] = None) -> Dict[str, float]:
     """Predict URL threat level"""
+    features = features or RequestFeatures('url', url)
+    bundle = bundle or active_bundle
+    # Spellings of one URL share their features and so their cached prediction
+    url = normalize_url(url)
     try:
-        features = extract_url_features(url)
-        features_scaled = scalers['url_analysis'].transform([features])
-        
-        proba = models['url_analysis'].predict_proba(features_scaled)[0]
-        prediction = models['url_analysis'].predict(features_scaled)[0]
-        
-        return {
-            'malicious_probability': float(proba[1] if len(proba) > 1 else proba[0]),
-            'prediction': int(prediction),
-            'confidence': float(max(proba))
-        }
+        return await cached_prediction(
+            'url_analysis', url,
+            lambda: infer('url_analysis', features.url(url), bundle), bundle
+        )
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in URL analysis prediction: {e}")
+        MODEL_FALLBACKS.inc('url_analysis')
         return {'malicious_probability': 0.5, 'prediction': 0, 'confidence': 0.5}
 
-async def predict_device_fingerprint(device_data: Dict[str, Any]) -> Dict[str, float]:
+async def predict_device_fingerprint(device_data: Dict[str, Any], features: Optional[RequestFeatures] = None,
+                                     bundle: Optional[ModelBundle] = None) -> Dict[str, float]:
     """Predict device fingerprint threat"""
+    features = features or RequestFeatures('device', '', device_fingerprint=device_data)
+    bundle = bundle or active_bundle
     try:
-        features = extract_device_features(device_data)
-        features_tensor = torch.FloatTensor([features])
-        
-        with torch.no_grad():
-            output = models['device_fingerprint'](features_tensor)
-            proba = output.numpy()[0]
-            
-        return {
-            'malicious_probability': float(proba[1] if len(proba) > 1 else proba[0]),
-            'prediction': int(np.argmax(proba)),
-            'confidence': float(max(proba))
-        }
+        return await cached_prediction(
+            'device_fingerprint', features.device_key,
+            lambda: infer('device_fingerprint', features.device, bundle), bundle
+        )
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in device fingerprint prediction: {e}")
+        MODEL_FALLBACKS.inc('device_fingerprint')
         return {'malicious_probability': 0.5, 'prediction': 0, 'confidence': 0.5}
 
-async def predict_behavioral_analysis(session_data: Dict[str, Any]) -> Dict[str, float]:
+async def predict_behavioral_analysis(session_data: Dict[str, Any], features: Optional[RequestFeatures] = None,
+                                      bundle: Optional[ModelBundle] = None) -> Dict[str, float]:
     """Predict behavioral anomalies"""
+    features = features or RequestFeatures('session', '', session_data=session_data)
+    bundle = bundle or active_bundle
     try:
-        # Extract behavioral features (simplified)
-        features = []
-        features.extend([
-            session_data.get('session_duration', 0),
-            session_data.get('page_views', 0),
-            session_data.get('clicks', 0),
-            session_data.get('scroll_depth', 0),
-            session_data.get('typing_speed', 0),
-        ])
-        
-        # Pad to sequence length
-        sequence_length = 10
-        while len(features) < sequence_length * 5:
-            features.extend([0] * 5)
-            
-        features = np.array(features[:sequence_length * 5]).reshape(1, sequence_length, 5)
-        features_tensor = torch.FloatTensor(features)
-        
-        with torch.no_grad():
-            output = models['behavioral_lstm'](features_tensor)
-            proba = output.numpy()[0]
-            
-        return {
-            'anomaly_probability': float(proba[1] if len(proba) > 1 else proba[0]),
-            'prediction': int(np.argmax(proba)),
-            'confidence': float(max(proba))
-        }
+        return await cached_prediction(
+            'behavioral_analysis', session_data,
+            lambda: infer('behavioral_lstm', features.behavioral, bundle), bundle
+        )
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in behavioral analysis prediction: {e}")
+        MODEL_FALLBACKS.inc('behavioral_analysis')
         return {'anomaly_probability': 0.5, 'prediction': 0, 'confidence': 0.5}
 
-async def detect_anomalies(features: np.ndarray) -> Dict[str, float]:
-    """Detect anomalies using Isolation Forest"""
+async def detect_anomalies(features: RequestFeatures, cache_input: Any = None,
+                           bundle: Optional[ModelBundle] = None) -> Dict[str, float]:
+    """Detect anomalies against the input type's streaming baseline (or the Isolation Forest)"""
+    bundle = bundle or active_bundle
     try:
-        # Pad or truncate features to expected size
-        if len(features) < 50:
-            features = np.pad(features, (0, 50 - len(features)), 'constant')
-        else:
-            features = features[:50]
-            
-        anomaly_score = models['anomaly_detection'].decision_function([features])[0]
-        is_anomaly = models['anomaly_detection'].predict([features])[0]
-        
-        # Convert to probability (anomaly score is typically negative for anomalies)
-        anomaly_probability = max(0, min(1, (1 - anomaly_score) / 2))
-        
-        return {
-            'anomaly_probability': float(anomaly_probability),
-            'is_anomaly': bool(is_anomaly == -1),
-            'anomaly_score': float(anomaly_score)
-        }
+        row = anomaly_scoring_row(features.anomaly, features.input_type)
+        # Every event a streaming baseline scores also updates it, so its results aren't cached
+        if cache_input is None or anomaly_detector is not None:
+            return await infer('anomaly_detection', row, bundle)
+        return await cached_prediction(
+            'anomaly_detection', cache_input, lambda: infer('anomaly_detection', row, bundle), bundle
+        )
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in anomaly detection: {e}")
+        MODEL_FALLBACKS.inc('anomaly_detection')
         return {'anomaly_probability': 0.5, 'is_anomaly': False, 'anomaly_score': 0.0}
 
+# Ensemble scoring
+# Column order matches the order analyze_threat adds predictions, so per-row
+# sums are accumulated in the same order on the single and batch paths.
+ENSEMBLE_COLUMNS = ['ip_reputation', 'url_analysis', 'device_fingerprint', 'behavioral_analysis', 'anomaly_detection']
+
+# Prediction key -> model that produces it
+PREDICTION_MODELS = {
+    'ip_reputation': 'ip_reputation',
+    'url_analysis': 'url_analysis',
+    'device_fingerprint': 'device_fingerprint',
+    'behavioral_analysis': 'behavioral_lstm',
+    'anomaly_detection': 'anomaly_detection',
+}
+
+FALLBACK_PREDICTIONS = {
+    'ip_reputation': {'malicious_probability': 0.5, 'prediction': 0, 'confidence': 0.5},
+    'url_analysis': {'malicious_probability': 0.5, 'prediction': 0, 'confidence': 0.5},
+    'device_fingerprint': {'malicious_probability': 0.5, 'prediction': 0, 'confidence': 0.5},
+    'behavioral_analysis': {'anomaly_probability': 0.5, 'prediction': 0, 'confidence': 0.5},
+    'anomaly_detection': {'anomaly_probability': 0.5, 'is_anomaly': False, 'anomaly_score': 0.0},
+}
+
+def ensemble_scores(prediction_rows: List[Dict[str, Dict[str, float]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Average risk and confidence over the models each row ran (50 when none ran)"""
+    risk = np.full((len(prediction_rows), len(ENSEMBLE_COLUMNS)), np.nan)
+    confidence = np.full_like(risk, np.nan)
+    
+    for i, predictions in enumerate(prediction_rows):
+        for model_name, pred in predictions.items():
+            j = ENSEMBLE_COLUMNS.index(model_name)
+            if 'malicious_probability' in pred:
+                risk[i, j] = pred['malicious_probability'] * 100
+                confidence[i, j] = pred['confidence'] * 100
+            elif 'anomaly_probability' in pred:
+                risk[i, j] = pred['anomaly_probability'] * 100
+                confidence[i, j] = 0.8 * 100  # Default confidence for anomaly detection
+    
+    counts = np.count_nonzero(~np.isnan(risk), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        final_risk = np.where(counts > 0, np.trunc(np.nansum(risk, axis=1) / counts), 50)
+        final_confidence = np.where(counts > 0, np.trunc(np.nansum(confidence, axis=1) / counts), 50)
+    return final_risk.astype(int), final_confidence.astype(int)
+
+def build_response(request: ThreatAnalysisRequest, predictions: Dict[str, Dict[str, float]],
+                   final_risk_score: int, final_confidence: int, processing_time: float,
+                   model_version: Optional[str] = None,
+                   skipped: Optional[Dict[str, str]] = None) -> ThreatAnalysisResponse:
+    """Turn ensemble scores into the API response"""
+    # Determine threat type and severity
+    threat_type = "unknown"
+    severity = "low"
+    
+    if final_risk_score >= 80:
+        severity = "critical"
+        threat_type = "high_risk_threat"
+    elif final_risk_score >= 60:
+        severity = "high"
+        threat_type = "suspicious_activity"
+    elif final_risk_score >= 40:
+        severity = "medium"
+        threat_type = "potential_threat"
+    else:
+        severity = "low"
+        threat_type = "low_risk"
+    
+    # Generate explanation and recommendations
+    explanation = f"Analysis of {request.input_type} '{request.input_value}' indicates {severity} risk level."
+    recommendations = []
+    
+    if final_risk_score >= 70:
+        recommendations.extend([
+            "Block or quarantine the source immediately",
+            "Investigate related network traffic",
+            "Review security logs for similar patterns"
+        ])
+    elif final_risk_score >= 40:
+        recommendations.extend([
+            "Monitor the source closely",
+            "Apply additional security controls",
+            "Consider rate limiting"
+        ])
+    else:
+        recommendations.append("Continue normal monitoring")
+    
+    return ThreatAnalysisResponse(
+        risk_score=final_risk_score,
+        confidence_score=final_confidence,
+        threat_type=threat_type,
+        severity=severity,
+        explanation=explanation,
+        recommendations=recommendations,
+        model_predictions={
+            **{k: v.get('malicious_probability', v.get('anomaly_probability', 0.5)) for k, v in predictions.items()},
+            **{k: None for k in skipped or {}}
+        },
+        processing_time_ms=processing_time,
+        model_version=model_version,
+        skipped_models=skipped or {}
+    )
+
+def known_indicator(request: ThreatAnalysisRequest) -> Optional[IndicatorMatch]:
+    """Entry of the known-indicator lists matching the request's input, if any"""
+    if request.input_type not in INDICATOR_INPUT_TYPES:
+        return None
+    with stage('indicators.lookup'):
+        match = indicator_index.lookup(request.input_type, request.input_value)
+    INDICATOR_LOOKUPS.inc(request.input_type, match.verdict if match else 'miss')
+    return match
+
+def indicator_response(request: ThreatAnalysisRequest, match: IndicatorMatch,
+                       processing_time: float) -> ThreatAnalysisResponse:
+    """Immediate verdict for an input found on a known-indicator list"""
+    malicious = match.verdict == 'malicious'
+    return ThreatAnalysisResponse(
+        risk_score=100 if malicious else 0,
+        confidence_score=100,
+        threat_type="known_malicious" if malicious else "known_benign",
+        severity="critical" if malicious else "low",
+        explanation=(
+            f"{request.input_type} '{request.input_value}' matches {match.verdict} indicator "
+            f"{match.indicator} ({match.source})."
+        ),
+        recommendations=[
+            "Block or quarantine the source immediately",
+            "Investigate related network traffic",
+            "Review security logs for similar patterns"
+        ] if malicious else ["Continue normal monitoring"],
+        model_predictions={'indicator_index': 1.0 if malicious else 0.0},
+        processing_time_ms=processing_time,
+        indicator_match=match.to_dict()
+    )
+
+def indicator_verdicts(requests: List[ThreatAnalysisRequest]) -> Dict[int, ThreatAnalysisResponse]:
+    """Responses for the requests the known-indicator lists decide, by position"""
+    verdicts = {}
+    for i, request in enumerate(requests):
+        started = time.perf_counter()
+        match = known_indicator(request)
+        if match is not None:
+            verdicts[i] = indicator_response(request, match, (time.perf_counter() - started) * 1000)
+    return verdicts
+
+def error_response(error: Exception, processing_time: float,
+                   model_version: Optional[str] = None) -> ThreatAnalysisResponse:
+    """Response returned when analysis fails"""
+    return ThreatAnalysisResponse(
+        risk_score=50,
+        confidence_score=0,
+        threat_type="analysis_error",
+        severity="unknown",
+        explanation=f"Error occurred during analysis: {str(error)}",
+        recommendations=["Manual review required"],
+        model_predictions={},
+        processing_time_ms=processing_time,
+        model_version=model_version
+    )
+
 # Main analysis function
-async def analyze_threat(request: ThreatAnalysisRequest) -> ThreatAnalysisResponse:
-    """Main threat analysis function"""
-    start_time = datetime.now()
+# Cheap models whose confident predictions let the cascade skip the rest
+CASCADE_FIRST_STAGE = ('ip_reputation', 'url_analysis')
+
+def cascade_decides(prediction: Dict[str, float]) -> bool:
+    """True if the cheap first-stage prediction's larger class probability reaches CASCADE_CONFIDENCE"""
+    return CASCADE_ENABLED and prediction.get('confidence', 0.0) >= CASCADE_CONFIDENCE
+
+async def analyze_threat(request: ThreatAnalysisRequest, bundle: Optional[ModelBundle] = None,
+                         deadline: Optional[float] = None) -> ThreatAnalysisResponse:
+    """Main threat analysis function; every model runs from ``bundle`` (default: the active one).
+    
+    Models run cheapest first. With a ``deadline`` (event-loop time), models
+    that haven't finished by then are skipped and the ensemble covers the
+    ones that did.
+    """
+    start_time = time.perf_counter()
+    bundle = bundle or active_bundle
+    loop = asyncio.get_running_loop()
     
     try:
         predictions = {}
+        skipped: Dict[str, str] = {}
+        # Set once the cascade has decided or the deadline has passed; the remaining models are skipped
+        skip_reason = None
+        # Each feature vector is extracted once and shared by the models below
+        features = RequestFeatures.from_request(request)
+        
+        async def run(prediction_key: str, predict):
+            """Add one model's prediction, unless the cascade or the deadline rules it out"""
+            nonlocal skip_reason
+            if skip_reason is not None:
+                skipped[prediction_key] = skip_reason
+                return
+            try:
+                if deadline is None:
+                    predictions[prediction_key] = await predict()
+                    return
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                predictions[prediction_key] = await asyncio.wait_for(predict(), remaining)
+            except asyncio.TimeoutError:
+                skipped[prediction_key] = skip_reason = 'deadline'
         
         # Run appropriate models based on input type
+        primary = None
         if request.input_type == 'ip':
-            predictions['ip_reputation'] = await predict_ip_reputation(request.input_value)
+            primary = 'ip_reputation'
+            await run(primary, lambda: predict_ip_reputation(request.input_value, features, bundle))
         elif request.input_type == 'url':
-            predictions['url_analysis'] = await predict_url_analysis(request.input_value)
+            primary = 'url_analysis'
+            await run(primary, lambda: predict_url_analysis(request.input_value, features, bundle))
         elif request.input_type == 'email':
             # For email, analyze the domain part as URL
-            domain = request.input_value.split('@')[-1] if '@' in request.input_value else request.input_value
-            predictions['url_analysis'] = await predict_url_analysis(domain)
+            primary = 'url_analysis'
+            await run(primary, lambda: predict_url_analysis(features.domain, features, bundle))
+        
+        if primary in predictions and cascade_decides(predictions[primary]):
+            skip_reason = 'cascade'
         
         # Device fingerprint analysis
         if request.device_fingerprint:
-            predictions['device_fingerprint'] = await predict_device_fingerprint(request.device_fingerprint)
+            await run('device_fingerprint', lambda: predict_device_fingerprint(
+                request.device_fingerprint, features, bundle
+            ))
         
         # Behavioral analysis
         if request.session_data:
-            predictions['behavioral_analysis'] = await predict_behavioral_analysis(request.session_data)
+            await run('behavioral_analysis', lambda: predict_behavioral_analysis(
+                request.session_data, features, bundle
+            ))
         
-        # Anomaly detection on combined features
-        all_features = []
+        # Anomaly detection on combined features (input features plus the scalar device features)
+        anomaly_input = {'device_fingerprint': features.device_key if request.device_fingerprint else None}
         if request.input_type == 'ip':
-            all_features.extend(extract_ip_features(request.input_value))
+            anomaly_input['ip'] = request.input_value
         elif request.input_type in ['url', 'email']:
-            domain = request.input_value.split('@')[-1] if '@' in request.input_value else request.input_value
-            all_features.extend(extract_url_features(domain))
+            anomaly_input['url'] = features.domain
         
-        if request.device_fingerprint:
-            device_features = extract_device_features(request.device_fingerprint)
-            all_features.extend(device_features[:20])  # Take first 20 features
-        
-        if all_features:
-            predictions['anomaly_detection'] = await detect_anomalies(np.array(all_features))
+        if len(anomaly_input) > 1 or request.device_fingerprint:
+            await run('anomaly_detection', lambda: detect_anomalies(features, anomaly_input, bundle))
         
-        # Ensemble prediction
-        risk_scores = []
-        confidence_scores = []
+        for prediction_key, reason in skipped.items():
+            MODELS_SKIPPED.inc(prediction_key, reason)
         
-        for model_name, pred in predictions.items():
-            if 'malicious_probability' in pred:
-                risk_scores.append(pred['malicious_probability'] * 100)
-                confidence_scores.append(pred['confidence'] * 100)
-            elif 'anomaly_probability' in pred:
-                risk_scores.append(pred['anomaly_probability'] * 100)
-                confidence_scores.append(0.8 * 100)  # Default confidence for anomaly detection
+        # Ensemble prediction over the models that ran
+        with stage('ensemble'):
+            final_risk, final_confidence = ensemble_scores([predictions])
         
-        # Calculate final scores
-        final_risk_score = int(np.mean(risk_scores)) if risk_scores else 50
-        final_confidence = int(np.mean(confidence_scores)) if confidence_scores else 50
+        # Calculate processing time
+        elapsed = time.perf_counter() - start_time
+        record_stage('analysis', elapsed)
         
-        # Determine threat type and severity
-        threat_type = "unknown"
-        severity = "low"
+        return build_response(
+            request, predictions, int(final_risk[0]), int(final_confidence[0]), elapsed * 1000, bundle.version,
+            skipped
+        )
         
-        if final_risk_score >= 80:
-            severity = "critical"
-            threat_type = "high_risk_threat"
-        elif final_risk_score >= 60:
-            severity = "high"
-            threat_type = "suspicious_activity"
-        elif final_risk_score >= 40:
-            severity = "medium"
-            threat_type = "potential_threat"
-        else:
-            severity = "low"
-            threat_type = "low_risk"
-        
-        # Generate explanation and recommendations
-        explanation = f"Analysis of {request.input_type} '{request.input_value}' indicates {severity} risk level."
-        recommendations = []
-        
-        if final_risk_score >= 70:
-            recommendations.extend([
-                "Block or quarantine the source immediately",
-                "Investigate related network traffic",
-                "Review security logs for similar patterns"
-            ])
-        elif final_risk_score >= 40:
-            recommendations.extend([
-                "Monitor the source closely",
-                "Apply additional security controls",
-                "Consider rate limiting"
-            ])
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        logger.error(f"Error in threat analysis: {e}")
+        processing_time = (time.perf_counter() - start_time) * 1000
+        return error_response(e, processing_time, bundle.version if bundle else None)
+
+def analyze_threats_vectorized(requests: List[ThreatAnalysisRequest],
+                               bundle: Optional[ModelBundle] = None) -> List[ThreatAnalysisResponse]:
+    """Columnar batch analysis: one scaler/model call per model for the whole batch.
+
+    Produces the same responses as calling analyze_threat on each request
+    with the same bundle; processing_time_ms is the batch time amortized
+    over its items.
+    """
+    start_time = time.perf_counter()
+    bundle = bundle or active_bundle
+    
+    # Build one input row per (request, prediction) pair, grouped by model
+    model_rows: Dict[str, List[np.ndarray]] = {name: [] for name in BATCH_SCORERS}
+    row_owners: Dict[str, List[Tuple[int, str]]] = {name: [] for name in BATCH_SCORERS}
+    prediction_rows: List[Dict[str, Dict[str, float]]] = [{} for _ in requests]
+    
+    def add_row(index: int, prediction_key: str, row: np.ndarray):
+        model_name = PREDICTION_MODELS[prediction_key]
+        model_rows[model_name].append(row)
+        row_owners[model_name].append((index, prediction_key))
+        # Reserve the slot so predictions keep analyze_threat's key order
+        prediction_rows[index][prediction_key] = None
+    
+    # Extract IP and URL features for the whole batch at once; the URL model scores
+    # normalized URLs (of the part after '@' for emails), the anomaly vector uses the value as given
+    ip_values = {request.input_value: None for request in requests if request.input_type == 'ip'}
+    url_values = {}
+    scored_urls = {}
+    for i, request in enumerate(requests):
+        if request.input_type in ['url', 'email']:
+            scored_urls[i] = normalize_url(request.input_value if request.input_type == 'url'
+                                           else email_domain(request.input_value))
+            url_values[scored_urls[i]] = None
+            url_values[email_domain(request.input_value)] = None
+    with stage('batch.extract.ip'):
+        ip_matrix = extract_ip_features_batch(list(ip_values))
+    with stage('batch.extract.url'):
+        url_matrix = extract_url_features_batch(list(url_values))
+    ip_features = dict(zip(ip_values, ip_matrix))
+    url_features = dict(zip(url_values, url_matrix))
+    
+    with stage('batch.extract.rows'):
+        for i, request in enumerate(requests):
+            domain = email_domain(request.input_value)
+            primary_features = None
+            if request.input_type == 'ip':
+                primary_features = ip_features[request.input_value]
+                add_row(i, 'ip_reputation', primary_features)
+            elif request.input_type in ['url', 'email']:
+                primary_features = url_features[domain]
+                add_row(i, 'url_analysis', url_features[scored_urls[i]])
+        
+            device_features = None
+            if request.device_fingerprint:
+                device_features = extract_device_features(request.device_fingerprint)
+                add_row(i, 'device_fingerprint', device_features)
+        
+            if request.session_data:
+                try:
+                    add_row(i, 'behavioral_analysis', behavioral_sequence(request.session_data))
+                except Exception as e:
+                    logger.error(f"Error in behavioral analysis prediction: {e}")
+                    MODEL_FALLBACKS.inc('behavioral_analysis')
+                    prediction_rows[i]['behavioral_analysis'] = dict(FALLBACK_PREDICTIONS['behavioral_analysis'])
+        
+            anomaly_row = combined_anomaly_features(primary_features, device_features)
+            if anomaly_row is not None:
+                add_row(i, 'anomaly_detection', anomaly_scoring_row(anomaly_row, request.input_type))
+    
+    def score_rows(model_name: str, rows: List[np.ndarray], owners: List[Tuple[int, str]]):
+        if not rows:
+            return
+        try:
+            results = VECTORIZED_SCORERS[model_name](np.stack(rows), bundle)
+        except Exception as e:
+            logger.error(f"Error in batch {model_name} prediction: {e}")
+            results = [dict(FALLBACK_PREDICTIONS[key]) for _, key in owners]
+            for _, key in owners:
+                MODEL_FALLBACKS.inc(key)
+        for (index, prediction_key), result in zip(owners, results):
+            prediction_rows[index][prediction_key] = result
+    
+    # Score each model once over its stacked rows: the IP/URL models first, so the
+    # cascade can drop the other rows of the requests they settle
+    for model_name in CASCADE_FIRST_STAGE:
+        score_rows(model_name, model_rows[model_name], row_owners[model_name])
+    skipped: List[Dict[str, str]] = [{} for _ in requests]
+    if CASCADE_ENABLED:
+        for index, predictions in enumerate(prediction_rows):
+            primary = next((predictions[key] for key in CASCADE_FIRST_STAGE if key in predictions), None)
+            if primary is None or not cascade_decides(primary):
+                continue
+            for prediction_key in [key for key in predictions if key not in CASCADE_FIRST_STAGE]:
+                del predictions[prediction_key]
+                skipped[index][prediction_key] = 'cascade'
+                MODELS_SKIPPED.inc(prediction_key, 'cascade')
+    for model_name, rows in model_rows.items():
+        if model_name in CASCADE_FIRST_STAGE:
+            continue
+        kept = [j for j, (index, _) in enumerate(row_owners[model_name]) if not skipped[index]]
+        score_rows(model_name, [rows[j] for j in kept], [row_owners[model_name][j] for j in kept])
+    
+    # Ensemble in NumPy for the whole batch
+    with stage('batch.ensemble'):
+        final_risk, final_confidence = ensemble_scores(prediction_rows)
+    processing_time = (time.perf_counter() - start_time) * 1000 / max(len(requests), 1)
+    
+    responses = []
+    with stage('batch.responses'):
+        for i, request in enumerate(requests):
+            try:
+                responses.append(build_response(
+                    request, prediction_rows[i], int(final_risk[i]), int(final_confidence[i]), processing_time,
+                    bundle.version, skipped[i]
+                ))
+            except Exception as e:
+                logger.error(f"Error in threat analysis: {e}")
+                responses.append(error_response(e, processing_time, bundle.version))
+    return responses
+
+# Startup warm-up
+warmup_task: Optional[asyncio.Task] = None
+
+def warmup_rows(bundle: ModelBundle) -> Dict[str, np.ndarray]:
+    """One representative input row per model"""
+    return {
+        'ip_reputation': extract_ip_features("0.0.0.0")[np.newaxis],
+        'url_analysis': extract_url_features("https://example.com")[np.newaxis],
+        'device_fingerprint': extract_device_features({})[np.newaxis],
+        'behavioral_lstm': behavioral_sequence({})[np.newaxis],
+        'behavioral_step': behavioral_step_row(behavioral_event({}), None, bundle)[np.newaxis],
+        # No input type: warm-up rows mustn't reach the streaming baselines
+        'anomaly_detection': anomaly_scoring_row(anomaly_features(np.zeros(0, dtype=np.float32)), None)[np.newaxis],
+    }
+
+async def warm_bundle(bundle: ModelBundle):
+    """Run one prediction per model of ``bundle``, recording failures in ``bundle.warmup_errors``"""
+    started = time.perf_counter()
+    for model_name, row in warmup_rows(bundle).items():
+        try:
+            await run_inference(BATCH_SCORERS[model_name], row, bundle)
+        except Exception as e:
+            bundle.warmup_errors[model_name] = str(e)
+            logger.warning(f"Warm-up prediction for {model_name} ({bundle.version}) failed: {e}")
+    bundle.timings['warmup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+def poll_interval(configured: float) -> float:
+    """Seconds between registry or file checks (0: don't follow); pre-fork workers always follow"""
+    if serving_config.workers <= 1:
+        return configured
+    return min(configured, SERVING_WORKER_POLL_SECONDS) if configured > 0 else SERVING_WORKER_POLL_SECONDS
+
+async def catch_up_with_swaps():
+    """Swap in what changed since the pre-fork parent preloaded (for a worker forked again after a swap)"""
+    try:
+        version = await asyncio.to_thread(model_registry.active)
+        if version != active_bundle.version and model_registry.exists(version):
+            logger.info(f"Registry moved to model version {version} since the preload, reloading")
+            start_swap(version, 'poll')
+            await reload_task
+    except RegistryError as e:
+        logger.warning(f"Model registry unreadable, serving the preloaded version: {e}")
+    try:
+        if await asyncio.to_thread(directory_fingerprint, indicator_config.path) != indicator_index.fingerprint:
+            await reload_indicators()
+        if table_fingerprint(ip_intel_config.path) != ip_intel_table.fingerprint:
+            load_ip_intel_table()
+    except Exception as e:
+        logger.error(f"Serving the preloaded indicator lists or IP intelligence table: {e}")
+
+async def warm_up():
+    """Load models, start the inference backend and run one prediction per model"""
+    global service_ready, registry_poll_task, indicator_poll_task, anomaly_checkpoint_task, ip_intel_poll_task
+    
+    try:
+        # Pre-fork workers start with the parent's models, lists and baselines already in memory
+        indicators_loaded = None
+        if not models_preloaded:
+            # The indicator lists load in their own process alongside the models
+            indicators_loaded = asyncio.create_task(reload_indicators())
+            load_startup_ip_intel()
+            await load_models()
+            load_anomaly_state()
         else:
-            recommendations.append("Continue normal monitoring")
+            await catch_up_with_swaps()
+        start_inference_executor()
+        start_batchers()
         
-        # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds() * 1000
-        
-        return ThreatAnalysisResponse(
-            risk_score=final_risk_score,
-            confidence_score=final_confidence,
-            threat_type=threat_type,
-            severity=severity,
-            explanation=explanation,
-            recommendations=recommendations,
-            model_predictions={k: v.get('malicious_probability', v.get('anomaly_probability', 0.5)) 
-                             for k, v in predictions.items()},
-            processing_time_ms=processing_time
-        )
+        await warm_bundle(active_bundle)
+        startup_timings['warmup_ms'] = active_bundle.timings['warmup_ms']
+        try:
+            if indicators_loaded is not None:
+                await indicators_loaded
+        except Exception as e:
+            logger.error(f"Serving without known-indicator lists: {e}")
+        if poll_interval(indicator_config.poll_seconds) > 0:
+            indicator_poll_task = asyncio.create_task(follow_indicators(poll_interval(indicator_config.poll_seconds)))
+        if poll_interval(ip_intel_config.poll_seconds) > 0:
+            ip_intel_poll_task = asyncio.create_task(follow_ip_intel(poll_interval(ip_intel_config.poll_seconds)))
+        if anomaly_detector is not None and anomaly_config.checkpoint_seconds > 0:
+            anomaly_checkpoint_task = asyncio.create_task(follow_anomaly_checkpoints())
+        startup_timings['ready_ms'] = round((time.perf_counter() - _import_started) * 1000, 1)
+        
+        service_ready = True
+        logger.info(f"ML Service ready with model version {active_bundle.version}: {startup_timings}")
+        
+        if poll_interval(MODEL_REGISTRY_POLL_SECONDS) > 0:
+            registry_poll_task = asyncio.create_task(follow_registry(poll_interval(MODEL_REGISTRY_POLL_SECONDS)))
         
     except Exception as e:
-        logger.error(f"Error in threat analysis: {e}")
-        processing_time = (datetime.now() - start_time).total_seconds() * 1000
-        
-        return ThreatAnalysisResponse(
-            risk_score=50,
-            confidence_score=0,
-            threat_type="analysis_error",
-            severity="unknown",
-            explanation=f"Error occurred during analysis: {str(e)}",
-            recommendations=["Manual review required"],
-            model_predictions={},
-            processing_time_ms=processing_time
+        logger.error(f"Warm-up error: {e}")
+
+def preload_models():
+    """Load and warm the models, indicator lists and IP intelligence table in the pre-fork parent, for the workers to share"""
+    global indicator_index, models_preloaded
+    load_startup_ip_intel()
+    asyncio.run(load_models())
+    asyncio.run(warm_bundle(active_bundle))
+    try:
+        indicator_index = IndicatorIndex.load(indicator_config.path, indicator_config.max_entries)
+        INDICATOR_RELOADS.inc('loaded')
+        logger.info(f"Loaded {len(indicator_index)} known indicators from {indicator_config.path}")
+    except Exception as e:
+        INDICATOR_RELOADS.inc('failed')
+        logger.error(f"Serving without known-indicator lists: {e}")
+    load_anomaly_state()
+    models_preloaded = True
+
+# Known-indicator index
+async def reload_indicators() -> IndicatorIndex:
+    """Build the index from the list files in a child process and swap it in; the old one serves meanwhile"""
+    global indicator_index
+    async with indicator_reload_lock:
+        # Parsing millions of entries is pure Python; a separate process keeps it off this one's GIL.
+        # Spawned, not forked: forking this multi-threaded server could copy a lock some thread holds
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            index = await asyncio.get_running_loop().run_in_executor(
+                pool, IndicatorIndex.load, indicator_config.path, indicator_config.max_entries
+            )
+        except Exception:
+            INDICATOR_RELOADS.inc('failed')
+            raise
+        finally:
+            pool.shutdown(wait=False)
+        indicator_index = index
+        INDICATOR_RELOADS.inc('loaded')
+        logger.info(f"Loaded {len(index)} known indicators from {indicator_config.path} in {index.build_ms} ms")
+        return index
+
+async def follow_indicators(poll_seconds: float):
+    """Reload the index whenever the list files change"""
+    failed_fingerprint = None
+    while True:
+        await asyncio.sleep(poll_seconds)
+        fingerprint = await asyncio.to_thread(directory_fingerprint, indicator_config.path)
+        if fingerprint in (indicator_index.fingerprint, failed_fingerprint) or indicator_reload_lock.locked():
+            continue
+        try:
+            await reload_indicators()
+        except Exception as e:
+            failed_fingerprint = fingerprint
+            logger.error(f"Indicator reload failed, keeping the current index: {e}")
+
+# IP intelligence table
+def load_ip_intel_table() -> IpIntelTable:
+    """Map the IP intelligence table and take the IP features from it; lookups use the old mapping until the swap"""
+    global ip_intel_table
+    try:
+        table = IpIntelTable.open(ip_intel_config.path)
+    except Exception:
+        IP_INTEL_RELOADS.inc('failed')
+        raise
+    ip_intel_table = table
+    use_ip_intel(table)
+    IP_INTEL_RELOADS.inc('loaded')
+    if len(table):
+        logger.info(f"Mapped {len(table.ipv4)} IPv4 and {len(table.ipv6)} IPv6 ranges from {ip_intel_config.path}")
+    else:
+        logger.info(f"No IP intelligence table at {ip_intel_config.path}, IP geolocation features are mocked")
+    return table
+
+def load_startup_ip_intel():
+    try:
+        load_ip_intel_table()
+    except Exception as e:
+        logger.error(f"Serving with mock IP geolocation features: {e}")
+
+async def follow_ip_intel(poll_seconds: float):
+    """Map the table again whenever a new build replaces the file"""
+    failed_fingerprint = None
+    while True:
+        await asyncio.sleep(poll_seconds)
+        fingerprint = table_fingerprint(ip_intel_config.path)
+        if fingerprint in (ip_intel_table.fingerprint, failed_fingerprint):
+            continue
+        try:
+            load_ip_intel_table()
+        except Exception as e:
+            failed_fingerprint = fingerprint
+            logger.error(f"IP intelligence table reload failed, keeping the current table: {e}")
+
+# Streaming anomaly baseline checkpoints
+def load_anomaly_state():
+    """Restore the streaming anomaly baselines from their checkpoint, when there is one taken with these settings"""
+    if anomaly_detector is None:
+        return
+    try:
+        if anomaly_detector.load():
+            logger.info(f"Restored anomaly baselines ({anomaly_detector.events} events) from {anomaly_config.checkpoint_path}")
+    except Exception as e:
+        logger.error(f"Starting the anomaly baselines afresh, checkpoint unreadable: {e}")
+
+def save_anomaly_state():
+    """Checkpoint the baselines if they changed; only the single serving process or pre-fork worker 0 writes"""
+    if anomaly_detector is None or (worker_index() or 0) != 0:
+        return
+    if anomaly_detector.events == anomaly_detector.checkpointed_events:
+        return
+    try:
+        anomaly_detector.save()
+    except Exception as e:
+        logger.error(f"Anomaly baseline checkpoint failed: {e}")
+
+async def follow_anomaly_checkpoints():
+    """Checkpoint the baselines every ANOMALY_CHECKPOINT_SECONDS"""
+    while True:
+        await asyncio.sleep(anomaly_config.checkpoint_seconds)
+        await asyncio.to_thread(save_anomaly_state)
+
+# Hot reload and rollback
+def activate_bundle(bundle: ModelBundle):
+    """Serve new requests with ``bundle``; requests already running finish on the bundle they started with"""
+    global active_bundle, previous_bundle
+    if bundle is not active_bundle:
+        previous_bundle, active_bundle = active_bundle, bundle
+    remember_bundle(bundle)
+    logger.info(f"Serving model version {bundle.version} (previous: {previous_bundle.version if previous_bundle else None})")
+
+def reload_in_progress() -> bool:
+    return reload_task is not None and not reload_task.done()
+
+async def swap_to_version(version: str, kind: str) -> Optional[ModelBundle]:
+    """Load and warm ``version`` off the event loop, then swap it in.
+
+    ``kind`` is reload, rollback or poll; the first two also move the
+    registry's active pointer. A version fails if it can't be loaded or if a
+    model that works in the active version fails its warm-up prediction;
+    failures leave the active bundle untouched.
+    """
+    started = time.perf_counter()
+    try:
+        bundle = await asyncio.to_thread(build_bundle, version)
+        await warm_bundle(bundle)
+        broken = sorted(set(bundle.warmup_errors) - set(active_bundle.warmup_errors))
+        if broken:
+            raise RuntimeError(f"warm-up failed for {', '.join(broken)}: {bundle.warmup_errors[broken[0]]}")
+        activate_bundle(bundle)
+        if kind != 'poll':
+            await asyncio.to_thread(model_registry.set_active, version, kind == 'rollback')
+    except Exception as e:
+        logger.error(f"Loading model version {version} failed, still serving "
+                     f"{active_bundle.version if active_bundle else None}: {e}")
+        MODEL_RELOADS.inc(kind, 'failed')
+        reload_status.update({'state': 'failed', 'error': str(e), 'finished_at': datetime.now().isoformat()})
+        return None
+    
+    MODEL_RELOADS.inc(kind, 'succeeded')
+    reload_status.update({
+        'state': 'idle',
+        'finished_at': datetime.now().isoformat(),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+    return bundle
+
+def start_swap(version: str, kind: str):
+    global reload_task
+    reload_status.clear()
+    reload_status.update({'state': 'loading', 'kind': kind, 'version': version, 'started_at': datetime.now().isoformat()})
+    reload_task = asyncio.create_task(swap_to_version(version, kind))
+
+async def follow_registry(poll_seconds: float):
+    """Swap in the registry's active version whenever it changes"""
+    while True:
+        await asyncio.sleep(poll_seconds)
+        try:
+            version = await asyncio.to_thread(model_registry.active)
+        except RegistryError as e:
+            logger.warning(f"Model registry poll failed: {e}")
+            continue
+        failed_before = reload_status.get('state') == 'failed' and reload_status.get('version') == version
+        if active_bundle is None or version == active_bundle.version or reload_in_progress() or failed_before:
+            continue
+        logger.info(f"Registry switched to model version {version}, reloading")
+        start_swap(version, 'poll')
+        await asyncio.shield(reload_task)
+
+def check_serving_config():
+    """Refuse settings that can't serve correctly together"""
+    if anomaly_detector is not None and ExecutorConfig.from_env().backend == 'process':
+        # Scoring in a child would update only that child's fork-time copy of the baselines
+        raise RuntimeError(
+            "ANOMALY_ENGINE=hst updates its baselines in the serving process and can't run with "
+            "INFERENCE_BACKEND=process; use the thread or inline backend, or ANOMALY_ENGINE=isolation_forest"
+        )
+    if serving_config.workers > 1 and session_config.redis_mode != 'always':
+        # Pre-fork workers share one socket, so a session's events can't be routed to one of them
+        raise RuntimeError(
+            f"SERVING_WORKERS={serving_config.workers} needs SESSION_REDIS_MODE=always to share session "
+            f"state between the workers, got {session_config.redis_mode!r}"
         )
 
+def ensure_ready():
+    """Reject analysis requests until the models are warm"""
+    if not service_ready:
+        raise HTTPException(status_code=503, detail="Models are still loading", headers={"Retry-After": "5"})
+
+def create_redis_client():
+    """Redis client on a bounded pool; callers wait up to REDIS_POOL_TIMEOUT_MS for a connection"""
+    pool = redis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        decode_responses=False,
+        max_connections=redis_cache_config.max_connections,
+        timeout=redis_cache_config.pool_timeout_ms / 1000,
+        socket_timeout=redis_cache_config.socket_timeout_ms / 1000,
+        socket_connect_timeout=redis_cache_config.socket_timeout_ms / 1000,
+    )
+    return redis.Redis(connection_pool=pool)
+
 # API Routes
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
-    global redis_client
+    global redis_client, redis_backend, analysis_cache, session_store, warmup_task
     
     try:
-        # Initialize Redis
-        redis_client = redis.from_url(
-            os.getenv("REDIS_URL", "redis://localhost:6379"),
-            decode_responses=True
-        )
-        await redis_client.ping()
-        logger.info("Connected to Redis")
+        check_serving_config()
         
-        # Load ML models
-        await load_models()
+        # Initialize Redis; without it the service runs with the local cache tier only
+        started = time.perf_counter()
+        redis_client = create_redis_client()
+        redis_backend = RedisBackend(lambda: redis_client, redis_cache_config)
+        try:
+            await redis_client.ping()
+            startup_timings['redis_connect_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            logger.info("Connected to Redis")
+        except Exception as e:
+            redis_backend.failed(e)
+        
+        analysis_cache = TieredCache.from_env(
+            "analysis",
+            redis_backend,
+            encode=lambda body: ANALYSIS_CACHE_PREFIX + body,
+            decode=decode_cached_analysis,
+            ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS
+        )
+        if SUBRESULT_CACHE_ENABLED:
+            for prediction_key, default_ttl in SUBRESULT_TTL_DEFAULTS.items():
+                subresult_caches[prediction_key] = TieredCache.from_env(
+                    f"sub:{prediction_key}",
+                    redis_backend,
+                    encode=json.dumps,
+                    decode=json.loads,
+                    ttl_seconds=int(os.getenv(f"SUBRESULT_TTL_{prediction_key.upper()}_SECONDS", default_ttl))
+                )
+        session_store = SessionStore(session_config, redis_backend, shared=serving_config.workers > 1)
+        session_store.start()
+        
+        # Load and warm models in the background; /health answers meanwhile and /ready reports progress
+        warmup_task = asyncio.create_task(warm_up())
         
         logger.info("ML Service started successfully")
         
@@ -592,6 +1733,18 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    for task in (warmup_task, registry_poll_task, reload_task, training_task, indicator_poll_task,
+                 ip_intel_poll_task, anomaly_checkpoint_task):
+        if task and not task.done():
+            task.cancel()
+    save_anomaly_state()
+    await training_jobs.stop()
+    await stop_batchers()
+    stop_inference_executor()
+    if session_store:
+        await session_store.stop()
+    if redis_backend:
+        await redis_backend.stop()
     if redis_client:
         await redis_client.close()
     logger.info("ML Service shut down")
@@ -604,130 +1757,672 @@ async def health_check():
         return {
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
-            "models_loaded": len(models),
+            "models_loaded": len(active_bundle.models) if active_bundle else 0,
+            "model_version": active_bundle.version if active_bundle else None,
             "redis_connected": True
         }
     except Exception as e:
+        # Analysis keeps working without Redis, on the local cache tier only
         return {
-            "status": "unhealthy",
+            "status": "degraded",
             "timestamp": datetime.now().isoformat(),
+            "models_loaded": len(active_bundle.models) if active_bundle else 0,
+            "model_version": active_bundle.version if active_bundle else None,
+            "redis_connected": False,
             "error": str(e)
         }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 200 only once models are loaded and warm"""
+    status = {
+        "status": "ready" if service_ready else "loading",
+        "timestamp": datetime.now().isoformat(),
+        "models_loaded": len(active_bundle.models) if active_bundle else 0,
+        "model_version": active_bundle.version if active_bundle else None,
+        "model_versions": active_bundle.model_versions if active_bundle else {},
+        "startup_timings": startup_timings
+    }
+    if not service_ready:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+def debug_breakdown(debug_timings: bool) -> Optional[Dict[str, float]]:
+    """Start collecting this request's stage timings if it asked for them and they're enabled"""
+    return start_breakdown() if debug_timings and DEBUG_TIMINGS_ENABLED else None
+
+def analysis_cache_key(request: ThreatAnalysisRequest, bundle: ModelBundle) -> str:
+    # Keyed on the models' artifact versions, not the bundle's name ("base" whatever the base models
+    # are); the IP features depend on the IP intelligence table as well, and the indicator
+    # version keeps entries computed before a list change from outliving it
+    return (f"analysis:{stable_digest(bundle.model_versions)}:{ip_intel_table.version}:{indicator_index.version}:"
+            f"{stable_digest(request.dict())}")
+
+# The analysis cache holds serialized response bodies, so a hit is sent back as stored.
+# Redis copies are prefixed with a digest of the response schema: entries written for
+# another schema are treated as misses instead of being served in a stale format.
+ANALYSIS_SCHEMA_VERSION = stable_digest(ThreatAnalysisResponse.model_json_schema())[:12]
+ANALYSIS_CACHE_PREFIX = f"{ANALYSIS_SCHEMA_VERSION}:".encode()
+
+def decode_cached_analysis(raw: bytes) -> Optional[bytes]:
+    return raw[len(ANALYSIS_CACHE_PREFIX):] if raw.startswith(ANALYSIS_CACHE_PREFIX) else None
+
+def encode_analysis(result: ThreatAnalysisResponse) -> bytes:
+    """Response body of a result, by pydantic-core's serializer (FastAPI's encoder is far slower)"""
+    with stage('serialize'):
+        return to_json(result)
+
+def json_body(body: bytes, breakdown: Optional[Dict[str, float]] = None) -> Response:
+    response = Response(content=body, media_type="application/json")
+    if breakdown is not None:
+        response.headers["Server-Timing"] = server_timing(breakdown)
+    return response
+
+class AnalysisFailed(Exception):
+    """An analysis that came back as analysis_error; raised with its encoded response so the cache doesn't keep it"""
+    def __init__(self, body: bytes):
+        super().__init__('analysis_error')
+        self.body = body
+
+async def analyze_encoded(request: ThreatAnalysisRequest, bundle: ModelBundle) -> bytes:
+    result = await analyze_threat(request, bundle)
+    body = encode_analysis(result)
+    if result.threat_type == 'analysis_error':
+        raise AnalysisFailed(body)
+    return body
+
+async def analyze_within_deadline(request: ThreatAnalysisRequest, bundle: ModelBundle, cache_key: str,
+                                  deadline: float) -> bytes:
+    """Cached result, or an analysis cut off at ``deadline``; only complete results are cached"""
+    # Not single-flight: sharing another request's computation would ignore this request's budget
+    cached = (await analysis_cache.get_many([cache_key])).get(cache_key)
+    if cached is not None:
+        return cached
+    result = await analyze_threat(request, bundle, deadline)
+    body = encode_analysis(result)
+    if 'deadline' not in result.skipped_models.values() and result.threat_type != 'analysis_error':
+        analysis_cache.put(cache_key, body)
+    return body
+
 @app.post("/api/analyze", response_model=ThreatAnalysisResponse)
-async def analyze_single_threat(request: ThreatAnalysisRequest):
-    """Analyze a single threat"""
+async def analyze_single_threat(request: ThreatAnalysisRequest, debug_timings: bool = False,
+                                deadline_ms: Optional[float] = None):
+    """Analyze a single threat, within ``deadline_ms`` (default ANALYSIS_DEADLINE_MS) if given"""
+    ensure_ready()
+    breakdown = debug_breakdown(debug_timings)
+    deadline_ms = ANALYSIS_DEADLINE_MS if deadline_ms is None else deadline_ms
+    deadline = asyncio.get_running_loop().time() + deadline_ms / 1000 if deadline_ms > 0 else None
     try:
-        # Check cache first
-        cache_key = f"analysis:{hash(str(request.dict()))}"
-        cached_result = await redis_client.get(cache_key)
-        
-        if cached_result:
-            logger.info("Returning cached result")
-            return ThreatAnalysisResponse.parse_raw(cached_result)
-        
-        # Perform analysis
-        result = await analyze_threat(request)
-        
-        # Cache result for 5 minutes
-        await redis_client.setex(
-            cache_key, 
-            300, 
-            result.json()
-        )
-        
-        return result
+        # Listed indicators are answered before the cache, so list changes apply immediately
+        started = time.perf_counter()
+        match = known_indicator(request)
+        if match is not None:
+            return json_body(encode_analysis(indicator_response(request, match, (time.perf_counter() - started) * 1000)))
+        
+        # Local tier, then Redis, then analysis; identical concurrent requests share one computation.
+        # The request keeps this bundle even if another version is swapped in meanwhile.
+        bundle = active_bundle
+        cache_key = analysis_cache_key(request, bundle)
+        if deadline is None:
+            try:
+                body = await analysis_cache.get_or_compute(cache_key, lambda: analyze_encoded(request, bundle))
+            except AnalysisFailed as e:
+                # Answered, but not cached: a transient failure shouldn't be served for a whole TTL
+                body = e.body
+        else:
+            body = await analyze_within_deadline(request, bundle, cache_key, deadline)
+        return json_body(body, breakdown)
         
+    except ExecutorSaturated as e:
+        logger.warning(f"Analysis rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Analysis error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/analyze/batch")
-async def analyze_batch_threats(request: BatchAnalysisRequest):
+async def analyze_batch_threats(request: BatchAnalysisRequest, debug_timings: bool = False):
     """Analyze multiple threats in batch"""
+    ensure_ready()
+    breakdown = debug_breakdown(debug_timings)
     try:
-        results = []
-        
-        # Process requests concurrently
-        tasks = [analyze_threat(req) for req in request.requests]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Handle exceptions
-        processed_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"Batch analysis error for request {i}: {result}")
-                processed_results.append({
-                    "error": str(result),
-                    "request_index": i
-                })
-            else:
-                processed_results.append(result.dict())
-        
-        return {
-            "results": processed_results,
-            "total_processed": len(processed_results),
-            "timestamp": datetime.now().isoformat()
-        }
-        
+        bundle = active_bundle
+        verdicts = indicator_verdicts(request.requests)
+        keys = {i: analysis_cache_key(item, bundle) for i, item in enumerate(request.requests) if i not in verdicts}
+        # Local tier, then one MGET for the rest; only the misses are analyzed
+        results = await analysis_cache.get_many(list(keys.values()))
+        misses = {key: request.requests[i] for i, key in keys.items() if key not in results}
+        if misses:
+            # Score the distinct misses column-wise: one call per model
+            scored = await run_inference(analyze_threats_vectorized, list(misses.values()), bundle)
+            for key, result in zip(misses, scored):
+                results[key] = body = encode_analysis(result)
+                if result.threat_type != 'analysis_error':
+                    analysis_cache.put(key, body)
+        bodies = [
+            encode_analysis(verdicts[i]) if i in verdicts else results[keys[i]] for i in range(len(request.requests))
+        ]
+        # The cached bodies are spliced into the envelope as they are
+        return json_body(b'{"results":[%s],"total_processed":%d,"timestamp":"%s"}' % (
+            b",".join(bodies), len(bodies), datetime.now().isoformat().encode(),
+        ), breakdown)
+        
+    except ExecutorSaturated as e:
+        logger.warning(f"Batch analysis rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Batch analysis error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def score_stream_chunk(requests: List[ThreatAnalysisRequest]) -> List[Dict[str, Any]]:
+    """Score one chunk of a streamed request body, waiting (not failing) while the executor is saturated"""
+    verdicts = indicator_verdicts(requests)
+    rest = [request for i, request in enumerate(requests) if i not in verdicts]
+    # Each chunk takes an analysis slot in turn with the other endpoints, but is never shed
+    admitted_at = await admission.acquire(shed=False) if rest and admission.config.enabled else None
+    try:
+        while True:
+            try:
+                scored = iter(await run_inference(analyze_threats_vectorized, rest, active_bundle) if rest else [])
+                return [(verdicts[i] if i in verdicts else next(scored)).dict() for i in range(len(requests))]
+            except ExecutorSaturated:
+                await asyncio.sleep(STREAM_SATURATED_BACKOFF_SECONDS)
+    finally:
+        if admitted_at is not None:
+            admission.release(admitted_at)
+
+@app.post("/api/analyze/stream")
+async def analyze_threat_stream(request: Request):
+    """Analyze a newline-delimited JSON stream of threats, streaming NDJSON results back"""
+    ensure_ready()
+    if admission.config.enabled and admission.queued >= admission.config.max_queue:
+        retry_after = admission.retry_after()
+        raise HTTPException(status_code=429, detail=f"Service overloaded (queue_full), retry in {retry_after}s",
+                            headers={"Retry-After": str(retry_after)})
+    stream = NDJSONScoringStream(
+        request.stream(), ThreatAnalysisRequest.parse_raw, score_stream_chunk, StreamingConfig.from_env(),
+        wait_disconnect=request.receive,
+    )
+    return NDJSONStreamingResponse(stream)
+
+@app.post("/api/sessions/events", response_model=SessionEventResponse)
+async def score_session_event(request: SessionEventRequest):
+    """Apply one event to a session's persisted LSTM state: one LSTM step per event"""
+    ensure_ready()
+    start_time = time.perf_counter()
+    bundle = active_bundle
+    model_version = bundle.model_versions.get('behavioral_lstm', 'unknown')
+    try:
+        # Events of one session are applied in turn; other sessions don't wait
+        async with session_store.lock(request.session_id):
+            session = None if request.reset else await session_store.get(request.session_id, model_version)
+            with stage('extract.behavioral_event'):
+                row = behavioral_step_row(behavioral_event(request.event), session.state if session else None, bundle)
+            prediction, state = await infer('behavioral_step', row, bundle)
+            steps = session.steps + 1 if session else 1
+            session_store.put(request.session_id, SessionState(state, steps, model_version))
+        
+        risk, _ = ensemble_scores([{'behavioral_analysis': prediction}])
+        return SessionEventResponse(
+            session_id=request.session_id,
+            steps=steps,
+            new_session=session is None,
+            risk_score=int(risk[0]),
+            behavioral_analysis=prediction,
+            model_version=bundle.version,
+            processing_time_ms=(time.perf_counter() - start_time) * 1000
+        )
+        
+    except ExecutorSaturated as e:
+        logger.warning(f"Session event rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error(f"Session event error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a session's state"""
+    async with session_store.lock(session_id):
+        found = session_store.delete(session_id)
+    return {"session_id": session_id, "deleted": found}
+
+@app.get("/api/sessions/stats")
+async def get_session_stats():
+    """Get session store size, state memory, hit/restore counters and evictions"""
+    return {**(session_store.stats() if session_store else {}), "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/models/anomaly")
+async def get_anomaly_stats():
+    """Get the anomaly engine and the state of each input type's streaming baseline"""
+    if anomaly_detector is None:
+        return {"engine": anomaly_config.engine, "timestamp": datetime.now().isoformat()}
+    return {**anomaly_detector.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/indicators")
+async def get_indicator_stats():
+    """Get the known-indicator index size, lookup hit rates and lookup latency"""
+    lookups: Dict[str, Dict[str, int]] = {}
+    for input_type in INDICATOR_INPUT_TYPES:
+        counts = {result: int(INDICATOR_LOOKUPS.value(input_type, result)) for result in ('malicious', 'benign', 'miss')}
+        total = sum(counts.values())
+        lookups[input_type] = {**counts, 'hit_rate': (total - counts['miss']) / total if total else 0.0}
+    latency_us = {
+        name: round(STAGE_SECONDS.quantile(q, 'indicators.lookup') * 1e6, 1)
+        for name, q in (('p50', 0.5), ('p99', 0.99)) if STAGE_SECONDS.snapshot('indicators.lookup')
+    }
+    return {
+        **indicator_index.stats(),
+        "path": indicator_config.path,
+        "reloading": indicator_reload_lock.locked(),
+        "lookups": lookups,
+        "lookup_latency_us": latency_us,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/indicators/reload")
+async def reload_indicator_lists():
+    """Rebuild the known-indicator index from the list files; the current index serves until it's swapped"""
+    if indicator_reload_lock.locked():
+        raise HTTPException(status_code=409, detail="Indicator lists are already being reloaded")
+    try:
+        index = await reload_indicators()
+    except IndicatorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Indicator reload error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {**index.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/ip-intel")
+async def get_ip_intel_stats():
+    """Get the IP intelligence table in use"""
+    return {**ip_intel_table.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.post("/api/ip-intel/lookup")
+async def lookup_ip_intel(request: IpIntelLookupRequest):
+    """Look up addresses in the IP intelligence table; null for addresses outside its ranges"""
+    records = ip_intel_table.lookup_many(request.ips)
+    return {
+        "results": [{"ip": ip, "intel": record.to_dict() if record else None} for ip, record in zip(request.ips, records)],
+        "version": ip_intel_table.version,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/ip-intel/reload")
+async def reload_ip_intel():
+    """Map the IP intelligence table file again; the current table serves until the new one is swapped in"""
+    try:
+        table = load_ip_intel_table()
+    except IpIntelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"IP intelligence reload error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {**table.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Serving metrics in Prometheus text format, labelled with the worker under pre-fork serving"""
+    # Pre-fork workers count on their own: scrape each on its SERVING_METRICS_PORT + index
+    index = worker_index()
+    return Response(REGISTRY.render({'worker': str(index)} if index is not None else None), media_type=CONTENT_TYPE)
+
+def collect_service_metrics():
+    """Scrape-time metrics from the caches, batchers, executor and loaded models"""
+    yield ("sureguard_ml_ready", "gauge", "1 once models are loaded and warm", [({}, int(service_ready))])
+    if active_bundle is not None:
+        yield ("sureguard_ml_model_info", "gauge", "Loaded model versions",
+               [({"model": name, "version": version}, 1) for name, version in sorted(active_bundle.model_versions.items())])
+        yield ("sureguard_ml_active_model_version_info", "gauge", "Registry version being served",
+               [({"version": active_bundle.version}, 1)])
+    
+    caches = {"analysis": analysis_cache} if analysis_cache else {}
+    caches.update(subresult_caches)
+    lookups = []
+    for name, cache in caches.items():
+        stats = cache.stats()
+        lookups.extend([
+            ({"cache": name, "tier": "local", "result": "hit"}, stats["local"]["hits"]),
+            ({"cache": name, "tier": "local", "result": "miss"}, stats["local"]["misses"]),
+            ({"cache": name, "tier": "redis", "result": "hit"}, stats["redis"]["hits"]),
+            ({"cache": name, "tier": "redis", "result": "miss"}, stats["redis"]["misses"]),
+        ])
+    yield ("sureguard_ml_cache_lookups_total", "counter", "Cache lookups by cache, tier and result", lookups)
+    yield ("sureguard_ml_cache_entries", "gauge", "Entries in each local cache tier",
+           [({"cache": name}, len(cache.local)) for name, cache in caches.items()])
+    if redis_backend is not None:
+        stats = redis_backend.stats()
+        yield ("sureguard_ml_redis_available", "gauge", "0 while Redis errors keep the caches local-only",
+               [({}, int(stats["available"]))])
+        yield ("sureguard_ml_redis_errors_total", "counter", "Redis command errors", [({}, stats["errors"])])
+        yield ("sureguard_ml_redis_pending_writes", "gauge", "Cache writes waiting for the next write-behind flush",
+               [({}, stats["pending_writes"])])
+        yield ("sureguard_ml_redis_writes_total", "counter", "Write-behind cache writes by outcome", [
+            ({"outcome": "written"}, stats["writes"]), ({"outcome": "dropped"}, stats["dropped_writes"]),
+        ])
+    
+    yield ("sureguard_ml_indicator_entries", "gauge", "Known indicators loaded by list kind",
+           [({"kind": kind}, count) for kind, count in sorted(indicator_index.counts.items())])
+    yield ("sureguard_ml_indicator_index_bytes", "gauge", "Memory held by the known-indicator index",
+           [({}, indicator_index.nbytes)])
+    yield ("sureguard_ml_ip_intel_ranges", "gauge", "IP intelligence table ranges by address family",
+           [({"family": "ipv4"}, len(ip_intel_table.ipv4)), ({"family": "ipv6"}, len(ip_intel_table.ipv6))])
+    
+    if anomaly_detector is not None:
+        baselines = anomaly_detector.stats()["baselines"]
+        yield ("sureguard_ml_anomaly_baseline_events_total", "counter", "Events scored into each streaming anomaly baseline",
+               [({"input_type": input_type}, stats["events"]) for input_type, stats in baselines.items()])
+        yield ("sureguard_ml_anomaly_baseline_ready", "gauge", "1 once an input type's streaming anomaly baseline scores",
+               [({"input_type": input_type}, int(stats["ready"])) for input_type, stats in baselines.items()])
+    
+    if session_store is not None:
+        stats = session_store.stats()
+        yield ("sureguard_ml_sessions", "gauge", "Sessions with LSTM state held in memory", [({}, stats["sessions"])])
+        yield ("sureguard_ml_session_state_bytes", "gauge", "Memory held by session LSTM states",
+               [({}, stats["state_bytes"])])
+        yield ("sureguard_ml_session_lookups_total", "counter", "Session state lookups by result", [
+            ({"result": "hit"}, stats["hits"]), ({"result": "restored"}, stats["restores"]),
+            ({"result": "miss"}, stats["misses"]), ({"result": "version_reset"}, stats["version_resets"]),
+        ])
+        yield ("sureguard_ml_session_evictions_total", "counter", "Sessions dropped from memory by reason",
+               [({"reason": reason}, count) for reason, count in sorted(stats["evictions"].items())])
+        yield ("sureguard_ml_session_spills_total", "counter", "Session states written to Redis", [({}, stats["spills"])])
+    
+    yield ("sureguard_ml_batches_total", "counter", "Micro-batches scored per model",
+           [({"model": name}, batcher.stats.batches) for name, batcher in batchers.items()])
+    yield ("sureguard_ml_batched_rows_total", "counter", "Rows scored through each model's micro-batcher",
+           [({"model": name}, batcher.stats.items) for name, batcher in batchers.items()])
+    
+    stats = admission.stats()
+    yield ("sureguard_ml_admission_in_flight", "gauge", "Analysis requests holding a slot", [({}, stats["in_flight"])])
+    yield ("sureguard_ml_admission_queued", "gauge", "Analysis requests waiting for a slot", [({}, stats["queued"])])
+    yield ("sureguard_ml_admission_requests_total", "counter", "Analysis requests by admission outcome", [
+        ({"outcome": "admitted"}, stats["admitted"]), ({"outcome": "disconnected"}, stats["disconnected"]),
+    ] + [({"outcome": f"rejected_{reason}"}, count) for reason, count in sorted(stats["rejected"].items())])
+    
+    worker = str(worker_index() or 0)
+    yield ("sureguard_ml_worker_info", "gauge", "Serving process answering this scrape",
+           [({"worker": worker, "pid": str(os.getpid())}, 1)])
+    yield ("sureguard_ml_process_memory_bytes", "gauge", "Serving process memory (pss counts shared pages proportionally)",
+           [({"worker": worker, "kind": kind}, value) for kind, value in sorted(memory_usage().items())])
+    
+    if inference_executor is not None:
+        stats = inference_executor.stats()
+        yield ("sureguard_ml_executor_queued", "gauge", "Inference calls waiting for a slot", [({}, stats["queued"])])
+        yield ("sureguard_ml_executor_running", "gauge", "Inference calls running", [({}, stats["running"])])
+        yield ("sureguard_ml_executor_calls_total", "counter", "Inference calls by outcome", [
+            ({"outcome": outcome}, stats[outcome]) for outcome in ("completed", "failed", "rejected")
+        ])
+
+REGISTRY.add_collector(collect_service_metrics)
+
 @app.get("/api/models/metrics")
 async def get_model_metrics():
-    """Get model performance metrics"""
+    """Get per-model serving metrics: calls, rows, fallbacks and inference latency"""
     try:
+        bundle = active_bundle
+        evaluation = version_metadata(bundle.version).get('evaluation', {}) if bundle else {}
         metrics = []
-        
-        # Mock metrics - in production, these would be real performance metrics
-        model_names = ['ip_reputation', 'url_analysis', 'device_fingerprint', 'behavioral_lstm', 'anomaly_detection']
-        
-        for model_name in model_names:
-            if model_name in models:
-                metrics.append(ModelMetrics(
-                    model_name=model_name,
-                    accuracy=0.95 + np.random.random() * 0.04,  # 95-99%
-                    precision=0.93 + np.random.random() * 0.06,  # 93-99%
-                    recall=0.91 + np.random.random() * 0.08,     # 91-99%
-                    f1_score=0.92 + np.random.random() * 0.07,   # 92-99%
-                    last_updated=datetime.now()
-                ))
-        
-        return {"metrics": [metric.dict() for metric in metrics]}
+        for prediction_key, model_name in PREDICTION_MODELS.items():
+            if bundle is None or model_name not in bundle.models:
+                continue
+            stage_name = f'inference.{model_name}'
+            snapshot = STAGE_SECONDS.snapshot(stage_name)
+            latency_ms = {}
+            if snapshot is not None:
+                _, total, count = snapshot
+                latency_ms['mean'] = round(total / count * 1000, 3)
+                for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                    latency_ms[name] = round(STAGE_SECONDS.quantile(q, stage_name) * 1000, 3)
+            metrics.append(ModelMetrics(
+                model_name=model_name,
+                version=bundle.model_versions.get(model_name),
+                inference_calls=snapshot[2] if snapshot else 0,
+                rows_scored=int(INFERENCE_ROWS.value(model_name)),
+                fallbacks=int(MODEL_FALLBACKS.value(prediction_key)),
+                latency_ms=latency_ms,
+                accuracy=evaluation.get(model_name, {}).get('accuracy'),
+                precision=evaluation.get(model_name, {}).get('precision'),
+                recall=evaluation.get(model_name, {}).get('recall'),
+                f1_score=evaluation.get(model_name, {}).get('f1')
+            ))
+        
+        return {"metrics": [metric.dict() for metric in metrics], "timestamp": datetime.now().isoformat()}
         
     except Exception as e:
         logger.error(f"Error getting model metrics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/models/retrain")
-async def retrain_models(background_tasks: BackgroundTasks):
-    """Trigger model retraining"""
+@app.get("/api/models/batching")
+async def get_batching_stats():
+    """Get achieved micro-batch sizes per model"""
+    return {
+        "enabled": BATCHING_ENABLED,
+        "models": {
+            name: {
+                "max_batch_size": batcher.config.max_batch_size,
+                "max_wait_ms": batcher.config.max_wait_ms,
+                **batcher.stats.to_dict()
+            }
+            for name, batcher in batchers.items()
+        },
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/models/executor")
+async def get_executor_stats():
+    """Get inference executor queue and concurrency stats"""
+    if inference_executor is None:
+        return {"backend": None, "timestamp": datetime.now().isoformat()}
+    return {**inference_executor.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/admission")
+async def get_admission_stats():
+    """Get admission control limits, queue depth and shed requests"""
+    return {**admission.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters per cache tier"""
+    return {
+        "analysis": analysis_cache.stats() if analysis_cache else None,
+        "subresults": {name: cache.stats() for name, cache in subresult_caches.items()},
+        "redis": redis_backend.stats() if redis_backend else None,
+        "model_version": active_bundle.version if active_bundle else None,
+        "model_versions": active_bundle.model_versions if active_bundle else {},
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/models/serving")
+async def get_serving_config():
+    """Get the inference engine in use for each model"""
+    bundle = active_bundle
+    return {
+        "model_version": bundle.version if bundle else None,
+        "tree_engine": TREE_ENGINE,
+        "tree_engine_max_rows": TREE_ENGINE_MAX_ROWS,
+        "compiled_tree_models": sorted(bundle.compiled) if bundle else [],
+        "torch": bundle.torch_report if bundle else {},
+        "worker": {
+            "index": worker_index(),
+            "pid": os.getpid(),
+            "workers": serving_config.workers,
+            "models_preloaded": models_preloaded,
+            "torch_threads": torch.get_num_threads(),
+            "memory_bytes": memory_usage(),
+        },
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/models/registry")
+async def get_model_registry():
+    """Get the serving and registry versions, rollback history and the last reload"""
     try:
-        background_tasks.add_task(retrain_models_background)
         return {
-            "message": "Model retraining initiated",
+            "active": active_bundle.describe() if active_bundle else None,
+            "previous": previous_bundle.version if previous_bundle else None,
+            "registry_active": model_registry.active(),
+            "history": model_registry.history(),
+            "versions": model_registry.versions(),
+            "reload": dict(reload_status, in_progress=reload_in_progress()),
             "timestamp": datetime.now().isoformat()
         }
+    except RegistryError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/models/reload", status_code=202)
+async def reload_model_version(request: Optional[ModelReloadRequest] = None):
+    """Load a registry version in the background and swap it in once warm"""
+    ensure_ready()
+    if reload_in_progress():
+        raise HTTPException(status_code=409, detail=f"Already loading model version {reload_status.get('version')}")
+    try:
+        version = (request.version if request else None) or model_registry.latest()
+        if version is None:
+            raise HTTPException(status_code=404, detail="No model versions have been published")
+        if not model_registry.exists(version):
+            raise HTTPException(status_code=404, detail=f"Unknown model version {version!r}")
+    except RegistryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    if version == active_bundle.version:
+        return JSONResponse(status_code=200, content={"status": "active", "version": version})
+    start_swap(version, 'reload')
+    return {"status": "loading", "version": version, "replacing": active_bundle.version}
+
+@app.post("/api/models/rollback")
+async def rollback_model_version():
+    """Go back to the previously active version.
+
+    Instant when that version is still held in memory (the usual case right
+    after a reload); otherwise it is loaded in the background like a reload.
+    """
+    ensure_ready()
+    if reload_in_progress():
+        raise HTTPException(status_code=409, detail=f"Already loading model version {reload_status.get('version')}")
+    try:
+        version = model_registry.rollback_target()
+    except RegistryError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if version is None:
+        raise HTTPException(status_code=409, detail="No previous model version to roll back to")
+    
+    replaced = active_bundle.version
+    if previous_bundle is not None and previous_bundle.version == version:
+        activate_bundle(previous_bundle)
+        await asyncio.to_thread(model_registry.set_active, version, True)
+        MODEL_RELOADS.inc('rollback', 'succeeded')
+        return {"status": "active", "version": version, "replaced": replaced}
+    start_swap(version, 'rollback')
+    return JSONResponse(status_code=202, content={"status": "loading", "version": version, "replacing": replaced})
+
+@app.post("/api/training/examples")
+async def add_labeled_examples(request: LabeledExamplesRequest):
+    """Store labeled examples for the next training job"""
+    try:
+        stored = await asyncio.to_thread(labeled_store.add, [example.dict() for example in request.examples])
+        stats = await asyncio.to_thread(labeled_store.stats)
+        return {"stored": stored, "examples": stats, "timestamp": datetime.now().isoformat()}
     except Exception as e:
-        logger.error(f"Error initiating model retraining: {e}")
+        logger.error(f"Error storing labeled examples: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def retrain_models_background():
-    """Background task for model retraining"""
+@app.post("/api/models/retrain", status_code=202)
+async def retrain_models(request: Optional[RetrainRequest] = None):
+    """Start a training job on the labeled examples; it publishes a new registry version"""
+    global training_task
+    request = request or RetrainRequest()
+    unknown = sorted(set(request.models) - set(TRAINABLE_MODELS))
+    if unknown or not request.models:
+        raise HTTPException(status_code=400, detail=f"Trainable models are {sorted(TRAINABLE_MODELS)}, got {request.models}")
+    if request.mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {MODES}")
+    if training_jobs.running():
+        raise HTTPException(status_code=409, detail=f"Training job {training_jobs.job_id} is still running")
+    
     try:
-        logger.info("Starting model retraining...")
-        # In production, this would trigger actual model retraining
-        await asyncio.sleep(5)  # Simulate training time
-        logger.info("Model retraining completed")
+        # Train on top of the version being served; the job reads its artifacts, not the loaded models
+        parent = active_bundle.version if active_bundle else model_registry.active()
+        job = await training_jobs.start({
+            'models': request.models,
+            'mode': request.mode,
+            'force': request.force,
+            'activate': request.activate,
+            'registry_root': MODEL_REGISTRY_PATH,
+            'parent_version': parent,
+            'parent_metadata': version_metadata(parent),
+            'search_path': version_search_path(parent),
+            'ip_intel_path': ip_intel_config.path,
+            'ip_intel_version': ip_intel_table.version,
+        })
     except Exception as e:
-        logger.error(f"Model retraining error: {e}")
+        logger.error(f"Error starting training job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    training_task = asyncio.create_task(follow_training_job(job['job_id'], request.activate))
+    logger.info(f"Training job {job['job_id']} started for {request.models} on version {parent}")
+    return {
+        "message": "Model retraining initiated",
+        "job": job,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/models/retrain")
+async def list_training_jobs():
+    """Get recent training jobs and the labeled example counts"""
+    return {
+        "running": training_jobs.job_id if training_jobs.running() else None,
+        "jobs": await asyncio.to_thread(training_jobs.recent),
+        "examples": await asyncio.to_thread(labeled_store.stats),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/models/retrain/{job_id}")
+async def get_training_job(job_id: str):
+    """Get a training job's state, progress and per-model results"""
+    try:
+        status = training_jobs.status(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown training job {job_id!r}")
+    return status
+
+def version_metadata(version: str) -> Dict[str, Any]:
+    """Manifest metadata of a registry version (empty for the base models)"""
+    if version == BASE_VERSION:
+        return {}
+    try:
+        return model_registry.manifest(version).get('metadata', {})
+    except RegistryError as e:
+        logger.warning(f"Could not read metadata of model version {version}: {e}")
+        return {}
+
+async def follow_training_job(job_id: str, activate: bool):
+    """Wait for a training job and, if asked, swap in the version it published"""
+    status = await training_jobs.wait()
+    TRAINING_JOBS.inc(status.get('state', 'failed'))
+    logger.info(f"Training job {job_id} finished: {status.get('state')} {status.get('version') or status.get('error') or ''}")
+    if status.get('state') != 'succeeded' or not activate:
+        return
+    if reload_in_progress():
+        training_jobs.update(job_id, activation=f"skipped: model version {reload_status.get('version')} was loading")
+        return
+    start_swap(status['version'], 'retrain')
+    bundle = await reload_task
+    training_jobs.update(job_id, activation='activated' if bundle else f"failed: {reload_status.get('error')}")
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app:app",
-        host="0.0.0.0",
-        port=8080,
-        reload=False,
-        workers=1
-    )
+    check_serving_config()
+    if serving_config.workers > 1:
+        # Load the models once here; the forked workers share them copy-on-write
+        run_prefork(app, serving_config, preload=preload_models)
+    else:
+        uvicorn.run(
+            "app:app",
+            host=serving_config.host,
+            port=serving_config.port,
+            reload=False,
+            workers=1
+        )
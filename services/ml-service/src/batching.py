@@ -0,0 +1,195 @@
+import os
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Batch-size histogram buckets (upper bounds, inclusive)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+@dataclass
+class BatchingConfig:
+    """Per-model micro-batching limits"""
+    max_batch_size: int = 64
+    max_wait_ms: float = 2.0
+
+    @classmethod
+    def from_env(cls, model_name: str) -> "BatchingConfig":
+        """Read BATCH_<MODEL>_MAX_SIZE / BATCH_<MODEL>_MAX_WAIT_MS, falling back to the global values"""
+        prefix = f"BATCH_{model_name.upper()}_"
+        max_batch_size = os.getenv(prefix + "MAX_SIZE", os.getenv("BATCH_MAX_SIZE", cls.max_batch_size))
+        max_wait_ms = os.getenv(prefix + "MAX_WAIT_MS", os.getenv("BATCH_MAX_WAIT_MS", cls.max_wait_ms))
+        return cls(max_batch_size=max(1, int(max_batch_size)), max_wait_ms=max(0.0, float(max_wait_ms)))
+
+
+@dataclass
+class BatchStats:
+    """Counters describing the batch sizes a batcher actually achieves"""
+    batches: int = 0
+    items: int = 0
+    max_batch_size: int = 0
+    flushed_on_size: int = 0
+    flushed_on_timeout: int = 0
+    errors: int = 0
+    total_batch_time_ms: float = 0.0
+    size_histogram: Dict[str, int] = field(
+        default_factory=lambda: {str(b): 0 for b in BATCH_SIZE_BUCKETS} | {"+Inf": 0}
+    )
+
+    def record(self, size: int, full: bool, elapsed_ms: float) -> None:
+        self.batches += 1
+        self.items += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.total_batch_time_ms += elapsed_ms
+        if full:
+            self.flushed_on_size += 1
+        else:
+            self.flushed_on_timeout += 1
+        for bound in BATCH_SIZE_BUCKETS:
+            if size <= bound:
+                self.size_histogram[str(bound)] += 1
+                break
+        else:
+            self.size_histogram["+Inf"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "flushed_on_size": self.flushed_on_size,
+            "flushed_on_timeout": self.flushed_on_timeout,
+            "errors": self.errors,
+            "avg_batch_time_ms": self.total_batch_time_ms / self.batches if self.batches else 0.0,
+            "size_histogram": dict(self.size_histogram),
+        }
+
+
+class MicroBatcher:
+    """Collects concurrent single-row inference calls and scores them as one matrix.
+
+    Callers ``await submit(row)``; a background task waits up to ``max_wait_ms``
+    after the first queued row (or until ``max_batch_size`` rows are queued),
+    stacks the rows and calls ``batch_fn`` once. ``batch_fn`` must return one
+    result per input row, in order. When a ``runner`` is given (e.g.
+    InferenceExecutor.run) batches are dispatched through it, so a new batch
+    can form while the previous one is still being scored.
+
+    Rows submitted with a ``key`` are scored with ``batch_fn(rows, key)``, and
+    rows with different keys never share a call (the service keys rows by
+    the model bundle their request started with).
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[np.ndarray], List[Any]], config: Optional[BatchingConfig] = None,
+                 runner: Optional[Callable[..., Awaitable[Any]]] = None):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.config = config or BatchingConfig.from_env(name)
+        self.runner = runner
+        self.stats = BatchStats()
+        self._queue: "asyncio.Queue[Tuple[np.ndarray, Any, asyncio.Future]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._collect())
+            logger.info(
+                f"Started micro-batcher for {self.name} "
+                f"(max_batch_size={self.config.max_batch_size}, max_wait_ms={self.config.max_wait_ms})"
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+        # Fail anything still waiting so callers don't hang on shutdown
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"Batcher {self.name} stopped"))
+
+    async def submit(self, row: np.ndarray, key: Any = None) -> Any:
+        """Queue a single feature row and wait for its result"""
+        if self._task is None:
+            # Not running (e.g. during startup): score inline
+            rows = row[np.newaxis]
+            return (self.batch_fn(rows) if key is None else self.batch_fn(rows, key))[0]
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, key, future))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        max_batch_size = self.config.max_batch_size
+        max_wait = self.config.max_wait_ms / 1000
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + max_wait
+
+            while len(batch) < max_batch_size:
+                # Take whatever is already queued before waiting on the clock
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            flush = loop.create_task(self._flush(batch, full=len(batch) >= max_batch_size))
+            self._inflight.add(flush)
+            flush.add_done_callback(self._inflight.discard)
+
+    async def _flush(self, batch: List[Tuple[np.ndarray, Any, asyncio.Future]], full: bool) -> None:
+        # Drop rows whose caller has already gone away
+        groups: Dict[Any, List[Tuple[np.ndarray, asyncio.Future]]] = {}
+        for row, key, future in batch:
+            if not future.done():
+                groups.setdefault(key, []).append((row, future))
+        for key, group in groups.items():
+            await self._score(group, key, full and len(groups) == 1)
+
+    async def _score(self, batch: List[Tuple[np.ndarray, asyncio.Future]], key: Any, full: bool) -> None:
+        start = time.perf_counter()
+        try:
+            rows = np.stack([row for row, _ in batch])
+            args = (rows,) if key is None else (rows, key)
+            if self.runner is not None:
+                results = await self.runner(self.batch_fn, *args)
+            else:
+                results = self.batch_fn(*args)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Batcher {self.name} stopped"))
+            raise
+        except Exception as e:
+            self.stats.errors += 1
+            logger.error(f"Batch inference error in {self.name}: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.stats.record(len(batch), full, (time.perf_counter() - start) * 1000)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
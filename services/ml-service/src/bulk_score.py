@@ -0,0 +1,278 @@
+"""Offline bulk scoring of indicator dumps with the service's models and ensemble.
+
+Reads a CSV or Parquet file in chunks and scores every chunk in a worker
+process with analyze_threats_vectorized, the same code path as
+/api/analyze/batch. Each chunk is written as its own Parquet part in the
+output directory (readable as one dataset with ``pd.read_parquet(output)``),
+and a checkpoint records finished chunks so an interrupted run resumes
+where it stopped.
+
+Input columns: ``input_value`` and ``input_type`` (required), and optionally
+``context``, ``session_data`` and ``device_fingerprint`` as JSON objects.
+
+    python src/bulk_score.py indicators.csv --output scored/ --workers 8
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import multiprocessing
+import resource
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set
+import pandas as pd
+
+import app
+from executor import set_torch_threads
+
+logger = logging.getLogger(__name__)
+
+REQUEST_COLUMNS = ['input_value', 'input_type']
+OPTIONAL_COLUMNS = ['context', 'user_agent']
+JSON_COLUMNS = ['context', 'session_data', 'device_fingerprint']
+CHECKPOINT_FILE = '_checkpoint.json'
+FORMATS = ('csv', 'parquet')
+
+
+def input_format(path: str, requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    return 'parquet' if path.endswith(('.parquet', '.pq')) else 'csv'
+
+def read_chunks(path: str, fmt: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Yield the input as DataFrames of at most ``chunk_size`` rows"""
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+
+def json_value(value: Any) -> Optional[Dict[str, Any]]:
+    """A JSON-object cell as a dict (empty and missing cells are None)"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, dict):
+        return value
+    text = str(value).strip()
+    return json.loads(text) if text else None
+
+def frame_requests(frame: pd.DataFrame) -> List[Any]:
+    """One ThreatAnalysisRequest per row, or the error that made the row invalid"""
+    columns = [column for column in REQUEST_COLUMNS + OPTIONAL_COLUMNS + JSON_COLUMNS if column in frame.columns]
+    requests = []
+    for record in frame[list(dict.fromkeys(columns))].to_dict('records'):
+        try:
+            fields = {key: value for key, value in record.items() if key not in JSON_COLUMNS and value != ''}
+            for key in JSON_COLUMNS:
+                if key in record:
+                    parsed = json_value(record[key])
+                    if parsed is not None:
+                        fields[key] = parsed
+            requests.append(app.ThreatAnalysisRequest(**fields))
+        except Exception as e:
+            requests.append(e)
+    return requests
+
+def score_frame(frame: pd.DataFrame, id_column: Optional[str]) -> pd.DataFrame:
+    """Scores for every row of ``frame``; invalid rows get an ``error`` and no scores"""
+    requests = frame_requests(frame)
+    valid = [request for request in requests if not isinstance(request, Exception)]
+    responses = iter(app.analyze_threats_vectorized(valid))
+
+    columns: Dict[str, List[Any]] = {
+        'risk_score': [], 'confidence_score': [], 'threat_type': [], 'severity': [], 'error': [],
+    }
+    columns.update({f'pred_{key}': [] for key in app.ENSEMBLE_COLUMNS})
+    for request in requests:
+        if isinstance(request, Exception):
+            response = None
+            columns['error'].append(str(request))
+        else:
+            response = next(responses)
+            columns['error'].append(None)
+        columns['risk_score'].append(response.risk_score if response else None)
+        columns['confidence_score'].append(response.confidence_score if response else None)
+        columns['threat_type'].append(response.threat_type if response else None)
+        columns['severity'].append(response.severity if response else None)
+        for key in app.ENSEMBLE_COLUMNS:
+            columns[f'pred_{key}'].append(response.model_predictions.get(key) if response else None)
+
+    keep = [id_column] if id_column else REQUEST_COLUMNS
+    result = frame[[column for column in keep if column in frame.columns]].reset_index(drop=True)
+    for name, values in columns.items():
+        if name in ('risk_score', 'confidence_score'):
+            result[name] = pd.array(values, dtype='Int64')
+        elif name.startswith('pred_'):
+            result[name] = pd.array(values, dtype='Float64')
+        else:
+            result[name] = pd.array(values, dtype='string')
+    return result
+
+def part_path(output: str, index: int) -> str:
+    return os.path.join(output, f"part-{index:06d}.parquet")
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak resident set size in MiB (ru_maxrss is KiB on Linux)"""
+    return resource.getrusage(who).ru_maxrss / 1024
+
+def init_worker(torch_threads: int) -> None:
+    """Worker initializer: cap torch threads; load models and anomaly baselines unless inherited through fork"""
+    set_torch_threads(torch_threads)
+    app.init_inference_worker()
+
+def score_chunk(index: int, frame: pd.DataFrame, output: str, id_column: Optional[str]) -> Dict[str, Any]:
+    """Score one chunk and write its Parquet part (runs in a worker)"""
+    started = time.perf_counter()
+    result = score_frame(frame, id_column)
+    path = part_path(output, index)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    result.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return {
+        'index': index,
+        'rows': len(result),
+        'errors': int(result['error'].notna().sum()),
+        'seconds': time.perf_counter() - started,
+        'worker_peak_rss_mb': peak_rss_mb(),
+    }
+
+
+class Checkpoint:
+    """Finished chunk indices for one output directory, plus the settings they were produced with"""
+
+    def __init__(self, output: str, settings: Dict[str, Any]):
+        self.path = os.path.join(output, CHECKPOINT_FILE)
+        self.settings = settings
+        self.completed: Set[int] = set()
+
+    def load(self, force: bool) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            saved = json.load(f)
+        if saved.get('settings') != self.settings and not force:
+            raise SystemExit(
+                f"{self.path} was written with different settings {saved.get('settings')}; "
+                "use a new --output directory or --force to resume anyway"
+            )
+        output = os.path.dirname(self.path)
+        # Only trust chunks whose part actually made it to disk
+        self.completed = {index for index in saved.get('completed', []) if os.path.exists(part_path(output, index))}
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'settings': self.settings, 'completed': sorted(self.completed)}, f)
+        os.replace(tmp_path, self.path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="CSV or Parquet file")
+    parser.add_argument("--output", required=True, help="Directory for the Parquet parts and checkpoint")
+    parser.add_argument("--format", choices=FORMATS, help="Input format (default: from the file extension)")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (0 scores in this process)")
+    parser.add_argument("--id-column", help="Column copied to the output instead of input_value/input_type")
+    parser.add_argument("--start-method", default=os.getenv("INFERENCE_MP_START_METHOD", "fork"),
+                        help="multiprocessing start method; fork shares the loaded models copy-on-write")
+    parser.add_argument("--force", action="store_true", help="Resume even if the checkpoint settings differ")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    fmt = input_format(args.input, args.format)
+    os.makedirs(args.output, exist_ok=True)
+
+    # Load once here: forked workers inherit the models (and compiled trees)
+    # instead of each loading their own copy
+    torch_threads = 1 if args.workers else max(1, os.cpu_count() or 1)
+    set_torch_threads(torch_threads)
+    app.load_startup_ip_intel()
+    asyncio.run(app.load_models())
+    # Score against the service's checkpointed anomaly baselines (read-only, see VECTORIZED_SCORERS)
+    app.load_anomaly_state()
+
+    stat = os.stat(args.input)
+    checkpoint = Checkpoint(args.output, {
+        'input': os.path.abspath(args.input),
+        'input_size': stat.st_size,
+        'input_mtime': int(stat.st_mtime),
+        'format': fmt,
+        'chunk_size': args.chunk_size,
+        'id_column': args.id_column,
+        'model_version': app.active_bundle.version,
+        'model_versions': dict(sorted(app.active_bundle.model_versions.items())),
+        'ip_intel_version': app.ip_intel_table.version,
+        'anomaly_events': app.anomaly_detector.events if app.anomaly_detector is not None else None,
+    })
+    checkpoint.load(args.force)
+    if checkpoint.completed:
+        logger.info(f"Resuming: {len(checkpoint.completed)} chunks already scored")
+
+    started = time.perf_counter()
+    rows = errors = 0
+    worker_peak_rss = 0.0
+
+    def finished(stats: Dict[str, Any]) -> None:
+        nonlocal rows, errors, worker_peak_rss
+        rows += stats['rows']
+        errors += stats['errors']
+        worker_peak_rss = max(worker_peak_rss, stats['worker_peak_rss_mb'])
+        checkpoint.completed.add(stats['index'])
+        checkpoint.save()
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"chunk {stats['index']}: {stats['rows']} rows in {stats['seconds']:.2f}s "
+            f"({rows} rows total, {rows / elapsed:,.0f} rows/s)"
+        )
+
+    chunks = ((index, frame) for index, frame in enumerate(read_chunks(args.input, fmt, args.chunk_size))
+              if index not in checkpoint.completed)
+
+    if args.workers == 0:
+        for index, frame in chunks:
+            finished(score_chunk(index, frame, args.output, args.id_column))
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context(args.start_method),
+            initializer=init_worker,
+            initargs=(torch_threads,),
+        )
+        # Keep a couple of chunks per worker in flight so reading overlaps scoring
+        # without buffering the whole input
+        pending: Set[Future] = set()
+        try:
+            for index, frame in chunks:
+                if len(pending) >= 2 * args.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished(future.result())
+                pending.add(pool.submit(score_chunk, index, frame, args.output, args.id_column))
+            for future in wait(pending).done:
+                finished(future.result())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'rows': rows,
+        'errors': errors,
+        'chunks_completed': len(checkpoint.completed),
+        'elapsed_seconds': round(elapsed, 2),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        # Per-process peak; forked workers share the model pages, so don't add these up
+        'worker_peak_rss_mb': round(max(worker_peak_rss, peak_rss_mb(resource.RUSAGE_CHILDREN)), 1),
+        'output': args.output,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
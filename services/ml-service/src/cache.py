@@ -0,0 +1,400 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Queued in place of a value to delete the key at the next flush
+_DELETE = object()
+
+
+def stable_digest(payload: Any) -> str:
+    """Process-independent digest of a JSON-like payload (sorted keys, compact separators)"""
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+@dataclass
+class RedisCacheConfig:
+    """Connection pool, write-behind and failure settings for the Redis tier"""
+    max_connections: int = 32
+    # Longest a command waits for a free pooled connection
+    pool_timeout_ms: float = 50.0
+    socket_timeout_ms: float = 100.0
+    # Redis is skipped for this long after an error (the caches run local-only meanwhile)
+    retry_seconds: float = 5.0
+    # Write-behind: SETEXs per pipeline, longest a write waits, pending writes kept before dropping
+    write_batch_size: int = 256
+    write_interval_ms: float = 5.0
+    max_pending_writes: int = 10000
+
+    @classmethod
+    def from_env(cls) -> "RedisCacheConfig":
+        return cls(
+            max_connections=max(1, int(os.getenv("REDIS_MAX_CONNECTIONS", cls.max_connections))),
+            pool_timeout_ms=float(os.getenv("REDIS_POOL_TIMEOUT_MS", cls.pool_timeout_ms)),
+            socket_timeout_ms=float(os.getenv("REDIS_SOCKET_TIMEOUT_MS", cls.socket_timeout_ms)),
+            retry_seconds=float(os.getenv("REDIS_RETRY_SECONDS", cls.retry_seconds)),
+            write_batch_size=max(1, int(os.getenv("REDIS_WRITE_BATCH_SIZE", cls.write_batch_size))),
+            write_interval_ms=float(os.getenv("REDIS_WRITE_INTERVAL_MS", cls.write_interval_ms)),
+            max_pending_writes=max(1, int(os.getenv("REDIS_MAX_PENDING_WRITES", cls.max_pending_writes))),
+        )
+
+
+class RedisBackend:
+    """Redis access shared by the caches: coalesced reads, write-behind writes, failure breaker.
+
+    Reads issued in the same event-loop iteration go out as one MGET. Writes
+    are queued (latest value per key wins) and flushed as pipelined SETEX/DEL
+    batches by a background task, so no request waits on a cache write;
+    values are encoded at flush time, and reads see still-queued writes. Any
+    Redis error opens the breaker for ``retry_seconds``: reads miss, writes
+    are dropped, and the service keeps answering from the local tier and the
+    models.
+    """
+
+    def __init__(self, client_getter: Callable[[], Any], config: Optional[RedisCacheConfig] = None):
+        self.client_getter = client_getter
+        self.config = config or RedisCacheConfig()
+        self._pending_reads: Dict[str, asyncio.Future] = {}
+        self._read_scheduled = False
+        # key -> (ttl, encode, value)
+        self._pending_writes: "OrderedDict[str, Tuple[int, Callable[[Any], str], Any]]" = OrderedDict()
+        self._write_wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._open_until = 0.0
+        self.errors = 0
+        self.mget_calls = 0
+        self.keys_read = 0
+        self.flushes = 0
+        self.writes = 0
+        self.dropped_writes = 0
+
+    def client(self) -> Optional[Any]:
+        """The Redis client, or None while the breaker is open or there is no client"""
+        if self._open_until and time.monotonic() < self._open_until:
+            return None
+        return self.client_getter()
+
+    @property
+    def available(self) -> bool:
+        return self.client() is not None
+
+    def failed(self, error: Exception) -> None:
+        """Record a Redis error and skip Redis for ``retry_seconds``"""
+        self.errors += 1
+        if not (self._open_until and time.monotonic() < self._open_until):
+            logger.warning(f"Redis unavailable, caching locally only for {self.config.retry_seconds}s: {error}")
+        self._open_until = time.monotonic() + self.config.retry_seconds
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """GET coalesced with the other reads of this loop iteration into one MGET"""
+        if self.client() is None:
+            return None
+        # A write still queued for the key is newer than what Redis holds
+        write = self._pending_writes.get(key)
+        if write is not None:
+            _, encode, value = write
+            return None if value is _DELETE else encode(value)
+        future = self._pending_reads.get(key)
+        if future is None:
+            future = self._pending_reads[key] = asyncio.get_running_loop().create_future()
+            if not self._read_scheduled:
+                self._read_scheduled = True
+                asyncio.get_running_loop().call_soon(self._start_read)
+        return await asyncio.shield(future)
+
+    def _start_read(self) -> None:
+        self._read_scheduled = False
+        pending, self._pending_reads = self._pending_reads, {}
+        if pending:
+            asyncio.ensure_future(self._read(pending))
+
+    async def _read(self, pending: Dict[str, asyncio.Future]) -> None:
+        values = await self.mget(list(pending))
+        for future, value in zip(pending.values(), values):
+            if not future.done():
+                future.set_result(value)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Values of ``keys`` in one round trip (all None when Redis is unavailable)"""
+        client = self.client()
+        if client is None or not keys:
+            return [None] * len(keys)
+        try:
+            values = await client.mget(keys)
+        except Exception as e:
+            self.failed(e)
+            return [None] * len(keys)
+        self.mget_calls += 1
+        self.keys_read += len(keys)
+        return values
+
+    def set_later(self, key: str, ttl_seconds: int, value: Any, encode: Callable[[Any], str]) -> None:
+        """Queue a SETEX; it is written by the next flush"""
+        if self.client() is None:
+            return
+        self._queue_write(key, (ttl_seconds, encode, value))
+
+    def delete_later(self, key: str) -> None:
+        """Queue a DEL (replacing any write of the key still queued)"""
+        if self.client() is None:
+            return
+        self._queue_write(key, (0, str, _DELETE))
+
+    def _queue_write(self, key: str, write: Tuple[int, Callable[[Any], str], Any]) -> None:
+        if key not in self._pending_writes and len(self._pending_writes) >= self.config.max_pending_writes:
+            self.dropped_writes += 1
+            return
+        self._pending_writes[key] = write
+        self._pending_writes.move_to_end(key)
+        if self._writer is None or self._writer.done():
+            self._write_wakeup = asyncio.Event()
+            self._writer = asyncio.ensure_future(self._write_loop())
+        if len(self._pending_writes) >= self.config.write_batch_size:
+            self._write_wakeup.set()
+
+    async def _write_loop(self) -> None:
+        interval = self.config.write_interval_ms / 1000
+        while self._pending_writes:
+            try:
+                await asyncio.wait_for(self._write_wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._write_wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything queued, one pipeline per ``write_batch_size`` keys"""
+        while self._pending_writes:
+            batch = []
+            while self._pending_writes and len(batch) < self.config.write_batch_size:
+                batch.append(self._pending_writes.popitem(last=False))
+            client = self.client()
+            if client is None:
+                self.dropped_writes += len(batch) + len(self._pending_writes)
+                self._pending_writes.clear()
+                return
+            try:
+                with stage("cache.redis_flush"):
+                    pipeline = client.pipeline(transaction=False)
+                    for key, (ttl, encode, value) in batch:
+                        if value is _DELETE:
+                            pipeline.delete(key)
+                        else:
+                            pipeline.setex(key, ttl, encode(value))
+                    await pipeline.execute()
+            except Exception as e:
+                self.failed(e)
+                self.dropped_writes += len(batch)
+                continue
+            self.flushes += 1
+            self.writes += len(batch)
+
+    async def stop(self) -> None:
+        """Flush queued writes and stop the writer"""
+        await self.flush()
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "errors": self.errors,
+            "mget_calls": self.mget_calls,
+            "keys_read": self.keys_read,
+            "pending_writes": len(self._pending_writes),
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "dropped_writes": self.dropped_writes,
+            "max_connections": self.config.max_connections,
+        }
+
+
+class TieredCache(Generic[T]):
+    """Local LRU tier in front of Redis, with single-flight computation.
+
+    Values are kept decoded in the local tier and encoded (``encode``/``decode``)
+    in Redis; ``decode`` returns None for an entry in an outdated format,
+    which then counts as a (stale) miss. Concurrent ``get_or_compute`` calls for the same key share one
+    lookup/computation; it runs as its own task so a cancelled caller doesn't
+    cancel it for the others. Redis writes are write-behind (see RedisBackend).
+    """
+
+    def __init__(self, name: str, redis: Optional[RedisBackend],
+                 encode: Callable[[T], Any], decode: Callable[[Any], Optional[T]],
+                 ttl_seconds: int = 300, local: Optional[LocalCache] = None):
+        self.name = name
+        self.redis = redis
+        self.encode = encode
+        self.decode = decode
+        self.ttl_seconds = ttl_seconds
+        self.local = local or LocalCache()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.stale = 0
+        self.computed = 0
+        self.singleflight_joins = 0
+        # Stage names for the latency histograms (see metrics.stage)
+        self._stage_local = f"cache.{name}.local"
+        self._stage_redis_get = f"cache.{name}.redis_get"
+        self._stage_redis_mget = f"cache.{name}.redis_mget"
+
+    @classmethod
+    def from_env(cls, name: str, redis: Optional[RedisBackend],
+                 encode: Callable[[T], Any], decode: Callable[[Any], Optional[T]],
+                 ttl_seconds: int = 300) -> "TieredCache[T]":
+        local = LocalCache(
+            max_entries=int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "10000")),
+            ttl_seconds=float(os.getenv("LOCAL_CACHE_TTL_SECONDS", "30")),
+        )
+        return cls(name, redis, encode, decode, ttl_seconds=ttl_seconds, local=local)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[T]]) -> T:
+        with stage(self._stage_local):
+            value = self.local.get(key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.singleflight_joins += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, compute: Callable[[], Awaitable[T]]) -> T:
+        if self.redis is not None and self.redis.available:
+            with stage(self._stage_redis_get):
+                cached = await self.redis.get(key)
+            value = self._decode(cached)
+            if value is not None:
+                self.local.set(key, value)
+                return value
+
+        value = await compute()
+        self.put(key, value)
+        return value
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, T]:
+        """Cached values of ``keys`` (missing keys are left out): local tier, then one MGET"""
+        found: Dict[str, T] = {}
+        remote: List[str] = []
+        with stage(self._stage_local):
+            for key in dict.fromkeys(keys):
+                value = self.local.get(key)
+                if value is not None:
+                    found[key] = value
+                else:
+                    remote.append(key)
+        if remote and self.redis is not None and self.redis.available:
+            with stage(self._stage_redis_mget):
+                values = await self.redis.mget(remote)
+            for key, cached in zip(remote, values):
+                value = self._decode(cached)
+                if value is not None:
+                    found[key] = value
+                    self.local.set(key, value)
+        return found
+
+    def _decode(self, cached: Any) -> Optional[T]:
+        value = self.decode(cached) if cached else None
+        if value is not None:
+            self.redis_hits += 1
+        else:
+            self.redis_misses += 1
+            self.stale += bool(cached)
+        return value
+
+    def put(self, key: str, value: T) -> None:
+        """Store a computed value locally now and in Redis with the next write-behind flush"""
+        self.computed += 1
+        self.local.set(key, value)
+        if self.redis is not None:
+            self.redis.set_later(key, self.ttl_seconds, value, self.encode)
+
+    def stats(self) -> Dict[str, Any]:
+        redis_lookups = self.redis_hits + self.redis_misses
+        return {
+            "local": self.local.stats(),
+            "redis": {
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "hit_rate": self.redis_hits / redis_lookups if redis_lookups else 0.0,
+                "stale": self.stale,
+                "ttl_seconds": self.ttl_seconds,
+            },
+            "computed": self.computed,
+            "singleflight_joins": self.singleflight_joins,
+            "inflight": len(self._inflight),
+        }
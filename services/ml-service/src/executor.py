@@ -0,0 +1,191 @@
+import os
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("inline", "thread", "process")
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the inference queue is full"""
+
+
+@dataclass
+class ExecutorConfig:
+    """Inference execution backend settings"""
+    backend: str = "thread"
+    max_workers: int = 4
+    max_concurrency: int = 4
+    max_queue: int = 1000
+    torch_threads: int = 1
+    mp_start_method: str = "fork"
+
+    @classmethod
+    def from_env(cls) -> "ExecutorConfig":
+        cpu_count = worker_cpus()
+        backend = os.getenv("INFERENCE_BACKEND", cls.backend).lower()
+        if backend not in BACKENDS:
+            raise ValueError(f"INFERENCE_BACKEND must be one of {BACKENDS}, got {backend!r}")
+        max_workers = max(1, int(os.getenv("INFERENCE_WORKERS", min(4, cpu_count))))
+        return cls(
+            backend=backend,
+            max_workers=max_workers,
+            max_concurrency=max(1, int(os.getenv("INFERENCE_MAX_CONCURRENCY", max_workers))),
+            max_queue=max(1, int(os.getenv("INFERENCE_MAX_QUEUE", cls.max_queue))),
+            # Split the cores between workers so torch doesn't oversubscribe them
+            torch_threads=max(1, int(os.getenv("TORCH_NUM_THREADS", max(1, cpu_count // max_workers)))),
+            mp_start_method=os.getenv("INFERENCE_MP_START_METHOD", cls.mp_start_method),
+        )
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (its affinity mask where the platform has one)"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def worker_cpus() -> int:
+    """This process's share of the CPUs when SERVING_WORKERS serving processes run side by side"""
+    return max(1, available_cpus() // max(1, int(os.getenv("SERVING_WORKERS", "1"))))
+
+
+def set_torch_threads(num_threads: int) -> None:
+    """Cap torch intra-op parallelism for the current process"""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def set_blas_threads(num_threads: int) -> None:
+    """Cap the BLAS/OpenMP thread pools numpy and sklearn use in the current process"""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(num_threads)
+    except ImportError:
+        pass
+
+
+def _process_initializer(torch_threads: int, initializer: Optional[Callable[[], None]]) -> None:
+    set_torch_threads(torch_threads)
+    if initializer is not None:
+        initializer()
+
+
+class InferenceExecutor:
+    """Runs blocking model calls off the event loop.
+
+    ``inline`` calls the function on the event loop (the old behaviour),
+    ``thread`` uses a thread pool (sklearn and torch release the GIL) and
+    ``process`` a process pool whose workers run ``worker_initializer`` once.
+    At most ``max_concurrency`` calls run at a time; once ``max_queue`` calls
+    are waiting, further calls fail fast with ExecutorSaturated.
+    """
+
+    def __init__(self, config: Optional[ExecutorConfig] = None,
+                 worker_initializer: Optional[Callable[[], None]] = None):
+        self.config = config or ExecutorConfig.from_env()
+        self.worker_initializer = worker_initializer
+        self._pool: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self.total_run_ms = 0.0
+
+    def start(self) -> None:
+        config = self.config
+        set_torch_threads(config.torch_threads)
+        self._semaphore = asyncio.Semaphore(config.max_concurrency)
+
+        if config.backend == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=config.max_workers, thread_name_prefix="inference")
+        elif config.backend == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=config.max_workers,
+                mp_context=multiprocessing.get_context(config.mp_start_method),
+                initializer=_process_initializer,
+                initargs=(config.torch_threads, self.worker_initializer),
+            )
+
+        logger.info(
+            f"Inference executor started (backend={config.backend}, workers={config.max_workers}, "
+            f"max_concurrency={config.max_concurrency}, max_queue={config.max_queue}, "
+            f"torch_threads={config.torch_threads})"
+        )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` on the configured backend"""
+        if self._semaphore is None:
+            # Not started (e.g. during startup or in scripts): behave like inline
+            return fn(*args)
+
+        if self.queued >= self.config.max_queue:
+            self.rejected += 1
+            raise ExecutorSaturated(f"Inference queue full ({self.queued} waiting)")
+
+        self.submitted += 1
+        self.queued += 1
+        enqueued = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        started = time.perf_counter()
+        self.total_wait_ms += (started - enqueued) * 1000
+        self.running += 1
+        try:
+            if self._pool is None:
+                result = fn(*args)
+            elif self.config.backend == "thread":
+                # Carry the caller's context (e.g. its stage-timing breakdown) into the thread
+                context = contextvars.copy_context()
+                result = await asyncio.get_running_loop().run_in_executor(self._pool, context.run, fn, *args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self.total_run_ms += (time.perf_counter() - started) * 1000
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "backend": self.config.backend,
+            "max_workers": self.config.max_workers,
+            "max_concurrency": self.config.max_concurrency,
+            "max_queue": self.config.max_queue,
+            "torch_threads": self.config.torch_threads,
+            "queued": self.queued,
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": self.total_wait_ms / self.submitted if self.submitted else 0.0,
+            "avg_run_ms": self.total_run_ms / finished if finished else 0.0,
+        }
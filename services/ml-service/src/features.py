@@ -0,0 +1,525 @@
+"""Feature extraction for the threat models.
+
+The scalar extractors turn one input into one feature vector. The ``*_batch``
+variants turn a list of inputs into a feature matrix with array operations
+over the strings' code points, and produce exactly the rows the scalar
+extractors would: inputs outside the vectorized fast path (non-ASCII text,
+IPs that aren't plain dotted quads) are routed through the scalar extractor.
+``RequestFeatures`` extracts each of a request's feature vectors at most once,
+so the models and the anomaly detector share them.
+"""
+import zlib
+import hashlib
+import logging
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+import numpy as np
+
+from metrics import stage
+from ip_intel import IpIntelTable, parse_address
+
+logger = logging.getLogger(__name__)
+
+IP_FEATURES = 12
+URL_FEATURES = 14
+# Device rows: the scalar features, then hashed plugin/font/language tokens for the
+# network's EmbeddingBag (bucket ids, -1 in unused slots)
+DEVICE_DENSE_FEATURES = 16
+DEVICE_TOKEN_SLOTS = 64
+DEVICE_HASH_BUCKETS = 4096
+DEVICE_FEATURES = DEVICE_DENSE_FEATURES + DEVICE_TOKEN_SLOTS
+DEVICE_FIELD_SEEDS = {field: zlib.crc32(field.encode()) for field in ('plugins', 'fonts', 'languages')}
+ANOMALY_FEATURES = 50
+# Device features included in the anomaly detector's input: the scalar ones
+ANOMALY_DEVICE_FEATURES = DEVICE_DENSE_FEATURES
+BEHAVIORAL_SEQUENCE_LENGTH = 10
+# Per-step input width of the behavioral LSTM; the session fields fill the first columns
+BEHAVIORAL_STEP_FEATURES = 50
+BEHAVIORAL_FIELDS = ['session_duration', 'page_views', 'clicks', 'scroll_depth', 'typing_speed']
+
+SUSPICIOUS_KEYWORDS = ['admin', 'login', 'secure', 'bank', 'paypal', 'amazon']
+URL_COUNTED_CHARS = './?&=-_'
+
+# Local IP intelligence for the geolocation features; without a table they keep their
+# mock values, which the shipped IP models were trained on (see use_ip_intel)
+ip_intel = IpIntelTable.empty()
+
+# Below this many inputs the batch extractors just loop the scalar ones,
+# which is faster than setting up the array passes
+VECTORIZE_MIN_ROWS = 128
+
+
+def use_ip_intel(table: IpIntelTable):
+    """Take the geolocation features from ``table`` (the empty table restores the mock values)"""
+    global ip_intel
+    ip_intel = table
+
+def extract_ip_features(ip_address: str) -> np.ndarray:
+    """Extract features from IP address"""
+    features = []
+
+    try:
+        if ':' in ip_address:
+            return extract_ipv6_features(ip_address)
+
+        # Basic IP parsing
+        octets = ip_address.split('.')
+        if len(octets) == 4:
+            features.extend([int(octet) for octet in octets])
+        else:
+            features.extend([0, 0, 0, 0])
+
+        # IP range features
+        first_octet = int(octets[0]) if len(octets) > 0 else 0
+        features.extend([
+            1 if first_octet in [10] else 0,  # Private Class A
+            1 if first_octet == 172 else 0,   # Private Class B
+            1 if first_octet == 192 else 0,   # Private Class C
+            1 if first_octet == 127 else 0,   # Loopback
+            1 if first_octet >= 224 else 0,   # Multicast
+        ])
+
+        features.extend(geo_features(ip_address))
+
+    except Exception as e:
+        logger.error(f"Error extracting IP features: {e}")
+        features = [0] * IP_FEATURES
+
+    return np.array(features, dtype=np.float32)
+
+def extract_ipv6_features(ip_address: str) -> np.ndarray:
+    """IPv6 rows: no octets or IPv4 classes; loopback, multicast and geolocation"""
+    features = np.zeros(IP_FEATURES, dtype=np.float32)
+    address = parse_address(ip_address)
+    if address is None:
+        return features
+    version, number = address
+    if version == 4:
+        # IPv4-mapped: the dotted quad's features
+        return extract_ip_features('.'.join(str(number >> shift & 255) for shift in (24, 16, 8, 0)))
+    features[7] = number == 1
+    features[8] = number >> 120 == 0xff
+    features[9:12] = geo_features(ip_address)
+    return features
+
+def geo_features(ip_address: str) -> List[float]:
+    """Latitude, longitude and country code of an IP, from the IP intelligence table when one is loaded"""
+    if len(ip_intel):
+        return ip_intel.geo_features(ip_address)
+    return mock_geo_features(ip_address)
+
+def mock_geo_features(ip_address: str) -> List[float]:
+    """Mock latitude, longitude and country code for an IP, the same in every process"""
+    return [
+        _stable_hash(ip_address) % 1000 / 1000,  # Mock latitude
+        _stable_hash(ip_address[::-1]) % 1000 / 1000,  # Mock longitude
+        _stable_hash(ip_address + "country") % 200,  # Mock country code
+    ]
+
+def _stable_hash(text: str) -> int:
+    # crc32 rather than hash(): str hashes are randomized per process (PYTHONHASHSEED)
+    return zlib.crc32(text.encode('utf-8', 'surrogatepass'))
+
+def extract_url_features(url: str) -> np.ndarray:
+    """Extract features from URL"""
+    features = []
+
+    try:
+        # Basic URL features
+        features.append(len(url))
+        features.extend(url.count(char) for char in URL_COUNTED_CHARS)
+        features.extend([
+            1 if 'https' in url else 0,
+            1 if any(char.isdigit() for char in url) else 0,
+        ])
+
+        # Suspicious patterns
+        lowered = url.lower()
+        features.append(sum(1 for keyword in SUSPICIOUS_KEYWORDS if keyword in lowered))
+
+        # Domain features
+        domain_parts = url.split('/')[2].split('.') if '//' in url else url.split('.')
+        features.extend([
+            len(domain_parts),
+            max(len(part) for part in domain_parts) if domain_parts else 0,
+            1 if domain_parts and any(char.isdigit() for char in domain_parts[0]) else 0,
+        ])
+
+    except Exception as e:
+        logger.error(f"Error extracting URL features: {e}")
+        features = [0] * URL_FEATURES
+
+    return np.array(features, dtype=np.float32)
+
+def _token_hashes(field: str, values: Any) -> List[int]:
+    """Process-independent 32-bit hashes of a list field's entries, seeded per field"""
+    if isinstance(values, str):
+        values = [values]
+    seed = DEVICE_FIELD_SEEDS[field]
+    try:
+        return [zlib.crc32(value.encode(), seed) for value in values]
+    except AttributeError:
+        # Entries that aren't strings (e.g. plugin objects) hash their str()
+        return [zlib.crc32(str(value).encode(), seed) for value in values]
+
+def extract_device_features(device_fingerprint: Dict[str, Any]) -> np.ndarray:
+    """Extract features from device fingerprint.
+
+    The first DEVICE_DENSE_FEATURES slots are scalar features; the
+    DEVICE_TOKEN_SLOTS after them hold the hash buckets of the plugin, font
+    and language entries (-1 for unused slots), for the network's
+    EmbeddingBag. Lists with more distinct entries than there are slots keep
+    the entries with the smallest hashes, a sample that doesn't depend on
+    the lists' order.
+    """
+    row = np.full(DEVICE_FEATURES, -1, dtype=np.float32)
+
+    try:
+        screen = device_fingerprint.get('screen', {})
+        plugins = device_fingerprint.get('plugins', [])
+        fonts = device_fingerprint.get('fonts', [])
+        plugin_hashes = _token_hashes('plugins', plugins)
+        font_hashes = _token_hashes('fonts', fonts)
+        language_hashes = _token_hashes(
+            'languages', device_fingerprint.get('languages') or device_fingerprint.get('language') or []
+        )
+        row[:DEVICE_DENSE_FEATURES] = [
+            # Screen features
+            screen.get('width', 0),
+            screen.get('height', 0),
+            screen.get('colorDepth', 0),
+            screen.get('pixelRatio', 1.0),
+            # Browser features
+            len(device_fingerprint.get('userAgent', '')),
+            len(device_fingerprint.get('language', '')),
+            len(device_fingerprint.get('platform', '')),
+            device_fingerprint.get('cookieEnabled', 0),
+            device_fingerprint.get('doNotTrack', 0),
+            # Plugin and font features: counts and order-independent digests of the lists
+            len(plugins),
+            len(fonts),
+            sum(plugin_hashes) % 1000,
+            sum(font_hashes) % 1000,
+            # Timezone and other features
+            device_fingerprint.get('timezone', 0),
+            device_fingerprint.get('webgl', 0),
+            device_fingerprint.get('canvas', 0),
+        ]
+
+        # Distinct token hashes, smallest first (np.unique hashes rather than sorts on numpy 2)
+        tokens = np.sort(np.array(plugin_hashes + font_hashes + language_hashes, dtype=np.uint32))
+        tokens = tokens[np.flatnonzero(np.diff(tokens, prepend=np.uint32(0)) != 0) if len(tokens) else []]
+        tokens = tokens[:DEVICE_TOKEN_SLOTS] % DEVICE_HASH_BUCKETS
+        row[DEVICE_DENSE_FEATURES:DEVICE_DENSE_FEATURES + len(tokens)] = tokens
+
+    except Exception as e:
+        logger.error(f"Error extracting device features: {e}")
+        row[:DEVICE_DENSE_FEATURES] = 0
+        row[DEVICE_DENSE_FEATURES:] = -1
+
+    return row
+
+def behavioral_event(session_data: Dict[str, Any]) -> np.ndarray:
+    """One LSTM input step: the session fields, zero-padded to the model's input width"""
+    step = np.zeros(BEHAVIORAL_STEP_FEATURES, dtype=np.float32)
+    step[:len(BEHAVIORAL_FIELDS)] = [session_data.get(name, 0) for name in BEHAVIORAL_FIELDS]
+    return step
+
+def behavioral_sequence(session_data: Dict[str, Any]) -> np.ndarray:
+    """Build the (sequence_length, 50) behavioral input for the LSTM: the session as the first step, then zeros"""
+    sequence = np.zeros((BEHAVIORAL_SEQUENCE_LENGTH, BEHAVIORAL_STEP_FEATURES), dtype=np.float32)
+    sequence[0] = behavioral_event(session_data)
+    return sequence
+
+def anomaly_features(features: np.ndarray) -> np.ndarray:
+    """Pad or truncate combined features to the anomaly model's 50 inputs"""
+    if len(features) < ANOMALY_FEATURES:
+        # Same result as np.pad(..., 'constant'), without its per-call overhead
+        padded = np.zeros(ANOMALY_FEATURES, dtype=features.dtype)
+        padded[:len(features)] = features
+        return padded
+    return features[:ANOMALY_FEATURES]
+
+def combined_anomaly_features(primary: Optional[np.ndarray], device: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """Anomaly detector input: primary input features followed by the first device features"""
+    parts = []
+    if primary is not None:
+        parts.append(primary)
+    if device is not None:
+        parts.append(device[:ANOMALY_DEVICE_FEATURES])
+    if not parts:
+        return None
+    return anomaly_features(np.concatenate(parts))
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url: str) -> str:
+    """``url`` as the URL model scores and caches it: scheme and host lowercased, the scheme's
+    default port, the fragment and a bare '/' path dropped (unparseable URLs are kept as given)"""
+    has_scheme = '://' in url
+    try:
+        parts = urlsplit(url if has_scheme else '//' + url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.hostname:
+        return url
+    scheme = parts.scheme.lower()
+    host = f'[{parts.hostname}]' if ':' in parts.hostname else parts.hostname
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host += f':{port}'
+    userinfo, _, _ = parts.netloc.rpartition('@')
+    netloc = f'{userinfo}@{host}' if userinfo else host
+    path = '' if parts.path == '/' else parts.path
+    normalized = f'{scheme}://{netloc}{path}' if has_scheme else f'{netloc}{path}'
+    return normalized + (f'?{parts.query}' if parts.query else '')
+
+def email_domain(value: str) -> str:
+    """Part after the last '@' (the whole value when there is none)"""
+    return value.split('@')[-1] if '@' in value else value
+
+
+class RequestFeatures:
+    """Feature vectors for one analysis request, each extracted at most once.
+
+    Vectors are extracted on first access, so models served from a cache
+    never pay for extraction.
+    """
+
+    def __init__(self, input_type: str, input_value: str,
+                 device_fingerprint: Optional[Dict[str, Any]] = None,
+                 session_data: Optional[Dict[str, Any]] = None):
+        self.input_type = input_type
+        self.input_value = input_value
+        self.device_fingerprint = device_fingerprint
+        self.session_data = session_data
+        self._url_features: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_request(cls, request: Any) -> "RequestFeatures":
+        return cls(request.input_type, request.input_value, request.device_fingerprint, request.session_data)
+
+    @property
+    def domain(self) -> str:
+        return email_domain(self.input_value)
+
+    def url(self, url: str) -> np.ndarray:
+        """URL features of ``url`` (the input itself or its domain)"""
+        features = self._url_features.get(url)
+        if features is None:
+            with stage('extract.url'):
+                features = self._url_features[url] = extract_url_features(url)
+        return features
+
+    @cached_property
+    def ip(self) -> np.ndarray:
+        with stage('extract.ip'):
+            return extract_ip_features(self.input_value)
+
+    @cached_property
+    def device(self) -> np.ndarray:
+        with stage('extract.device'):
+            return extract_device_features(self.device_fingerprint)
+
+    @cached_property
+    def device_key(self) -> str:
+        """Cache key of the device row: the same in every process, and for fingerprints that encode alike"""
+        return hashlib.blake2b(self.device.tobytes(), digest_size=16).hexdigest()
+
+    @cached_property
+    def behavioral(self) -> np.ndarray:
+        with stage('extract.behavioral'):
+            return behavioral_sequence(self.session_data)
+
+    @cached_property
+    def primary(self) -> Optional[np.ndarray]:
+        """Features of the input itself as seen by the anomaly detector"""
+        if self.input_type == 'ip':
+            return self.ip
+        if self.input_type in ['url', 'email']:
+            return self.url(self.domain)
+        return None
+
+    @cached_property
+    def anomaly(self) -> Optional[np.ndarray]:
+        device = self.device if self.device_fingerprint else None
+        primary = self.primary
+        with stage('extract.anomaly'):
+            return combined_anomaly_features(primary, device)
+
+
+class _CodePoints:
+    """Code points of a list of strings laid end to end, with each string's bounds.
+
+    Lookups work on the (usually sparse) positions of the characters of
+    interest rather than on running sums over every code point.
+    """
+
+    def __init__(self, strings: Sequence[str]):
+        self.n = len(strings)
+        self.lengths = np.fromiter(map(len, strings), dtype=np.int64, count=self.n)
+        self.ends = np.cumsum(self.lengths)
+        self.starts = self.ends - self.lengths
+        joined = "".join(strings)
+        try:
+            self.codes = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+            self.is_ascii = True
+        except UnicodeEncodeError:
+            self.codes = np.frombuffer(joined.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+            self.is_ascii = False
+        # Index of the string each code point belongs to
+        self.owner = np.repeat(np.arange(self.n), self.lengths)
+
+    def positions(self, char: str, codes: Optional[np.ndarray] = None) -> np.ndarray:
+        codes = self.codes if codes is None else codes
+        return np.flatnonzero(codes == ord(char))
+
+    def count(self, positions: np.ndarray) -> np.ndarray:
+        """Number of the given positions in each string"""
+        return np.bincount(self.owner[positions], minlength=self.n)
+
+    def find(self, pattern: str, codes: Optional[np.ndarray] = None) -> np.ndarray:
+        """Start positions of ``pattern`` occurrences that lie within one string"""
+        codes = self.codes if codes is None else codes
+        candidates = self.positions(pattern[0], codes)
+        candidates = candidates[candidates + len(pattern) <= self.ends[self.owner[candidates]]]
+        for offset, char in enumerate(pattern[1:], start=1):
+            candidates = candidates[codes[candidates + offset] == ord(char)]
+        return candidates
+
+    def contains(self, pattern: str, codes: Optional[np.ndarray] = None) -> np.ndarray:
+        """Whether each string contains ``pattern``"""
+        return self.count(self.find(pattern, codes)) > 0
+
+    def non_ascii(self) -> np.ndarray:
+        """Indices of strings with any non-ASCII code point"""
+        if self.is_ascii:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(self.owner[np.flatnonzero(self.codes > 127)])
+
+
+def _nth(positions: np.ndarray, rows: np.ndarray, n: int, k: int, default: np.ndarray) -> np.ndarray:
+    """k-th (0-based) of each string's sorted positions, or ``default`` where it has fewer"""
+    counts = np.bincount(rows, minlength=n)
+    index = np.cumsum(counts) - counts + k
+    padded = np.append(positions, 0)
+    return np.where(counts > k, padded[np.minimum(index, len(positions))], default)
+
+
+def extract_url_features_batch(urls: Sequence[str]) -> np.ndarray:
+    """extract_url_features for a list of URLs, as one (n, 14) matrix"""
+    urls = list(urls)
+    features = np.zeros((len(urls), URL_FEATURES), dtype=np.float32)
+    if len(urls) < VECTORIZE_MIN_ROWS:
+        for i, url in enumerate(urls):
+            features[i] = extract_url_features(url)
+        return features
+
+    text = _CodePoints(urls)
+    codes = text.codes
+    digits = np.flatnonzero((codes >= ord('0')) & (codes <= ord('9')))
+
+    features[:, 0] = text.lengths
+    located = {char: text.positions(char) for char in URL_COUNTED_CHARS}
+    for column, char in enumerate(URL_COUNTED_CHARS, start=1):
+        features[:, column] = text.count(located[char])
+    features[:, 8] = text.contains('https')
+    features[:, 9] = text.count(digits) > 0
+
+    # ASCII case folding; exact for the (all-letter) keywords
+    folded = codes | 0x20
+    features[:, 10] = sum(text.contains(keyword, folded).astype(np.int64) for keyword in SUSPICIOUS_KEYWORDS)
+
+    # The domain is the text between the second and third '/' when the URL
+    # contains '//' anywhere (url.split('/')[2]), otherwise the whole URL
+    slashes = located['/']
+    slash_rows = text.owner[slashes]
+    has_double_slash = text.contains('//')
+    lo = np.where(has_double_slash, _nth(slashes, slash_rows, text.n, 1, text.starts - 1) + 1, text.starts)
+    hi = np.where(has_double_slash, _nth(slashes, slash_rows, text.n, 2, text.ends), text.ends)
+
+    dots = located['.']
+    dot_rows = text.owner[dots]
+    in_domain = (dots >= lo[dot_rows]) & (dots < hi[dot_rows])
+    dots, dot_rows = dots[in_domain], dot_rows[in_domain]
+    features[:, 11] = np.bincount(dot_rows, minlength=text.n) + 1
+
+    # Longest part: the gaps before each domain dot and after the last one
+    is_first = np.ones(len(dots), dtype=bool)
+    is_first[1:] = dot_rows[1:] != dot_rows[:-1]
+    is_last = np.ones(len(dots), dtype=bool)
+    is_last[:-1] = is_first[1:]
+    previous = np.where(is_first, lo[dot_rows] - 1, np.roll(dots, 1))
+    last_dot = lo - 1
+    last_dot[dot_rows[is_last]] = dots[is_last]
+    longest = hi - last_dot - 1
+    if len(dots):
+        group_starts = np.flatnonzero(is_first)
+        before_dots = np.maximum.reduceat(dots - previous - 1, group_starts)
+        rows = dot_rows[group_starts]
+        longest[rows] = np.maximum(longest[rows], before_dots)
+    features[:, 12] = longest
+
+    first_part_end = hi.copy()
+    first_part_end[dot_rows[is_first]] = dots[is_first]
+    features[:, 13] = np.searchsorted(digits, first_part_end) > np.searchsorted(digits, lo)
+
+    # Unicode digits and case mapping only match the scalar path for ASCII
+    for i in text.non_ascii():
+        features[i] = extract_url_features(urls[i])
+    return features
+
+def extract_ip_features_batch(ip_addresses: Sequence[str]) -> np.ndarray:
+    """extract_ip_features for a list of IPs, as one (n, 12) matrix"""
+    ip_addresses = list(ip_addresses)
+    n = len(ip_addresses)
+    features = np.zeros((n, IP_FEATURES), dtype=np.float32)
+    if n < VECTORIZE_MIN_ROWS:
+        for i, ip_address in enumerate(ip_addresses):
+            features[i] = extract_ip_features(ip_address)
+        return features
+
+    text = _CodePoints(ip_addresses)
+    codes = text.codes
+    digits = np.flatnonzero((codes >= ord('0')) & (codes <= ord('9')))
+    dots = text.positions('.')
+    dot_rows = text.owner[dots]
+
+    # Fast path: plain dotted quads of 1-9 digit ASCII octets
+    dot_counts = np.bincount(dot_rows, minlength=n)
+    plain = (dot_counts == 3) & (text.count(digits) + dot_counts == text.lengths)
+    bounds = [text.starts - 1] + [_nth(dots, dot_rows, n, k, text.ends) for k in range(3)] + [text.ends]
+    octet_lengths = np.stack([bounds[k + 1] - bounds[k] - 1 for k in range(4)], axis=1)
+    plain &= (octet_lengths >= 1).all(axis=1) & (octet_lengths <= 9).all(axis=1)
+
+    rows = np.flatnonzero(plain)
+    octets = np.zeros((len(rows), 4), dtype=np.int64)
+    for k in range(4):
+        end, length = bounds[k + 1][rows], octet_lengths[rows, k]
+        place = 1
+        for digit in range(9):
+            present = length > digit
+            value = codes[np.where(present, end - 1 - digit, 0)].astype(np.int64) - ord('0')
+            octets[:, k] += np.where(present, value * place, 0)
+            place *= 10
+
+    first_octet = octets[:, 0]
+    features[rows, 0:4] = octets
+    features[rows, 4] = first_octet == 10
+    features[rows, 5] = first_octet == 172
+    features[rows, 6] = first_octet == 192
+    features[rows, 7] = first_octet == 127
+    features[rows, 8] = first_octet >= 224
+    plain_ips = [ip_addresses[i] for i in rows]
+    if len(ip_intel):
+        features[rows, 9:12] = ip_intel.geo_features_many(plain_ips)
+    else:
+        # Mock geolocation, the same expressions as mock_geo_features column by column
+        features[rows, 9] = np.fromiter((_stable_hash(ip) % 1000 / 1000 for ip in plain_ips), np.float64, len(rows))
+        features[rows, 10] = np.fromiter((_stable_hash(ip[::-1]) % 1000 / 1000 for ip in plain_ips), np.float64, len(rows))
+        features[rows, 11] = np.fromiter((_stable_hash(ip + "country") % 200 for ip in plain_ips), np.int64, len(rows))
+
+    for i in np.flatnonzero(~plain):
+        features[i] = extract_ip_features(ip_addresses[i])
+    return features
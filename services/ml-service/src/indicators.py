@@ -0,0 +1,410 @@
+"""Index of known malicious and benign indicators, consulted before the models.
+
+The index is built from the list files in one directory (INDICATOR_PATH),
+named ``<verdict>_<kind>[_<anything>].txt`` with verdict ``malicious`` or
+``benign`` and kind ``ips``, ``domains``, ``urls`` or ``emails``, e.g.
+``malicious_ips_feodo.txt``. Each line holds one indicator (the first
+whitespace- or comma-separated field); blank lines and ``#`` comments are
+skipped. IP lists take addresses or CIDR networks.
+
+Everything is held in sorted numpy arrays, a few bytes per entry:
+
+* IPv4 networks: one table of network prefixes per prefix length, searched
+  longest prefix first, so a /32 allowlist entry inside a blocked /16 wins.
+* IPv6 networks, domains, URLs and emails: 64-bit hashes of the normalized
+  value, keyed with a random key per index so collisions with listed
+  entries can't be searched for offline (an unlisted value falsely matches
+  with probability entries / 2^64, under 1 in 10^12 for ten million
+  entries). Domains match themselves and
+  their subdomains, most specific entry first; URLs and emails fall back to
+  their host or domain.
+
+Where a malicious and a benign list hold the same entry, malicious wins.
+An index is immutable: a reload builds a new one and the caller swaps the
+reference, so lookups never see a half-loaded index.
+
+    python src/indicators.py lookup 203.0.113.7 --type ip
+    python src/indicators.py stats
+"""
+import os
+import sys
+import time
+import bisect
+import socket
+import hashlib
+import argparse
+import ipaddress
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+import numpy as np
+
+VERDICTS = ("malicious", "benign")
+KINDS = ("ips", "domains", "urls", "emails")
+
+
+class IndicatorError(Exception):
+    """Raised when the indicator lists can't be loaded"""
+
+
+@dataclass
+class IndicatorConfig:
+    """Where the indicator lists live and how large the index may grow"""
+    path: str = "/app/models/indicators"
+    max_entries: int = 20_000_000
+    # Reload when the list files change; 0 disables polling
+    poll_seconds: float = 0.0
+
+    @classmethod
+    def from_env(cls, model_path: str) -> "IndicatorConfig":
+        return cls(
+            path=os.getenv("INDICATOR_PATH", os.path.join(model_path, "indicators")),
+            max_entries=max(1, int(os.getenv("INDICATOR_MAX_ENTRIES", cls.max_entries))),
+            poll_seconds=float(os.getenv("INDICATOR_POLL_SECONDS", cls.poll_seconds)),
+        )
+
+
+@dataclass(frozen=True)
+class IndicatorMatch:
+    """The list entry that decided a verdict"""
+    verdict: str
+    kind: str
+    indicator: str
+    source: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"verdict": self.verdict, "kind": self.kind, "indicator": self.indicator, "source": self.source}
+
+
+def _hash(key: bytes, kind: str, value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{kind}:{value}".encode("utf-8"), digest_size=8, key=key).digest(), "little")
+
+
+def normalize_domain(value: str) -> str:
+    value = value.strip().lower().rstrip(".")
+    return value[2:] if value.startswith("*.") else value
+
+
+def normalize_email(value: str) -> str:
+    return value.strip().lower()
+
+
+def split_url(value: str) -> Tuple[str, str]:
+    """(host, normalized URL): scheme, default port and fragment dropped, host lowercased.
+
+    Both are empty for a URL that can't be parsed (bad port, unclosed IPv6 bracket).
+    """
+    value = value.strip()
+    if "://" not in value:
+        value = "http://" + value
+    try:
+        parts = urlsplit(value)
+        port = parts.port
+    except ValueError:
+        return "", ""
+    host = (parts.hostname or "").rstrip(".")
+    port = port if port not in (None, 80, 443) else None
+    path = parts.path if parts.path not in ("", "/") else ""
+    url = f"{host}:{port}" if port else host
+    url += path + (f"?{parts.query}" if parts.query else "")
+    return host, url
+
+
+_IPV4_MAPPED = bytes(10) + b"\xff\xff"
+
+
+def parse_network(value: str) -> Optional[Tuple[int, int, int]]:
+    """(IP version, address as an int, prefix length) of an address or CIDR network, or None.
+
+    Host bits are kept (callers shift them out); IPv4-mapped IPv6 becomes IPv4.
+    """
+    address, _, length = value.strip().partition("/")
+    address = address.strip("[]")
+    try:
+        if ":" in address:
+            packed, bits = socket.inet_pton(socket.AF_INET6, address), 128
+        else:
+            packed, bits = socket.inet_pton(socket.AF_INET, address), 32
+        length = int(length) if length else bits
+    except (OSError, ValueError):
+        return None
+    if not 0 <= length <= bits:
+        return None
+    if bits == 128 and packed[:12] == _IPV4_MAPPED and length >= 96:
+        packed, bits, length = packed[12:], 32, length - 96
+    return (4 if bits == 32 else 6), int.from_bytes(packed, "big"), length
+
+
+def list_files(directory: str) -> List[Tuple[str, str, str]]:
+    """(path, verdict, kind) of every list file in ``directory``, sorted by name"""
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    files = []
+    for name in names:
+        stem, _, extension = name.partition(".")
+        parts = stem.split("_")
+        if extension != "txt" or len(parts) < 2 or parts[0] not in VERDICTS or parts[1] not in KINDS:
+            continue
+        files.append((os.path.join(directory, name), parts[0], parts[1]))
+    return files
+
+
+def directory_fingerprint(directory: str) -> Tuple[Tuple[str, int, int], ...]:
+    """Names, sizes and mtimes of the list files; changes when any list does"""
+    fingerprint = []
+    for path, _, _ in list_files(directory):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        fingerprint.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+
+def read_entries(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield line.replace(",", " ").split()[0]
+
+
+class _Table:
+    """Sorted keys with the index of the list each came from"""
+    __slots__ = ("keys", "sources", "_keys", "_sources")
+
+    def __init__(self, keys: np.ndarray, sources: np.ndarray):
+        self.keys = keys
+        self.sources = sources
+        # Searched through memoryviews: bisect on them yields plain ints, where
+        # np.searchsorted with a Python int would convert the whole array per call
+        self._keys = memoryview(keys)
+        self._sources = memoryview(sources)
+
+    def __reduce__(self):
+        return _Table, (self.keys, self.sources)
+
+    @classmethod
+    def build(cls, keys: array, sources: array, dtype: Any, malicious: np.ndarray) -> "_Table":
+        keys = np.frombuffer(keys, dtype=dtype) if len(keys) else np.zeros(0, dtype=dtype)
+        sources = np.frombuffer(sources, dtype=np.uint16) if len(sources) else np.zeros(0, dtype=np.uint16)
+        # Sort by key, malicious lists first, and keep the first entry per key
+        order = np.lexsort((sources, ~malicious[sources], keys))
+        keys, sources = keys[order], sources[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        return cls(np.ascontiguousarray(keys[first]), np.ascontiguousarray(sources[first]))
+
+    def find(self, key: int) -> int:
+        """Source index of ``key``, or -1"""
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._sources[i]
+        return -1
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.sources.nbytes
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class IndicatorIndex:
+    """Immutable lookup index over the indicator lists of one directory"""
+
+    def __init__(self, sources: List[Tuple[str, str, str]], ipv4: Dict[int, _Table], ipv6: Dict[int, _Table],
+                 hashed: _Table, counts: Dict[str, int], skipped: int, key: bytes, fingerprint: Tuple = (),
+                 build_ms: float = 0.0):
+        # (file name, verdict, kind) per source index
+        self.sources = sources
+        self.key = key
+        self.ipv4 = ipv4
+        self.ipv6 = ipv6
+        self.hashed = hashed
+        self.counts = counts
+        self.skipped = skipped
+        self.fingerprint = fingerprint
+        # Names, sizes and mtimes of the lists loaded: the same in every process that loads them
+        self.version = hashlib.blake2b(repr(fingerprint).encode(), digest_size=8).hexdigest() if fingerprint else "none"
+        self.build_ms = build_ms
+        self.loaded_at = time.time()
+        self._ipv4_lengths = sorted(ipv4, reverse=True)
+        self._ipv6_lengths = sorted(ipv6, reverse=True)
+
+    @classmethod
+    def empty(cls) -> "IndicatorIndex":
+        table = _Table(np.zeros(0, np.uint64), np.zeros(0, np.uint16))
+        return cls([], {}, {}, table, {kind: 0 for kind in KINDS}, 0, os.urandom(16))
+
+    @classmethod
+    def load(cls, directory: str, max_entries: int = IndicatorConfig.max_entries) -> "IndicatorIndex":
+        """Build an index from the list files in ``directory`` (empty if there are none)"""
+        started = time.perf_counter()
+        fingerprint = directory_fingerprint(directory)
+        files = list_files(directory)
+        if len(files) > np.iinfo(np.uint16).max:
+            raise IndicatorError(f"Too many indicator lists in {directory}")
+        # Keys accumulate in compact arrays rather than Python lists of ints
+        ipv4: Dict[int, Tuple[array, array]] = {}
+        ipv6: Dict[int, Tuple[array, array]] = {}
+        hashed = (array("Q"), array("H"))
+        counts = {kind: 0 for kind in KINDS}
+        skipped = entries = 0
+        key = os.urandom(16)
+
+        for source, (path, _, kind) in enumerate(files):
+            for value in read_entries(path):
+                if kind == "ips":
+                    network = parse_network(value)
+                    if network is None:
+                        skipped += 1
+                        continue
+                    version, number, length = network
+                    if version == 4:
+                        keys, sources = ipv4.setdefault(length, (array("I"), array("H")))
+                        keys.append(number >> (32 - length))
+                    else:
+                        keys, sources = ipv6.setdefault(length, (array("Q"), array("H")))
+                        keys.append(_hash(key, "ip6", f"{number >> (128 - length)}/{length}"))
+                    sources.append(source)
+                else:
+                    if kind == "domains":
+                        value = normalize_domain(value)
+                    elif kind == "urls":
+                        value = split_url(value)[1]
+                    else:
+                        value = normalize_email(value)
+                    if not value:
+                        skipped += 1
+                        continue
+                    hashed[0].append(_hash(key, kind, value))
+                    hashed[1].append(source)
+                counts[kind] += 1
+                entries += 1
+                if entries > max_entries:
+                    raise IndicatorError(f"More than INDICATOR_MAX_ENTRIES={max_entries} indicators in {directory}")
+
+        malicious = np.array([verdict == "malicious" for _, verdict, _ in files] or [False])
+        return cls(
+            [(os.path.basename(path), verdict, kind) for path, verdict, kind in files],
+            {length: _Table.build(keys, sources, np.uint32, malicious) for length, (keys, sources) in ipv4.items()},
+            {length: _Table.build(keys, sources, np.uint64, malicious) for length, (keys, sources) in ipv6.items()},
+            _Table.build(hashed[0], hashed[1], np.uint64, malicious),
+            counts, skipped, key, fingerprint, round((time.perf_counter() - started) * 1000, 1),
+        )
+
+    def _match(self, source: int, kind: str, indicator: str) -> IndicatorMatch:
+        name, verdict, _ = self.sources[source]
+        return IndicatorMatch(verdict, kind, indicator, name)
+
+    def lookup_ip(self, value: str) -> Optional[IndicatorMatch]:
+        address = parse_network(value) if "/" not in value else None
+        if address is None:
+            return None
+        version, number, _ = address
+        bits, lengths = (32, self._ipv4_lengths) if version == 4 else (128, self._ipv6_lengths)
+        for length in lengths:
+            prefix = number >> (bits - length)
+            if version == 4:
+                source = self.ipv4[length].find(prefix)
+            else:
+                source = self.ipv6[length].find(_hash(self.key, "ip6", f"{prefix}/{length}"))
+            if source >= 0:
+                network = ipaddress.ip_address(prefix << (bits - length))
+                return self._match(source, "ips", f"{network}/{length}")
+        return None
+
+    def lookup_domain(self, value: str) -> Optional[IndicatorMatch]:
+        domain = normalize_domain(value)
+        if not domain:
+            return None
+        if domain[-1].isdigit() or ":" in domain:
+            match = self.lookup_ip(domain)
+            if match is not None or parse_network(domain) is not None:
+                return match
+        labels = domain.split(".")
+        for i in range(len(labels)):
+            suffix = ".".join(labels[i:])
+            source = self.hashed.find(_hash(self.key, "domains", suffix))
+            if source >= 0:
+                return self._match(source, "domains", suffix)
+        return None
+
+    def lookup_url(self, value: str) -> Optional[IndicatorMatch]:
+        host, url = split_url(value)
+        if not url:
+            return None
+        source = self.hashed.find(_hash(self.key, "urls", url))
+        if source >= 0:
+            return self._match(source, "urls", url)
+        return self.lookup_domain(host) if host else None
+
+    def lookup_email(self, value: str) -> Optional[IndicatorMatch]:
+        email = normalize_email(value)
+        source = self.hashed.find(_hash(self.key, "emails", email))
+        if source >= 0:
+            return self._match(source, "emails", email)
+        return self.lookup_domain(email.split("@")[-1]) if "@" in email else None
+
+    def lookup(self, input_type: str, value: str) -> Optional[IndicatorMatch]:
+        """Most specific list entry matching an analysis input, or None"""
+        if not len(self):
+            return None
+        if input_type == "ip":
+            return self.lookup_ip(value)
+        if input_type == "url":
+            return self.lookup_url(value)
+        if input_type == "email":
+            return self.lookup_email(value)
+        if input_type == "domain":
+            return self.lookup_domain(value)
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return self.hashed.nbytes + sum(table.nbytes for table in (*self.ipv4.values(), *self.ipv6.values()))
+
+    def __len__(self) -> int:
+        return len(self.hashed) + sum(len(table) for table in (*self.ipv4.values(), *self.ipv6.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "entries": len(self),
+            "entries_by_kind": dict(self.counts),
+            "skipped_lines": self.skipped,
+            "bytes": self.nbytes,
+            "ipv4_prefix_lengths": sorted(self.ipv4),
+            "ipv6_prefix_lengths": sorted(self.ipv6),
+            "lists": [name for name, _, _ in self.sources],
+            "build_ms": self.build_ms,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect the known-indicator index")
+    parser.add_argument("--path", default=IndicatorConfig.from_env(os.getenv("MODEL_PATH", "/app/models")).path)
+    commands = parser.add_subparsers(dest="command", required=True)
+    lookup = commands.add_parser("lookup", help="Look up indicators")
+    lookup.add_argument("values", nargs="+")
+    lookup.add_argument("--type", default="ip", choices=["ip", "url", "email", "domain"])
+    commands.add_parser("stats", help="Load the lists and print index statistics")
+    args = parser.parse_args(argv)
+
+    index = IndicatorIndex.load(args.path)
+    if args.command == "stats":
+        for name, value in index.stats().items():
+            print(f"{name:<22}{value}")
+        return
+    for value in args.values:
+        match = index.lookup(args.type, value)
+        print(f"{value}\t{match.verdict + ' ' + match.indicator + ' (' + match.source + ')' if match else 'no match'}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+"""Local IP intelligence table: geolocation, ASN and hosting/VPN flags by address range.
+
+The table is one binary file (IP_INTEL_PATH) built from CSV range data by
+this module's ``build`` command. It holds sorted, non-overlapping IPv4 and
+IPv6 ranges as packed column arrays, and is memory-mapped read-only: the
+pre-fork workers share the parent's mapping, and separately started
+processes share the page cache, so there's one copy in memory however many
+processes serve.
+
+Lookups binary-search the range starts and ends: IPv4 as 32-bit integers,
+IPv6 as 16-byte big-endian keys, which numpy orders like the addresses.
+IPv4-mapped IPv6 addresses are looked up as IPv4.
+
+    python src/ip_intel.py build ranges.csv                  # writes IP_INTEL_PATH
+    python src/ip_intel.py lookup 203.0.113.7 2001:db8::1
+    python src/ip_intel.py stats
+
+The CSV has a header row and either a ``network`` column (CIDR) or
+``start_ip`` and ``end_ip`` columns (addresses or integers, inclusive), plus
+any of ``country`` (ISO 3166 alpha-2), ``latitude``, ``longitude``, ``asn``
+(``13335`` or ``AS13335``) and the flags ``hosting``, ``vpn``, ``proxy`` and
+``tor`` (1/true/yes). The builder writes a temporary file and renames it
+over the table, so a serving process never sees a partly written table;
+never modify a table file in place.
+"""
+import os
+import sys
+import csv
+import json
+import mmap
+import socket
+import time
+import bisect
+import argparse
+import ipaddress
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+from indicators import parse_network
+
+MAGIC = b"SGIPTAB1"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+FLAGS = ("hosting", "vpn", "proxy", "tor")
+TRUE_VALUES = ("1", "true", "yes", "y", "t")
+# Per-range columns after the start and end keys
+ATTRIBUTE_DTYPES = {"country": "<u2", "asn": "<u4", "latitude": "<f4", "longitude": "<f4", "flags": "u1"}
+KEY_DTYPES = {"ipv4": "<u4", "ipv6": "S16"}
+# The IPv4 section also stores, for every /16 prefix p, how many ranges start below p's first address
+PREFIX_BITS = 16
+
+
+class IpIntelError(Exception):
+    """Raised when an IP intelligence table can't be built or opened"""
+
+
+@dataclass
+class IpIntelConfig:
+    """Where the IP intelligence table lives and how often to check it for a new build"""
+    path: str = "/app/models/ip_intel.bin"
+    # Remap the table when the file is replaced; 0 disables polling
+    poll_seconds: float = 0.0
+
+    @classmethod
+    def from_env(cls, model_path: str) -> "IpIntelConfig":
+        return cls(
+            path=os.getenv("IP_INTEL_PATH", os.path.join(model_path, "ip_intel.bin")),
+            poll_seconds=float(os.getenv("IP_INTEL_POLL_SECONDS", cls.poll_seconds)),
+        )
+
+
+@dataclass(frozen=True)
+class IpIntelRecord:
+    """The range an address fell in and what the table knows about it"""
+    network: str
+    country: Optional[str]
+    asn: Optional[int]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    hosting: bool
+    vpn: bool
+    proxy: bool
+    tor: bool
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "network": self.network, "country": self.country, "asn": self.asn, "latitude": self.latitude,
+            "longitude": self.longitude, "hosting": self.hosting, "vpn": self.vpn, "proxy": self.proxy, "tor": self.tor,
+        }
+
+
+def country_code(country: str) -> int:
+    """1-676 for an alpha-2 code (AA=1, ZZ=676), 0 for unknown"""
+    country = country.strip().upper()
+    if len(country) != 2 or not country.isascii() or not country.isalpha():
+        return 0
+    return 1 + (ord(country[0]) - 65) * 26 + ord(country[1]) - 65
+
+
+def country_name(code: int) -> Optional[str]:
+    if not code:
+        return None
+    return chr(65 + (code - 1) // 26) + chr(65 + (code - 1) % 26)
+
+
+def parse_address(value: str) -> Optional[Tuple[int, int]]:
+    """(IP version, address as an int) of a single address, or None"""
+    if "/" in value:
+        return None
+    address = parse_network(value)
+    return address[:2] if address is not None else None
+
+
+def address_key(value: str) -> Optional[Tuple[int, int]]:
+    """``parse_address``, with a fast path for plain dotted quads"""
+    if ":" not in value:
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), "big")
+        except OSError:
+            pass
+    return parse_address(value)
+
+
+def table_fingerprint(path: str) -> Optional[Tuple[int, int, int]]:
+    """Inode, size and mtime of the table file; changes when a new build replaces it"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class _Section:
+    """One address family's ranges: start and end keys, the attribute columns and, for IPv4, the prefix index"""
+    COLUMNS = ("start", "end", "country", "asn", "latitude", "longitude", "flags")
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+        self.prefix_index = columns.get("prefix_index")
+        # Scalar lookups read memoryviews: indexing one gives a plain int or float, not a numpy scalar
+        self._country, self._asn, self._latitude, self._longitude, self._flags = (
+            memoryview(columns[name]) for name in self.COLUMNS[2:]
+        )
+        ipv4 = self.prefix_index is not None
+        self._start = memoryview(self.start) if ipv4 else None
+        self._end = memoryview(self.end) if ipv4 else None
+        self._prefix_index = memoryview(self.prefix_index) if ipv4 else None
+
+    @classmethod
+    def empty(cls, family: str) -> "_Section":
+        columns = {name: np.zeros(0, dtype) for name, dtype in ATTRIBUTE_DTYPES.items()}
+        columns.update(start=np.zeros(0, KEY_DTYPES[family]), end=np.zeros(0, KEY_DTYPES[family]))
+        if family == "ipv4":
+            columns["prefix_index"] = np.zeros((1 << PREFIX_BITS) + 1, np.uint32)
+        return cls(columns)
+
+    def find(self, key: Any) -> int:
+        """Row of the range holding ``key`` (an int for IPv4, 16 big-endian bytes for IPv6), or -1"""
+        if self._prefix_index is not None:
+            # Only the ranges starting in the key's /16 (and the one before) are candidates
+            prefix = key >> (32 - PREFIX_BITS)
+            i = bisect.bisect_right(self._start, key, self._prefix_index[prefix], self._prefix_index[prefix + 1]) - 1
+            return i if i >= 0 and key <= self._end[i] else -1
+        # numpy's bytes scalars drop trailing zero bytes; dropping them from the key as well
+        # keeps fixed-width keys in the same order
+        key = key.rstrip(b"\0")
+        i = bisect.bisect_right(self.start, key) - 1
+        return i if i >= 0 and key <= self.end[i] else -1
+
+    def find_many(self, keys: np.ndarray) -> np.ndarray:
+        """Rows of the ranges holding ``keys``, -1 where none does"""
+        rows = np.searchsorted(self.start, keys, "right") - 1
+        # With sorted, disjoint ranges the first range ending at or after a key is the only candidate
+        rows[(rows < 0) | (np.searchsorted(self.end, keys, "left") != rows)] = -1
+        return rows
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.COLUMNS) + (
+            self.prefix_index.nbytes if self.prefix_index is not None else 0
+        )
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+
+class IpIntelTable:
+    """Read-only view of a memory-mapped IP intelligence table"""
+
+    def __init__(self, ipv4: _Section, ipv6: _Section, header: Optional[Dict[str, Any]] = None, path: str = "",
+                 fingerprint: Optional[Tuple[int, int, int]] = None, mapping: Optional[mmap.mmap] = None):
+        self.ipv4 = ipv4
+        self.ipv6 = ipv6
+        self.header = header or {}
+        self.path = path
+        self.fingerprint = fingerprint
+        # Build id of the table, for cache keys; lookups answered without a table share "none"
+        self.version = self.header.get("build_id", "none")
+        self.loaded_at = time.time()
+        # The arrays point into the mapping; it's unmapped when the last of them is released
+        self._mapping = mapping
+
+    @classmethod
+    def empty(cls) -> "IpIntelTable":
+        return cls(_Section.empty("ipv4"), _Section.empty("ipv6"))
+
+    @classmethod
+    def open(cls, path: str) -> "IpIntelTable":
+        """Map the table at ``path``; a missing file gives the empty table"""
+        fingerprint = table_fingerprint(path)
+        if fingerprint is None:
+            return cls.empty()
+        with open(path, "rb") as f:
+            # The mapping outlives the descriptor, and a later rename over the path
+            try:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise IpIntelError(f"{path} is empty")
+        try:
+            if mapping[:len(MAGIC)] != MAGIC:
+                raise IpIntelError(f"{path} is not an IP intelligence table")
+            header_size = int.from_bytes(mapping[len(MAGIC):len(MAGIC) + 4], "little")
+            header = json.loads(mapping[len(MAGIC) + 4:len(MAGIC) + 4 + header_size])
+            if header.get("format") != FORMAT_VERSION:
+                raise IpIntelError(f"{path} has table format {header.get('format')}, expected {FORMAT_VERSION}")
+            sections = {}
+            for family in KEY_DTYPES:
+                section = header["sections"][family]
+                columns = {}
+                for name, (offset, dtype, count) in section["columns"].items():
+                    dtype = np.dtype(dtype)
+                    if offset + count * dtype.itemsize > len(mapping):
+                        raise IpIntelError(f"{path} is truncated")
+                    columns[name] = np.frombuffer(mapping, dtype=dtype, count=count, offset=offset)
+                sections[family] = _Section(columns)
+        except (KeyError, TypeError, ValueError) as e:
+            raise IpIntelError(f"{path} has a malformed header: {e}")
+        return cls(sections["ipv4"], sections["ipv6"], header, path, fingerprint, mapping)
+
+    def _record(self, section: _Section, row: int) -> IpIntelRecord:
+        if section is self.ipv4:
+            start, end = (socket.inet_ntop(socket.AF_INET, section._start[row].to_bytes(4, "big")),
+                          socket.inet_ntop(socket.AF_INET, section._end[row].to_bytes(4, "big")))
+        else:
+            start, end = (socket.inet_ntop(socket.AF_INET6, bytes(section.start[row]).ljust(16, b"\0")),
+                          socket.inet_ntop(socket.AF_INET6, bytes(section.end[row]).ljust(16, b"\0")))
+        latitude, longitude, flags = section._latitude[row], section._longitude[row], section._flags[row]
+        return IpIntelRecord(
+            f"{start}-{end}",
+            country_name(section._country[row]),
+            section._asn[row] or None,
+            None if latitude != latitude else round(latitude, 4),
+            None if longitude != longitude else round(longitude, 4),
+            *(bool(flags >> bit & 1) for bit in range(len(FLAGS))),
+        )
+
+    def _find(self, value: str) -> Tuple[Optional[_Section], int]:
+        address = address_key(value)
+        if address is None:
+            return None, -1
+        version, number = address
+        if version == 4:
+            return self.ipv4, self.ipv4.find(number)
+        return self.ipv6, self.ipv6.find(number.to_bytes(16, "big"))
+
+    def lookup(self, value: str) -> Optional[IpIntelRecord]:
+        """What the table knows about an address, or None"""
+        section, row = self._find(value)
+        return self._record(section, row) if row >= 0 else None
+
+    def locate(self, values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """IPv4 and IPv6 table rows of many addresses: -1 where that family has no range for it"""
+        v4_rows = np.full(len(values), -1, dtype=np.intp)
+        v6_rows = np.full(len(values), -1, dtype=np.intp)
+        v4, v4_keys, v6, v6_keys = [], [], [], []
+        for i, value in enumerate(values):
+            address = address_key(value)
+            if address is None:
+                continue
+            if address[0] == 4:
+                v4.append(i)
+                v4_keys.append(address[1])
+            else:
+                v6.append(i)
+                v6_keys.append(address[1].to_bytes(16, "big"))
+        if v4 and len(self.ipv4):
+            v4_rows[v4] = self.ipv4.find_many(np.array(v4_keys, dtype=np.uint32))
+        if v6 and len(self.ipv6):
+            v6_rows[v6] = self.ipv6.find_many(np.array(v6_keys, dtype="S16"))
+        return v4_rows, v6_rows
+
+    def lookup_many(self, values: Sequence[str]) -> List[Optional[IpIntelRecord]]:
+        """``lookup`` for a list of addresses, with the range searches done as array operations"""
+        v4_rows, v6_rows = self.locate(values)
+        return [
+            self._record(self.ipv4, v4) if v4 >= 0 else self._record(self.ipv6, v6) if v6 >= 0 else None
+            for v4, v6 in zip(v4_rows.tolist(), v6_rows.tolist())
+        ]
+
+    def geo_features(self, value: str) -> List[float]:
+        """Latitude and longitude scaled to [0, 1] and the country code; zeros where unknown"""
+        section, row = self._find(value)
+        if row < 0:
+            return [0.0, 0.0, 0.0]
+        # The same arithmetic as _geo_columns, in Python floats (float64) as there
+        latitude, longitude = section._latitude[row], section._longitude[row]
+        return [
+            0.0 if latitude != latitude else (latitude + 90) / 180,
+            0.0 if longitude != longitude else (longitude + 180) / 360,
+            float(section._country[row]),
+        ]
+
+    def geo_features_many(self, values: Sequence[str]) -> np.ndarray:
+        """``geo_features`` for a list of addresses, as an (n, 3) matrix"""
+        features = np.zeros((len(values), 3), dtype=np.float32)
+        for section, rows in zip((self.ipv4, self.ipv6), self.locate(values)):
+            found = np.flatnonzero(rows >= 0)
+            features[found] = _geo_columns(section, rows[found])
+        return features
+
+    @property
+    def nbytes(self) -> int:
+        return self.ipv4.nbytes + self.ipv6.nbytes
+
+    def __len__(self) -> int:
+        return len(self.ipv4) + len(self.ipv6)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "version": self.version,
+            "ipv4_ranges": len(self.ipv4),
+            "ipv6_ranges": len(self.ipv6),
+            "bytes": self.nbytes,
+            "source": self.header.get("source"),
+            "built_at": self.header.get("built_at"),
+            "loaded_at": self.loaded_at,
+        }
+
+
+def _geo_columns(section: _Section, rows: np.ndarray) -> np.ndarray:
+    latitude = (section.latitude[rows].astype(np.float64) + 90) / 180
+    longitude = (section.longitude[rows].astype(np.float64) + 180) / 360
+    geo = np.stack([latitude, longitude, section.country[rows].astype(np.float64)], axis=1)
+    return np.nan_to_num(geo, nan=0.0)
+
+
+def _parse_bound(value: str) -> Tuple[int, int]:
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return (4 if number < 2 ** 32 else 6), number
+    address = parse_address(value)
+    if address is None:
+        raise ValueError(f"not an IP address: {value!r}")
+    return address
+
+
+def _parse_float(value: Optional[str]) -> float:
+    return float(value) if value not in (None, "") else float("nan")
+
+
+def read_ranges(rows: Iterable[Dict[str, str]]) -> Dict[str, List[Tuple[int, int, Tuple]]]:
+    """(start, end, attributes) per address family from CSV rows"""
+    ranges: Dict[str, List[Tuple[int, int, Tuple]]] = {"ipv4": [], "ipv6": []}
+    for line, row in enumerate(rows, start=2):
+        try:
+            if row.get("network"):
+                network = parse_network(row["network"])
+                if network is None:
+                    raise ValueError(f"not a network: {row['network']!r}")
+                version, number, length = network
+                bits = 32 if version == 4 else 128
+                start = number >> (bits - length) << (bits - length)
+                end = start | ((1 << (bits - length)) - 1)
+            else:
+                (version, start), (end_version, end) = _parse_bound(row["start_ip"]), _parse_bound(row["end_ip"])
+                if end_version != version or end < start:
+                    raise ValueError(f"bad range {row['start_ip']} - {row['end_ip']}")
+            asn = (row.get("asn") or "0").strip().upper()
+            flags = sum(1 << bit for bit, flag in enumerate(FLAGS)
+                        if (row.get(flag) or "").strip().lower() in TRUE_VALUES)
+            attributes = (country_code(row.get("country") or ""), int(asn[2:] if asn.startswith("AS") else asn),
+                          _parse_float(row.get("latitude")), _parse_float(row.get("longitude")), flags)
+        except (KeyError, ValueError) as e:
+            raise IpIntelError(f"line {line}: {e}")
+        ranges["ipv4" if version == 4 else "ipv6"].append((start, end, attributes))
+    return ranges
+
+
+def build(source: str, path: str) -> Dict[str, Any]:
+    """Build a table from the CSV at ``source`` and atomically replace the one at ``path``"""
+    with open(source, newline="") as f:
+        ranges = read_ranges(csv.DictReader(f))
+
+    header: Dict[str, Any] = {
+        "format": FORMAT_VERSION, "build_id": os.urandom(8).hex(), "source": os.path.basename(source),
+        "built_at": time.time(), "sections": {},
+    }
+    arrays: List[np.ndarray] = []
+    for family, entries in ranges.items():
+        entries.sort(key=lambda entry: entry[0])
+        for previous, entry in zip(entries, entries[1:]):
+            if entry[0] <= previous[1]:
+                address = ipaddress.IPv4Address if family == "ipv4" else ipaddress.IPv6Address
+                raise IpIntelError(f"overlapping {family} ranges starting at {address(previous[0])} and {address(entry[0])}")
+        if family == "ipv4":
+            start = np.array([entry[0] for entry in entries], dtype=KEY_DTYPES[family])
+            end = np.array([entry[1] for entry in entries], dtype=KEY_DTYPES[family])
+        else:
+            start = np.array([entry[0].to_bytes(16, "big") for entry in entries], dtype=KEY_DTYPES[family])
+            end = np.array([entry[1].to_bytes(16, "big") for entry in entries], dtype=KEY_DTYPES[family])
+        columns = {"start": start, "end": end}
+        for i, (name, dtype) in enumerate(ATTRIBUTE_DTYPES.items()):
+            columns[name] = np.array([entry[2][i] for entry in entries], dtype=dtype)
+        if family == "ipv4":
+            prefixes = np.arange((1 << PREFIX_BITS) + 1, dtype=np.uint64) << (32 - PREFIX_BITS)
+            columns["prefix_index"] = np.searchsorted(start, prefixes).astype("<u4")
+        header["sections"][family] = {"rows": len(entries), "columns": {
+            name: [0, column.dtype.str, len(column)] for name, column in columns.items()
+        }}
+        arrays.extend((family, name, column) for name, column in columns.items())
+
+    # Offsets depend on the header size, which depends on the offsets' digits: lay out with a fixed-width reserve
+    header_size = len(json.dumps(header)) + 32 * len(arrays) + ALIGNMENT
+    data_start = -(-(len(MAGIC) + 4 + header_size) // ALIGNMENT) * ALIGNMENT
+    offset = data_start
+    for family, name, column in arrays:
+        header["sections"][family]["columns"][name][0] = offset
+        offset += -(-column.nbytes // ALIGNMENT) * ALIGNMENT
+    encoded = json.dumps(header).encode().ljust(header_size)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(MAGIC + len(encoded).to_bytes(4, "little") + encoded)
+            for family, name, column in arrays:
+                f.seek(header["sections"][family]["columns"][name][0])
+                f.write(column.tobytes())
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return {"path": path, "ipv4_ranges": len(ranges["ipv4"]), "ipv6_ranges": len(ranges["ipv6"]),
+            "bytes": offset, "build_id": header["build_id"]}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build and inspect the IP intelligence table")
+    parser.add_argument("--path", default=IpIntelConfig.from_env(os.getenv("MODEL_PATH", "/app/models")).path)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="Build the table from CSV range data")
+    build_command.add_argument("source")
+    lookup = commands.add_parser("lookup", help="Look up addresses")
+    lookup.add_argument("values", nargs="+")
+    commands.add_parser("stats", help="Print table statistics")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        try:
+            result = build(args.source, args.path)
+        except IpIntelError as e:
+            parser.error(f"{args.source}: {e}")
+        print(f"Built {result['ipv4_ranges']} IPv4 and {result['ipv6_ranges']} IPv6 ranges into {result['path']} "
+              f"({result['bytes']} bytes) in {time.perf_counter() - started:.1f}s")
+        return
+    table = IpIntelTable.open(args.path)
+    if args.command == "stats":
+        for name, value in table.stats().items():
+            print(f"{name:<14}{value}")
+        return
+    for value, record in zip(args.values, table.lookup_many(args.values)):
+        print(f"{value}\t{json.dumps(record.to_dict()) if record else 'no match'}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""Serving metrics: stage timings, counters and Prometheus text exposition.
+
+Hot-path code wraps each stage in ``stage(name)``, which observes a
+monotonic duration into the ``sureguard_ml_stage_duration_seconds``
+histogram; when a request has called ``start_breakdown()`` the duration is
+also added to that request's breakdown, which the API can return for
+debugging. Without a breakdown the cost of a stage is two
+``perf_counter()`` calls and one histogram update.
+
+State that already lives elsewhere (cache and batcher counters, queue
+depths) is exported at scrape time by collectors instead of being counted
+twice on the hot path.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Stage duration buckets in seconds (10us .. 10s)
+STAGE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# (metric name, type, help, [(labels, value), ...]) produced by a collector at scrape time
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], *extra: str) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    pairs.extend(pair for pair in extra if pair)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self, const: str = "") -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_labels(self.label_names, label_values, const)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, *label_values: str) -> Optional[Tuple[List[int], float, int]]:
+        """(per-bucket counts, sum, count) of one series, or None if it has no observations"""
+        with self._lock:
+            series = self._series.get(label_values)
+            return (list(series[0]), series[1], series[2]) if series else None
+
+    def quantile(self, q: float, *label_values: str) -> Optional[float]:
+        """Estimate of the ``q`` quantile, interpolated within its bucket as Prometheus does"""
+        snapshot = self.snapshot(*label_values)
+        if snapshot is None:
+            return None
+        counts, _, count = snapshot
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def series(self) -> List[Tuple[str, ...]]:
+        with self._lock:
+            return sorted(self._series)
+
+    def render(self, const: str = "") -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values in self.series():
+            counts, total, count = self.snapshot(*label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, const, le)} {cumulative}")
+            labels = _labels(self.label_names, label_values, const)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics and scrape-time collectors rendered together as Prometheus text"""
+
+    def __init__(self):
+        self.metrics: List[Any] = []
+        self.collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def register(self, metric: Any) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        self.collectors.append(collector)
+
+    def render(self, const_labels: Optional[Dict[str, str]] = None) -> str:
+        """Every metric as Prometheus text, each sample also labelled with ``const_labels``"""
+        const = ",".join(f'{name}="{_escape(str(value))}"' for name, value in (const_labels or {}).items())
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render(const))
+        for collector in self.collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()), const)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "sureguard_ml_stage_duration_seconds", "Time spent in each analysis stage", ["stage"]
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "sureguard_ml_request_duration_seconds", "HTTP request latency", ["endpoint"]
+))
+REQUESTS = REGISTRY.register(Counter(
+    "sureguard_ml_requests_total", "HTTP requests by endpoint and status", ["endpoint", "status"]
+))
+
+# Per-request stage breakdown (stage -> milliseconds), set only when requested
+_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_breakdown", default=None)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, name)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown[name] = breakdown.get(name, 0.0) + seconds * 1000
+
+
+class stage:
+    """Context manager timing one stage: ``with stage('extract.ip'): ...``"""
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "stage":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        record_stage(self.name, time.perf_counter() - self.started)
+
+
+def start_breakdown() -> Dict[str, float]:
+    """Collect the current request's stage timings into the returned dict.
+
+    The breakdown follows the request's context, including tasks it starts.
+    """
+    breakdown: Dict[str, float] = {}
+    _breakdown.set(breakdown)
+    return breakdown
+
+
+def server_timing(breakdown: Dict[str, float]) -> str:
+    """A breakdown as a Server-Timing header value"""
+    entries = []
+    for name, ms in breakdown.items():
+        token = "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+        entries.append(f"{token};dur={ms:.3f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and timing them per endpoint.
+
+    Paths that aren't routes of the app are counted as ``other`` so unknown
+    URLs can't grow the label set.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        self._paths: Optional[set] = None
+
+    def _endpoint(self, scope: Dict[str, Any]) -> str:
+        if self._paths is None:
+            router = scope.get("app")
+            routes = getattr(getattr(router, "router", None), "routes", [])
+            self._paths = {route.path for route in routes if hasattr(route, "path")}
+        path = scope.get("path", "")
+        return path if path in self._paths else "other"
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = self._endpoint(scope)
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+            REQUESTS.inc(endpoint, status)
@@ -0,0 +1,377 @@
+"""Streaming anomaly detection with half-space trees.
+
+Replaces scoring against an IsolationForest fit once at startup: each
+``input_type`` keeps its own baseline of live traffic that is updated with
+every event it scores, so the detector follows drift without batch refits.
+
+A baseline is an ensemble of half-space trees (Tan, Ting & Liu, "Fast
+anomaly detection for streaming data", IJCAI 2011). Every tree is a
+complete binary tree of ``depth`` random axis-aligned splits, each halving
+its node's range of the split feature, so the trees are built without
+looking at the data. Each node counts how many events of the previous
+window (the reference) and of the current window (latest) fell in it; an
+event is scored by the reference mass of the deepest node on its path that
+still holds at least ``size_limit`` events, scaled by 2^depth, and added to
+the latest counts. When ``window`` events have been seen the latest counts
+become the reference and counting starts over. Updates cost O(trees *
+depth) per event and the memory is fixed by the tree shape.
+
+Mass scores have no fixed scale, so they are turned into an anomaly
+probability by rank: the share of the previous window's events that scored
+higher (looked more normal). An event in a region no recent event visited
+gets 1.0; normal traffic spreads evenly over [0, 1], so the threshold sets
+the share of normal events flagged.
+
+A baseline's first window only learns each feature's range (the workspace
+the trees split, then frozen), its second fills the first reference and
+its third the first score ranking, so it answers from its fourth window
+on. Until then ``process`` returns NaN for its rows and the caller scores
+them some other way.
+
+``score`` is the read-only counterpart of ``process``: it scores against
+the current reference and ranking without counting the rows, so batch and
+offline scoring give the same answers whatever their order or split.
+
+State checkpoints to a single ``.npz`` file, written atomically; a
+checkpoint taken with different tree settings or feature width is ignored.
+"""
+import os
+import json
+import zlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("hst", "isolation_forest")
+
+# Baselines, by input type code; unknown input types share the last one
+INPUT_TYPES = ("ip", "url", "email", "domain", "other")
+TYPE_CODES = {input_type: code for code, input_type in enumerate(INPUT_TYPES)}
+# Code of rows scored without a baseline (warm-up and benchmark rows)
+NO_BASELINE = -1
+
+
+@dataclass
+class OnlineAnomalyConfig:
+    """Half-space tree settings and checkpointing"""
+    engine: str = "hst"
+    trees: int = 25
+    depth: int = 10
+    window: int = 256
+    # Nodes holding fewer reference events than this fraction of the window end a path
+    size_limit_ratio: float = 0.1
+    # anomaly_probability above which an event is flagged (about the share of normal events flagged)
+    threshold: float = 0.99
+    seed: int = 42
+    checkpoint_path: str = "/app/models/anomaly_state.npz"
+    # Checkpoint this often while the baselines change; 0 checkpoints on shutdown only
+    checkpoint_seconds: float = 60.0
+
+    @classmethod
+    def from_env(cls, model_path: str) -> "OnlineAnomalyConfig":
+        engine = os.getenv("ANOMALY_ENGINE", cls.engine).lower()
+        if engine not in ENGINES:
+            raise ValueError(f"ANOMALY_ENGINE must be one of {', '.join(ENGINES)}, got {engine!r}")
+        return cls(
+            engine=engine,
+            trees=max(1, int(os.getenv("ANOMALY_HST_TREES", cls.trees))),
+            depth=min(20, max(1, int(os.getenv("ANOMALY_HST_DEPTH", cls.depth)))),
+            window=max(16, int(os.getenv("ANOMALY_HST_WINDOW", cls.window))),
+            size_limit_ratio=float(os.getenv("ANOMALY_HST_SIZE_LIMIT", cls.size_limit_ratio)),
+            threshold=float(os.getenv("ANOMALY_HST_THRESHOLD", cls.threshold)),
+            seed=int(os.getenv("ANOMALY_HST_SEED", cls.seed)),
+            checkpoint_path=os.getenv("ANOMALY_CHECKPOINT_PATH", os.path.join(model_path, "anomaly_state.npz")),
+            checkpoint_seconds=max(0.0, float(os.getenv("ANOMALY_CHECKPOINT_SECONDS", cls.checkpoint_seconds))),
+        )
+
+
+def type_code(input_type: Optional[str]) -> int:
+    """Baseline code of ``input_type`` (None: no baseline)"""
+    if input_type is None:
+        return NO_BASELINE
+    return TYPE_CODES.get(input_type, TYPE_CODES["other"])
+
+
+def anomaly_scoring_row(features: np.ndarray, input_type: Optional[str]) -> np.ndarray:
+    """Anomaly scoring row: the anomaly features followed by the baseline code of ``input_type``"""
+    row = np.empty(len(features) + 1, dtype=np.float32)
+    row[:-1] = features
+    row[-1] = type_code(input_type)
+    return row
+
+
+class HalfSpaceTrees:
+    """One streaming baseline: ``trees`` half-space trees over ``n_features`` inputs"""
+
+    def __init__(self, n_features: int, config: OnlineAnomalyConfig, seed: int):
+        self.n_features = n_features
+        self.config = config
+        self.seed = seed
+        self.size_limit = max(1, int(config.size_limit_ratio * config.window))
+        n_nodes = 2 ** (config.depth + 1) - 1
+        self.low = np.full(n_features, np.inf, dtype=np.float32)
+        self.high = np.full(n_features, -np.inf, dtype=np.float32)
+        self.scale: Optional[np.ndarray] = None
+        # Split feature and value of each internal node, nodes in heap order (children of i: 2i+1, 2i+2)
+        self.split_dim: Optional[np.ndarray] = None
+        self.split_val: Optional[np.ndarray] = None
+        self.reference = np.zeros((config.trees, n_nodes), dtype=np.int32)
+        self.latest = np.zeros((config.trees, n_nodes), dtype=np.int32)
+        self._tree_index = np.arange(config.trees)[:, np.newaxis]
+        # Mass scores of the current window's events, and of the previous window's sorted
+        self.window_scores = np.zeros(config.window, dtype=np.float64)
+        self.ranking: Optional[np.ndarray] = None
+        self.events = 0
+        self.window_events = 0
+        self.windows = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.ranking is not None
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.low, self.high, self.scale, self.split_dim, self.split_val, self.reference, self.latest,
+                  self.window_scores, self.ranking)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def process(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score ``rows`` in order against the reference window and add them to the latest one.
+
+        Returns each row's anomaly probability and mass score (normalized by
+        trees * window; 0 where the reference window has no events), both
+        NaN for rows seen before the baseline is ready.
+        """
+        probabilities = np.full(len(rows), np.nan)
+        scores = np.full(len(rows), np.nan)
+        start = 0
+        while start < len(rows):
+            end = min(len(rows), start + self.config.window - self.window_events)
+            segment = rows[start:end]
+            if self.split_dim is None:
+                np.minimum(self.low, segment.min(axis=0), out=self.low)
+                np.maximum(self.high, segment.max(axis=0), out=self.high)
+            else:
+                paths = self._paths(segment)
+                if self.windows >= 2:
+                    mass = self._mass_scores(paths)
+                    self.window_scores[self.window_events:self.window_events + len(segment)] = mass
+                    if self.ranking is not None:
+                        scores[start:end] = mass
+                        higher = len(self.ranking) - np.searchsorted(self.ranking, mass, side='right')
+                        probabilities[start:end] = higher / len(self.ranking)
+                np.add.at(self.latest.ravel(), paths.ravel(), 1)
+            self.window_events += end - start
+            self.events += end - start
+            if self.window_events == self.config.window:
+                self._end_window()
+            start = end
+        return probabilities, scores
+
+    def score(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score ``rows`` like ``process`` but leave the baseline as it is (all NaN until it is ready)"""
+        probabilities = np.full(len(rows), np.nan)
+        scores = np.full(len(rows), np.nan)
+        if self.ranking is not None and len(rows):
+            scores[:] = self._mass_scores(self._paths(rows))
+            higher = len(self.ranking) - np.searchsorted(self.ranking, scores, side='right')
+            probabilities[:] = higher / len(self.ranking)
+        return probabilities, scores
+
+    def _end_window(self) -> None:
+        if self.split_dim is None:
+            self._build()
+        else:
+            if self.windows >= 2:
+                self.ranking = np.sort(self.window_scores)
+            self.reference, self.latest = self.latest, self.reference
+            self.latest[:] = 0
+        self.windows += 1
+        self.window_events = 0
+
+    def _build(self) -> None:
+        """Draw the trees over the workspace learned from the first window"""
+        config = self.config
+        rng = np.random.default_rng(self.seed)
+        span = self.high - self.low
+        self.scale = np.where(span > 0, 1.0 / np.where(span > 0, span, 1.0), 1.0).astype(np.float32)
+        # Features constant over the first window (e.g. padding) are never split on
+        varying = np.flatnonzero(span > 0)
+        if not len(varying):
+            varying = np.arange(self.n_features)
+        n_internal = 2 ** config.depth - 1
+        n_nodes = 2 * n_internal + 1
+        self.split_dim = rng.choice(varying, size=(config.trees, n_internal)).astype(np.intp)
+        self.split_val = np.empty((config.trees, n_internal), dtype=np.float32)
+        # Each tree's workspace: a random point of the unit cube +- twice its larger distance to a face
+        s = rng.random((config.trees, self.n_features))
+        width = 2 * np.maximum(s, 1 - s)
+        for t in range(config.trees):
+            lo = np.empty((n_nodes, self.n_features))
+            hi = np.empty((n_nodes, self.n_features))
+            lo[0], hi[0] = s[t] - width[t], s[t] + width[t]
+            for level in range(config.depth):
+                nodes = np.arange(2 ** level - 1, 2 ** (level + 1) - 1)
+                dims = self.split_dim[t, nodes]
+                mid = (lo[nodes, dims] + hi[nodes, dims]) / 2
+                self.split_val[t, nodes] = mid
+                left, right = 2 * nodes + 1, 2 * nodes + 2
+                lo[left], hi[left] = lo[nodes], hi[nodes]
+                hi[left, dims] = mid
+                lo[right], hi[right] = lo[nodes], hi[nodes]
+                lo[right, dims] = mid
+
+    def _paths(self, rows: np.ndarray) -> np.ndarray:
+        """(rows, trees, depth + 1) flat indices into the mass arrays of the nodes from each tree's root to its leaf"""
+        scaled = ((rows - self.low) * self.scale).ravel()
+        n, trees, depth = len(rows), self.config.trees, self.config.depth
+        n_internal = self.split_dim.shape[1]
+        # Flat offsets of each row's features and each tree's internal nodes and mass counts
+        row_offset = (np.arange(n) * self.n_features)[:, np.newaxis]
+        split_offset = self._tree_index.T * n_internal
+        mass_offset = self._tree_index.T * (2 * n_internal + 1)
+        split_dim, split_val = self.split_dim.ravel(), self.split_val.ravel()
+        paths = np.empty((n, trees, depth + 1), dtype=np.intp)
+        node = np.zeros((n, trees), dtype=np.intp)
+        paths[:, :, 0] = mass_offset
+        for level in range(depth):
+            split = node + split_offset
+            goes_right = scaled.take(split_dim.take(split) + row_offset) >= split_val.take(split)
+            node *= 2
+            node += 1
+            node += goes_right
+            paths[:, :, level + 1] = node + mass_offset
+        return paths
+
+    def _mass_scores(self, paths: np.ndarray) -> np.ndarray:
+        mass = self.reference.ravel().take(paths)
+        # Each path ends at its first node below the size limit, or at the leaf
+        terminal = mass < self.size_limit
+        terminal[:, :, -1] = True
+        depth = terminal.argmax(axis=2)
+        terminal_mass = np.take_along_axis(mass, depth[:, :, np.newaxis], axis=2)[:, :, 0]
+        # Mass * 2^depth estimates the window size in a region as dense as the average
+        return (terminal_mass * np.exp2(depth)).sum(axis=1) / (self.config.trees * self.config.window)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        state = {
+            "low": self.low, "high": self.high, "reference": self.reference, "latest": self.latest,
+            "window_scores": self.window_scores,
+            "counters": np.array([self.events, self.window_events, self.windows], dtype=np.int64),
+        }
+        if self.split_dim is not None:
+            state.update(scale=self.scale, split_dim=self.split_dim, split_val=self.split_val)
+        if self.ranking is not None:
+            state["ranking"] = self.ranking
+        return state
+
+    def restore(self, state: Dict[str, np.ndarray]) -> None:
+        self.low, self.high = state["low"].copy(), state["high"].copy()
+        self.reference, self.latest = state["reference"].copy(), state["latest"].copy()
+        self.window_scores = state["window_scores"].copy()
+        self.ranking = state["ranking"].copy() if "ranking" in state else None
+        self.events, self.window_events, self.windows = (int(value) for value in state["counters"])
+        if "split_dim" in state:
+            self.scale = state["scale"].copy()
+            self.split_dim = state["split_dim"].copy()
+            self.split_val = state["split_val"].copy()
+
+
+class OnlineAnomalyDetector:
+    """Half-space tree baselines per input type, safe to call from several threads"""
+
+    def __init__(self, n_features: int, config: Optional[OnlineAnomalyConfig] = None):
+        self.n_features = n_features
+        self.config = config or OnlineAnomalyConfig()
+        self.baselines = {
+            input_type: HalfSpaceTrees(n_features, self.config, self.config.seed + zlib.crc32(input_type.encode()))
+            for input_type in INPUT_TYPES
+        }
+        self._locks = {input_type: threading.Lock() for input_type in INPUT_TYPES}
+        self.checkpointed_events = 0
+
+    @property
+    def events(self) -> int:
+        return sum(baseline.events for baseline in self.baselines.values())
+
+    def process(self, rows: np.ndarray, codes: np.ndarray, update: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """Score each row against its code's baseline, updating it unless ``update`` is False; NaN where there is none (yet)"""
+        probabilities = np.full(len(rows), np.nan)
+        scores = np.full(len(rows), np.nan)
+        for code in np.unique(codes):
+            if code == NO_BASELINE:
+                continue
+            mask = codes == code
+            input_type = INPUT_TYPES[int(code)]
+            baseline = self.baselines[input_type]
+            with self._locks[input_type]:
+                probabilities[mask], scores[mask] = (baseline.process if update else baseline.score)(rows[mask])
+        return probabilities, scores
+
+    def _meta(self) -> Dict[str, Any]:
+        config = self.config
+        return {
+            "n_features": self.n_features, "trees": config.trees, "depth": config.depth,
+            "window": config.window, "seed": config.seed,
+        }
+
+    def save(self, path: Optional[str] = None) -> str:
+        """Write every baseline to ``path`` (the configured checkpoint path) atomically"""
+        path = path or self.config.checkpoint_path
+        arrays = {"meta": np.array(json.dumps(self._meta()))}
+        events = 0
+        for input_type, baseline in self.baselines.items():
+            with self._locks[input_type]:
+                arrays.update({f"{input_type}.{name}": value.copy() for name, value in baseline.state().items()})
+                events += baseline.events
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        self.checkpointed_events = events
+        return path
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """Restore the baselines from a checkpoint; False when there is none or it doesn't fit this config"""
+        path = path or self.config.checkpoint_path
+        if not os.path.exists(path):
+            return False
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta != self._meta():
+                logger.warning(f"Ignoring anomaly checkpoint {path}: taken with {meta}, serving with {self._meta()}")
+                return False
+            arrays = {name: data[name] for name in data.files}
+        for input_type, baseline in self.baselines.items():
+            prefix = f"{input_type}."
+            state = {name[len(prefix):]: value for name, value in arrays.items() if name.startswith(prefix)}
+            with self._locks[input_type]:
+                baseline.restore(state)
+        self.checkpointed_events = self.events
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": self.config.engine,
+            "trees": self.config.trees,
+            "depth": self.config.depth,
+            "window": self.config.window,
+            "threshold": self.config.threshold,
+            "checkpoint_path": self.config.checkpoint_path,
+            "checkpointed_events": self.checkpointed_events,
+            "memory_bytes": sum(baseline.nbytes for baseline in self.baselines.values()),
+            "baselines": {
+                input_type: {
+                    "ready": baseline.ready,
+                    "events": baseline.events,
+                    "windows": baseline.windows,
+                    "window_events": baseline.window_events,
+                }
+                for input_type, baseline in self.baselines.items()
+            },
+        }
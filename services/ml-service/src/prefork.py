@@ -0,0 +1,183 @@
+"""Pre-fork multi-worker serving.
+
+With SERVING_WORKERS > 1 the parent process binds the listening socket,
+loads and warms the models once (``preload``), freezes the garbage
+collector's view of everything allocated so far and forks the workers.
+Each worker runs its own uvicorn server and event loop on the shared
+socket (the kernel spreads connections between them) and reads the
+parent's model memory copy-on-write, so adding a worker costs its private
+working set rather than another copy of every model. The parent only
+supervises: a worker that dies is forked again from the same preloaded
+state, and SIGTERM/SIGINT is passed on to the workers for a graceful stop.
+
+Every worker caps its torch and BLAS thread pools at
+``threads_per_worker`` (by default the process's CPUs split evenly between
+the workers) so the workers don't oversubscribe the cores between them.
+
+Per-process state stays per worker: caches' local tiers, micro-batchers,
+admission limits and metrics. The kernel decides which worker a scrape
+reaches, so with ``metrics_port`` set each worker also serves on its own
+port (``metrics_port + index``) for scraping every worker's metrics. A swap (model reload, rollback or
+retrain, indicator or IP table reload) is made by the worker that was
+asked; the others pick it up by following the model registry and the files
+(the service polls in every worker), and a worker forked again catches up
+before it serves. A model version swapped in after startup is loaded by
+each worker on its own and no longer shared.
+"""
+import os
+import gc
+import time
+import signal
+import socket
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+from executor import set_blas_threads, set_torch_threads, worker_cpus
+
+logger = logging.getLogger(__name__)
+
+# A worker that exits sooner than this after its fork is restarted only after a pause
+MIN_WORKER_LIFETIME_SECONDS = 5.0
+
+
+@dataclass
+class PreforkConfig:
+    """Serving process layout"""
+    workers: int = 1
+    host: str = "0.0.0.0"
+    port: int = 8080
+    threads_per_worker: int = 1
+    backlog: int = 2048
+    # Worker i also listens on metrics_port + i (0: no per-worker ports)
+    metrics_port: int = 0
+
+    @classmethod
+    def from_env(cls) -> "PreforkConfig":
+        workers = max(1, int(os.getenv("SERVING_WORKERS", cls.workers)))
+        return cls(
+            workers=workers,
+            host=os.getenv("SERVING_HOST", cls.host),
+            port=int(os.getenv("SERVING_PORT", cls.port)),
+            threads_per_worker=max(1, int(os.getenv("SERVING_THREADS_PER_WORKER", worker_cpus()))),
+            backlog=max(1, int(os.getenv("SERVING_BACKLOG", cls.backlog))),
+            metrics_port=max(0, int(os.getenv("SERVING_METRICS_PORT", cls.metrics_port))),
+        )
+
+
+def worker_index() -> Optional[int]:
+    """This process's worker number under pre-fork serving, or None when serving single-process"""
+    index = os.getenv("SERVING_WORKER_INDEX")
+    return int(index) if index is not None else None
+
+
+def memory_usage() -> Dict[str, int]:
+    """This process's memory in bytes: resident, proportional (shared pages split between their users) and private.
+
+    ``pss`` is what a process really costs when its pages are shared
+    copy-on-write; it and ``private`` are empty where /proc/self/smaps_rollup
+    is not available.
+    """
+    usage: Dict[str, int] = {}
+    fields = {"Rss:": "rss", "Pss:": "pss", "Private_Clean:": "private", "Private_Dirty:": "private"}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                name = fields.get(parts[0]) if parts else None
+                if name is not None:
+                    usage[name] = usage.get(name, 0) + int(parts[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        try:
+            with open("/proc/self/statm") as f:
+                usage["rss"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            pass
+    return usage
+
+
+def bind_socket(config: PreforkConfig, port: Optional[int] = None) -> socket.socket:
+    family = socket.AF_INET6 if ":" in config.host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((config.host, config.port if port is None else port))
+    sock.listen(config.backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app: Any, sock: socket.socket, index: int, config: PreforkConfig) -> None:
+    import uvicorn
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    os.environ["SERVING_WORKER_INDEX"] = str(index)
+    set_torch_threads(config.threads_per_worker)
+    set_blas_threads(config.threads_per_worker)
+    sockets = [sock]
+    if config.metrics_port:
+        sockets.append(bind_socket(config, config.metrics_port + index))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=sockets)
+
+
+def run_prefork(app: Any, config: PreforkConfig, preload: Optional[Callable[[], None]] = None) -> None:
+    """Preload, fork ``config.workers`` workers serving ``app`` and supervise them until stopped"""
+    # Bind first: connections arriving while the models load wait in the backlog
+    sock = bind_socket(config)
+    logger.info(f"Listening on {config.host}:{config.port}, preloading models for {config.workers} workers")
+    # The parent never serves, so it loads with one thread and starts no thread pools to inherit
+    set_torch_threads(1)
+    if preload is not None:
+        preload()
+    # Keep the collector from writing to (and so un-sharing) the pages of everything loaded so far
+    gc.collect()
+    gc.freeze()
+
+    workers: Dict[int, int] = {}
+    started_at: Dict[int, float] = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(app, sock, index, config)
+            except BaseException as e:
+                logger.error(f"Worker {index} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = index
+        started_at[index] = time.monotonic()
+        logger.info(f"Started worker {index} (pid {pid}, {config.threads_per_worker} threads)")
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(config.workers):
+        spawn(index)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if index is None or stopping:
+            continue
+        lifetime = time.monotonic() - started_at[index]
+        logger.error(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        if lifetime < MIN_WORKER_LIFETIME_SECONDS:
+            time.sleep(1.0)
+        if not stopping:
+            spawn(index)
+    sock.close()
+    logger.info("All workers stopped")
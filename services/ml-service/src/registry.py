@@ -0,0 +1,296 @@
+"""Versioned model registry on local disk.
+
+Layout under the registry root (MODEL_REGISTRY_PATH):
+
+    versions/<version>/manifest.json   version, creation time, artifact digests, metadata
+    versions/<version>/<artifact>      e.g. ip_reputation_model.pkl, behavioral_lstm.pth
+    active.json                        {"version": ..., "history": [previously active versions]}
+
+A version is written under a temporary name and renamed into place, so it
+is either complete or absent, and is never modified afterwards. A version
+may hold only some of the models; the rest come from the base model
+directories. ``BASE_VERSION`` names the base directories on their own.
+
+    python src/registry.py publish /path/to/artifacts --note "retrained ip model"
+    python src/registry.py activate <version>
+    python src/registry.py list
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+BASE_VERSION = "base"
+MANIFEST_FILE = "manifest.json"
+ACTIVE_FILE = "active.json"
+# Previously active versions remembered for rollback
+HISTORY_LIMIT = 20
+
+
+class RegistryError(Exception):
+    """Raised for unknown versions and malformed registry contents"""
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path: str, payload: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def new_version_id() -> str:
+    """Sortable, unique version id: creation time plus a random suffix"""
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:6]}"
+
+
+class ModelRegistry:
+    """Published model versions and the active-version pointer under ``root``"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.versions_dir = os.path.join(root, "versions")
+        self.active_path = os.path.join(root, ACTIVE_FILE)
+        self._lock = threading.Lock()
+
+    def version_dir(self, version: str) -> str:
+        if not version or version == BASE_VERSION or os.sep in version or version.startswith("."):
+            raise RegistryError(f"Not a registry version: {version!r}")
+        return os.path.join(self.versions_dir, version)
+
+    def exists(self, version: str) -> bool:
+        return version == BASE_VERSION or os.path.isfile(os.path.join(self.version_dir(version), MANIFEST_FILE))
+
+    def manifest(self, version: str) -> Dict[str, Any]:
+        path = os.path.join(self.version_dir(version), MANIFEST_FILE)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise RegistryError(f"Unknown model version {version!r}") from None
+        except ValueError as e:
+            raise RegistryError(f"Malformed manifest for {version!r}: {e}") from None
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """Manifests of all published versions, oldest first"""
+        try:
+            names = os.listdir(self.versions_dir)
+        except FileNotFoundError:
+            return []
+        manifests = []
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            try:
+                manifests.append(self.manifest(name))
+            except RegistryError:
+                continue
+        return sorted(manifests, key=lambda manifest: (manifest.get("created_at", 0), manifest["version"]))
+
+    def artifact_paths(self, version: str) -> Dict[str, str]:
+        """Artifact file name -> path for the files a version holds itself (none for BASE_VERSION)"""
+        if version == BASE_VERSION:
+            return {}
+        directory = self.version_dir(version)
+        return {name: os.path.join(directory, name) for name in self.manifest(version).get("artifacts", {})}
+
+    def latest(self) -> Optional[str]:
+        versions = self.versions()
+        return versions[-1]["version"] if versions else None
+
+    def publish(self, artifacts: Dict[str, str], metadata: Optional[Dict[str, Any]] = None,
+                version: Optional[str] = None) -> str:
+        """Copy ``artifacts`` (artifact file name -> source path) into a new version"""
+        if not artifacts:
+            raise RegistryError("Nothing to publish")
+        version = version or new_version_id()
+        final_dir = self.version_dir(version)
+        if os.path.exists(final_dir):
+            raise RegistryError(f"Version {version!r} already exists")
+
+        os.makedirs(self.versions_dir, exist_ok=True)
+        tmp_dir = os.path.join(self.versions_dir, f".tmp-{version}")
+        os.makedirs(tmp_dir)
+        try:
+            digests = {}
+            for filename, source in sorted(artifacts.items()):
+                if os.path.basename(filename) != filename:
+                    raise RegistryError(f"Artifact names must be plain file names, got {filename!r}")
+                target = os.path.join(tmp_dir, filename)
+                shutil.copyfile(source, target)
+                digests[filename] = file_digest(target)
+            write_json_atomic(os.path.join(tmp_dir, MANIFEST_FILE), {
+                "version": version,
+                "created_at": time.time(),
+                "artifacts": digests,
+                "metadata": metadata or {},
+            })
+            os.rename(tmp_dir, final_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return version
+
+    def _pointer(self) -> Dict[str, Any]:
+        try:
+            with open(self.active_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            raise RegistryError(f"Malformed {self.active_path}: {e}") from None
+
+    def active(self) -> str:
+        """Version the registry says should be serving (BASE_VERSION if none was activated)"""
+        return self._pointer().get("version") or BASE_VERSION
+
+    def history(self) -> List[str]:
+        return list(self._pointer().get("history", []))
+
+    def set_active(self, version: str, rollback: bool = False) -> None:
+        """Point the registry at ``version``; a rollback pops the history instead of extending it"""
+        if not self.exists(version):
+            raise RegistryError(f"Unknown model version {version!r}")
+        with self._lock:
+            pointer = self._pointer()
+            current = pointer.get("version") or BASE_VERSION
+            history = pointer.get("history", [])
+            if rollback:
+                if history and history[-1] == version:
+                    history = history[:-1]
+            elif current != version:
+                history = (history + [current])[-HISTORY_LIMIT:]
+            os.makedirs(self.root, exist_ok=True)
+            write_json_atomic(self.active_path, {"version": version, "history": history, "updated_at": time.time()})
+
+    def rollback_target(self) -> Optional[str]:
+        """Most recent previously active version that still exists"""
+        for version in reversed(self.history()):
+            if self.exists(version):
+                return version
+        return None
+
+
+@dataclass(eq=False)
+class ModelBundle:
+    """One loaded model version: every model plus what was derived from it at load time.
+
+    Requests hold on to the bundle they started with, so swapping the active
+    bundle never changes models under an in-flight request. Bundles compare
+    and hash by identity. Pickling sends only the version; the receiving
+    process resolves it to its own copy (see ``resolve_bundle``).
+    """
+    version: str
+    models: Dict[str, Any] = field(default_factory=dict)
+    scalers: Dict[str, Any] = field(default_factory=dict)
+    model_versions: Dict[str, str] = field(default_factory=dict)
+    compiled: Dict[str, Any] = field(default_factory=dict)
+    serving: Dict[str, Any] = field(default_factory=dict)
+    torch_report: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, Any] = field(default_factory=dict)
+    warmup_errors: Dict[str, str] = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+
+    def __reduce__(self):
+        return resolve_bundle, (self.version,)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "model_versions": dict(self.model_versions),
+            "loaded_at": self.loaded_at,
+            "timings": self.timings,
+            "warmup_errors": dict(self.warmup_errors),
+        }
+
+
+# Bundles this process has loaded, most recent last. A bundle pickled to a
+# worker process arrives as its version and resolves here, loading it with
+# the registered loader the first time the worker sees that version.
+LOADED_BUNDLES_MAX = 2
+_loaded_bundles: "OrderedDict[str, ModelBundle]" = OrderedDict()
+_bundle_loader: Optional[Callable[[str], ModelBundle]] = None
+_bundles_lock = threading.Lock()
+
+
+def set_bundle_loader(loader: Callable[[str], ModelBundle]) -> None:
+    global _bundle_loader
+    _bundle_loader = loader
+
+
+def remember_bundle(bundle: ModelBundle) -> None:
+    with _bundles_lock:
+        _loaded_bundles[bundle.version] = bundle
+        _loaded_bundles.move_to_end(bundle.version)
+        while len(_loaded_bundles) > LOADED_BUNDLES_MAX:
+            _loaded_bundles.popitem(last=False)
+
+
+def resolve_bundle(version: str) -> ModelBundle:
+    with _bundles_lock:
+        bundle = _loaded_bundles.get(version)
+    if bundle is not None:
+        return bundle
+    if _bundle_loader is None:
+        raise RegistryError(f"Model version {version!r} is not loaded in this process")
+    bundle = _bundle_loader(version)
+    remember_bundle(bundle)
+    return bundle
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the local model registry")
+    parser.add_argument("--root", default=os.getenv("MODEL_REGISTRY_PATH", os.path.join(
+        os.getenv("MODEL_PATH", "/app/models"), "registry")))
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="Publish the artifacts in a directory as a new version")
+    publish.add_argument("directory")
+    publish.add_argument("--version", help="Version id (default: timestamp-based)")
+    publish.add_argument("--note", help="Free-text note stored in the manifest")
+    publish.add_argument("--activate", action="store_true", help="Also make it the active version")
+    activate = commands.add_parser("activate", help="Point the registry at a version")
+    activate.add_argument("version")
+    commands.add_parser("list", help="List published versions")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.root)
+    if args.command == "publish":
+        artifacts = {
+            name: os.path.join(args.directory, name) for name in sorted(os.listdir(args.directory))
+            if os.path.isfile(os.path.join(args.directory, name)) and name != MANIFEST_FILE
+        }
+        version = registry.publish(artifacts, {"note": args.note} if args.note else None, args.version)
+        if args.activate:
+            registry.set_active(version)
+        print(version)
+    elif args.command == "activate":
+        registry.set_active(args.version)
+    else:
+        active = registry.active()
+        for manifest in registry.versions():
+            marker = "*" if manifest["version"] == active else " "
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(manifest.get("created_at", 0)))
+            print(f"{marker} {manifest['version']:<28}{created}  {', '.join(sorted(manifest.get('artifacts', {})))}")
+        if active == BASE_VERSION:
+            print(f"* {BASE_VERSION} (base model directories)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
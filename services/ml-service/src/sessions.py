@@ -0,0 +1,234 @@
+"""Per-session recurrent state for incremental behavioral scoring.
+
+Clients stream a session's events one at a time; the service keeps the
+behavioral LSTM's (h, c) for each session so an event costs one LSTM step
+instead of re-running the whole sequence. States live in a bounded
+in-process LRU with an idle TTL. With Redis, sessions pushed out of memory
+(and all sessions on shutdown) are spilled there and restored on their next
+event (SESSION_REDIS_MODE=spill), or every update is also written through
+(always). A session's events must reach one replica at a time (sticky
+routing); the Redis copy is a spill area, not shared live state. Pre-fork
+workers share a socket and can't be routed to, so there the store is
+``shared``: it writes every update through and reads each state from Redis
+first, the local copy only standing in when Redis has none.
+
+A state carries the version of the LSTM that produced it; a state from a
+different LSTM version is discarded and the session starts over.
+"""
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import numpy as np
+from cache import RedisBackend
+
+logger = logging.getLogger(__name__)
+
+REDIS_MODES = ("off", "spill", "always")
+REDIS_KEY_PREFIX = "session:"
+
+
+@dataclass
+class SessionConfig:
+    """Session state store limits"""
+    max_entries: int = 50000
+    # Sessions idle for longer are dropped (and expire from Redis after the same time)
+    ttl_seconds: float = 1800.0
+    redis_mode: str = "spill"
+    sweep_seconds: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "SessionConfig":
+        redis_mode = os.getenv("SESSION_REDIS_MODE", cls.redis_mode).lower()
+        if redis_mode not in REDIS_MODES:
+            raise ValueError(f"SESSION_REDIS_MODE must be one of {', '.join(REDIS_MODES)}, got {redis_mode!r}")
+        return cls(
+            max_entries=max(1, int(os.getenv("SESSION_MAX_ENTRIES", cls.max_entries))),
+            ttl_seconds=max(1.0, float(os.getenv("SESSION_TTL_SECONDS", cls.ttl_seconds))),
+            redis_mode=redis_mode,
+            sweep_seconds=max(0.1, float(os.getenv("SESSION_SWEEP_SECONDS", cls.sweep_seconds))),
+        )
+
+
+class SessionState:
+    """Recurrent state of one session after ``steps`` events"""
+    __slots__ = ("state", "steps", "model_version", "expires_at")
+
+    def __init__(self, state: np.ndarray, steps: int, model_version: str, expires_at: float = 0.0):
+        self.state = state
+        self.steps = steps
+        self.model_version = model_version
+        self.expires_at = expires_at
+
+    def encode(self) -> str:
+        return json.dumps({
+            "v": self.model_version,
+            "n": self.steps,
+            "s": base64.b64encode(np.ascontiguousarray(self.state, dtype=np.float32).tobytes()).decode("ascii"),
+        })
+
+    @classmethod
+    def decode(cls, raw: bytes) -> "SessionState":
+        payload = json.loads(raw)
+        state = np.frombuffer(base64.b64decode(payload["s"]), dtype=np.float32).copy()
+        return cls(state, int(payload["n"]), payload["v"])
+
+
+class SessionStore:
+    """Bounded LRU of session states with idle expiry and optional Redis spill.
+
+    Callers serialize a session's updates with ``lock(session_id)`` around
+    their ``get`` / ``put`` pair, so concurrent events of one session are
+    applied in turn while other sessions proceed in parallel.
+    """
+
+    def __init__(self, config: Optional[SessionConfig] = None, redis: Optional[RedisBackend] = None,
+                 shared: bool = False):
+        self.config = config or SessionConfig()
+        self.redis = redis if self.config.redis_mode != "off" else None
+        # Other processes update the same sessions (needs redis_mode always)
+        self.shared = shared
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.state_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.restores = 0
+        self.spills = 0
+        self.version_resets = 0
+        self.evictions = {"capacity": 0, "expired": 0, "deleted": 0}
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    async def get(self, session_id: str, model_version: str) -> Optional[SessionState]:
+        """State of a live session (restored from Redis if spilled), or None to start a new one"""
+        session = self._sessions.get(session_id)
+        if session is not None and session.expires_at < time.monotonic():
+            self._remove(session_id, "expired")
+            session = None
+        if (session is None or self.shared) and self.redis is not None:
+            restored = await self._restore(session_id)
+            if restored is not None:
+                session = restored
+            elif session is not None:
+                self.hits += 1
+        elif session is not None:
+            self.hits += 1
+        if session is None:
+            self.misses += 1
+            return None
+        if session.model_version != model_version:
+            self.version_resets += 1
+            return None
+        return session
+
+    async def _restore(self, session_id: str) -> Optional[SessionState]:
+        raw = await self.redis.get(REDIS_KEY_PREFIX + session_id)
+        if raw is None:
+            return None
+        try:
+            session = SessionState.decode(raw)
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable spilled state of session {session_id}: {e}")
+            return None
+        self.restores += 1
+        return session
+
+    def put(self, session_id: str, session: SessionState) -> None:
+        """Store the state after an event, evicting (and spilling) the least recently used sessions"""
+        session.expires_at = time.monotonic() + self.config.ttl_seconds
+        previous = self._sessions.pop(session_id, None)
+        if previous is not None:
+            self.state_bytes -= previous.state.nbytes
+        self._sessions[session_id] = session
+        self.state_bytes += session.state.nbytes
+        if self.config.redis_mode == "always" and self.redis is not None:
+            self._spill(session_id, session)
+        while len(self._sessions) > self.config.max_entries:
+            evicted_id, evicted = self._sessions.popitem(last=False)
+            self.state_bytes -= evicted.state.nbytes
+            self.evictions["capacity"] += 1
+            if self.redis is not None and self.config.redis_mode == "spill":
+                self._spill(evicted_id, evicted)
+
+    def delete(self, session_id: str) -> bool:
+        """Forget a session here and in Redis; True if it was held in memory"""
+        found = self._remove(session_id, "deleted")
+        if self.redis is not None:
+            self.redis.delete_later(REDIS_KEY_PREFIX + session_id)
+        return found
+
+    def _remove(self, session_id: str, reason: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.state_bytes -= session.state.nbytes
+        self.evictions[reason] += 1
+        return True
+
+    def _spill(self, session_id: str, session: SessionState) -> None:
+        ttl = max(1, int(session.expires_at - time.monotonic())) if session.expires_at else int(self.config.ttl_seconds)
+        self.redis.set_later(REDIS_KEY_PREFIX + session_id, ttl, session, SessionState.encode)
+        self.spills += 1
+
+    def sweep(self) -> int:
+        """Drop sessions idle past the TTL; returns how many were dropped"""
+        now = time.monotonic()
+        expired = 0
+        # Least recently updated first, so expired sessions are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.expires_at >= now:
+                break
+            self._remove(session_id, "expired")
+            expired += 1
+        return expired
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.sweep_seconds)
+            self.sweep()
+
+    def start(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        """Stop sweeping and spill the live sessions so they survive a restart"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self.redis is not None and self.config.redis_mode == "spill":
+            self.sweep()
+            for session_id, session in self._sessions.items():
+                self._spill(session_id, session)
+            await self.redis.flush()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.config.max_entries,
+            "ttl_seconds": self.config.ttl_seconds,
+            "redis_mode": self.config.redis_mode if self.redis is not None else "off",
+            "state_bytes": self.state_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "restores": self.restores,
+            "spills": self.spills,
+            "version_resets": self.version_resets,
+            "evictions": dict(self.evictions),
+        }
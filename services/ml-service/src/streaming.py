@@ -0,0 +1,248 @@
+import os
+import json
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamingConfig:
+    """Chunking and buffering limits for NDJSON streams"""
+    chunk_size: int = 256
+    max_pending_chunks: int = 4
+    max_line_bytes: int = 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> "StreamingConfig":
+        return cls(
+            chunk_size=max(1, int(os.getenv("STREAM_CHUNK_SIZE", cls.chunk_size))),
+            max_pending_chunks=max(1, int(os.getenv("STREAM_MAX_PENDING_CHUNKS", cls.max_pending_chunks))),
+            max_line_bytes=max(1, int(os.getenv("STREAM_MAX_LINE_BYTES", cls.max_line_bytes))),
+        )
+
+
+@dataclass
+class StreamStats:
+    """Counters for one stream, reported in its summary record"""
+    records: int = 0
+    scored: int = 0
+    errors: int = 0
+    chunks: int = 0
+    started: float = 0.0
+
+    def summary(self, completed: bool) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "records": self.records,
+            "scored": self.scored,
+            "errors": self.errors,
+            "chunks": self.chunks,
+            "completed": completed,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "records_per_second": round(self.scored / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+# One input line: (line number, parsed item or None, error message or None)
+Entry = Tuple[int, Any, Optional[str]]
+
+_END = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def iter_lines(body: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[List[Tuple[int, Optional[bytes]]]]:
+    """Group a byte stream into its complete lines, one list per body chunk read.
+
+    Blank lines are skipped; a line longer than ``max_line_bytes`` is
+    discarded and reported as ``None``.
+    """
+    buffer = b""
+    line_no = 0
+    oversized = False
+
+    async for data in body:
+        lines = []
+        buffer += data
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            line_no += 1
+            if oversized:
+                lines.append((line_no, None))
+                oversized = False
+            elif len(line) > max_line_bytes:
+                lines.append((line_no, None))
+            elif line.strip():
+                lines.append((line_no, line))
+        if len(buffer) > max_line_bytes:
+            # Don't hold on to an oversized line until its newline arrives
+            buffer = b""
+            oversized = True
+        if lines:
+            yield lines
+
+    if oversized or buffer.strip():
+        yield [(line_no + 1, None if oversized else buffer)]
+
+
+class NDJSONScoringStream:
+    """Scores a newline-delimited JSON body in chunks and streams NDJSON results back.
+
+    A reader task parses lines into chunks of ``chunk_size`` items and a
+    scorer task runs ``score_chunk`` on each chunk, in input order. Both hand
+    off through queues bounded at ``max_pending_chunks``, so memory stays
+    bounded however large the body is: when scoring falls behind the reader
+    blocks and stops pulling the body, and when the client reads slowly the
+    scorer blocks. A partial chunk is handed off as soon as the scorer is
+    idle, so a slowly arriving body still gets prompt results.
+
+    Every input line produces one output line, ``{"line": n, ...result}`` or
+    ``{"line": n, "error": ...}``, followed by a final ``{"summary": ...}``.
+    Once the body has been read, ``wait_disconnect`` (the ASGI ``receive``)
+    is awaited so scoring stops if the client goes away.
+    """
+
+    def __init__(self, body: AsyncIterator[bytes], parse: Callable[[bytes], Any],
+                 score_chunk: Callable[[List[Any]], Awaitable[List[Dict[str, Any]]]],
+                 config: Optional[StreamingConfig] = None,
+                 wait_disconnect: Optional[Callable[[], Awaitable[Any]]] = None):
+        self.body = body
+        self.parse = parse
+        self.score_chunk = score_chunk
+        self.config = config or StreamingConfig.from_env()
+        self.wait_disconnect = wait_disconnect
+        self.stats = StreamStats()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        self.stats.started = time.perf_counter()
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=self.config.max_pending_chunks)
+        output: asyncio.Queue = asyncio.Queue(maxsize=self.config.max_pending_chunks)
+        reader = asyncio.ensure_future(self._read(chunks))
+        scorer = asyncio.ensure_future(self._score(chunks, output))
+        tasks = [reader, scorer]
+        disconnected = None
+        if self.wait_disconnect is not None:
+            disconnected = asyncio.ensure_future(self._watch_disconnect(reader))
+            tasks.append(disconnected)
+        completed = False
+        try:
+            while True:
+                block = await self._next_block(output, disconnected)
+                if block is _END:
+                    completed = True
+                    break
+                if isinstance(block, _Failed):
+                    yield self._encode({"error": f"Stream aborted: {block.error}"})
+                    break
+                yield block
+            yield self._encode({"summary": self.stats.summary(completed)})
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _next_block(self, output: asyncio.Queue, disconnected: Optional[asyncio.Future]) -> Any:
+        if disconnected is None:
+            return await output.get()
+        get = asyncio.ensure_future(output.get())
+        await asyncio.wait({get, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if get.done():
+            return get.result()
+        get.cancel()
+        logger.info(f"NDJSON stream client disconnected after {self.stats.scored} records")
+        return _Failed(ConnectionError("client disconnected"))
+
+    async def _watch_disconnect(self, reader: asyncio.Future) -> None:
+        # receive belongs to the body reader until the body is exhausted
+        await asyncio.wait({reader})
+        while True:
+            message = await self.wait_disconnect()
+            if message.get("type") == "http.disconnect":
+                return
+
+    async def _read(self, chunks: asyncio.Queue) -> None:
+        chunk: List[Entry] = []
+        try:
+            async for lines in iter_lines(self.body, self.config.max_line_bytes):
+                for line_no, line in lines:
+                    chunk.append(self._parse_line(line_no, line))
+                    if len(chunk) >= self.config.chunk_size:
+                        await chunks.put(chunk)
+                        chunk = []
+                if chunk and chunks.empty():
+                    await chunks.put(chunk)
+                    chunk = []
+            if chunk:
+                await chunks.put(chunk)
+            await chunks.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading NDJSON stream: {e}")
+            await chunks.put(_Failed(e))
+
+    def _parse_line(self, line_no: int, line: Optional[bytes]) -> Entry:
+        self.stats.records += 1
+        if line is None:
+            return line_no, None, f"Line exceeds {self.config.max_line_bytes} bytes"
+        try:
+            return line_no, self.parse(line), None
+        except Exception as e:
+            return line_no, None, str(e)
+
+    async def _score(self, chunks: asyncio.Queue, output: asyncio.Queue) -> None:
+        while True:
+            chunk = await chunks.get()
+            if chunk is _END or isinstance(chunk, _Failed):
+                await output.put(chunk)
+                return
+
+            items = [item for _, item, error in chunk if error is None]
+            try:
+                results = iter(await self.score_chunk(items)) if items else iter(())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error scoring NDJSON chunk: {e}")
+                await output.put(_Failed(e))
+                return
+
+            lines = []
+            for line_no, _, error in chunk:
+                if error is None:
+                    lines.append(self._encode({"line": line_no, **next(results)}))
+                else:
+                    lines.append(self._encode({"line": line_no, "error": error}))
+            self.stats.chunks += 1
+            self.stats.scored += len(items)
+            self.stats.errors += len(chunk) - len(items)
+            await output.put(b"".join(lines))
+
+    @staticmethod
+    def _encode(record: Dict[str, Any]) -> bytes:
+        return json.dumps(record, default=str).encode("utf-8") + b"\n"
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse that leaves ``receive`` to the stream.
+
+    Under ASGI spec < 2.4 (uvicorn advertises 2.3) StreamingResponse listens
+    for disconnect on ``receive`` while it streams, which would swallow the
+    request body an NDJSONScoringStream is still reading. The stream watches
+    for the disconnect itself once the body is consumed.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
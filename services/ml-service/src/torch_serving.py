@@ -0,0 +1,125 @@
+"""CPU serving variants of the PyTorch models.
+
+``optimized`` folds BatchNorm into the adjacent Linear, drops Dropout and
+freezes a TorchScript trace; ``quantized`` additionally applies dynamic int8
+quantization to the Linear/LSTM layers before tracing. Every variant is
+checked against the eager model before it is used.
+"""
+import copy
+import logging
+from typing import Any, Dict, Optional, Tuple
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+SERVING_MODES = ("eager", "optimized", "quantized")
+
+# Largest acceptable |probability difference| from the eager model per mode
+DEFAULT_DRIFT_TOLERANCE = {"optimized": 1e-4, "quantized": 2e-2}
+
+
+@torch.no_grad()
+def _fold(linear: nn.Linear, bn: nn.BatchNorm1d, preceding: bool) -> nn.Linear:
+    """bn(linear(x)) (preceding) or linear(bn(x)) as a single Linear"""
+    # Eval-mode BatchNorm is the affine map x * scale + shift
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    shift = bn.bias - bn.running_mean * scale
+    bias = linear.bias if linear.bias is not None else torch.zeros(linear.out_features)
+    folded = nn.Linear(linear.in_features, linear.out_features)
+    if preceding:
+        folded.weight.copy_(linear.weight * scale[:, None])
+        folded.bias.copy_(bias * scale + shift)
+    else:
+        folded.weight.copy_(linear.weight * scale[None, :])
+        folded.bias.copy_(bias + linear.weight @ shift)
+    return folded
+
+
+def fold_batchnorm(sequential: nn.Sequential) -> nn.Sequential:
+    """Eval-only copy of a Sequential with every BatchNorm1d folded into a Linear and Dropout removed.
+
+    A BatchNorm right after a Linear folds into that Linear; one that follows
+    an activation (Linear -> ReLU -> BatchNorm, as in DeviceFingerprintNet)
+    folds into the next Linear instead, since it is affine in the activation's output.
+    """
+    layers = []
+    pending_bn: Optional[nn.BatchNorm1d] = None
+    for layer in sequential:
+        if isinstance(layer, nn.Dropout):
+            continue
+        if isinstance(layer, nn.BatchNorm1d):
+            if layers and isinstance(layers[-1], nn.Linear) and pending_bn is None:
+                layers[-1] = _fold(layers[-1], layer, preceding=True)
+            else:
+                if pending_bn is not None:
+                    layers.append(copy.deepcopy(pending_bn))
+                pending_bn = layer
+            continue
+        if pending_bn is not None:
+            if isinstance(layer, nn.Linear):
+                layer = _fold(layer, pending_bn, preceding=False)
+            else:
+                layers.append(copy.deepcopy(pending_bn))
+            pending_bn = None
+        else:
+            layer = copy.deepcopy(layer)
+        layers.append(layer)
+    if pending_bn is not None:
+        layers.append(copy.deepcopy(pending_bn))
+    return nn.Sequential(*layers).eval()
+
+
+def build_serving_model(model: nn.Module, example_input: torch.Tensor, mode: str) -> nn.Module:
+    """Build the serving variant of an eval-mode model"""
+    if mode not in SERVING_MODES:
+        raise ValueError(f"Serving mode must be one of {SERVING_MODES}, got {mode!r}")
+    if mode == "eager":
+        return model
+
+    module = copy.deepcopy(model).eval()
+    if isinstance(getattr(module, "network", None), nn.Sequential):
+        module.network = fold_batchnorm(module.network)
+    if mode == "quantized":
+        module = torch.ao.quantization.quantize_dynamic(module, {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(module, example_input)
+    try:
+        return torch.jit.freeze(traced)
+    except Exception as e:
+        logger.debug(f"TorchScript freeze unavailable ({e}), serving unfrozen trace")
+        return traced
+
+
+def max_drift(reference: nn.Module, candidate: nn.Module, inputs: torch.Tensor) -> float:
+    """Largest absolute output difference between two models on the same inputs"""
+    with torch.inference_mode():
+        return float((reference(inputs) - candidate(inputs)).abs().max())
+
+
+def prepare_serving_model(name: str, model: nn.Module, example_input: torch.Tensor, mode: str,
+                          tolerance: Optional[float] = None) -> Tuple[nn.Module, Dict[str, Any]]:
+    """Build a serving variant and fall back to the eager model if it drifts or fails"""
+    report: Dict[str, Any] = {"requested_mode": mode, "mode": "eager", "drift": 0.0}
+    if mode == "eager":
+        return model, report
+
+    tolerance = DEFAULT_DRIFT_TOLERANCE[mode] if tolerance is None else tolerance
+    report["tolerance"] = tolerance
+    try:
+        candidate = build_serving_model(model, example_input, mode)
+        drift = max_drift(model, candidate, example_input)
+    except Exception as e:
+        logger.warning(f"Could not build {mode} serving model for {name}: {e}")
+        report["error"] = str(e)
+        return model, report
+
+    report["drift"] = drift
+    if drift > tolerance:
+        logger.warning(f"{mode} {name} drifts {drift:.2e} from eager (tolerance {tolerance:.0e}), serving eager")
+        return model, report
+
+    report["mode"] = mode
+    logger.info(f"Serving {mode} {name} (drift {drift:.2e})")
+    return candidate, report
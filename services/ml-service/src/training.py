@@ -0,0 +1,548 @@
+"""Retraining pipeline: labeled example store and training jobs.
+
+Labeled examples (an analysis request plus whether it turned out to be
+malicious) are kept in a local SQLite store. A training job runs this
+module as a separate, reniced process with its BLAS/OpenMP/sklearn thread
+pools capped, so training can't take CPU from the inference workers:
+
+- the IP and URL forests are warm-started (new trees fit on the examples
+  added since their last training are appended, the scaler is kept as the
+  existing trees depend on it) or, past ``max_trees`` or on request, refit
+  from scratch together with a new scaler;
+- the IsolationForest is refit on benign examples;
+- every candidate is compared with the model it would replace on a
+  holdout set that is never trained on, and a candidate whose gate metric
+  (F1 for the classifiers, ROC AUC for the anomaly detector, whose
+  thresholded predictions say little) drops by more than
+  ``max_metric_drop`` is rejected;
+- accepted models are published as a new registry version, together with
+  the parent version's other artifacts, and the holdout metrics.
+
+Job state, progress and results are written to ``<data dir>/jobs/<job id>.json``.
+
+    python src/training.py import labeled.csv    # input_value,input_type,label[,device_fingerprint,session_data]
+    python src/training.py stats
+"""
+import os
+import sys
+import copy
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+import logging
+import tempfile
+import threading
+import traceback
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from registry import ModelRegistry, new_version_id, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Models the pipeline can train: model name -> input types whose examples it learns from
+TRAINABLE_MODELS = {
+    'ip_reputation': ('ip',),
+    'url_analysis': ('url', 'email'),
+    'anomaly_detection': ('ip', 'url', 'email'),
+}
+CLASSIFIER_ARTIFACTS = {
+    'ip_reputation': ('ip_reputation_model.pkl', 'ip_reputation_scaler.pkl'),
+    'url_analysis': ('url_analysis_model.pkl', 'url_analysis_scaler.pkl'),
+}
+ANOMALY_ARTIFACT = 'anomaly_model.pkl'
+GATE_METRICS = {'ip_reputation': 'f1', 'url_analysis': 'f1', 'anomaly_detection': 'roc_auc'}
+MODES = ('auto', 'warm_start', 'refit')
+FINISHED_STATES = ('succeeded', 'rejected', 'failed')
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+@dataclass
+class TrainingConfig:
+    """Training job settings, read from the environment"""
+    data_path: str = "/app/models/training"
+    # Threads for BLAS/OpenMP pools and the forests' n_jobs
+    threads: int = 1
+    # Niceness added to the training process (0 keeps the service's priority)
+    nice: int = 10
+    # CPUs the training process may run on, e.g. [3] to keep it off the inference cores
+    cpus: List[int] = field(default_factory=list)
+    holdout_fraction: float = 0.2
+    min_examples: int = 50
+    # Most recent examples used by a refit
+    max_examples: int = 200000
+    warm_start_trees: int = 20
+    refit_trees: int = 100
+    # Warm starts that would grow a forest beyond this refit it instead
+    max_trees: int = 300
+    max_metric_drop: float = 0.02
+
+    @classmethod
+    def from_env(cls, model_path: str) -> "TrainingConfig":
+        cpus = os.getenv("TRAINING_CPUS", "")
+        return cls(
+            data_path=os.getenv("TRAINING_DATA_PATH", os.path.join(model_path, "training")),
+            threads=max(1, int(os.getenv("TRAINING_THREADS", cls.threads))),
+            nice=max(0, int(os.getenv("TRAINING_NICE", cls.nice))),
+            cpus=[int(cpu) for cpu in cpus.split(",") if cpu.strip()],
+            holdout_fraction=float(os.getenv("TRAINING_HOLDOUT_FRACTION", cls.holdout_fraction)),
+            min_examples=max(1, int(os.getenv("TRAINING_MIN_EXAMPLES", cls.min_examples))),
+            max_examples=max(1, int(os.getenv("TRAINING_MAX_EXAMPLES", cls.max_examples))),
+            warm_start_trees=max(1, int(os.getenv("TRAINING_WARM_START_TREES", cls.warm_start_trees))),
+            refit_trees=max(1, int(os.getenv("TRAINING_REFIT_TREES", cls.refit_trees))),
+            max_trees=max(1, int(os.getenv("TRAINING_MAX_TREES", cls.max_trees))),
+            max_metric_drop=float(os.getenv("TRAINING_MAX_METRIC_DROP", cls.max_metric_drop)),
+        )
+
+    @property
+    def store_path(self) -> str:
+        return os.path.join(self.data_path, "labeled.db")
+
+    @property
+    def jobs_path(self) -> str:
+        return os.path.join(self.data_path, "jobs")
+
+
+@dataclass
+class LabeledExample:
+    """One stored example: the analysis request fields plus its label (1 = malicious)"""
+    id: int
+    input_type: str
+    input_value: str
+    label: int
+    device_fingerprint: Optional[Dict[str, Any]] = None
+    session_data: Optional[Dict[str, Any]] = None
+
+
+class LabeledStore:
+    """Append-only SQLite store of labeled examples"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS examples ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL,"
+                " input_type TEXT NOT NULL, input_value TEXT NOT NULL, label INTEGER NOT NULL,"
+                " device_fingerprint TEXT, session_data TEXT, source TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS examples_type ON examples (input_type, id)")
+            self._initialized = True
+        return connection
+
+    def add(self, examples: Iterable[Dict[str, Any]]) -> int:
+        """Store examples given as dicts of input_type, input_value, label and the optional fields"""
+        now = time.time()
+        rows = [
+            (
+                now, example['input_type'], example['input_value'], int(bool(example['label'])),
+                json.dumps(example['device_fingerprint']) if example.get('device_fingerprint') else None,
+                json.dumps(example['session_data']) if example.get('session_data') else None,
+                example.get('source'),
+            )
+            for example in examples
+        ]
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO examples (created_at, input_type, input_value, label,"
+                " device_fingerprint, session_data, source) VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def examples(self, input_types: Iterable[str], after_id: int = 0,
+                 limit: Optional[int] = None) -> List[LabeledExample]:
+        """Examples of ``input_types`` with id > ``after_id``, oldest first (the latest ``limit`` if given)"""
+        input_types = list(input_types)
+        placeholders = ",".join("?" * len(input_types))
+        query = (f"SELECT id, input_type, input_value, label, device_fingerprint, session_data FROM examples"
+                 f" WHERE input_type IN ({placeholders}) AND id > ? ORDER BY id DESC")
+        params: List[Any] = [*input_types, after_id]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as connection:
+            rows = connection.execute(query, params).fetchall()
+        return [
+            LabeledExample(row[0], row[1], row[2], row[3],
+                           json.loads(row[4]) if row[4] else None, json.loads(row[5]) if row[5] else None)
+            for row in reversed(rows)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT input_type, label, COUNT(*), MAX(id) FROM examples GROUP BY input_type, label"
+            ).fetchall()
+        by_type: Dict[str, Dict[str, int]] = {}
+        for input_type, label, count, _ in rows:
+            by_type.setdefault(input_type, {"benign": 0, "malicious": 0})["malicious" if label else "benign"] = count
+        return {
+            "total": sum(row[2] for row in rows),
+            "max_id": max((row[3] for row in rows), default=0),
+            "by_type": by_type,
+        }
+
+
+def in_holdout(example_id: int, fraction: float) -> bool:
+    """Deterministic holdout membership, so an example is never trained on in any job"""
+    return ((example_id * 2654435761) & 0xFFFFFFFF) < fraction * 2 ** 32
+
+
+# Training jobs
+
+class TrainingJobs:
+    """Starts training jobs (one at a time) as subprocesses and reads their status files"""
+
+    def __init__(self, config: TrainingConfig):
+        self.config = config
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.job_id: Optional[str] = None
+
+    def job_path(self, job_id: str) -> str:
+        if not job_id or os.sep in job_id or job_id.startswith("."):
+            raise ValueError(f"Not a job id: {job_id!r}")
+        return os.path.join(self.config.jobs_path, f"{job_id}.json")
+
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.job_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        try:
+            names = sorted(name for name in os.listdir(self.config.jobs_path) if name.endswith(".json"))
+        except FileNotFoundError:
+            return []
+        jobs = [self.status(name[:-len(".json")]) for name in reversed(names[-limit:])]
+        return [job for job in jobs if job is not None]
+
+    def update(self, job_id: str, **fields: Any) -> Dict[str, Any]:
+        status = self.status(job_id) or {"job_id": job_id}
+        status.update(fields)
+        write_json_atomic(self.job_path(job_id), status)
+        return status
+
+    async def start(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a queued job with ``params`` and start its training process"""
+        if self.running():
+            raise RuntimeError(f"Training job {self.job_id} is still running")
+        job_id = new_version_id()
+        os.makedirs(self.config.jobs_path, exist_ok=True)
+        self.update(job_id, state="queued", progress=0.0, step="starting",
+                    created_at=time.time(), params=params, config=asdict(self.config))
+
+        # Thread caps must be in the environment before numpy loads its BLAS
+        env = dict(os.environ, **{name: str(self.config.threads) for name in THREAD_ENV_VARS})
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "run", self.job_path(job_id), env=env
+        )
+        self.job_id = job_id
+        return self.update(job_id, pid=self.process.pid)
+
+    async def wait(self) -> Dict[str, Any]:
+        """Wait for the running job; a process that died without finishing marks its job failed"""
+        job_id, process = self.job_id, self.process
+        returncode = await process.wait()
+        status = self.status(job_id) or {}
+        if status.get("state") not in FINISHED_STATES:
+            status = self.update(job_id, state="failed", finished_at=time.time(),
+                                 error=f"training process exited with code {returncode}")
+        return status
+
+    async def stop(self) -> None:
+        if self.running():
+            self.process.terminate()
+            await self.wait()
+
+
+class JobRunner:
+    """Runs one job inside the training process"""
+
+    def __init__(self, job_path: str):
+        self.job_path = job_path
+        with open(job_path) as f:
+            self.status = json.load(f)
+        self.params = self.status["params"]
+        self.config = TrainingConfig(**self.status["config"])
+
+    def report(self, **fields: Any) -> None:
+        self.status.update(fields)
+        write_json_atomic(self.job_path, self.status)
+
+    def limit_resources(self) -> None:
+        if self.config.nice:
+            os.nice(self.config.nice)
+        if self.config.cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.config.cpus)
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(self.config.threads)
+        except ImportError:
+            pass
+
+    def run(self) -> None:
+        self.report(state="running", started_at=time.time(), step="loading examples")
+        try:
+            self.limit_resources()
+            self.use_serving_ip_intel()
+            self.train()
+        except Exception as e:
+            logger.error(f"Training job {self.status['job_id']} failed: {e}")
+            self.report(state="failed", finished_at=time.time(), error=str(e),
+                        traceback=traceback.format_exc(limit=5))
+
+    def use_serving_ip_intel(self) -> None:
+        """Take the IP geo features from the IP intelligence table the service uses"""
+        from features import use_ip_intel
+        from ip_intel import IpIntelTable
+
+        path = self.params.get("ip_intel_path")
+        table = IpIntelTable.open(path) if path else IpIntelTable.empty()
+        if table.version != self.params.get("ip_intel_version", table.version):
+            logger.warning(f"IP intelligence table {path} is version {table.version}, "
+                           f"the service uses {self.params['ip_intel_version']}")
+        use_ip_intel(table)
+        self.report(ip_intel_version=table.version)
+
+    def train(self) -> None:
+        import joblib
+
+        registry = ModelRegistry(self.params["registry_root"])
+        store = LabeledStore(self.config.store_path)
+        parent_training = self.params.get("parent_metadata", {}).get("training", {})
+        results: Dict[str, Dict[str, Any]] = {}
+        accepted: Dict[str, Any] = {}
+
+        names = self.params["models"]
+        for index, name in enumerate(names):
+            self.report(step=f"training {name}", progress=round(index / (len(names) + 1), 3))
+            result, artifacts = train_model(name, store, self.config, self.params["search_path"],
+                                            parent_training.get(name, {}), self.params.get("mode", "auto"))
+            results[name] = result
+            self.report(models=results)
+            if artifacts is None:
+                continue
+            current, candidate = result.get("current_metrics"), result["candidate_metrics"]
+            metric = GATE_METRICS[name] if GATE_METRICS[name] in candidate else 'f1'
+            if (current and metric in current and candidate[metric] < current[metric] - self.config.max_metric_drop
+                    and not self.params.get("force")):
+                result["outcome"] = "rejected"
+                result["reason"] = f"holdout {metric} {candidate[metric]:.4f} vs {current[metric]:.4f} for the current model"
+                continue
+            result["outcome"] = "accepted"
+            accepted.update(artifacts)
+
+        if not accepted:
+            trained = [name for name, result in results.items() if result.get("outcome") == "rejected"]
+            self.report(state="rejected" if trained else "failed", progress=1.0, step="done",
+                        finished_at=time.time(), models=results,
+                        error=None if trained else "no model had enough labeled examples to train")
+            return
+
+        self.report(step="publishing", progress=round(len(names) / (len(names) + 1), 3), models=results)
+        parent = self.params["parent_version"]
+        evaluation = dict(self.params.get("parent_metadata", {}).get("evaluation", {}))
+        training = dict(parent_training)
+        for name, result in results.items():
+            if result.get("outcome") == "accepted":
+                evaluation[name] = result["candidate_metrics"]
+                training[name] = {key: result[key] for key in ("mode", "n_estimators", "train_examples", "max_example_id")}
+        with tempfile.TemporaryDirectory(dir=self.config.data_path) as directory:
+            artifacts = dict(registry.artifact_paths(parent))
+            for filename, obj in accepted.items():
+                path = os.path.join(directory, filename)
+                joblib.dump(obj, path)
+                artifacts[filename] = path
+            version = registry.publish(artifacts, {
+                "parent": parent,
+                "job_id": self.status["job_id"],
+                "training": training,
+                "evaluation": evaluation,
+            })
+        self.report(state="succeeded", version=version, progress=1.0, step="done",
+                    finished_at=time.time(), models=results)
+
+
+def evaluate(y_true, y_pred, scores) -> Dict[str, float]:
+    """Holdout metrics of one model; ``scores`` are higher for more likely malicious"""
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+    metrics = {
+        "examples": int(len(y_true)),
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "precision": float(precision_score(y_true, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_true, y_pred, zero_division=0)),
+        "f1": float(f1_score(y_true, y_pred, zero_division=0)),
+    }
+    if len(set(y_true)) > 1:
+        metrics["roc_auc"] = float(roc_auc_score(y_true, scores))
+    return metrics
+
+
+def feature_matrix(name: str, examples: List[LabeledExample]):
+    """Feature rows the model sees for ``examples`` and their labels (examples without features are dropped)"""
+    import numpy as np
+    from features import (
+        RequestFeatures, email_domain, extract_ip_features_batch, extract_url_features_batch, normalize_url,
+    )
+
+    labels = np.array([example.label for example in examples], dtype=np.int64)
+    if name == 'ip_reputation':
+        return extract_ip_features_batch([example.input_value for example in examples]), labels
+    if name == 'url_analysis':
+        # The service scores normalized URLs
+        urls = [normalize_url(email_domain(example.input_value) if example.input_type == 'email' else example.input_value)
+                for example in examples]
+        return extract_url_features_batch(urls), labels
+
+    rows, kept = [], []
+    for index, example in enumerate(examples):
+        # The service scores an email's domain, which RequestFeatures.primary already does
+        features = RequestFeatures(example.input_type, example.input_value, example.device_fingerprint).anomaly
+        if features is not None:
+            rows.append(features)
+            kept.append(index)
+    return (np.vstack(rows) if rows else np.zeros((0, 0))), labels[kept]
+
+
+def load_current(name: str, search_path: List[str]) -> Tuple[Any, Any]:
+    """The model (and scaler) a job would replace, from the parent version's search path"""
+    import joblib
+    filenames = CLASSIFIER_ARTIFACTS.get(name, (ANOMALY_ARTIFACT,))
+    for directory in search_path:
+        paths = [os.path.join(directory, filename) for filename in filenames]
+        if all(os.path.exists(path) for path in paths):
+            loaded = [joblib.load(path) for path in paths]
+            return loaded[0], loaded[1] if len(loaded) > 1 else None
+    return None, None
+
+
+def train_model(name: str, store: LabeledStore, config: TrainingConfig, search_path: List[str],
+                previous: Dict[str, Any], mode: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Train one model; returns its result summary and the artifacts to publish (None if not trained)"""
+    from sklearn.ensemble import IsolationForest, RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    input_types = TRAINABLE_MODELS[name]
+    current, current_scaler = load_current(name, search_path)
+    classifier = name in CLASSIFIER_ARTIFACTS
+    if mode == 'auto':
+        can_warm_start = (classifier and isinstance(current, RandomForestClassifier) and current_scaler is not None
+                          and len(current.estimators_) + config.warm_start_trees <= config.max_trees)
+        mode = 'warm_start' if can_warm_start else 'refit'
+    elif mode == 'warm_start' and not (classifier and isinstance(current, RandomForestClassifier)
+                                       and current_scaler is not None):
+        raise ValueError(f"{name} has no existing forest to warm-start; use mode 'refit'")
+
+    # Warm starts learn from what was added since the model was last trained; refits from the latest window
+    after_id = previous.get("max_example_id", 0) if mode == 'warm_start' else 0
+    examples = store.examples(input_types, after_id=after_id, limit=None if mode == 'warm_start' else config.max_examples)
+    train = [example for example in examples if not in_holdout(example.id, config.holdout_fraction)]
+    holdout = [example for example in store.examples(input_types, limit=config.max_examples)
+               if in_holdout(example.id, config.holdout_fraction)]
+    result: Dict[str, Any] = {"mode": mode, "train_examples": len(train), "holdout_examples": len(holdout)}
+
+    X_train, y_train = feature_matrix(name, train)
+    if classifier:
+        enough = len(y_train) >= config.min_examples and len(set(y_train.tolist())) == 2
+    else:
+        # The anomaly detector learns what normal traffic looks like
+        X_train = X_train[y_train == 0]
+        enough = len(X_train) >= config.min_examples
+    if not enough or not holdout:
+        result["outcome"] = "skipped"
+        result["reason"] = (f"needs {config.min_examples} training examples"
+                            f"{' of both labels' if classifier else ' labeled benign'} and a holdout set")
+        return result, None
+
+    scaler = current_scaler
+    if classifier and mode == 'warm_start':
+        # Append trees to a copy of the fitted forest; the existing trees expect the existing scaler
+        model = copy.deepcopy(current)
+        model.set_params(warm_start=True, n_estimators=len(current.estimators_) + config.warm_start_trees,
+                         n_jobs=config.threads)
+        model.fit(scaler.transform(X_train), y_train)
+        model.set_params(warm_start=False, n_jobs=None)
+    elif classifier:
+        scaler = StandardScaler().fit(X_train)
+        model = RandomForestClassifier(n_estimators=config.refit_trees, random_state=42, n_jobs=config.threads)
+        model.fit(scaler.transform(X_train), y_train)
+        model.set_params(n_jobs=None)
+    else:
+        params = current.get_params() if isinstance(current, IsolationForest) else {"contamination": 0.1, "random_state": 42}
+        model = IsolationForest(**dict(params, n_jobs=config.threads)).fit(X_train)
+        model.set_params(n_jobs=None)
+
+    X_holdout, y_holdout = feature_matrix(name, holdout)
+    result["candidate_metrics"] = evaluate_model(model, scaler, X_holdout, y_holdout, classifier)
+    if current is not None:
+        result["current_metrics"] = evaluate_model(current, current_scaler, X_holdout, y_holdout, classifier)
+    result["n_estimators"] = len(model.estimators_)
+    result["max_example_id"] = max(example.id for example in examples)
+
+    if classifier:
+        model_file, scaler_file = CLASSIFIER_ARTIFACTS[name]
+        return result, {model_file: model, scaler_file: scaler}
+    return result, {ANOMALY_ARTIFACT: model}
+
+
+def evaluate_model(model: Any, scaler: Any, X, y, classifier: bool) -> Dict[str, float]:
+    if classifier:
+        X_scaled = scaler.transform(X)
+        return evaluate(y, model.predict(X_scaled), model.predict_proba(X_scaled)[:, -1])
+    # IsolationForest: -1 (anomalous) counts as a malicious prediction
+    return evaluate(y, (model.predict(X) == -1).astype(int), -model.score_samples(X))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Labeled examples and training jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run a training job (started by the service)")
+    run.add_argument("job_file")
+    load = commands.add_parser("import", help="Add labeled examples from a CSV file")
+    load.add_argument("path")
+    load.add_argument("--source", help="Recorded with every imported example")
+    commands.add_parser("stats", help="Count stored examples by input type and label")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "run":
+        JobRunner(args.job_file).run()
+        return
+
+    config = TrainingConfig.from_env(os.getenv("MODEL_PATH", "/app/models"))
+    store = LabeledStore(config.store_path)
+    if args.command == "import":
+        import csv
+        with open(args.path, newline="") as f:
+            examples = [
+                {
+                    "input_type": row["input_type"],
+                    "input_value": row["input_value"],
+                    "label": row["label"].strip().lower() in ("1", "true", "malicious", "yes"),
+                    "device_fingerprint": json.loads(row["device_fingerprint"]) if row.get("device_fingerprint") else None,
+                    "session_data": json.loads(row["session_data"]) if row.get("session_data") else None,
+                    "source": args.source,
+                }
+                for row in csv.DictReader(f)
+            ]
+        print(f"Imported {store.add(examples)} examples")
+    print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
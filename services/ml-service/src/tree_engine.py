@@ -0,0 +1,175 @@
+"""Array-based evaluator for fitted sklearn tree ensembles.
+
+Every tree of a fitted RandomForestClassifier / IsolationForest is flattened
+into one set of contiguous node arrays (feature, threshold, children, leaf
+values). A batch is scored by walking all trees for all rows at once, one
+depth level per step, so probability, label and anomaly score come out of a
+single traversal instead of separate predict_proba/predict/decision_function
+calls that each walk every tree.
+"""
+import logging
+from typing import Any, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TREE_LEAF = -1
+
+
+def _average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """Average unsuccessful-search path length in a BST of n samples (as in IsolationForest)"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    mask_2 = n_samples == 2
+    not_mask = n_samples > 2
+    result[mask_2] = 1.0
+    n = n_samples[not_mask]
+    result[not_mask] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return result
+
+
+def _node_depths(children_left: np.ndarray, children_right: np.ndarray) -> np.ndarray:
+    depths = np.zeros(len(children_left), dtype=np.int64)
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        for child in (children_left[node], children_right[node]):
+            if child != TREE_LEAF:
+                depths[child] = depths[node] + 1
+                stack.append(child)
+    return depths
+
+
+class CompiledForest:
+    """Node arrays for a list of fitted sklearn trees, concatenated back to back"""
+
+    def __init__(self, trees: Sequence[Any], feature_maps: Optional[Sequence[np.ndarray]] = None):
+        features, thresholds, lefts, rights, roots = [], [], [], [], []
+        self.leaf_depths = []
+        offset = 0
+        max_depth = 0
+
+        for i, tree in enumerate(trees):
+            is_leaf = tree.children_left == TREE_LEAF
+            node_ids = np.arange(tree.node_count)
+
+            feature = np.where(is_leaf, 0, tree.feature)
+            if feature_maps is not None:
+                # Trees fit on a feature subset index into that subset
+                feature = np.asarray(feature_maps[i])[feature]
+            # Leaves point back to themselves (also used to detect them)
+            threshold = np.where(is_leaf, np.inf, tree.threshold)
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+            depths = _node_depths(tree.children_left, tree.children_right)
+            max_depth = max(max_depth, int(depths.max()))
+
+            features.append(feature)
+            thresholds.append(threshold)
+            lefts.append(left)
+            rights.append(right)
+            roots.append(offset)
+            self.leaf_depths.append(depths)
+            offset += tree.node_count
+
+        index_dtype = np.int32 if offset < np.iinfo(np.int32).max else np.int64
+        self.feature = np.ascontiguousarray(np.concatenate(features), dtype=index_dtype)
+        self.threshold = np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64)
+        self.left = np.ascontiguousarray(np.concatenate(lefts), dtype=index_dtype)
+        self.right = np.ascontiguousarray(np.concatenate(rights), dtype=index_dtype)
+        self.roots = np.asarray(roots, dtype=index_dtype)
+        self.is_leaf = self.left == np.arange(offset, dtype=index_dtype)
+        self.max_depth = max_depth
+        self.n_trees = len(trees)
+        self.n_nodes = offset
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node index reached by every row in every tree, shape (n_trees, n_rows)"""
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+
+        # One (tree, row) position per entry, tree-major; only positions that
+        # have not reached a leaf yet are advanced at each depth
+        nodes = np.repeat(self.roots, n_rows)
+        row_offsets = np.tile(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        active = np.arange(nodes.size)
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            go_left = flat_X[row_offsets[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+            if not active.size:
+                break
+        return nodes.reshape(self.n_trees, n_rows)
+
+
+class CompiledRandomForestClassifier:
+    """RandomForestClassifier scored in one traversal: (probabilities, labels)"""
+
+    def __init__(self, model: Any):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+        self.forest = CompiledForest(trees)
+        self.classes = np.asarray(model.classes_)
+        n_classes = len(self.classes)
+        # Per-leaf class distribution, normalized the way DecisionTreeClassifier.predict_proba does
+        values = np.concatenate([tree.value[:, 0, :n_classes] for tree in trees]).astype(np.float64)
+        normalizer = values.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        self.leaf_proba = values / normalizer
+
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        leaves = self.forest.apply(X)
+        proba = self.leaf_proba[leaves].sum(axis=0) / self.forest.n_trees
+        return proba, self.classes.take(np.argmax(proba, axis=1))
+
+
+class CompiledIsolationForest:
+    """IsolationForest scored in one traversal: (decision_function, labels)"""
+
+    def __init__(self, model: Any):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        feature_maps = model.estimators_features_ if model._max_features != model.n_features_in_ else None
+        self.forest = CompiledForest(trees, feature_maps)
+        self.offset = float(model.offset_)
+        # Path length contributed by each leaf: nodes on the path plus the
+        # expected remaining depth for the samples the leaf still holds
+        self.leaf_path_length = np.concatenate([
+            (depths + 1.0) + _average_path_length(tree.n_node_samples) - 1.0
+            for depths, tree in zip(self.forest.leaf_depths, trees)
+        ])
+        self.denominator = self.forest.n_trees * _average_path_length(np.array([model._max_samples]))[0]
+
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        leaves = self.forest.apply(X)
+        depths = self.leaf_path_length[leaves].sum(axis=0)
+        decision = -(2 ** (-depths / self.denominator)) - self.offset
+        labels = np.where(decision < 0, -1, 1)
+        return decision, labels
+
+
+def compile_model(model: Any):
+    """Compile a supported fitted ensemble, or return None"""
+    name = type(model).__name__
+    if name == "RandomForestClassifier":
+        return CompiledRandomForestClassifier(model)
+    if name == "IsolationForest":
+        return CompiledIsolationForest(model)
+    return None
+
+
+def max_deviation(compiled: Any, model: Any, X: np.ndarray) -> float:
+    """Largest absolute difference between the compiled and sklearn outputs on X"""
+    scores, labels = compiled.predict(X)
+    if isinstance(compiled, CompiledIsolationForest):
+        expected_scores, expected_labels = model.decision_function(X), model.predict(X)
+    else:
+        expected_scores, expected_labels = model.predict_proba(X), model.predict(X)
+    if not np.array_equal(labels, expected_labels):
+        return float("inf")
+    return float(np.max(np.abs(scores - expected_scores))) if len(X) else 0.0
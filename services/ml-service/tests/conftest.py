@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# app reads its settings at import; keep the tests away from /app/models
+os.environ.setdefault("MODEL_PATH", tempfile.mkdtemp(prefix="ml-service-tests-"))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def base_bundle():
+    """The base models, generated once into the test MODEL_PATH"""
+    import app
+    return app.build_bundle(app.BASE_VERSION)
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionConfig, AdmissionController, AdmissionMiddleware, AdmissionRejected, ClientDisconnected
+
+
+def controller(**settings):
+    return AdmissionController(AdmissionConfig(**{"max_in_flight": 1, "max_queue": 2, "max_wait_ms": 0, **settings}))
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_released_slots_go_to_waiters_in_arrival_order():
+    async def scenario():
+        limiter = controller()
+        order = []
+        first = await limiter.acquire()
+
+        async def queued(name):
+            admitted_at = await limiter.acquire()
+            order.append(name)
+            return admitted_at
+        waiters = [asyncio.create_task(queued(name)) for name in ("a", "b")]
+        await settle()
+        assert (limiter.in_flight, limiter.queued) == (1, 2)
+        limiter.release(first)
+        limiter.release(await waiters[0])
+        limiter.release(await waiters[1])
+        assert order == ["a", "b"]
+        assert (limiter.in_flight, limiter.queued, limiter.admitted) == (0, 0, 3)
+    asyncio.run(scenario())
+
+
+def test_full_queue_and_long_waits_are_shed():
+    async def scenario():
+        limiter = controller(max_queue=1, max_wait_ms=20)
+        held = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await settle()
+        with pytest.raises(AdmissionRejected) as shed:
+            await limiter.acquire()
+        assert shed.value.reason == "queue_full" and shed.value.retry_after >= 1
+        with pytest.raises(AdmissionRejected, match="queue_timeout"):
+            await waiter
+        # Unshed callers queue past both limits
+        unshed = [asyncio.create_task(limiter.acquire(shed=False)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert limiter.queued == 3 and not any(task.done() for task in unshed)
+        limiter.release(held)
+        for task in unshed:
+            limiter.release(await task)
+        assert limiter.rejected == {"queue_full": 1, "queue_timeout": 1}
+        assert limiter.in_flight == 0
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_passes_on_a_slot_it_was_handed():
+    async def scenario():
+        limiter = controller()
+        held = await limiter.acquire()
+        cancelled = asyncio.create_task(limiter.acquire())
+        following = asyncio.create_task(limiter.acquire())
+        await settle()
+        # Hand the slot over and cancel its receiver before it resumes
+        limiter.release(held)
+        cancelled.cancel()
+        await settle()
+        assert cancelled.cancelled()
+        limiter.release(await asyncio.wait_for(following, 1))
+        assert (limiter.in_flight, limiter.queued) == (0, 0)
+    asyncio.run(scenario())
+
+
+def test_client_disconnecting_while_queued_leaves_the_queue():
+    async def scenario():
+        limiter = controller()
+        held = await limiter.acquire()
+        gone = asyncio.Event()
+        waiter = asyncio.create_task(limiter.acquire(gone.wait))
+        await settle()
+        gone.set()
+        with pytest.raises(ClientDisconnected):
+            await waiter
+        assert (limiter.queued, limiter.disconnected) == (0, 1)
+        limiter.release(held)
+        assert limiter.in_flight == 0
+    asyncio.run(scenario())
+
+
+def test_middleware_sheds_with_retry_after():
+    async def scenario():
+        limiter = controller(max_queue=0)
+        called = []
+
+        async def app(scope, receive, send):
+            called.append(scope["path"])
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+        middleware = AdmissionMiddleware(app, limiter, ["/api/analyze"])
+
+        async def call(path):
+            sent = []
+
+            async def receive():
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                sent.append(message)
+            await middleware({"type": "http", "path": path, "headers": []}, receive, send)
+            return sent[0]["status"], dict(sent[0].get("headers", []))
+
+        held = await limiter.acquire()
+        status, headers = await call("/api/analyze")
+        assert status == 429 and headers[b"retry-after"] == b"1"
+        assert await call("/health") == (200, {})
+        limiter.release(held)
+        assert (await call("/api/analyze"))[0] == 200
+        assert called == ["/health", "/api/analyze"] and limiter.in_flight == 0
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import app
+from cache import TieredCache
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(app, "service_ready", True)
+    monkeypatch.setattr(app, "active_bundle", SimpleNamespace(version="test", model_versions={"ip_reputation": "a1"}))
+    monkeypatch.setattr(app, "analysis_cache", TieredCache.from_env("analysis", None, encode=bytes, decode=bytes))
+    calls = []
+
+    def analyze(outcome):
+        async def analyze_threat(request, bundle=None, deadline=None):
+            calls.append(request.input_value)
+            if outcome == "error":
+                return app.error_response(RuntimeError("model failed"), 1.0, bundle.version)
+            return app.ThreatAnalysisResponse(
+                risk_score=10, confidence_score=90, threat_type="benign", severity="low", explanation="",
+                recommendations=[], model_predictions={}, processing_time_ms=1.0,
+            )
+        monkeypatch.setattr(app, "analyze_threat", analyze_threat)
+
+    return analyze, calls
+
+
+def analyze_once(value):
+    request = app.ThreatAnalysisRequest(input_type="ip", input_value=value)
+    response = asyncio.run(app.analyze_single_threat(request, deadline_ms=0))
+    return json.loads(response.body)
+
+
+def test_failed_analyses_are_not_cached(service):
+    analyze, calls = service
+    analyze("error")
+    assert analyze_once("198.51.100.7")["threat_type"] == "analysis_error"
+    analyze("ok")
+    assert analyze_once("198.51.100.7")["threat_type"] == "benign"
+    assert calls == ["198.51.100.7", "198.51.100.7"]
+
+
+def test_successful_analyses_are_cached(service):
+    analyze, calls = service
+    analyze("ok")
+    assert analyze_once("198.51.100.8") == analyze_once("198.51.100.8")
+    assert calls == ["198.51.100.8"]
+
+
+def test_indicator_list_changes_start_a_new_cache_generation(service, monkeypatch, tmp_path):
+    analyze, calls = service
+    analyze("ok")
+    analyze_once("198.51.100.9")
+    (tmp_path / "malicious_domains.txt").write_text("evil.example\n")
+    monkeypatch.setattr(app, "indicator_index", app.IndicatorIndex.load(str(tmp_path)))
+    analyze_once("198.51.100.9")
+    assert calls == ["198.51.100.9", "198.51.100.9"]
+
+
+def test_new_model_artifacts_start_a_new_cache_generation(service, monkeypatch):
+    analyze, calls = service
+    analyze("ok")
+    analyze_once("198.51.100.10")
+    # Same bundle name, regenerated base models
+    monkeypatch.setattr(app, "active_bundle", SimpleNamespace(version="test", model_versions={"ip_reputation": "b2"}))
+    analyze_once("198.51.100.10")
+    assert calls == ["198.51.100.10", "198.51.100.10"]
@@ -0,0 +1,79 @@
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+import app
+from online_anomaly import TYPE_CODES, OnlineAnomalyConfig, OnlineAnomalyDetector
+
+DEVICE = {"screen": {"width": 1920, "height": 1080, "colorDepth": 24}, "userAgent": "Mozilla/5.0",
+          "language": "en-US", "platform": "Linux", "cookieEnabled": 1, "plugins": ["pdf"], "fonts": ["Arial"]}
+SESSION = {"session_duration": 120, "page_views": 4, "clicks": 9, "scroll_depth": 0.5, "typing_speed": 3}
+
+
+def sample_requests(n):
+    rng = random.Random(0)
+    requests = []
+    for i in range(n):
+        input_type = rng.choice(["ip", "url", "email", "domain"])
+        value = {
+            "ip": f"{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+            "url": f"https://{rng.choice(['login', 'shop', 'secure-bank'])}.example/{i}?a={i}",
+            "email": f"user{i}@{rng.choice(['mail', 'paypal-secure'])}.example",
+            "domain": f"site{i}.example",
+        }[input_type]
+        requests.append(app.ThreatAnalysisRequest(
+            input_type=input_type, input_value=value,
+            device_fingerprint={**DEVICE, "timezone": i % 5 - 2} if i % 3 == 0 else None,
+            session_data={**SESSION, "clicks": i} if i % 4 == 0 else None,
+        ))
+    return requests
+
+
+def single(request, bundle):
+    return asyncio.run(app.analyze_threat(request, bundle))
+
+
+@pytest.fixture
+def per_request_path(monkeypatch):
+    # Score inline and against the Isolation Forest: the streaming baselines change with every event
+    monkeypatch.setattr(app, "anomaly_detector", None)
+    monkeypatch.setattr(app, "subresult_caches", {})
+    monkeypatch.setattr(app, "batchers", {})
+
+
+@pytest.mark.parametrize("cascade", [False, True])
+def test_batch_matches_per_request_analysis(base_bundle, per_request_path, monkeypatch, cascade):
+    monkeypatch.setattr(app, "CASCADE_ENABLED", cascade)
+    # A low bar so the cascade decides some of the sample
+    monkeypatch.setattr(app, "CASCADE_CONFIDENCE", 0.6)
+    requests = sample_requests(150)
+    batch = app.analyze_threats_vectorized(requests, base_bundle)
+    assert len(batch) == len(requests)
+    for request, response in zip(requests, batch):
+        expected = single(request, base_bundle)
+        fields = {"processing_time_ms", "model_predictions"}
+        assert response.model_dump(exclude=fields) == expected.model_dump(exclude=fields), request
+        # The torch models' batched matrix products round differently from single rows
+        assert response.model_predictions == pytest.approx(expected.model_predictions, abs=1e-6), request
+    if cascade:
+        assert any(response.skipped_models for response in batch)
+
+
+def test_batch_scoring_reads_the_anomaly_baselines_without_updating_them(base_bundle, per_request_path, monkeypatch):
+    config = OnlineAnomalyConfig(trees=10, depth=6, window=32, seed=7)
+    detector = OnlineAnomalyDetector(app.ANOMALY_FEATURES, config)
+    rows = np.random.default_rng(0).random((4 * config.window, app.ANOMALY_FEATURES)).astype(np.float32)
+    for input_type in ("ip", "url", "email", "domain"):
+        detector.process(rows, np.full(len(rows), TYPE_CODES[input_type]))
+    monkeypatch.setattr(app, "anomaly_detector", detector)
+    monkeypatch.setattr(app, "anomaly_config", config)
+    events = detector.events
+
+    requests = sample_requests(60)
+    forward = app.analyze_threats_vectorized(requests, base_bundle)
+    backward = app.analyze_threats_vectorized(requests[::-1], base_bundle)[::-1]
+    assert detector.events == events
+    assert [r.model_dump(exclude={"processing_time_ms"}) for r in forward] == \
+        [r.model_dump(exclude={"processing_time_ms"}) for r in backward]
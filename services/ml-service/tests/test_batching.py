@@ -0,0 +1,67 @@
+import asyncio
+
+import numpy as np
+
+from batching import BatchingConfig, MicroBatcher
+
+
+def scorer(calls):
+    def batch_fn(rows, key=None):
+        calls.append((len(rows), key))
+        return [float(row.sum()) + (key or 0) for row in rows]
+    return batch_fn
+
+
+def test_concurrent_rows_share_a_batch():
+    async def scenario():
+        calls = []
+        batcher = MicroBatcher("test", scorer(calls), BatchingConfig(max_batch_size=4, max_wait_ms=20))
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(np.full(3, i, np.float32)) for i in range(10)))
+        await batcher.stop()
+        assert results == [3.0 * i for i in range(10)]
+        assert [size for size, _ in calls] == [4, 4, 2]
+        stats = batcher.stats.to_dict()
+        assert (stats["flushed_on_size"], stats["flushed_on_timeout"], stats["items"]) == (2, 1, 10)
+    asyncio.run(scenario())
+
+
+def test_rows_with_different_keys_are_scored_apart():
+    async def scenario():
+        calls = []
+        batcher = MicroBatcher("test", scorer(calls), BatchingConfig(max_batch_size=8, max_wait_ms=20))
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(np.ones(2, np.float32), key=i % 2 * 100) for i in range(4)))
+        await batcher.stop()
+        assert results == [2.0, 102.0, 2.0, 102.0]
+        assert sorted(calls) == [(2, 0), (2, 100)]
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    async def scenario():
+        def failing(rows):
+            raise ValueError("bad batch")
+        batcher = MicroBatcher("test", failing, BatchingConfig(max_batch_size=4, max_wait_ms=5))
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(np.zeros(2)) for _ in range(3)), return_exceptions=True)
+        await batcher.stop()
+        assert all(isinstance(result, ValueError) for result in results)
+        assert batcher.stats.errors == 1
+    asyncio.run(scenario())
+
+
+def test_not_started_scores_inline():
+    async def scenario():
+        calls = []
+        batcher = MicroBatcher("test", scorer(calls), BatchingConfig())
+        assert await batcher.submit(np.ones(2, np.float32), key=1) == 3.0
+        assert calls == [(1, 1)]
+    asyncio.run(scenario())
+
+
+def test_config_from_env(monkeypatch):
+    monkeypatch.setenv("BATCH_MAX_SIZE", "16")
+    monkeypatch.setenv("BATCH_DEVICE_MAX_WAIT_MS", "0.5")
+    assert BatchingConfig.from_env("device") == BatchingConfig(max_batch_size=16, max_wait_ms=0.5)
+    assert BatchingConfig.from_env("url").max_wait_ms == BatchingConfig.max_wait_ms
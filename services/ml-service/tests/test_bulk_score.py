@@ -0,0 +1,55 @@
+import json
+
+import pandas as pd
+import pytest
+
+import app
+from bulk_score import Checkpoint, frame_requests, part_path, score_chunk
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        "input_value": ["198.51.100.7", "", "https://phish.example/login"],
+        "input_type": ["ip", "ip", "url"],
+        "session_data": ['{"page_views": 3}', "", "{not json"],
+    })
+
+
+def test_rows_become_requests_or_errors(frame):
+    requests = frame_requests(frame)
+    assert requests[0].input_value == "198.51.100.7" and requests[0].session_data == {"page_views": 3}
+    assert isinstance(requests[1], Exception) and isinstance(requests[2], Exception)
+
+
+def test_chunk_parts_keep_every_row(frame, tmp_path, monkeypatch):
+    def analyze(requests):
+        return [app.ThreatAnalysisResponse(
+            risk_score=80, confidence_score=90, threat_type="malicious_ip", severity="high", explanation="",
+            recommendations=[], model_predictions={"ip_reputation": 0.9}, processing_time_ms=1.0,
+        ) for _ in requests]
+    monkeypatch.setattr(app, "analyze_threats_vectorized", analyze)
+    stats = score_chunk(3, frame, str(tmp_path), None)
+    result = pd.read_parquet(part_path(str(tmp_path), 3))
+    assert (stats["rows"], stats["errors"]) == (3, 2)
+    assert list(result["input_value"]) == list(frame["input_value"])
+    assert result["risk_score"].tolist()[0] == 80 and pd.isna(result["risk_score"][1])
+    assert result["pred_ip_reputation"][0] == 0.9 and pd.isna(result["pred_url_analysis"][0])
+
+
+def test_checkpoint_resumes_only_chunks_on_disk(tmp_path):
+    settings = {"input": "dump.csv", "chunk_size": 10}
+    checkpoint = Checkpoint(str(tmp_path), settings)
+    checkpoint.completed = {0, 1}
+    checkpoint.save()
+    open(part_path(str(tmp_path), 0), "wb").close()
+
+    resumed = Checkpoint(str(tmp_path), settings)
+    resumed.load(force=False)
+    assert resumed.completed == {0}
+    with pytest.raises(SystemExit):
+        Checkpoint(str(tmp_path), {**settings, "chunk_size": 20}).load(force=False)
+    forced = Checkpoint(str(tmp_path), {**settings, "chunk_size": 20})
+    forced.load(force=True)
+    assert forced.completed == {0}
+    assert json.load(open(checkpoint.path))["settings"] == settings
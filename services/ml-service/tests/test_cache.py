@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from cache import LocalCache, RedisBackend, RedisCacheConfig, TieredCache, stable_digest
+
+
+def test_stable_digest_ignores_key_order():
+    assert stable_digest({"a": 1, "b": [1, 2]}) == stable_digest({"b": [1, 2], "a": 1})
+    assert stable_digest({"a": 1}) != stable_digest({"a": 2})
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.evictions == 1
+
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(ttl_seconds=10)
+    cache.set("short", 4, ttl_seconds=-1)
+    cache.set("long", 5, ttl_seconds=60)
+    assert (cache.get("short"), cache.get("long")) == (None, 5)
+    assert (cache.expirations, len(cache)) == (1, 1)
+
+
+def test_concurrent_misses_compute_once():
+    async def scenario():
+        cache = TieredCache("test", None, encode=str, decode=int)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 7
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        assert results == [7] * 5 and calls == [1]
+        assert cache.singleflight_joins == 4
+        assert await cache.get_or_compute("k", compute) == 7 and calls == [1]
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_computation():
+    async def scenario():
+        cache = TieredCache("test", None, encode=str, decode=int)
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            return 7
+        first = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        second = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == 7
+    asyncio.run(scenario())
+
+
+def test_redis_tier_coalesces_reads_and_writes_behind():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        backend = RedisBackend(lambda: client, RedisCacheConfig(write_interval_ms=1))
+        writer = TieredCache("test", backend, encode=str, decode=int)
+        for i in range(3):
+            writer.put(f"k{i}", i)
+        assert await backend.get("k1") == "1"  # still queued, read back from the queue
+        await backend.stop()
+        assert await client.get("k2") == b"2"
+
+        reader = TieredCache("test", backend, encode=str, decode=int)
+        values = await asyncio.gather(*(reader.get_or_compute(f"k{i}", None) for i in range(3)))
+        assert values == [0, 1, 2] and backend.mget_calls == 1
+        assert await reader.get_many(["k0", "k9"]) == {"k0": 0}
+    asyncio.run(scenario())
+
+
+def test_stale_redis_entries_are_recomputed():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        await client.set("k", b"old-format")
+        backend = RedisBackend(lambda: client)
+        cache = TieredCache("test", backend, encode=str, decode=lambda raw: int(raw) if raw.isdigit() else None)
+
+        async def compute():
+            return 5
+        assert await cache.get_or_compute("k", compute) == 5
+        assert (cache.stale, cache.computed) == (1, 1)
+    asyncio.run(scenario())
+
+
+class FailingRedis:
+    async def mget(self, keys):
+        raise ConnectionError("down")
+
+    def pipeline(self, transaction=False):
+        raise ConnectionError("down")
+
+
+def test_redis_errors_fall_back_to_local_caching():
+    async def scenario():
+        backend = RedisBackend(FailingRedis, RedisCacheConfig(retry_seconds=60))
+        cache = TieredCache("test", backend, encode=str, decode=int)
+
+        async def compute():
+            return 3
+        assert await cache.get_or_compute("k", compute) == 3
+        assert backend.errors == 1 and not backend.available
+        cache.put("j", 4)
+        assert backend.stats()["pending_writes"] == 0
+        assert await cache.get_or_compute("j", compute) == 4
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("malicious_probability, decides", [
+    (0.95, True), (0.9, True), (0.05, True), (0.1, True), (0.89, False), (0.11, False), (0.5, False),
+])
+def test_cascade_threshold_is_the_larger_class_probability(monkeypatch, malicious_probability, decides):
+    monkeypatch.setattr(app, "CASCADE_ENABLED", True)
+    monkeypatch.setattr(app, "CASCADE_CONFIDENCE", 0.9)
+    prediction = {"malicious_probability": malicious_probability,
+                  "confidence": max(malicious_probability, 1 - malicious_probability)}
+    assert app.cascade_decides(prediction) is decides
+
+
+def test_cascade_disabled_or_fallback_never_decides(monkeypatch):
+    monkeypatch.setattr(app, "CASCADE_CONFIDENCE", 0.9)
+    assert not app.cascade_decides({"malicious_probability": 0.99, "confidence": 0.99})
+    monkeypatch.setattr(app, "CASCADE_ENABLED", True)
+    assert not app.cascade_decides(app.FALLBACK_PREDICTIONS["ip_reputation"])
+
+
+def test_models_past_the_deadline_are_skipped(monkeypatch, base_bundle):
+    monkeypatch.setattr(app, "anomaly_detector", None)
+    monkeypatch.setattr(app, "subresult_caches", {})
+    monkeypatch.setattr(app, "batchers", {})
+    infer = app.infer
+
+    async def slow_behavioral(model_name, row, bundle):
+        if model_name == "behavioral_lstm":
+            await asyncio.sleep(1)
+        return await infer(model_name, row, bundle)
+    monkeypatch.setattr(app, "infer", slow_behavioral)
+    request = app.ThreatAnalysisRequest(input_type="ip", input_value="198.51.100.7", session_data={"clicks": 3})
+
+    async def analyze():
+        return await app.analyze_threat(request, base_bundle, deadline=asyncio.get_running_loop().time() + 0.2)
+    response = asyncio.run(analyze())
+    assert response.skipped_models == {"behavioral_analysis": "deadline", "anomaly_detection": "deadline"}
+    assert response.model_predictions["ip_reputation"] is not None
+    assert response.model_predictions["behavioral_analysis"] is None
@@ -0,0 +1,38 @@
+import torch
+import torch.nn as nn
+
+from app import DeviceFingerprintNet
+from features import DEVICE_DENSE_FEATURES, DEVICE_TOKEN_SLOTS
+
+
+def legacy_network(hidden_sizes=(256, 128, 64), num_classes=2) -> nn.Sequential:
+    """The device network as checkpoints saved before the hashed tokens have it"""
+    layers, previous = [], DeviceFingerprintNet.LEGACY_INPUT_SIZE
+    for size in hidden_sizes:
+        layers += [nn.Linear(previous, size), nn.ReLU(), nn.BatchNorm1d(size), nn.Dropout(0.3)]
+        previous = size
+    return nn.Sequential(*layers, nn.Linear(previous, num_classes), nn.Softmax(dim=1))
+
+
+def test_legacy_checkpoint_loads_and_scores_as_before():
+    torch.manual_seed(0)
+    legacy = legacy_network()
+    model = DeviceFingerprintNet()
+    model.load_state_dict({f"network.{key}": value for key, value in legacy.state_dict().items()})
+    legacy.eval()
+    model.eval()
+
+    dense = torch.randn(8, DEVICE_DENSE_FEATURES)
+    legacy_rows = torch.cat((dense, torch.zeros(8, DeviceFingerprintNet.LEGACY_INPUT_SIZE - DEVICE_DENSE_FEATURES)), 1)
+    rows = torch.cat((dense, torch.full((8, DEVICE_TOKEN_SLOTS), -1.0)), 1)
+    with torch.no_grad():
+        assert torch.allclose(model(rows), legacy(legacy_rows), atol=1e-6)
+
+
+def test_current_checkpoint_round_trip():
+    model = DeviceFingerprintNet().eval()
+    restored = DeviceFingerprintNet().eval()
+    restored.load_state_dict(model.state_dict())
+    rows = model.example_input(4, torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        assert torch.equal(model(rows), restored(rows))
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from executor import ExecutorConfig, ExecutorSaturated, InferenceExecutor
+from metrics import record_stage, start_breakdown
+
+
+def worker_pid(_):
+    return os.getpid()
+
+
+def run(executor, scenario):
+    async def wrapped():
+        executor.start()
+        try:
+            return await scenario()
+        finally:
+            executor.shutdown()
+    return asyncio.run(wrapped())
+
+
+def test_concurrency_is_bounded_and_a_full_queue_fails_fast():
+    executor = InferenceExecutor(ExecutorConfig(backend="thread", max_workers=4, max_concurrency=2, max_queue=2))
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work(_):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    async def scenario():
+        return await asyncio.gather(*(executor.run(work, i) for i in range(5)), return_exceptions=True)
+    results = run(executor, scenario)
+    assert peak[0] == 2
+    assert sum(isinstance(result, ExecutorSaturated) for result in results) == 1
+    assert (executor.completed, executor.rejected, executor.queued, executor.running) == (4, 1, 0, 0)
+
+
+def test_thread_backend_keeps_the_callers_stage_breakdown():
+    executor = InferenceExecutor(ExecutorConfig(backend="thread", max_workers=1, max_concurrency=1))
+
+    async def scenario():
+        breakdown = start_breakdown()
+        await executor.run(record_stage, "inference.ip", 0.003)
+        return breakdown
+    assert run(executor, scenario) == pytest.approx({"inference.ip": 3.0})
+
+
+def test_errors_propagate_and_are_counted():
+    executor = InferenceExecutor(ExecutorConfig(backend="thread", max_workers=1, max_concurrency=1))
+
+    def fail():
+        raise ValueError("bad input")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await executor.run(fail)
+    run(executor, scenario)
+    assert (executor.failed, executor.completed) == (1, 0)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_process_backend_runs_in_worker_processes():
+    executor = InferenceExecutor(ExecutorConfig(backend="process", max_workers=2, max_concurrency=2))
+
+    async def scenario():
+        return await asyncio.gather(*(executor.run(worker_pid, i) for i in range(4)))
+    assert os.getpid() not in run(executor, scenario)
+
+
+def test_unstarted_executor_runs_inline():
+    executor = InferenceExecutor(ExecutorConfig(backend="thread"))
+    assert asyncio.run(executor.run(worker_pid, 0)) == os.getpid()
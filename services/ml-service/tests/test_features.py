@@ -0,0 +1,70 @@
+import random
+
+import numpy as np
+import pytest
+
+import features
+from features import (RequestFeatures, extract_ip_features, extract_ip_features_batch, extract_url_features,
+                      extract_url_features_batch, normalize_url)
+
+IRREGULAR_IPS = ["", "1.2.3", "1.2.3.4.5", "01.002.0003.4", "999.1.1.1", "1..2.3", "a.b.c.d", "١.٢.٣.٤",
+                 "::1", "2001:db8::7", "::ffff:10.0.0.1", " 8.8.8.8", "123456789.0.0.0"]
+IRREGULAR_URLS = ["", "/", "http://", "https://bank.example/login?a=1&b=2", "HTTP://ADMIN.example",
+                  "https://пример.рф/secure", "ftp://x_y-z.example/a/b/c/d", "paypal.com", "?&=-_./",
+                  "https://a.b.c.d.e.example:8443/path?q=amazon#frag", "http://[::1]/", "x" * 300]
+
+
+def random_ips(rng, n):
+    return [".".join(str(rng.choice([0, 10, 127, 172, 192, 224, 255, rng.randrange(256)])) for _ in range(4))
+            for _ in range(n)]
+
+
+def random_urls(rng, n):
+    words = ["login", "secure", "shop", "a", "bank", "news", "x-y", "q_1"]
+    return [f"{rng.choice(['http', 'https'])}://{'.'.join(rng.sample(words, rng.randint(1, 4)))}.example/"
+            f"{'/'.join(rng.sample(words, rng.randint(0, 3)))}?{rng.choice(words)}={rng.randrange(100)}"
+            for _ in range(n)]
+
+
+@pytest.mark.parametrize("size", [10, features.VECTORIZE_MIN_ROWS, 1000])
+def test_ip_batch_matches_scalar(size):
+    ips = random_ips(random.Random(size), size - len(IRREGULAR_IPS)) + IRREGULAR_IPS
+    expected = np.stack([extract_ip_features(ip) for ip in ips])
+    assert np.array_equal(extract_ip_features_batch(ips), expected)
+
+
+@pytest.mark.parametrize("size", [10, features.VECTORIZE_MIN_ROWS, 1000])
+def test_url_batch_matches_scalar(size):
+    urls = random_urls(random.Random(size), size - len(IRREGULAR_URLS)) + IRREGULAR_URLS
+    expected = np.stack([extract_url_features(url) for url in urls])
+    assert np.array_equal(extract_url_features_batch(urls), expected)
+
+
+def test_empty_batches():
+    assert extract_ip_features_batch([]).shape == (0, features.IP_FEATURES)
+    assert extract_url_features_batch([]).shape == (0, features.URL_FEATURES)
+
+
+def test_request_features_extract_once(monkeypatch):
+    calls = []
+
+    def counting(url):
+        calls.append(url)
+        return np.zeros(features.URL_FEATURES, np.float32)
+    monkeypatch.setattr(features, "extract_url_features", counting)
+    request = RequestFeatures("email", "someone@mail.example")
+    assert request.primary is request.url("mail.example")
+    request.anomaly
+    assert calls == ["mail.example"]
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://Shop.Example:443/#top", "https://shop.example"),
+    ("http://shop.example:80/Cart/?id=1#x", "http://shop.example/Cart/?id=1"),
+    ("https://shop.example:8443/", "https://shop.example:8443"),
+    ("http://User@[2001:DB8::1]:80/", "http://User@[2001:db8::1]"),
+    ("Mail.Example", "mail.example"),
+    ("http://shop.example:99999/", "http://shop.example:99999/"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
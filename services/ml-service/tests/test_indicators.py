@@ -0,0 +1,72 @@
+import asyncio
+import os
+
+import pytest
+
+from indicators import IndicatorIndex, split_url
+
+MALFORMED_URLS = ["http://a.com:99999/", "http://x.com:abc/", "http://[::1"]
+
+
+def write_list(directory, name, lines):
+    with open(os.path.join(directory, name), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def index(tmp_path):
+    write_list(tmp_path, "malicious_ips.txt", ["203.0.113.0/24", "2001:db8::/32"])
+    write_list(tmp_path, "benign_ips.txt", ["203.0.113.7"])
+    write_list(tmp_path, "malicious_domains.txt", ["evil.example"])
+    write_list(tmp_path, "malicious_urls.txt", ["https://phish.example/login", *MALFORMED_URLS])
+    write_list(tmp_path, "malicious_emails.txt", ["# comment", "", "bad@mail.example"])
+    return IndicatorIndex.load(str(tmp_path))
+
+
+def test_split_url_normalizes():
+    assert split_url("HTTPS://Phish.Example:443/login#top") == ("phish.example", "phish.example/login")
+    assert split_url("phish.example:8080/") == ("phish.example", "phish.example:8080")
+
+
+@pytest.mark.parametrize("url", MALFORMED_URLS)
+def test_split_url_malformed_is_empty(url):
+    assert split_url(url) == ("", "")
+
+
+def test_malformed_list_lines_are_skipped(index):
+    assert index.counts["urls"] == 1
+    assert index.skipped == len(MALFORMED_URLS)
+
+
+@pytest.mark.parametrize("url", MALFORMED_URLS)
+def test_malformed_url_lookup_is_a_miss(index, url):
+    assert index.lookup("url", url) is None
+
+
+def test_lookups(index):
+    assert index.lookup("ip", "203.0.113.9").verdict == "malicious"
+    # The /32 allowlist entry is more specific than the blocked /24
+    assert index.lookup("ip", "203.0.113.7").verdict == "benign"
+    assert index.lookup("ip", "2001:db8::1").indicator == "2001:db8::/32"
+    assert index.lookup("ip", "198.51.100.1") is None
+    assert index.lookup("domain", "www.evil.example").indicator == "evil.example"
+    assert index.lookup("url", "http://phish.example/login").kind == "urls"
+    assert index.lookup("url", "http://sub.evil.example/x").kind == "domains"
+    assert index.lookup("email", "BAD@mail.example").kind == "emails"
+    assert index.lookup("email", "someone@good.example") is None
+
+
+def test_version_follows_the_lists(tmp_path, index):
+    assert IndicatorIndex.empty().version == "none"
+    assert IndicatorIndex.load(str(tmp_path)).version == index.version != "none"
+    write_list(tmp_path, "malicious_domains_extra.txt", ["worse.example"])
+    assert IndicatorIndex.load(str(tmp_path)).version != index.version
+
+
+def test_reload_builds_the_index_in_a_spawned_process(tmp_path, monkeypatch):
+    import app
+    write_list(tmp_path, "malicious_domains.txt", ["evil.example"])
+    monkeypatch.setattr(app, "indicator_config", app.IndicatorConfig(path=str(tmp_path)))
+    monkeypatch.setattr(app, "indicator_index", IndicatorIndex.empty())
+    index = asyncio.run(app.reload_indicators())
+    assert app.indicator_index is index and index.counts["domains"] == 1
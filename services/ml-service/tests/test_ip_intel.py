@@ -0,0 +1,119 @@
+import os
+import random
+import ipaddress
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import features
+from features import extract_ip_features, extract_ip_features_batch, use_ip_intel
+from ip_intel import IpIntelError, IpIntelTable, build
+
+RANGES = """network,country,latitude,longitude,asn,hosting,vpn,proxy,tor
+203.0.113.0/24,AU,-33.87,151.21,AS64500,1,0,0,0
+2001:db8::/48,DE,52.52,13.40,64501,0,1,0,0
+"""
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    return str(path)
+
+
+@pytest.fixture
+def table(tmp_path):
+    path = str(tmp_path / "ip_intel.bin")
+    build(write(tmp_path / "ranges.csv", RANGES), path)
+    return IpIntelTable.open(path)
+
+
+def test_round_trip(table):
+    record = table.lookup("203.0.113.7")
+    assert record.to_dict() == {
+        "network": "203.0.113.0-203.0.113.255", "country": "AU", "asn": 64500, "latitude": -33.87,
+        "longitude": 151.21, "hosting": True, "vpn": False, "proxy": False, "tor": False,
+    }
+    assert table.lookup("2001:db8:0:ffff::1").country == "DE"
+    assert table.lookup("2001:db8:1::") is None
+    # IPv4-mapped IPv6 is looked up as IPv4
+    assert table.lookup("::ffff:203.0.113.9").country == "AU"
+    assert table.lookup("203.0.114.0") is None
+    assert table.lookup("not an ip") is None
+    assert table.lookup_many(["203.0.113.1", "bogus", "2001:db8::2"]) == [
+        table.lookup("203.0.113.1"), None, table.lookup("2001:db8::2"),
+    ]
+
+
+def test_start_end_ranges_and_integers(tmp_path):
+    source = write(tmp_path / "ranges.csv", "start_ip,end_ip,country\n10.0.0.0,10.0.0.9,US\n167772170,167772170,FR\n")
+    build(source, str(tmp_path / "t.bin"))
+    table = IpIntelTable.open(str(tmp_path / "t.bin"))
+    assert [table.lookup(f"10.0.0.{i}").country for i in (0, 9, 10)] == ["US", "US", "FR"]
+    assert table.lookup("10.0.0.11") is None
+
+
+def test_overlapping_ranges_are_rejected(tmp_path):
+    source = write(tmp_path / "ranges.csv", "network\n2001:db8::/32\n2001:db8:1::/48\n")
+    with pytest.raises(IpIntelError, match="overlapping"):
+        build(source, str(tmp_path / "t.bin"))
+    assert not os.path.exists(tmp_path / "t.bin")
+
+
+def test_bad_files(tmp_path):
+    assert len(IpIntelTable.open(str(tmp_path / "missing.bin"))) == 0
+    with pytest.raises(IpIntelError):
+        IpIntelTable.open(write(tmp_path / "junk.bin", "junk" * 10))
+
+
+def test_rebuild_leaves_open_table_intact(tmp_path, table):
+    build(write(tmp_path / "other.csv", "network,country\n198.51.100.0/24,NZ\n"), table.path)
+    assert table.lookup("203.0.113.7").country == "AU"
+    assert IpIntelTable.open(table.path).lookup("198.51.100.1").country == "NZ"
+
+
+def test_scalar_and_batch_searches_agree(tmp_path):
+    rng = random.Random(0)
+    lines = ["start_ip,end_ip,country"]
+    for low, high in ((0, 2 ** 32), (2 ** 125, 2 ** 126)):
+        bounds = sorted({rng.randrange(low, high) for _ in range(400)})
+        lines += [f"{start},{end},US" for start, end in zip(bounds[::2], bounds[1::2])]
+    path = str(tmp_path / "t.bin")
+    build(write(tmp_path / "ranges.csv", "\n".join(lines) + "\n"), path)
+    table = IpIntelTable.open(path)
+
+    numbers = [rng.randrange(2 ** 32) for _ in range(500)] + table.ipv4.start.tolist()[:50]
+    numbers += [rng.randrange(2 ** 125, 2 ** 126) for _ in range(300)]
+    ips = [str(ipaddress.ip_address(number)) for number in numbers]
+    records = [table.lookup(ip) for ip in ips]
+    assert table.lookup_many(ips) == records
+    assert any(records[:550]) and any(records[550:])
+    assert np.array_equal(table.geo_features_many(ips), np.array([table.geo_features(ip) for ip in ips], np.float32))
+
+
+def test_ip_features_with_table(table):
+    ips = [f"203.0.113.{i}" for i in range(200)] + ["8.8.8.8", "2001:db8::1", "::1", "ff02::1", "1.2.3"]
+    try:
+        use_ip_intel(table)
+        batch = extract_ip_features_batch(ips)
+        assert np.array_equal(batch, np.stack([extract_ip_features(ip) for ip in ips]))
+        # AU: latitude and longitude scaled to [0, 1], the country as its alpha-2 index
+        assert np.allclose(batch[0, 9:], [(-33.87 + 90) / 180, (151.21 + 180) / 360, 1 + 0 * 26 + 20])
+        assert batch[200, 9:].tolist() == [0, 0, 0]
+        assert batch[201, 11] > 0
+        assert (batch[202, 7], batch[203, 8]) == (1, 1)
+    finally:
+        use_ip_intel(IpIntelTable.empty())
+
+
+def test_mock_geo_features_are_process_independent():
+    code = "import features; print(features.mock_geo_features('198.51.100.7'))"
+    outputs = {
+        subprocess.run([sys.executable, "-c", code], env={**os.environ, "PYTHONHASHSEED": seed,
+                                                         "PYTHONPATH": os.path.dirname(features.__file__)},
+                       capture_output=True, text=True, check=True).stdout
+        for seed in ("1", "2")
+    }
+    assert outputs == {f"{features.mock_geo_features('198.51.100.7')}\n"}
@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, MetricsMiddleware, Registry, record_stage, server_timing, start_breakdown
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "a")
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{stage="a",le="0.1"} 2',
+        'test_seconds_bucket{stage="a",le="1.0"} 3',
+        'test_seconds_bucket{stage="a",le="+Inf"} 4',
+        'test_seconds_sum{stage="a"} 3.65',
+        'test_seconds_count{stage="a"} 4',
+    ]
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram("test_seconds", "Test", buckets=(1.0, 2.0, 4.0))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == pytest.approx(4.0)
+    histogram.observe(100.0)
+    assert histogram.quantile(1.0) == 4.0
+
+
+def test_registry_renders_counters_and_collectors():
+    registry = Registry()
+    counter = registry.register(Counter("test_total", "Test", ["reason"]))
+    counter.inc('say "hi"\n', amount=2)
+    registry.add_collector(lambda: [("test_entries", "gauge", "Entries", [({"cache": "local"}, 3)])])
+    assert registry.render().splitlines() == [
+        "# HELP test_total Test", "# TYPE test_total counter", 'test_total{reason="say \\"hi\\"\\n"} 2',
+        "# HELP test_entries Entries", "# TYPE test_entries gauge", 'test_entries{cache="local"} 3',
+    ]
+
+
+def test_breakdown_follows_the_request_into_its_tasks():
+    async def request():
+        breakdown = start_breakdown()
+        record_stage("extract.ip", 0.001)
+
+        async def child():
+            record_stage("inference.ip", 0.002)
+        await asyncio.create_task(child())
+        return breakdown
+
+    async def other_request():
+        record_stage("extract.ip", 1.0)
+
+    async def scenario():
+        breakdown, _ = await asyncio.gather(request(), other_request())
+        return breakdown
+    assert asyncio.run(scenario()) == pytest.approx({"extract.ip": 1.0, "inference.ip": 2.0})
+    assert server_timing({"cache.analysis local": 0.25}) == "cache.analysis_local;dur=0.250"
+
+
+def test_unknown_paths_share_one_endpoint_label(monkeypatch):
+    monkeypatch.setattr(metrics, "REQUESTS", Counter("test_requests_total", "Test", ["endpoint", "status"]))
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 404 if scope["path"] != "/health" else 200})
+    router = SimpleNamespace(router=SimpleNamespace(routes=[SimpleNamespace(path="/health")]))
+    middleware = MetricsMiddleware(app)
+
+    async def call(path):
+        async def send(message):
+            pass
+        await middleware({"type": "http", "path": path, "app": router}, None, send)
+
+    for path in ("/health", "/random-1", "/random-2"):
+        asyncio.run(call(path))
+    assert metrics.REQUESTS.value("/health", "200") == 1 and metrics.REQUESTS.value("other", "404") == 2
+
+
+def test_registry_labels_every_sample_with_the_worker():
+    registry = Registry()
+    registry.register(Counter("test_total", "Test", ["reason"])).inc("hit")
+    registry.register(Histogram("test_seconds", "Test", buckets=(1.0,))).observe(0.5)
+    registry.add_collector(lambda: [("test_entries", "gauge", "Entries", [({}, 3)])])
+    samples = [line for line in registry.render({"worker": "1"}).splitlines() if not line.startswith("#")]
+    assert samples == [
+        'test_total{reason="hit",worker="1"} 1',
+        'test_seconds_bucket{worker="1",le="1.0"} 1', 'test_seconds_bucket{worker="1",le="+Inf"} 1',
+        'test_seconds_sum{worker="1"} 0.5', 'test_seconds_count{worker="1"} 1',
+        'test_entries{worker="1"} 3',
+    ]
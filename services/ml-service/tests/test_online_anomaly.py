@@ -0,0 +1,75 @@
+import numpy as np
+
+from online_anomaly import TYPE_CODES, OnlineAnomalyConfig, OnlineAnomalyDetector
+
+N_FEATURES = 4
+CONFIG = OnlineAnomalyConfig(trees=10, depth=6, window=32, seed=7)
+
+
+def traffic(n, seed=0):
+    return np.random.default_rng(seed).normal(0.5, 0.05, (n, N_FEATURES)).astype(np.float32)
+
+
+def codes(n, input_type="ip"):
+    return np.full(n, TYPE_CODES[input_type])
+
+
+def test_baseline_answers_from_its_fourth_window():
+    detector = OnlineAnomalyDetector(N_FEATURES, CONFIG)
+    probabilities, _ = detector.process(traffic(4 * CONFIG.window), codes(4 * CONFIG.window))
+    assert np.isnan(probabilities[:3 * CONFIG.window]).all()
+    assert not np.isnan(probabilities[3 * CONFIG.window:]).any()
+    assert detector.baselines["ip"].ready and not detector.baselines["url"].ready
+
+
+def test_outliers_score_above_normal_traffic():
+    detector = OnlineAnomalyDetector(N_FEATURES, CONFIG)
+    detector.process(traffic(4 * CONFIG.window), codes(4 * CONFIG.window))
+    outlier = np.full((1, N_FEATURES), 0.95, dtype=np.float32)
+    normal, _ = detector.process(traffic(1, seed=1), codes(1))
+    anomalous, _ = detector.process(outlier, codes(1))
+    assert anomalous[0] > normal[0]
+
+
+def test_checkpoint_restores_the_stream(tmp_path):
+    path = str(tmp_path / "anomaly_state.npz")
+    rows = traffic(6 * CONFIG.window + 5)
+    detector = OnlineAnomalyDetector(N_FEATURES, CONFIG)
+    detector.process(rows[:4 * CONFIG.window + 3], codes(4 * CONFIG.window + 3))
+    detector.save(path)
+
+    restored = OnlineAnomalyDetector(N_FEATURES, CONFIG)
+    assert restored.load(path)
+    assert restored.events == restored.checkpointed_events == detector.events
+    rest = rows[4 * CONFIG.window + 3:]
+    expected = detector.process(rest, codes(len(rest)))
+    actual = restored.process(rest, codes(len(rest)))
+    np.testing.assert_array_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
+
+
+def test_checkpoint_of_other_settings_is_ignored(tmp_path):
+    path = str(tmp_path / "anomaly_state.npz")
+    assert not OnlineAnomalyDetector(N_FEATURES, CONFIG).load(path)
+    detector = OnlineAnomalyDetector(N_FEATURES, CONFIG)
+    detector.process(traffic(CONFIG.window), codes(CONFIG.window))
+    detector.save(path)
+    other = OnlineAnomalyDetector(N_FEATURES, OnlineAnomalyConfig(trees=10, depth=5, window=32, seed=7))
+    assert not other.load(path)
+    assert other.events == 0
+
+
+def test_read_only_scoring_leaves_the_baselines_alone():
+    detector = OnlineAnomalyDetector(N_FEATURES, CONFIG)
+    rows = traffic(CONFIG.window, seed=2)
+    assert np.isnan(detector.process(rows, codes(len(rows)), update=False)[0]).all()
+    detector.process(traffic(4 * CONFIG.window + 3), codes(4 * CONFIG.window + 3))
+    before = {name: value.copy() for name, value in detector.baselines["ip"].state().items()}
+
+    read_only = detector.process(rows, codes(len(rows)), update=False)
+    for name, value in detector.baselines["ip"].state().items():
+        np.testing.assert_array_equal(value, before[name])
+    # Within one window the updating pass scores against the same reference and ranking
+    updating = detector.process(rows[:CONFIG.window - 3], codes(CONFIG.window - 3))
+    np.testing.assert_array_equal(read_only[0][:CONFIG.window - 3], updating[0])
+    np.testing.assert_array_equal(read_only[1][:CONFIG.window - 3], updating[1])
@@ -0,0 +1,134 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app
+from prefork import PreforkConfig, memory_usage
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-fork serving needs fork")
+
+SERVER = textwrap.dedent("""
+    import os, sys, json
+    sys.path.insert(0, {src!r})
+    from prefork import PreforkConfig, run_prefork, worker_index
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = json.dumps({{"pid": os.getpid(), "worker": worker_index(), "preloaded": PRELOADED}}).encode()
+        await send({{"type": "http.response.start", "status": 200, "headers": [
+            (b"content-length", str(len(body)).encode()), (b"connection", b"close"),
+        ]}})
+        await send({{"type": "http.response.body", "body": body}})
+
+    PRELOADED = None
+
+    def preload():
+        global PRELOADED
+        PRELOADED = os.getpid()
+
+    run_prefork(app, PreforkConfig(workers=2, host="127.0.0.1", port={port}, metrics_port={metrics_port}), preload)
+""")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=2) as sock:
+                sock.sendall(b"GET / HTTP/1.1\r\nHost: test\r\n\r\n")
+                response = b""
+                while chunk := sock.recv(4096):
+                    response += chunk
+            return json.loads(response.split(b"\r\n\r\n", 1)[1])
+        except (OSError, ValueError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_workers_share_the_socket_and_the_preloaded_state():
+    port, metrics_port = free_port(), free_port()
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+    server = subprocess.Popen([sys.executable, "-c", SERVER.format(src=src, port=port, metrics_port=metrics_port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        seen = {}
+        deadline = time.monotonic() + 15
+        while len(seen) < 2 and time.monotonic() < deadline:
+            response = get(port)
+            seen[response["worker"]] = response
+        assert set(seen) == {0, 1}
+        assert {response["preloaded"] for response in seen.values()} == {server.pid}
+        # Each worker's own port always reaches that worker
+        assert get(metrics_port)["pid"] == seen[0]["pid"]
+
+        # A worker that dies is forked again with the same index
+        os.kill(seen[0]["pid"], signal.SIGKILL)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            response = get(port)
+            if response["worker"] == 0 and response["pid"] != seen[0]["pid"]:
+                break
+        else:
+            pytest.fail("worker 0 was not restarted")
+
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(15) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
+
+
+def test_memory_usage_reports_resident_bytes():
+    usage = memory_usage()
+    assert usage["rss"] > 0
+    if "pss" in usage:
+        assert 0 < usage["pss"] <= usage["rss"]
+
+
+def test_prefork_workers_always_follow_swaps(monkeypatch):
+    monkeypatch.setattr(app, "serving_config", PreforkConfig(workers=1))
+    assert app.poll_interval(0) == 0 and app.poll_interval(30) == 30
+    monkeypatch.setattr(app, "serving_config", PreforkConfig(workers=4))
+    assert app.poll_interval(0) == app.SERVING_WORKER_POLL_SECONDS
+    assert app.poll_interval(1) == 1
+    assert app.poll_interval(600) == app.SERVING_WORKER_POLL_SECONDS
+
+
+def test_reforked_worker_catches_up_with_the_registry(monkeypatch):
+    swaps = []
+
+    async def swapped():
+        return None
+
+    def start_swap(version, kind):
+        swaps.append((version, kind))
+        app.reload_task = asyncio.ensure_future(swapped())
+
+    registry = SimpleNamespace(active=lambda: "v2", exists=lambda version: True)
+    monkeypatch.setattr(app, "model_registry", registry)
+    monkeypatch.setattr(app, "active_bundle", SimpleNamespace(version="v1"))
+    monkeypatch.setattr(app, "start_swap", start_swap)
+    monkeypatch.setattr(app, "reload_task", None)
+    asyncio.run(app.catch_up_with_swaps())
+    assert swaps == [("v2", "poll")]
+
+    monkeypatch.setattr(app, "active_bundle", SimpleNamespace(version="v2"))
+    asyncio.run(app.catch_up_with_swaps())
+    assert swaps == [("v2", "poll")]
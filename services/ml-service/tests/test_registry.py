@@ -0,0 +1,72 @@
+import os
+import pickle
+
+import pytest
+
+import registry
+from registry import BASE_VERSION, ModelBundle, ModelRegistry, RegistryError, file_digest
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    path = tmp_path / "ip_reputation_model.pkl"
+    path.write_bytes(b"model bytes")
+    return {"ip_reputation_model.pkl": str(path)}
+
+
+def test_publish_copies_artifacts_with_digests(tmp_path, artifacts):
+    models = ModelRegistry(str(tmp_path / "registry"))
+    version = models.publish(artifacts, {"note": "retrained"})
+    manifest = models.manifest(version)
+    path = models.artifact_paths(version)["ip_reputation_model.pkl"]
+    assert manifest["artifacts"] == {"ip_reputation_model.pkl": file_digest(path)}
+    assert manifest["metadata"] == {"note": "retrained"}
+    assert models.latest() == version and models.exists(version) and models.exists(BASE_VERSION)
+    assert os.listdir(models.versions_dir) == [version]
+
+
+def test_failed_publish_leaves_nothing_behind(tmp_path, artifacts):
+    models = ModelRegistry(str(tmp_path / "registry"))
+    with pytest.raises(RegistryError):
+        models.publish({"../escape.pkl": artifacts["ip_reputation_model.pkl"]}, version="v1")
+    with pytest.raises(FileNotFoundError):
+        models.publish({"model.pkl": str(tmp_path / "missing")}, version="v1")
+    assert models.versions() == [] and not models.exists("v1")
+
+
+@pytest.mark.parametrize("version", ["", BASE_VERSION, "../x", ".tmp-v1"])
+def test_version_names_stay_inside_the_registry(tmp_path, version):
+    with pytest.raises(RegistryError):
+        ModelRegistry(str(tmp_path)).version_dir(version)
+
+
+def test_activate_and_roll_back(tmp_path, artifacts):
+    models = ModelRegistry(str(tmp_path / "registry"))
+    first, second = models.publish(artifacts, version="v1"), models.publish(artifacts, version="v2")
+    assert models.active() == BASE_VERSION and models.rollback_target() is None
+    models.set_active(first)
+    models.set_active(second)
+    assert models.active() == second and models.history() == [BASE_VERSION, first]
+    target = models.rollback_target()
+    models.set_active(target, rollback=True)
+    assert models.active() == first and models.history() == [BASE_VERSION]
+    with pytest.raises(RegistryError):
+        models.set_active("v3")
+
+
+def test_bundles_pickle_as_their_version(monkeypatch):
+    monkeypatch.setattr(registry, "_loaded_bundles", type(registry._loaded_bundles)())
+    loaded = []
+
+    def loader(version):
+        loaded.append(version)
+        return ModelBundle(version)
+    monkeypatch.setattr(registry, "_bundle_loader", None)
+    bundle = ModelBundle("v1", models={"ip_reputation": object()})
+    data = pickle.dumps(bundle)
+    with pytest.raises(RegistryError):
+        pickle.loads(data)
+    registry.remember_bundle(bundle)
+    assert pickle.loads(data) is bundle
+    registry.set_bundle_loader(loader)
+    assert pickle.loads(pickle.dumps(ModelBundle("v2"))).version == "v2" and loaded == ["v2"]
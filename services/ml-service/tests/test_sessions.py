@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+import torch
+
+import app
+from cache import RedisBackend
+from registry import ModelBundle
+from sessions import SessionConfig, SessionState, SessionStore
+
+
+def state(value, version="v1"):
+    return SessionState(np.full(4, value, np.float32), 1, version)
+
+
+def test_state_round_trips():
+    restored = SessionState.decode(SessionState(np.arange(6, dtype=np.float32), 3, "v2").encode().encode())
+    assert np.array_equal(restored.state, np.arange(6)) and (restored.steps, restored.model_version) == (3, "v2")
+
+
+def test_store_evicts_expires_and_resets_on_a_new_model():
+    async def scenario():
+        store = SessionStore(SessionConfig(max_entries=2, redis_mode="off"))
+        for session_id in ("a", "b", "c"):
+            store.put(session_id, state(1))
+        assert await store.get("a", "v1") is None and await store.get("c", "v1") is not None
+        assert await store.get("c", "v2") is None and store.version_resets == 1
+        store._sessions["b"].expires_at = time.monotonic() - 1
+        assert store.sweep() == 1
+        assert store.evictions == {"capacity": 1, "expired": 1, "deleted": 0}
+        assert store.delete("c") and len(store) == 0 and store.state_bytes == 0
+    asyncio.run(scenario())
+
+
+def test_sessions_spilled_to_redis_are_restored():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        backend = RedisBackend(lambda: client)
+        store = SessionStore(SessionConfig(max_entries=1, redis_mode="spill"), backend)
+        store.put("a", state(1))
+        store.put("b", state(2))
+        await backend.flush()
+        restored = await store.get("a", "v1")
+        assert restored is not None and np.array_equal(restored.state, np.ones(4))
+        await store.stop()
+        fresh = SessionStore(SessionConfig(redis_mode="spill"), backend)
+        assert np.array_equal((await fresh.get("b", "v1")).state, np.full(4, 2))
+        assert (store.spills, store.restores, fresh.restores) == (2, 1, 1)
+    asyncio.run(scenario())
+
+
+def test_event_steps_match_scoring_the_whole_sequence():
+    torch.manual_seed(0)
+    model = app.BehavioralLSTM(input_size=8, hidden_size=16, num_layers=2).eval()
+    bundle = ModelBundle("test", models={"behavioral_lstm": model})
+    events = np.random.default_rng(0).normal(size=(2, 5, 8)).astype(np.float32)
+    states = [None, None]
+    for t in range(events.shape[1]):
+        rows = np.stack([app.behavioral_step_row(events[i, t], states[i], bundle) for i in range(2)])
+        results = app.score_behavioral_steps(rows, bundle)
+        states = [new_state for _, new_state in results]
+    with torch.inference_mode():
+        expected = model(torch.from_numpy(events)).numpy()
+    np.testing.assert_allclose([r["anomaly_probability"] for r, _ in results], expected[:, 1], atol=1e-6)
+
+
+def test_shared_store_reads_the_latest_state_from_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        backend = RedisBackend(lambda: client)
+        # Two pre-fork workers: each event of the session may reach either
+        first = SessionStore(SessionConfig(redis_mode="always"), backend, shared=True)
+        second = SessionStore(SessionConfig(redis_mode="always"), backend, shared=True)
+        first.put("a", state(1))
+        await backend.flush()
+        second.put("a", SessionState(np.full(4, 2, np.float32), 2, "v1"))
+        await backend.flush()
+        latest = await first.get("a", "v1")
+        assert latest.steps == 2 and np.array_equal(latest.state, np.full(4, 2))
+    asyncio.run(scenario())
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import app
+
+
+def test_generated_models_are_persisted_and_reused(base_bundle):
+    assert sorted(os.listdir(app.FALLBACK_MODEL_PATH)) == sorted([
+        "anomaly_model.pkl", "behavioral_lstm.pth", "device_fingerprint.pth", "ip_reputation_model.pkl",
+        "ip_reputation_scaler.pkl", "url_analysis_model.pkl", "url_analysis_scaler.pkl",
+    ])
+    reloaded = app.build_bundle(app.BASE_VERSION)
+    assert reloaded.model_versions == base_bundle.model_versions
+    assert not any(version.startswith("untrained-") for version in reloaded.model_versions.values())
+    rows = np.random.RandomState(0).rand(8, 12)
+    assert app.score_ip_reputation(rows, reloaded) == app.score_ip_reputation(rows, base_bundle)
+
+
+def test_not_ready_until_warm(monkeypatch, base_bundle):
+    monkeypatch.setattr(app, "service_ready", False)
+    monkeypatch.setattr(app, "active_bundle", None)
+    response = asyncio.run(app.readiness_check())
+    assert response.status_code == 503 and json.loads(response.body)["status"] == "loading"
+    with pytest.raises(HTTPException) as not_ready:
+        app.ensure_ready()
+    assert not_ready.value.status_code == 503 and "Retry-After" in not_ready.value.headers
+
+    monkeypatch.setattr(app, "service_ready", True)
+    monkeypatch.setattr(app, "active_bundle", base_bundle)
+    status = asyncio.run(app.readiness_check())
+    assert status["status"] == "ready" and status["models_loaded"] == 5
+    app.ensure_ready()
+
+
+def test_hst_baselines_refuse_the_process_backend(monkeypatch):
+    monkeypatch.setattr(app, "anomaly_detector", object())
+    monkeypatch.setenv("INFERENCE_BACKEND", "process")
+    with pytest.raises(RuntimeError, match="INFERENCE_BACKEND=process"):
+        app.check_serving_config()
+    monkeypatch.setenv("INFERENCE_BACKEND", "thread")
+    app.check_serving_config()
+    monkeypatch.setenv("INFERENCE_BACKEND", "process")
+    monkeypatch.setattr(app, "anomaly_detector", None)
+    app.check_serving_config()
+
+
+def test_prefork_serving_needs_sessions_written_through_to_redis(monkeypatch):
+    monkeypatch.setattr(app, "anomaly_detector", None)
+    monkeypatch.setattr(app, "serving_config", app.PreforkConfig(workers=2))
+    monkeypatch.setattr(app, "session_config", app.SessionConfig(redis_mode="spill"))
+    with pytest.raises(RuntimeError, match="SESSION_REDIS_MODE=always"):
+        app.check_serving_config()
+    monkeypatch.setattr(app, "session_config", app.SessionConfig(redis_mode="always"))
+    app.check_serving_config()
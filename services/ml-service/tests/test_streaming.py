@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from streaming import NDJSONScoringStream, StreamingConfig, iter_lines
+
+
+async def body_of(*parts):
+    for part in parts:
+        yield part
+
+
+async def collect(stream):
+    return [json.loads(line) for block in [block async for block in stream] for line in block.splitlines()]
+
+
+def test_lines_split_across_body_chunks():
+    async def scenario():
+        body = body_of(b'{"a"', b':1}\n\n{"b":2}\n{"c', b'":3}')
+        return [line for lines in [lines async for lines in iter_lines(body, 100)] for line in lines]
+    assert asyncio.run(scenario()) == [(1, b'{"a":1}'), (3, b'{"b":2}'), (4, b'{"c":3}')]
+
+
+def test_oversized_lines_are_reported_not_buffered():
+    async def scenario():
+        body = body_of(b"x" * 8, b"x" * 8, b"\nok\n")
+        return [line for lines in [lines async for lines in iter_lines(body, 10)] for line in lines]
+    assert asyncio.run(scenario()) == [(1, None), (2, b"ok")]
+
+
+def test_every_line_gets_a_result_in_order():
+    scored = []
+
+    async def score_chunk(items):
+        scored.append(len(items))
+        return [{"value": item["n"] * 2} for item in items]
+
+    lines = [json.dumps({"n": n}).encode() for n in range(7)]
+    lines[3] = b"not json"
+    body = body_of(b"\n".join(lines) + b"\n")
+    stream = NDJSONScoringStream(body, json.loads, score_chunk, StreamingConfig(chunk_size=2, max_pending_chunks=1))
+    records = asyncio.run(collect(stream))
+
+    assert [record.get("line") for record in records[:-1]] == list(range(1, 8))
+    assert records[3]["error"] and [record.get("value") for record in records[:3]] == [0, 2, 4]
+    summary = records[-1]["summary"]
+    assert (summary["records"], summary["scored"], summary["errors"], summary["completed"]) == (7, 6, 1, True)
+    assert max(scored) <= 2
+
+
+def test_scoring_failure_aborts_the_stream():
+    async def score_chunk(items):
+        raise RuntimeError("model down")
+
+    stream = NDJSONScoringStream(body_of(b'{"n":1}\n'), json.loads, score_chunk, StreamingConfig())
+    records = asyncio.run(collect(stream))
+    assert "model down" in records[0]["error"] and records[1]["summary"]["completed"] is False
+
+
+def test_client_disconnect_stops_scoring():
+    async def scenario():
+        release = asyncio.Event()
+        scored = []
+
+        async def score_chunk(items):
+            scored.append(len(items))
+            await release.wait()
+            return [{} for _ in items]
+
+        async def wait_disconnect():
+            return {"type": "http.disconnect"}
+
+        # The disconnect is watched for once the body has been read
+        body = body_of(*(b'{"n":1}\n' for _ in range(3)))
+        stream = NDJSONScoringStream(body, json.loads, score_chunk, StreamingConfig(chunk_size=1),
+                                     wait_disconnect=wait_disconnect)
+        records = await asyncio.wait_for(collect(stream), 1)
+        assert "disconnected" in records[0]["error"] and records[-1]["summary"]["completed"] is False
+        assert len(scored) == 1
+    asyncio.run(scenario())
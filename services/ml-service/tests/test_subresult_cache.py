@@ -0,0 +1,77 @@
+import asyncio
+import dataclasses
+import json
+
+import pytest
+
+import app
+from cache import TieredCache
+
+SESSION = {"session_duration": 120, "page_views": 4, "clicks": 9, "scroll_depth": 0.5, "typing_speed": 3}
+
+
+@pytest.fixture
+def inferred(monkeypatch, base_bundle):
+    monkeypatch.setattr(app, "anomaly_detector", None)
+    monkeypatch.setattr(app, "batchers", {})
+    monkeypatch.setattr(app, "subresult_caches", {
+        key: TieredCache(f"sub:{key}", None, encode=json.dumps, decode=json.loads) for key in app.SUBRESULT_TTL_DEFAULTS
+    })
+    calls = []
+    infer = app.infer
+
+    async def counting_infer(model_name, row, bundle):
+        calls.append(model_name)
+        return await infer(model_name, row, bundle)
+    monkeypatch.setattr(app, "infer", counting_infer)
+    return calls
+
+
+def analyze(*requests, bundle):
+    async def scenario():
+        return [await app.analyze_threat(request, bundle) for request in requests]
+    return asyncio.run(scenario())
+
+
+def ip_request(ip, clicks):
+    return app.ThreatAnalysisRequest(input_type="ip", input_value=ip, session_data={**SESSION, "clicks": clicks})
+
+
+def test_only_models_whose_input_changed_run_again(inferred, base_bundle):
+    first, second = analyze(ip_request("198.51.100.7", 1), ip_request("198.51.100.7", 2), bundle=base_bundle)
+    assert inferred.count("ip_reputation") == 1 and inferred.count("anomaly_detection") == 1
+    assert inferred.count("behavioral_lstm") == 2
+    assert first.model_predictions["ip_reputation"] == second.model_predictions["ip_reputation"]
+
+
+def test_entries_follow_the_model_version(inferred, base_bundle):
+    swapped = dataclasses.replace(
+        base_bundle, version="next", model_versions={**base_bundle.model_versions, "ip_reputation": "retrained"}
+    )
+    analyze(ip_request("198.51.100.8", 1), bundle=base_bundle)
+    analyze(ip_request("198.51.100.8", 1), bundle=swapped)
+    assert inferred.count("ip_reputation") == 2 and inferred.count("behavioral_lstm") == 1
+
+
+def test_failed_predictions_are_not_cached(inferred, base_bundle, monkeypatch):
+    counting_infer = app.infer
+
+    async def failing_ip(model_name, row, bundle):
+        if model_name == "ip_reputation":
+            raise RuntimeError("model failed")
+        return await counting_infer(model_name, row, bundle)
+    monkeypatch.setattr(app, "infer", failing_ip)
+    failed, = analyze(ip_request("198.51.100.9", 1), bundle=base_bundle)
+    monkeypatch.setattr(app, "infer", counting_infer)
+    analyze(ip_request("198.51.100.9", 1), ip_request("198.51.100.9", 1), bundle=base_bundle)
+    assert failed.model_predictions["ip_reputation"] == 0.5
+    # Computed once after the failure, then served from the cache
+    assert inferred.count("ip_reputation") == 1
+
+
+def test_spellings_of_one_url_share_an_entry(inferred, base_bundle):
+    variants = ["HTTPS://Shop.Example:443/#top", "https://shop.example/", "https://shop.example"]
+    results = analyze(*(app.ThreatAnalysisRequest(input_type="url", input_value=url) for url in variants),
+                      bundle=base_bundle)
+    assert inferred.count("url_analysis") == 1
+    assert len({json.dumps(result.model_predictions["url_analysis"]) for result in results}) == 1
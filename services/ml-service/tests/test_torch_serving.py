@@ -0,0 +1,60 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from torch_serving import build_serving_model, fold_batchnorm, max_drift, prepare_serving_model
+
+
+class Network(nn.Module):
+    def __init__(self, layers):
+        super().__init__()
+        self.network = nn.Sequential(*layers)
+
+    def forward(self, x):
+        return torch.softmax(self.network(x), dim=1)
+
+
+def trained_batchnorm(features):
+    bn = nn.BatchNorm1d(features)
+    with torch.no_grad():
+        bn.running_mean.uniform_(-1, 1)
+        bn.running_var.uniform_(0.5, 2)
+        bn.weight.uniform_(0.5, 1.5)
+        bn.bias.uniform_(-0.5, 0.5)
+    return bn
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    # BatchNorm both right after a Linear and after an activation, as in the served networks
+    return Network([
+        nn.Linear(12, 32), trained_batchnorm(32), nn.ReLU(), nn.Dropout(0.3),
+        nn.Linear(32, 16), nn.ReLU(), trained_batchnorm(16), nn.Linear(16, 2),
+    ]).eval()
+
+
+def test_fold_batchnorm_keeps_the_outputs(model):
+    folded = fold_batchnorm(model.network)
+    assert not any(isinstance(layer, (nn.BatchNorm1d, nn.Dropout)) for layer in folded)
+    inputs = torch.randn(64, 12)
+    with torch.no_grad():
+        assert torch.allclose(folded(inputs), model.network(inputs), atol=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["optimized", "quantized"])
+def test_serving_modes_stay_within_tolerance(model, mode):
+    inputs = torch.randn(64, 12)
+    served, report = prepare_serving_model("test", model, inputs, mode)
+    assert report["mode"] == mode and report["drift"] <= report["tolerance"]
+    assert max_drift(model, served, torch.randn(8, 12)) <= report["tolerance"]
+
+
+def test_drifting_or_failing_variants_fall_back_to_eager(model):
+    inputs = torch.randn(16, 12)
+    served, report = prepare_serving_model("test", model, inputs, "quantized", tolerance=0.0)
+    assert served is model and report["mode"] == "eager" and report["drift"] > 0
+    served, report = prepare_serving_model("test", model, torch.randn(16, 5), "optimized")
+    assert served is model and report["mode"] == "eager" and "error" in report
+    with pytest.raises(ValueError):
+        build_serving_model(model, inputs, "fast")
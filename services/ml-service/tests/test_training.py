@@ -0,0 +1,148 @@
+import json
+import os
+import random
+from dataclasses import asdict
+
+import joblib
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+import features
+from features import extract_ip_features_batch, use_ip_intel
+from ip_intel import IpIntelTable, build
+from registry import BASE_VERSION, ModelRegistry
+from training import CLASSIFIER_ARTIFACTS, JobRunner, LabeledStore, TrainingConfig, train_model
+
+
+def write_job(tmp_path, config=None, **params):
+    path = tmp_path / "job.json"
+    config = config or TrainingConfig.from_env(str(tmp_path))
+    path.write_text(json.dumps({"job_id": "test", "params": params, "config": asdict(config)}))
+    return str(path)
+
+
+def test_job_uses_the_serving_ip_intel_table(tmp_path):
+    source = tmp_path / "ranges.csv"
+    source.write_text("network,country\n203.0.113.0/24,AU\n")
+    table_path = str(tmp_path / "ip_intel.bin")
+    build(str(source), table_path)
+    version = IpIntelTable.open(table_path).version
+
+    runner = JobRunner(write_job(tmp_path, ip_intel_path=table_path, ip_intel_version=version))
+    try:
+        runner.use_serving_ip_intel()
+        assert features.ip_intel.version == version
+        assert features.extract_ip_features("203.0.113.7")[11] == 1 + 0 * 26 + 20
+        assert json.loads((tmp_path / "job.json").read_text())["ip_intel_version"] == version
+    finally:
+        use_ip_intel(IpIntelTable.empty())
+
+
+def test_job_without_a_table_uses_mock_features(tmp_path):
+    runner = JobRunner(write_job(tmp_path, ip_intel_path=str(tmp_path / "missing.bin"), ip_intel_version="none"))
+    runner.use_serving_ip_intel()
+    assert features.ip_intel.version == "none"
+
+
+def small_config(tmp_path, **overrides):
+    settings = dict(data_path=str(tmp_path), nice=0, min_examples=20, warm_start_trees=5, refit_trees=10,
+                    max_trees=30)
+    return TrainingConfig(**{**settings, **overrides})
+
+
+def ip_examples(n, seed=0):
+    """Malicious IPs from the top of the address space, benign ones from the bottom"""
+    rng = random.Random(seed)
+    examples = []
+    for i in range(n):
+        malicious = i % 2
+        first = rng.randrange(200, 224) if malicious else rng.randrange(1, 100)
+        examples.append({"input_type": "ip", "input_value": f"{first}.{rng.randrange(256)}.{rng.randrange(256)}.1",
+                         "label": malicious})
+    return examples
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LabeledStore(str(tmp_path / "labeled.db"))
+    store.add(ip_examples(200))
+    return store
+
+
+def current_forest(directory, trees):
+    """A fitted IP forest and scaler, saved where a job looks for the model it would replace"""
+    examples = ip_examples(100, seed=1)
+    X = extract_ip_features_batch([example["input_value"] for example in examples])
+    y = [example["label"] for example in examples]
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=trees, random_state=0).fit(scaler.transform(X), y)
+    model_file, scaler_file = CLASSIFIER_ARTIFACTS["ip_reputation"]
+    os.makedirs(directory, exist_ok=True)
+    joblib.dump(model, os.path.join(directory, model_file))
+    joblib.dump(scaler, os.path.join(directory, scaler_file))
+    return str(directory)
+
+
+def test_warm_start_appends_trees_fit_on_new_examples(tmp_path, store):
+    search_path = [current_forest(tmp_path / "current", trees=10)]
+    result, artifacts = train_model("ip_reputation", store, small_config(tmp_path), search_path,
+                                    {"max_example_id": 100}, "auto")
+    assert result["mode"] == "warm_start" and result["n_estimators"] == 15
+    # Only examples added since the last training, minus the holdout
+    assert 0 < result["train_examples"] < 100 and result["max_example_id"] == 200
+    model_file, scaler_file = CLASSIFIER_ARTIFACTS["ip_reputation"]
+    current_scaler = joblib.load(os.path.join(search_path[0], scaler_file))
+    assert (artifacts[scaler_file].mean_ == current_scaler.mean_).all()
+    assert "current_metrics" in result and "candidate_metrics" in result
+
+
+@pytest.mark.parametrize("trees, mode", [(28, "auto"), (10, "refit")])
+def test_refit_past_max_trees_or_on_request(tmp_path, store, trees, mode):
+    search_path = [current_forest(tmp_path / "current", trees=trees)]
+    result, artifacts = train_model("ip_reputation", store, small_config(tmp_path), search_path,
+                                    {"max_example_id": 100}, mode)
+    assert result["mode"] == "refit" and result["n_estimators"] == 10
+    # A refit learns from the whole window, with a scaler of its own
+    assert result["train_examples"] > 100
+    scaler_file = CLASSIFIER_ARTIFACTS["ip_reputation"][1]
+    current_scaler = joblib.load(os.path.join(search_path[0], scaler_file))
+    assert (artifacts[scaler_file].mean_ != current_scaler.mean_).any()
+
+
+def test_too_few_examples_skip_the_model(tmp_path):
+    store = LabeledStore(str(tmp_path / "labeled.db"))
+    store.add(ip_examples(10))
+    result, artifacts = train_model("ip_reputation", store, small_config(tmp_path), [], {}, "auto")
+    assert result["outcome"] == "skipped" and artifacts is None
+    with pytest.raises(ValueError, match="warm-start"):
+        train_model("ip_reputation", store, small_config(tmp_path), [], {}, "warm_start")
+
+
+def run_training(tmp_path, config, search_path):
+    registry_root = str(tmp_path / "registry")
+    runner = JobRunner(write_job(
+        tmp_path, config, registry_root=registry_root, models=["ip_reputation"], search_path=search_path,
+        parent_version=BASE_VERSION, parent_metadata={}, mode="auto",
+    ))
+    runner.train()
+    return runner.status, ModelRegistry(registry_root)
+
+
+def test_job_publishes_accepted_models(tmp_path, store):
+    search_path = [current_forest(tmp_path / "current", trees=10)]
+    status, registry = run_training(tmp_path, small_config(tmp_path, max_metric_drop=1.0), search_path)
+    assert status["state"] == "succeeded" and status["models"]["ip_reputation"]["outcome"] == "accepted"
+    manifest = registry.manifest(status["version"])
+    assert sorted(manifest["artifacts"]) == sorted(CLASSIFIER_ARTIFACTS["ip_reputation"])
+    assert manifest["metadata"]["training"]["ip_reputation"]["mode"] == "warm_start"
+    assert manifest["metadata"]["parent"] == BASE_VERSION
+
+
+def test_holdout_gate_rejects_a_worse_candidate(tmp_path, store):
+    search_path = [current_forest(tmp_path / "current", trees=10)]
+    # A negative allowed drop makes any candidate short of beating the current model by 1.0 "worse"
+    status, registry = run_training(tmp_path, small_config(tmp_path, max_metric_drop=-1.0), search_path)
+    assert status["state"] == "rejected" and "version" not in status
+    assert status["models"]["ip_reputation"]["outcome"] == "rejected"
+    assert registry.latest() is None
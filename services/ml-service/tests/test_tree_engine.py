@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from tree_engine import CompiledIsolationForest, CompiledRandomForestClassifier, compile_model, max_deviation
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 6)).astype(np.float32)
+    y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int)
+    return X, y
+
+
+def test_random_forest_matches_sklearn(data):
+    X, y = data
+    model = RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0).fit(X, y)
+    compiled = compile_model(model)
+    assert isinstance(compiled, CompiledRandomForestClassifier)
+    assert max_deviation(compiled, model, X) < 1e-9
+
+
+@pytest.mark.parametrize("max_features", [1.0, 0.5])
+def test_isolation_forest_matches_sklearn(data, max_features):
+    X, _ = data
+    model = IsolationForest(n_estimators=30, max_features=max_features, random_state=0).fit(X)
+    compiled = compile_model(model)
+    assert isinstance(compiled, CompiledIsolationForest)
+    assert max_deviation(compiled, model, X) < 1e-9
+
+
+def test_unsupported_models_are_not_compiled(data):
+    X, y = data
+    assert compile_model(LogisticRegression().fit(X, y)) is None
+